@@ -0,0 +1,4 @@
+"""
+性能基准测试脚本
+在临时数据库上运行，不会修改 data/ 下的数据库。用法见各脚本的模块说明
+"""
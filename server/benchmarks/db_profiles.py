@@ -0,0 +1,165 @@
+"""
+SQLite 性能配置档基准测试
+对比 low-memory / balanced / throughput 三个配置档在列表查询（page_size=10000）和聚合报表查询上的耗时
+
+用法（在项目根目录执行）：
+    python -m server.benchmarks.db_profiles
+    python -m server.benchmarks.db_profiles --rows 500000 --iterations 30 --profiles balanced throughput
+"""
+
+import argparse
+import logging
+import os
+import random
+import statistics
+import tempfile
+import time
+from typing import Callable, Dict, List
+
+from server.database import SQLiteConnectionPool, PERFORMANCE_PROFILES
+
+PRODUCT_COUNT = 200
+CUSTOMER_COUNT = 500
+
+# 与 routers/sales.py 列表接口相同的查询形态
+LIST_QUERY = """
+    SELECT id, userId, productName, quantity, customerId, saleDate,
+           totalSalePrice, note, created_at
+    FROM sales
+    WHERE workspaceId = ?
+    ORDER BY saleDate DESC, id DESC
+    LIMIT ? OFFSET ?
+"""
+
+# 报表类聚合：按产品汇总销量和销售额
+AGGREGATE_QUERY = """
+    SELECT productName, COUNT(*), SUM(quantity), SUM(totalSalePrice)
+    FROM sales
+    WHERE workspaceId = ?
+    GROUP BY productName
+    ORDER BY SUM(totalSalePrice) DESC
+"""
+
+
+def _seed(pool: SQLiteConnectionPool, rows: int, seed: int) -> int:
+    """写入测试数据，返回 workspace ID"""
+    rng = random.Random(seed)
+    with pool.get_connection() as conn:
+        user_id = conn.execute(
+            "INSERT INTO users (username, password) VALUES ('bench', 'x')"
+        ).lastrowid
+        workspace_id = conn.execute(
+            "INSERT INTO workspaces (name, ownerId, storage_type) VALUES ('bench', ?, 'server')",
+            (user_id,)
+        ).lastrowid
+        batch = []
+        for i in range(rows):
+            batch.append((
+                user_id,
+                workspace_id,
+                f"产品{rng.randrange(PRODUCT_COUNT):03d}",
+                round(rng.uniform(1, 100), 2),
+                f"2024-{rng.randint(1, 12):02d}-{rng.randint(1, 28):02d}",
+                round(rng.uniform(10, 5000), 2),
+                "基准测试数据" * rng.randint(0, 3),
+            ))
+            if len(batch) >= 10000:
+                conn.executemany(
+                    "INSERT INTO sales (userId, workspaceId, productName, quantity, saleDate, totalSalePrice, note) "
+                    "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                    batch
+                )
+                batch.clear()
+        if batch:
+            conn.executemany(
+                "INSERT INTO sales (userId, workspaceId, productName, quantity, saleDate, totalSalePrice, note) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                batch
+            )
+    # 把 WAL 合并回主库文件，各配置档从相同的文件布局开始
+    with pool.get_connection() as conn:
+        conn.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+    return workspace_id
+
+
+def _time(func: Callable[[], None], iterations: int) -> Dict[str, float]:
+    """执行若干次并返回耗时统计（毫秒），第一次执行单独记录为冷启动"""
+    start = time.perf_counter()
+    func()
+    cold = (time.perf_counter() - start) * 1000
+    samples = []
+    for _ in range(iterations):
+        start = time.perf_counter()
+        func()
+        samples.append((time.perf_counter() - start) * 1000)
+    samples.sort()
+    return {
+        "cold": cold,
+        "median": statistics.median(samples),
+        "p95": samples[min(len(samples) - 1, int(len(samples) * 0.95))],
+    }
+
+
+def run_profile(profile: str, rows: int, iterations: int, seed: int) -> Dict[str, Dict[str, float]]:
+    """
+    在临时数据库上测试一个配置档
+    
+    Returns:
+        {查询名: 耗时统计}
+    """
+    with tempfile.TemporaryDirectory() as tmp:
+        db_path = os.path.join(tmp, "bench.db")
+        pool = SQLiteConnectionPool(db_path, max_connections=2, profile=profile)
+        try:
+            workspace_id = _seed(pool, rows, seed)
+            
+            # 关闭并重建连接池，让冷启动查询从空页缓存开始
+            pool.close_all()
+            pool = SQLiteConnectionPool(db_path, max_connections=2, profile=profile)
+            
+            def list_page():
+                with pool.get_connection() as conn:
+                    conn.execute(LIST_QUERY, (workspace_id, 10000, 0)).fetchall()
+            
+            def list_deep_page():
+                with pool.get_connection() as conn:
+                    conn.execute(LIST_QUERY, (workspace_id, 10000, rows // 2)).fetchall()
+            
+            def aggregate():
+                with pool.get_connection() as conn:
+                    conn.execute(AGGREGATE_QUERY, (workspace_id,)).fetchall()
+            
+            return {
+                "list page_size=10000": _time(list_page, iterations),
+                "list deep page": _time(list_deep_page, iterations),
+                "aggregate by product": _time(aggregate, iterations),
+            }
+        finally:
+            pool.close_all()
+
+
+def main(argv: List[str] = None):
+    parser = argparse.ArgumentParser(description="SQLite 性能配置档基准测试")
+    parser.add_argument("--rows", type=int, default=200000, help="销售记录行数")
+    parser.add_argument("--iterations", type=int, default=20, help="每个查询的重复次数")
+    parser.add_argument("--seed", type=int, default=42, help="随机数种子")
+    parser.add_argument(
+        "--profiles", nargs="+", default=list(PERFORMANCE_PROFILES),
+        choices=list(PERFORMANCE_PROFILES), help="要测试的配置档"
+    )
+    args = parser.parse_args(argv)
+    
+    logging.getLogger("server").setLevel(logging.WARNING)
+    print(f"rows={args.rows} iterations={args.iterations}")
+    print(f"{'profile':<12} {'query':<24} {'cold ms':>10} {'median ms':>10} {'p95 ms':>10}")
+    for profile in args.profiles:
+        results = run_profile(profile, args.rows, args.iterations, args.seed)
+        for query, timing in results.items():
+            print(
+                f"{profile:<12} {query:<24} "
+                f"{timing['cold']:>10.1f} {timing['median']:>10.1f} {timing['p95']:>10.1f}"
+            )
+
+
+if __name__ == "__main__":
+    main()
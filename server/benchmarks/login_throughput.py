@@ -0,0 +1,142 @@
+"""
+登录吞吐量基准测试
+在临时数据库上并发调用 /api/auth/login，同时每 10ms 请求一次 / 测量事件循环的响应延迟，
+对比 bcrypt 在事件循环中同步执行（inline）和在密码哈希线程池中执行（pool）两种方式
+
+用法（在项目根目录执行）：
+    python -m server.benchmarks.login_throughput
+    python -m server.benchmarks.login_throughput --requests 400 --concurrency 64 --workers 4 --queue 8
+"""
+
+import argparse
+import asyncio
+import logging
+import os
+import tempfile
+import time
+from typing import Dict, List
+
+USER_COUNT = 8
+PASSWORD = "bench-password"
+PROBE_INTERVAL = 0.01
+
+
+def _percentile(values: List[float], pct: float) -> float:
+    if not values:
+        return 0.0
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * pct))]
+
+
+async def _probe(client, stop: asyncio.Event, latencies: List[float]):
+    """每 PROBE_INTERVAL 秒请求一次 /，记录响应耗时（毫秒）"""
+    while not stop.is_set():
+        start = time.perf_counter()
+        await client.get("/")
+        latencies.append((time.perf_counter() - start) * 1000)
+        await asyncio.sleep(PROBE_INTERVAL)
+
+
+async def _run_mode(client, mode: str, requests: int, concurrency: int, workers: int, queue: int) -> Dict:
+    from server.services.password_hasher import init_password_hasher
+
+    hasher = init_password_hasher(max_workers=workers, max_queue=queue)
+    if mode == "inline":
+        # 改造前的行为：在事件循环中直接调用 bcrypt
+        async def _inline(func, *args):
+            return func(*args)
+        hasher.run = _inline
+
+    statuses: Dict[int, int] = {}
+    login_latencies: List[float] = []
+    probe_latencies: List[float] = []
+    counter = iter(range(requests))
+
+    async def _worker():
+        for i in counter:
+            start = time.perf_counter()
+            response = await client.post(
+                "/api/auth/login",
+                json={"username": f"bench{i % USER_COUNT}", "password": PASSWORD}
+            )
+            login_latencies.append((time.perf_counter() - start) * 1000)
+            statuses[response.status_code] = statuses.get(response.status_code, 0) + 1
+
+    stop = asyncio.Event()
+    probe_task = asyncio.create_task(_probe(client, stop, probe_latencies))
+    start = time.perf_counter()
+    await asyncio.gather(*(_worker() for _ in range(concurrency)))
+    elapsed = time.perf_counter() - start
+    stop.set()
+    await probe_task
+
+    return {
+        'mode': mode,
+        'elapsed': elapsed,
+        'ok': statuses.get(200, 0),
+        'rejected': statuses.get(429, 0),
+        'other': sum(n for code, n in statuses.items() if code not in (200, 429)),
+        'login_p50': _percentile(login_latencies, 0.5),
+        'login_p95': _percentile(login_latencies, 0.95),
+        'probe_p50': _percentile(probe_latencies, 0.5),
+        'probe_max': max(probe_latencies, default=0.0),
+    }
+
+
+async def _main(args):
+    import httpx
+    from server.main import app
+
+    async with app.router.lifespan_context(app):
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+            for i in range(USER_COUNT):
+                response = await client.post(
+                    "/api/auth/register",
+                    json={"username": f"bench{i}", "password": PASSWORD}
+                )
+                response.raise_for_status()
+
+            results = []
+            for mode in args.modes:
+                results.append(await _run_mode(
+                    client, mode, args.requests, args.concurrency, args.workers, args.queue
+                ))
+
+    print(
+        f"\n{args.requests} 次登录, 并发 {args.concurrency}, "
+        f"线程池并发 {args.workers}, 排队上限 {args.queue}\n"
+    )
+    print(
+        f"{'方式':<8}{'登录/秒':>10}{'成功':>7}{'429':>7}{'其他':>7}"
+        f"{'登录P50(ms)':>14}{'登录P95(ms)':>14}{'探测P50(ms)':>14}{'探测最大(ms)':>15}"
+    )
+    for r in results:
+        print(
+            f"{r['mode']:<10}{r['ok'] / r['elapsed']:>10.1f}{r['ok']:>7}{r['rejected']:>7}{r['other']:>7}"
+            f"{r['login_p50']:>14.1f}{r['login_p95']:>14.1f}{r['probe_p50']:>14.1f}{r['probe_max']:>15.1f}"
+        )
+
+
+def main():
+    parser = argparse.ArgumentParser(description="登录吞吐量基准测试")
+    parser.add_argument("--requests", type=int, default=200, help="登录请求总数")
+    parser.add_argument("--concurrency", type=int, default=16, help="并发客户端数")
+    parser.add_argument("--workers", type=int, default=min(4, os.cpu_count() or 1), help="密码哈希线程数")
+    parser.add_argument("--queue", type=int, default=32, help="密码哈希排队上限")
+    parser.add_argument(
+        "--modes", nargs="+", choices=["inline", "pool"], default=["inline", "pool"],
+        help="要测试的方式"
+    )
+    args = parser.parse_args()
+
+    logging.getLogger("server").setLevel(logging.ERROR)
+    logging.getLogger("httpx").setLevel(logging.WARNING)
+    with tempfile.TemporaryDirectory() as tmp:
+        # server.main 在导入时读取环境变量
+        os.environ["DB_PATH"] = os.path.join(tmp, "bench.db")
+        asyncio.run(_main(args))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,109 @@
+"""
+中间件开销基准测试
+在临时数据库上用进程内 ASGI 客户端请求 /health 和 /api/products，统计每秒请求数和延迟；
+--bare 去掉所有用户中间件，作为无中间件时的上限参考
+
+用法（在项目根目录执行）：
+    python -m server.benchmarks.middleware_rps
+    python -m server.benchmarks.middleware_rps --requests 5000 --concurrency 16
+    python -m server.benchmarks.middleware_rps --bare
+"""
+
+import argparse
+import asyncio
+import logging
+import os
+import tempfile
+import time
+from typing import List
+
+PRODUCT_COUNT = 50
+
+
+def _percentile(values: List[float], pct: float) -> float:
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * pct))]
+
+
+async def _measure(client, path: str, headers: dict, requests: int, concurrency: int) -> dict:
+    latencies: List[float] = []
+    errors = 0
+    counter = iter(range(requests))
+
+    async def _worker():
+        nonlocal errors
+        for _ in counter:
+            start = time.perf_counter()
+            response = await client.get(path, headers=headers)
+            latencies.append((time.perf_counter() - start) * 1000)
+            if response.status_code != 200:
+                errors += 1
+
+    start = time.perf_counter()
+    await asyncio.gather(*(_worker() for _ in range(concurrency)))
+    elapsed = time.perf_counter() - start
+    return {
+        'path': path,
+        'rps': requests / elapsed,
+        'p50': _percentile(latencies, 0.5),
+        'p99': _percentile(latencies, 0.99),
+        'errors': errors,
+    }
+
+
+async def _main(args):
+    import httpx
+    from server.main import app
+
+    if args.bare:
+        app.user_middleware.clear()
+        app.middleware_stack = None
+
+    async with app.router.lifespan_context(app):
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+            response = await client.post(
+                "/api/auth/register", json={"username": "bench", "password": "bench-password"}
+            )
+            token = response.json()["data"]["token"]
+            headers = {"Authorization": f"Bearer {token}", "Accept-Encoding": "gzip"}
+            response = await client.post(
+                "/api/workspaces", headers=headers, json={"name": "bench", "storage_type": "server"}
+            )
+            headers["X-Workspace-ID"] = str(response.json()["data"]["id"])
+            for i in range(PRODUCT_COUNT):
+                await client.post(
+                    "/api/products", headers=headers,
+                    json={"name": f"产品{i:03d}", "stock": 100, "unit": "袋"}
+                )
+
+            results = []
+            for path in ("/health", "/api/products?page_size=20"):
+                # 预热
+                await _measure(client, path, headers, min(200, args.requests), args.concurrency)
+                results.append(await _measure(client, path, headers, args.requests, args.concurrency))
+
+    print(f"\n{args.requests} 次请求, 并发 {args.concurrency}{'（无中间件）' if args.bare else ''}\n")
+    print(f"{'路径':<30}{'请求/秒':>10}{'P50(ms)':>10}{'P99(ms)':>10}{'非200':>8}")
+    for r in results:
+        print(f"{r['path']:<32}{r['rps']:>10.1f}{r['p50']:>10.2f}{r['p99']:>10.2f}{r['errors']:>8}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="中间件开销基准测试")
+    parser.add_argument("--requests", type=int, default=2000, help="每个路径的请求数")
+    parser.add_argument("--concurrency", type=int, default=8, help="并发客户端数")
+    parser.add_argument("--bare", action="store_true", help="去掉所有用户中间件")
+    args = parser.parse_args()
+
+    logging.getLogger("server").setLevel(logging.ERROR)
+    logging.getLogger("httpx").setLevel(logging.WARNING)
+    with tempfile.TemporaryDirectory() as tmp:
+        # server.main 在导入时读取环境变量；基准测试不受速率限制
+        os.environ["DB_PATH"] = os.path.join(tmp, "bench.db")
+        os.environ["RATE_LIMIT_ENABLED"] = "false"
+        asyncio.run(_main(args))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,647 @@
+"""
+查询计划检查与索引建议
+路由按筛选参数动态拼接 SQL，新增一个筛选条件就可能悄悄引入整表扫描。本脚本在生成的大数据量临时数据库上：
+
+- 按 ENDPOINTS 枚举各列表接口的筛选参数组合（每个组合再分别请求首页、include_total、游标翻页和页码翻页），
+  通过查询计时钩子记录路由实际执行的每条 SQL，按查询形状（规范化 SQL）去重
+- 对每种查询形状执行 EXPLAIN QUERY PLAN，标记整表扫描（SCAN）和临时排序（USE TEMP B-TREE），
+  按 WHERE / ORDER BY 给出建议的索引，并在回滚的事务中建索引验证建议是否消除了问题
+- 检查所有外键列是否有以该列开头的索引（删除被引用的行时 ON DELETE SET NULL / CASCADE 按外键列查找）
+
+--check 只检查 HOT_QUERIES 中的热点查询和 migrations 中声明的列表 / 外键索引，
+任何一条不再使用预期的索引（或出现整表扫描、临时排序）时以状态码 1 退出，可以放在 CI 中执行
+
+用法（在项目根目录执行）：
+    python -m server.benchmarks.query_plans
+    python -m server.benchmarks.query_plans --rows 200000 --only sales customers
+    python -m server.benchmarks.query_plans --check
+"""
+
+import argparse
+import asyncio
+import itertools
+import logging
+import os
+import random
+import re
+import sqlite3
+import sys
+import tempfile
+from dataclasses import dataclass, field
+from typing import Any, Dict, List, Optional, Tuple
+
+from server.services.slow_query_log import fingerprint, format_plan, normalize_sql
+
+WORKSPACE_COUNT = 4
+PRODUCT_COUNT = 300
+PARTY_COUNT = 500  # 每个 workspace 的客户 / 供应商 / 员工数
+PASSWORD = "bench-password"
+
+# 只分析这些语句（INSERT 和事务控制语句的执行计划没有参考价值）
+_EXPLAINABLE = ("SELECT", "WITH", "UPDATE", "DELETE")
+
+
+@dataclass(frozen=True)
+class ListEndpoint:
+    """
+    列表接口及其筛选参数
+
+    Attributes:
+        path: 接口路径
+        filters: 筛选参数 -> 可选值（每个组合中每个参数取其中一个值或不传；"$customer" 等占位符在生成数据后替换为实际 ID）
+        params: 每次都传的参数（必填参数）
+    """
+    path: str
+    filters: Dict[str, Tuple[Any, ...]] = field(default_factory=dict)
+    params: Dict[str, Any] = field(default_factory=dict)
+
+
+_DATE_FILTERS = {"start_date": ("2024-03-01",), "end_date": ("2024-03-31",)}
+
+# 要枚举的列表接口
+ENDPOINTS: Dict[str, ListEndpoint] = {
+    "sales": ListEndpoint("/api/sales", {"search": ("产品01",), **_DATE_FILTERS, "customer_id": ("$customer", 0)}),
+    "purchases": ListEndpoint("/api/purchases", {"search": ("产品01",), **_DATE_FILTERS, "supplier_id": ("$supplier", 0)}),
+    "returns": ListEndpoint("/api/returns", {"search": ("产品01",), **_DATE_FILTERS, "customer_id": ("$customer", 0)}),
+    "income": ListEndpoint("/api/income", {"search": ("备注",), **_DATE_FILTERS, "customer_id": ("$customer",)}),
+    "remittance": ListEndpoint("/api/remittance", {"search": ("备注",), **_DATE_FILTERS, "supplier_id": ("$supplier",)}),
+    "products": ListEndpoint("/api/products", {"search": ("产品01",), "supplier_id": ("$supplier",)}),
+    "customers": ListEndpoint("/api/customers", {"search": ("客户01",)}),
+    "suppliers": ListEndpoint("/api/suppliers", {"search": ("供应商01",)}),
+    "employees": ListEndpoint("/api/employees", {"search": ("员工01",)}),
+    "audit-logs": ListEndpoint("/api/audit-logs", {
+        "operation_type": ("CREATE",),
+        "entity_type": ("sale",),
+        "start_time": ("2024-03-01T00:00:00",),
+        "end_time": ("2024-03-31T23:59:59",),
+        "search": ("产品01",),
+    }),
+    "customers-all": ListEndpoint("/api/customers/all"),
+    "products-search": ListEndpoint("/api/products/search/all", params={"search": "产品01"}),
+    "customers-search": ListEndpoint("/api/customers/search/all", params={"search": "客户01"}),
+}
+
+
+@dataclass(frozen=True)
+class HotQuery:
+    """
+    热点查询（--check 模式检查）
+
+    Attributes:
+        name: 名称
+        path: 接口路径
+        table: 检查该请求中读取这个表的语句
+        params: 查询参数（"$customer" 等占位符同 ListEndpoint）
+        indexes: 可接受的索引（为空时只要求不出现整表扫描）
+        allow_sort: 是否允许临时排序（日期范围等由规划器在范围扫描和有序扫描之间选择的查询）
+        cursor: 先请求首页，检查用 next_cursor 翻到的第二页
+        method: HTTP 方法
+        json: 请求体
+    """
+    name: str
+    path: str
+    table: str
+    params: Dict[str, Any] = field(default_factory=dict)
+    indexes: Tuple[str, ...] = ()
+    allow_sort: bool = False
+    cursor: bool = False
+    method: str = "GET"
+    json: Optional[Dict[str, Any]] = None
+
+
+def _list_hot_queries(name: str, table: str, foreign_key: Optional[Tuple[str, str]] = None) -> List[HotQuery]:
+    """列表接口的首页、游标翻页和（可选的）按外键筛选"""
+    list_index = f"idx_{table}_workspace_list"
+    queries = [
+        HotQuery(f"{name}列表", f"/api/{table}", table, indexes=(list_index,)),
+        HotQuery(f"{name}列表（游标翻页）", f"/api/{table}", table, indexes=(list_index,), cursor=True),
+    ]
+    if foreign_key is not None:
+        param, column = foreign_key
+        # 外键 ID 全局唯一：规划器可以选外键索引（按外键定位后有序读取）或列表索引（有序读取并过滤）
+        queries.append(HotQuery(
+            f"{name}列表按 {param} 筛选", f"/api/{table}", table,
+            params={param: f"${param.split('_')[0]}"}, indexes=(f"idx_{table}_{column}", list_index)
+        ))
+    return queries
+
+
+HOT_QUERIES: List[HotQuery] = [
+    *_list_hot_queries("销售", "sales", ("customer_id", "customerId")),
+    *_list_hot_queries("进货", "purchases", ("supplier_id", "supplierId")),
+    *_list_hot_queries("退货", "returns", ("customer_id", "customerId")),
+    *_list_hot_queries("进账", "income", ("customer_id", "customerId")),
+    *_list_hot_queries("汇款", "remittance", ("supplier_id", "supplierId")),
+    *_list_hot_queries("产品", "products", ("supplier_id", "supplierId")),
+    *_list_hot_queries("客户", "customers"),
+    *_list_hot_queries("供应商", "suppliers"),
+    *_list_hot_queries("员工", "employees"),
+    HotQuery(
+        "销售列表按日期筛选", "/api/sales", "sales", params=dict(start_date="2024-03-01", end_date="2024-03-31"),
+        indexes=("idx_sales_workspace_day", "idx_sales_workspace_list"), allow_sort=True
+    ),
+    HotQuery("操作日志列表", "/api/audit-logs", "operation_logs", indexes=("idx_logs_workspace_time",)),
+    HotQuery("操作日志列表（游标翻页）", "/api/audit-logs", "operation_logs", indexes=("idx_logs_workspace_time",), cursor=True),
+    # 创建销售记录时按名称查找产品并扣减库存
+    HotQuery(
+        "创建销售记录（按名称查找产品）", "/api/sales", "products", method="POST",
+        json={"productName": "产品001", "quantity": 1, "saleDate": "2024-06-01T10:00:00"}
+    ),
+]
+
+
+# ==================== 生成数据 ====================
+
+def _seed(db_path: str, owner_id: int, api_workspace_id: int, rows: int, seed: int) -> Dict[str, int]:
+    """
+    写入测试数据：api_workspace_id 之外再建几个 workspace，让 workspaceId 条件有真实的选择性
+
+    Returns:
+        占位符 -> API 所用 workspace 中的实际 ID（$customer / $supplier / $employee）
+    """
+    rng = random.Random(seed)
+    conn = sqlite3.connect(db_path)
+    conn.execute("PRAGMA foreign_keys = ON")
+    workspace_ids = [api_workspace_id]
+    for i in range(1, WORKSPACE_COUNT):
+        workspace_ids.append(conn.execute(
+            "INSERT INTO workspaces (name, ownerId, storage_type) VALUES (?, ?, 'server')",
+            (f"bench{i}", owner_id)
+        ).lastrowid)
+
+    def _date(nullable: bool) -> Optional[str]:
+        if nullable and rng.random() < 0.05:
+            return None
+        return f"2024-{rng.randint(1, 12):02d}-{rng.randint(1, 28):02d}T{rng.randint(0, 23):02d}:00:00"
+
+    ids: Dict[str, int] = {}
+    per_workspace = max(rows // WORKSPACE_COUNT, 1)
+    for workspace_id in workspace_ids:
+        parties = {}
+        for table, label in (("customers", "客户"), ("suppliers", "供应商"), ("employees", "员工")):
+            conn.executemany(
+                f"INSERT INTO {table} (userId, workspaceId, name, updated_at) VALUES (?, ?, ?, ?)",
+                [(owner_id, workspace_id, f"{label}{i:03d}", _date(False)) for i in range(PARTY_COUNT)]
+            )
+            parties[table] = [row[0] for row in conn.execute(
+                f"SELECT id FROM {table} WHERE workspaceId = ?", (workspace_id,)
+            )]
+        conn.executemany(
+            "INSERT INTO products (userId, workspaceId, name, stock, unit, supplierId, updated_at) "
+            "VALUES (?, ?, ?, 1000000, '袋', ?, ?)",
+            [
+                (owner_id, workspace_id, f"产品{i:03d}", rng.choice(parties["suppliers"]), _date(False))
+                for i in range(PRODUCT_COUNT)
+            ]
+        )
+        if workspace_id == api_workspace_id:
+            ids = {
+                "$customer": parties["customers"][0],
+                "$supplier": parties["suppliers"][0],
+                "$employee": parties["employees"][0],
+            }
+
+        def _product() -> str:
+            return f"产品{rng.randrange(PRODUCT_COUNT):03d}"
+
+        conn.executemany(
+            "INSERT INTO sales (userId, workspaceId, productName, quantity, customerId, saleDate, totalSalePrice) "
+            "VALUES (?, ?, ?, 1, ?, ?, 10)",
+            [(owner_id, workspace_id, _product(), rng.choice(parties["customers"]), _date(True)) for _ in range(per_workspace)]
+        )
+        conn.executemany(
+            "INSERT INTO purchases (userId, workspaceId, productName, quantity, supplierId, purchaseDate, totalPurchasePrice) "
+            "VALUES (?, ?, ?, 1, ?, ?, 10)",
+            [(owner_id, workspace_id, _product(), rng.choice(parties["suppliers"]), _date(True)) for _ in range(per_workspace)]
+        )
+        conn.executemany(
+            "INSERT INTO returns (userId, workspaceId, productName, quantity, customerId, returnDate, totalReturnPrice) "
+            "VALUES (?, ?, ?, 1, ?, ?, 10)",
+            [(owner_id, workspace_id, _product(), rng.choice(parties["customers"]), _date(True)) for _ in range(per_workspace // 10)]
+        )
+        conn.executemany(
+            "INSERT INTO income (userId, workspaceId, incomeDate, customerId, amount, employeeId, paymentMethod, note) "
+            "VALUES (?, ?, ?, ?, 10, ?, '现金', '备注')",
+            [
+                (owner_id, workspace_id, _date(False), rng.choice(parties["customers"]), rng.choice(parties["employees"]))
+                for _ in range(per_workspace // 2)
+            ]
+        )
+        conn.executemany(
+            "INSERT INTO remittance (userId, workspaceId, remittanceDate, supplierId, amount, employeeId, paymentMethod, note) "
+            "VALUES (?, ?, ?, ?, 10, ?, '现金', '备注')",
+            [
+                (owner_id, workspace_id, _date(False), rng.choice(parties["suppliers"]), rng.choice(parties["employees"]))
+                for _ in range(per_workspace // 2)
+            ]
+        )
+        conn.executemany(
+            "INSERT INTO operation_logs (userId, workspaceId, username, operation_type, entity_type, entity_name, operation_time) "
+            "VALUES (?, ?, 'bench', ?, ?, ?, ?)",
+            [
+                (
+                    owner_id, workspace_id, rng.choice(("CREATE", "UPDATE", "DELETE")),
+                    rng.choice(("sale", "purchase", "product")), _product(), _date(False).replace("T", " ")
+                )
+                for _ in range(per_workspace)
+            ]
+        )
+        conn.commit()
+
+    # 生产环境由后台维护任务执行 PRAGMA optimize；有统计信息时规划器的选择才和线上一致
+    conn.execute("ANALYZE")
+    conn.commit()
+    conn.close()
+    return ids
+
+
+# ==================== 记录 SQL ====================
+
+class _StatementRecorder:
+    """查询计时钩子（阈值为 0，记录所有语句），见 server.database.set_query_tracer"""
+
+    threshold = 0.0
+
+    def __init__(self):
+        self.statements: List[Tuple[str, Any]] = []
+
+    def submit(self, sql: str, params, duration: float, rows: int):
+        self.statements.append((sql, params))
+
+    def take(self) -> List[Tuple[str, Any]]:
+        statements, self.statements = self.statements, []
+        return statements
+
+
+def _resolve(params: Dict[str, Any], ids: Dict[str, int]) -> Dict[str, Any]:
+    return {key: ids.get(value, value) if isinstance(value, str) else value for key, value in params.items()}
+
+
+async def _request(client, headers, method: str, path: str, params=None, json=None) -> dict:
+    response = await client.request(method, path, headers=headers, params=params, json=json)
+    if response.status_code >= 400:
+        raise RuntimeError(f"{method} {path} {params or ''} 返回 {response.status_code}: {response.text[:200]}")
+    return response.json().get("data") or {}
+
+
+# ==================== 执行计划分析 ====================
+
+@dataclass
+class Shape:
+    """一种查询形状（规范化 SQL 相同的语句）"""
+    key: str
+    sql: str
+    params: Any
+    sources: List[str] = field(default_factory=list)
+    plan: Optional[List[str]] = None
+    problems: List[str] = field(default_factory=list)
+    suggestion: Optional[str] = None
+    verified: Optional[bool] = None
+    note: Optional[str] = None
+
+
+def explain(conn: sqlite3.Connection, sql: str, params) -> Optional[List[str]]:
+    """EXPLAIN QUERY PLAN（参数无法绑定等情况返回 None）"""
+    try:
+        return format_plan(conn.execute(f"EXPLAIN QUERY PLAN {sql}", params or ()).fetchall())
+    except sqlite3.Error:
+        return None
+
+
+def plan_problems(plan: List[str]) -> List[str]:
+    """执行计划中的整表扫描和临时排序步骤"""
+    problems = []
+    for line in plan:
+        detail = line.strip()
+        # SCAN (subquery-N) 读取的是子查询的中间结果，对应的表扫描另有一行
+        if detail.startswith("SCAN ") and " USING " not in detail and not detail.startswith(("SCAN CONSTANT", "SCAN (")):
+            problems.append(detail)
+        elif detail.startswith("USE TEMP B-TREE"):
+            problems.append(detail)
+    return problems
+
+
+_WHERE = re.compile(r"\bWHERE\b(.*?)(?:\bGROUP BY\b|\bORDER BY\b|\bLIMIT\b|$)", re.IGNORECASE | re.DOTALL)
+_ORDER_BY = re.compile(r"\bORDER BY\b(.*?)(?:\bLIMIT\b|$)", re.IGNORECASE | re.DOTALL)
+_EQUALITY = re.compile(r"(?:\w+\.)?(\w+)\s*(?:=\s*\?|IS\s+NULL\b)", re.IGNORECASE)
+_RANGE = re.compile(
+    r"(date\(\s*\w+\s*\)|(?:\w+\.)?\w+)\s*(?:<=|>=|<|>)\s*(?:\?|date\(|datetime\()|(date\(\s*\w+\s*\)|(?:\w+\.)?\w+)\s+BETWEEN\b"
+    r"|\(\s*(\w+)\s*,[\w\s,]*\)\s*[<>]=?\s*\(",
+    re.IGNORECASE
+)
+
+
+def _table_columns(conn: sqlite3.Connection, table: str) -> List[str]:
+    return [row[1] for row in conn.execute(f"PRAGMA table_info({table})").fetchall()]
+
+
+def suggest_index(conn: sqlite3.Connection, sql: str, table: str) -> Optional[str]:
+    """
+    按 WHERE 的等值条件、范围条件和 ORDER BY 给出索引建议（启发式）：
+    等值列在前；没有范围条件或范围列就是第一个排序列时接排序列（避免临时排序），否则接范围列
+    """
+    columns = _table_columns(conn, table)
+    if not columns:
+        return None
+    where_match = _WHERE.search(sql)
+    where = where_match.group(1) if where_match else ""
+    order_match = _ORDER_BY.search(sql)
+
+    def _column(term: str) -> Optional[str]:
+        term = term.split(".")[-1].strip()
+        inner = re.fullmatch(r"date\(\s*(\w+)\s*\)", term, re.IGNORECASE)
+        name = inner.group(1) if inner else term
+        return term if name in columns else None
+
+    terms: List[str] = []
+    for name in _EQUALITY.findall(where):
+        column = _column(name)
+        if column and column not in terms:
+            terms.append(column)
+    # workspaceId 是几乎所有业务查询的第一个条件
+    if "workspaceId" in terms:
+        terms.remove("workspaceId")
+        terms.insert(0, "workspaceId")
+
+    ranges = [_column(next(group for group in groups if group)) for groups in _RANGE.findall(where)]
+    ranges = [column for column in ranges if column and column not in terms]
+
+    order: List[str] = []
+    if order_match:
+        for item in order_match.group(1).split(","):
+            parts = item.split()
+            column = _column(parts[0]) if parts else None
+            if column is None:
+                order = []
+                break
+            descending = len(parts) > 1 and parts[1].upper() == "DESC"
+            order.append((column, descending))
+    if order and (not ranges or ranges[0] == order[0][0]):
+        # 全部同向时索引可以反向扫描，只有混合方向才需要在索引中写明 DESC
+        mixed = len({descending for _, descending in order}) > 1
+        terms += [f"{column} DESC" if mixed and descending else column for column, descending in order if column not in terms]
+    elif ranges:
+        terms.append(ranges[0])
+    if not terms:
+        return None
+    name = "_".join(re.sub(r"\W+", "", term.replace(" DESC", "")) for term in terms)
+    return f"CREATE INDEX idx_{table}_{name} ON {table}({', '.join(terms)})"
+
+
+_PLAN_TABLE = re.compile(r"^(?:SCAN|SEARCH) (\w+)")
+
+
+def _verify_suggestion(conn: sqlite3.Connection, shape: Shape) -> bool:
+    """在回滚的事务中创建建议的索引，检查问题步骤是否消失"""
+    try:
+        conn.execute("BEGIN")
+        conn.execute(shape.suggestion)
+        plan = explain(conn, shape.sql, shape.params)
+    except sqlite3.Error:
+        return False
+    finally:
+        conn.execute("ROLLBACK")
+    return plan is not None and len(plan_problems(plan)) < len(shape.problems)
+
+
+def analyze_shapes(conn: sqlite3.Connection, shapes: Dict[str, Shape]):
+    """为每种查询形状获取执行计划、标记问题并给出索引建议"""
+    for shape in shapes.values():
+        shape.plan = explain(conn, shape.sql, shape.params)
+        if shape.plan is None:
+            continue
+        shape.problems = plan_problems(shape.plan)
+        if not shape.problems:
+            continue
+        tables = [m.group(1) for m in (_PLAN_TABLE.match(p) for p in shape.problems) if m]
+        table = tables[0] if tables else None
+        if table is None:
+            # 只有临时排序：按第一个被读取的表给建议
+            matches = [_PLAN_TABLE.match(line.strip()) for line in shape.plan]
+            table = next((m.group(1) for m in matches if m), None)
+        if table is not None:
+            shape.suggestion = suggest_index(conn, shape.sql, table)
+            if shape.suggestion:
+                shape.verified = _verify_suggestion(conn, shape)
+        if not shape.verified:
+            shape.note = _explain_remaining(shape)
+
+
+def _explain_remaining(shape: Shape) -> Optional[str]:
+    """建议的索引无法消除问题时，说明常见的原因"""
+    if any(line.strip() == "MULTI-INDEX OR" for line in shape.plan):
+        return "OR 条件按各分支分别查找后合并，合并后的结果只能再排序；匹配行较少时可以接受，否则改写为 UNION ALL"
+    where_match = _WHERE.search(shape.sql)
+    if where_match and _RANGE.search(where_match.group(1)) and _ORDER_BY.search(shape.sql):
+        return "范围条件与排序列不同，一个索引只能满足其中之一；规划器按统计信息在范围扫描后排序和按序扫描后过滤之间选择"
+    return None
+
+
+def unindexed_foreign_keys(conn: sqlite3.Connection) -> List[Tuple[str, str, str]]:
+    """
+    没有以外键列开头的索引的外键
+
+    Returns:
+        [(表, 外键列, 被引用的表), ...]
+    """
+    result = []
+    tables = [row[0] for row in conn.execute(
+        "SELECT name FROM sqlite_master WHERE type = 'table' AND name NOT LIKE 'sqlite_%'"
+    )]
+    for table in tables:
+        leading = {
+            conn.execute(f"PRAGMA index_info({index[1]})").fetchone()[2]
+            for index in conn.execute(f"PRAGMA index_list({table})").fetchall()
+        }
+        # INTEGER PRIMARY KEY 之外的主键也会出现在 index_list 中（sqlite_autoindex_*）
+        for fk in conn.execute(f"PRAGMA foreign_key_list({table})").fetchall():
+            if fk[3] not in leading:
+                result.append((table, fk[3], fk[2]))
+    return result
+
+
+# ==================== 报告 ====================
+
+async def _collect_shapes(client, headers, recorder: _StatementRecorder, ids, only: Optional[List[str]]) -> Dict[str, Shape]:
+    """按 ENDPOINTS 枚举筛选组合并记录执行的 SQL"""
+    shapes: Dict[str, Shape] = {}
+
+    def _record(source: str):
+        for sql, params in recorder.take():
+            if not sql.lstrip().upper().startswith(_EXPLAINABLE):
+                continue
+            normalized = normalize_sql(sql)
+            key = fingerprint(normalized)
+            shape = shapes.get(key)
+            if shape is None:
+                shape = shapes[key] = Shape(key, sql, params)
+            if len(shape.sources) < 3:
+                shape.sources.append(source)
+
+    for name, endpoint in ENDPOINTS.items():
+        if only and name not in only:
+            continue
+        names = list(endpoint.filters)
+        choices = [(None, *endpoint.filters[n]) for n in names]
+        for combination in itertools.product(*choices):
+            filters = _resolve({**endpoint.params, **{n: v for n, v in zip(names, combination) if v is not None}}, ids)
+            label = f"{endpoint.path}?{'&'.join(f'{k}={v}' for k, v in filters.items())}"
+            recorder.take()
+            first = await _request(client, headers, "GET", endpoint.path, {**filters, "page_size": 20})
+            _record(label)
+            await _request(client, headers, "GET", endpoint.path, {**filters, "page_size": 20, "include_total": "true"})
+            _record(f"{label} [include_total]")
+            if first.get("next_cursor"):
+                await _request(client, headers, "GET", endpoint.path, {
+                    **filters, "page_size": 20, "cursor": first["next_cursor"], "include_total": "true"
+                })
+                _record(f"{label} [cursor]")
+            if "page" in first:
+                await _request(client, headers, "GET", endpoint.path, {**filters, "page_size": 20, "page": 3})
+                _record(f"{label} [page=3]")
+    return shapes
+
+
+def _print_report(shapes: Dict[str, Shape], foreign_keys: List[Tuple[str, str, str]], verbose: bool):
+    flagged = [shape for shape in shapes.values() if shape.problems]
+    print(f"\n共 {len(shapes)} 种查询形状，{len(flagged)} 种有整表扫描或临时排序\n")
+    for shape in (shapes.values() if verbose else flagged):
+        print(f"[{shape.key}] {normalize_sql(shape.sql)[:300]}")
+        for source in shape.sources:
+            print(f"    来源: {source}")
+        for line in shape.plan or ["(无法获取执行计划)"]:
+            print(f"    {line}")
+        for problem in shape.problems:
+            print(f"    !! {problem}")
+        if shape.suggestion:
+            result = "已验证可消除" if shape.verified else "未能消除，需要人工分析"
+            print(f"    建议: {shape.suggestion};  ({result})")
+        if shape.note:
+            print(f"    说明: {shape.note}")
+        print()
+    if foreign_keys:
+        print("没有索引的外键（删除被引用的行时需要扫描整个表）:")
+        for table, column, parent in foreign_keys:
+            print(f"    {table}.{column} -> {parent}:  CREATE INDEX idx_{table}_{column} ON {table}({column});")
+    else:
+        print("所有外键都有索引")
+
+
+# ==================== 检查模式 ====================
+
+def _check_declared_indexes(conn: sqlite3.Connection) -> List[str]:
+    """migrations 中声明的列表 / 外键索引必须存在"""
+    from server.migrations import LIST_INDEXES, FOREIGN_KEY_INDEXES, DATED_TABLES
+
+    expected = [f"idx_{table}_workspace_list" for table in LIST_INDEXES]
+    expected += [f"idx_{table}_workspace_day" for table in DATED_TABLES]
+    expected += [f"idx_{table}_{column}" for table, column, _ in FOREIGN_KEY_INDEXES]
+    existing = {row[0] for row in conn.execute("SELECT name FROM sqlite_master WHERE type = 'index'")}
+    return [f"缺少索引 {name}" for name in expected if name not in existing]
+
+
+async def _check_hot_queries(client, headers, recorder: _StatementRecorder, ids, conn: sqlite3.Connection) -> List[str]:
+    failures = []
+    for hot in HOT_QUERIES:
+        params = _resolve(hot.params, ids)
+        if hot.cursor:
+            first = await _request(client, headers, "GET", hot.path, {**params, "page_size": 20})
+            params = {**params, "cursor": first.get("next_cursor")}
+        recorder.take()
+        await _request(client, headers, hot.method, hot.path, params or None, hot.json)
+        table_pattern = re.compile(rf"\b(FROM|UPDATE|JOIN)\s+{hot.table}\b", re.IGNORECASE)
+        index_pattern = re.compile(rf"SEARCH {hot.table} USING (COVERING )?INDEX ({'|'.join(hot.indexes) or '[^ ]+'})\b")
+        statements = [
+            (sql, p) for sql, p in recorder.take()
+            if sql.lstrip().upper().startswith(_EXPLAINABLE) and table_pattern.search(sql)
+        ]
+        problems = []
+        used = False
+        for sql, p in statements:
+            plan = explain(conn, sql, p) or []
+            for line in plan:
+                detail = line.strip()
+                if re.match(rf"SCAN {hot.table}\b", detail) and " USING " not in detail:
+                    problems.append(f"整表扫描: {detail}")
+                elif detail.startswith("USE TEMP B-TREE FOR ORDER BY") and not hot.allow_sort:
+                    problems.append(f"临时排序: {normalize_sql(sql)[:120]}")
+                elif index_pattern.match(detail):
+                    used = True
+        if not statements:
+            problems.append("没有执行读取该表的语句")
+        elif not used:
+            expected = " / ".join(hot.indexes) if hot.indexes else "任意索引"
+            problems.append(f"没有使用预期的索引（{expected}）")
+        status = "FAIL" if problems else "ok"
+        print(f"{status:<5} {hot.name}")
+        for problem in problems:
+            print(f"      {problem}")
+            failures.append(f"{hot.name}: {problem}")
+    return failures
+
+
+# ==================== 入口 ====================
+
+async def _main(args) -> int:
+    import httpx
+    from server.database import set_query_tracer
+    from server.main import app
+
+    db_path = os.environ["DB_PATH"]
+    recorder = _StatementRecorder()
+    async with app.router.lifespan_context(app):
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=60) as client:
+            response = await client.post("/api/auth/register", json={"username": "bench", "password": PASSWORD})
+            data = response.json()["data"]
+            headers = {"Authorization": f"Bearer {data['token']}"}
+            workspace = await _request(
+                client, headers, "POST", "/api/workspaces", json={"name": "bench", "storage_type": "server"}
+            )
+            headers["X-Workspace-ID"] = str(workspace["id"])
+
+            print(f"生成测试数据（约 {args.rows} 行销售记录）...")
+            ids = _seed(db_path, data["user"]["id"], workspace["id"], args.rows, args.seed)
+
+            conn = sqlite3.connect(db_path, isolation_level=None)
+            set_query_tracer(recorder)
+            try:
+                if args.check:
+                    failures = _check_declared_indexes(conn)
+                    for failure in failures:
+                        print(f"FAIL  {failure}")
+                    failures += await _check_hot_queries(client, headers, recorder, ids, conn)
+                    print(f"\n{len(HOT_QUERIES)} 个热点查询，{len(failures)} 项失败")
+                    return 1 if failures else 0
+
+                shapes = await _collect_shapes(client, headers, recorder, ids, args.only)
+                analyze_shapes(conn, shapes)
+                _print_report(shapes, unindexed_foreign_keys(conn), args.verbose)
+                return 0
+            finally:
+                set_query_tracer(None)
+                conn.close()
+
+
+def main(argv: List[str] = None):
+    parser = argparse.ArgumentParser(description="查询计划检查与索引建议")
+    parser.add_argument("--rows", type=int, default=100000, help="销售记录行数（其他表按比例生成）")
+    parser.add_argument("--seed", type=int, default=42, help="随机数种子")
+    parser.add_argument("--only", nargs="+", choices=list(ENDPOINTS), help="只枚举这些接口")
+    parser.add_argument("--verbose", action="store_true", help="输出所有查询形状（默认只输出有问题的）")
+    parser.add_argument("--check", action="store_true", help="只检查热点查询，有查询不再使用预期的索引时以状态码 1 退出")
+    args = parser.parse_args(argv)
+
+    logging.getLogger("server").setLevel(logging.ERROR)
+    logging.getLogger("httpx").setLevel(logging.WARNING)
+    with tempfile.TemporaryDirectory() as tmp:
+        # server.main 在导入时读取环境变量；大量请求不受速率限制和 SQL 时限影响
+        os.environ["DB_PATH"] = os.path.join(tmp, "bench.db")
+        os.environ["RATE_LIMIT_ENABLED"] = "false"
+        os.environ["QUERY_DEADLINES_MS"] = "interactive=0,report=0,export=0"
+        code = asyncio.run(_main(args))
+    sys.exit(code)
+
+
+if __name__ == "__main__":
+    main()
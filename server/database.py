@@ -7,17 +7,722 @@ import sqlite3
 import threading
 import time
 import logging
-from contextlib import contextmanager
-from queue import Queue, Empty
-from typing import Optional, Callable, Any
+import asyncio
+import contextvars
+from concurrent.futures import ThreadPoolExecutor, Future, wait as wait_futures
+from contextlib import contextmanager, asynccontextmanager
+from collections import deque
+from typing import Optional, Callable, Any, Awaitable, List, Dict
 from pathlib import Path
 import os
+import random
 import sys
 
+from fastapi import HTTPException, status
+
+from server.migrations import migrate
+from server.timing import LatencyHistogram, phase, record, PHASE_DB, PHASE_DB_WAIT
+
 # 配置日志
-logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+# 请求级连接：当前任务通过 acquire() 持有的连接 (pool, task, AsyncConnection, 是否可写)
+# 同一任务内嵌套的 acquire()（权限检查、操作日志等）直接复用该连接，
+# 每个请求只占用一个连接，也避免持有连接的请求再向连接池借连接而互相死锁
+_request_connection: contextvars.ContextVar[Optional[tuple]] = contextvars.ContextVar(
+    "sqlite_request_connection", default=None
+)
+
+# 查询计时（慢查询日志）：设置后连接池中所有连接的 execute / executemany 都会计时，
+# 耗时不低于 tracer.threshold（秒）的语句交给 tracer.submit(sql, params, 耗时, 行数)
+_query_tracer = None
+
+
+def set_query_tracer(tracer):
+    """
+    设置查询计时器（None 表示关闭）
+    
+    Args:
+        tracer: 具有 threshold 属性和 submit(sql, params, duration, rows) 方法的对象，
+                如 server.services.slow_query_log.SlowQueryLog
+    """
+    global _query_tracer
+    _query_tracer = tracer
+
+
+# 当前请求的 SQL 时限（秒，None 表示不限制），由中间件按路由类别设置
+_query_budget: contextvars.ContextVar[Optional[float]] = contextvars.ContextVar(
+    "sqlite_query_budget", default=None
+)
+
+# 当前持有的连接的 SQL 截止时间（time.monotonic()，None 表示不限制）
+# 在 acquire() 把连接交给请求时按 _query_budget 开始计时，等待连接、排队计算密码哈希等非 SQL 的等待不计入；
+# 连接上安装的进度回调每执行 PROGRESS_CHECK_INTERVAL 条虚拟机指令检查一次，超过截止时间时中断正在执行的语句
+_query_deadline: contextvars.ContextVar[Optional[float]] = contextvars.ContextVar(
+    "sqlite_query_deadline", default=None
+)
+
+PROGRESS_CHECK_INTERVAL = 10000
+
+
+def set_query_budget(seconds: Optional[float]) -> contextvars.Token:
+    """
+    设置当前请求的 SQL 执行时限（每次获取到数据库连接时开始计时）
+    
+    Args:
+        seconds: 持有连接期间允许执行 SQL 的秒数（None 或 <= 0 表示不限制）
+    
+    Returns:
+        用于 reset_query_budget 的 token
+    """
+    return _query_budget.set(seconds if seconds and seconds > 0 else None)
+
+
+def reset_query_budget(token: contextvars.Token):
+    """恢复 set_query_budget 之前的时限"""
+    _query_budget.reset(token)
+
+
+def _deadline_exceeded() -> bool:
+    """进度回调：当前请求的 SQL 截止时间已过时返回 True（SQLite 随即中断语句）"""
+    deadline = _query_deadline.get()
+    return deadline is not None and time.monotonic() >= deadline
+
+
+class AsyncCursor:
+    """
+    异步游标
+    包装 sqlite3.Cursor，fetch 操作在数据库线程池中执行，不阻塞事件循环
+    """
+    
+    def __init__(self, conn: "AsyncConnection", cursor: sqlite3.Cursor):
+        self._conn = conn
+        self._cursor = cursor
+    
+    @property
+    def rowcount(self) -> int:
+        return self._cursor.rowcount
+    
+    @property
+    def lastrowid(self) -> Optional[int]:
+        return self._cursor.lastrowid
+    
+    @property
+    def description(self):
+        return self._cursor.description
+    
+    async def fetchone(self):
+        return await self._conn._run(self._cursor.fetchone)
+    
+    async def fetchall(self) -> List[Any]:
+        return await self._conn._run(self._cursor.fetchall)
+    
+    async def fetchmany(self, size: int) -> List[Any]:
+        return await self._conn._run(self._cursor.fetchmany, size)
+
+
+class AsyncConnection:
+    """
+    异步数据库连接
+    包装连接池中的 sqlite3.Connection，所有 SQLite 调用都在连接池的线程池中执行
+    
+    Usage:
+        async with pool.acquire() as conn:
+            rows = await conn.fetchall("SELECT * FROM users WHERE id = ?", (user_id,))
+    """
+    
+    def __init__(self, pool: "SQLiteConnectionPool", conn: sqlite3.Connection):
+        self._pool = pool
+        self._conn = conn
+        # 最近一次提交到线程池的任务，归还连接前需要等待其完成
+        self._pending: Optional[Future] = None
+    
+    @property
+    def raw(self) -> sqlite3.Connection:
+        """底层 sqlite3 连接（仅限在数据库线程中使用）"""
+        return self._conn
+    
+    @property
+    def total_changes(self) -> int:
+        return self._conn.total_changes
+    
+    @property
+    def in_transaction(self) -> bool:
+        return self._conn.in_transaction
+    
+    async def _run(self, func: Callable, *args) -> Any:
+        """在数据库线程池中执行 func，并记录为当前连接的未完成任务"""
+        future = self._pool._submit(func, *args)
+        self._pending = future
+        with phase(PHASE_DB):
+            try:
+                return await asyncio.wrap_future(future)
+            except sqlite3.OperationalError as e:
+                if "interrupted" in str(e) and _deadline_exceeded():
+                    self._pool._stats['query_timeouts'] += 1
+                    raise QueryTimeoutError() from e
+                raise
+    
+    async def execute(self, sql: str, params=()) -> AsyncCursor:
+        cursor = await self._run(self._conn.execute, sql, params)
+        return AsyncCursor(self, cursor)
+    
+    async def executemany(self, sql: str, seq_of_params) -> AsyncCursor:
+        cursor = await self._run(self._conn.executemany, sql, seq_of_params)
+        return AsyncCursor(self, cursor)
+    
+    async def fetchone(self, sql: str, params=()):
+        """执行查询并返回第一行"""
+        return await self._run(lambda: self._conn.execute(sql, params).fetchone())
+    
+    async def fetchall(self, sql: str, params=()) -> List[Any]:
+        """执行查询并返回所有行"""
+        return await self._run(lambda: self._conn.execute(sql, params).fetchall())
+    
+    async def commit(self):
+        await self._run(self._conn.commit)
+    
+    async def rollback(self):
+        await self._run(self._conn.rollback)
+    
+    async def run_sync(self, func: Callable[[sqlite3.Connection], Any]) -> Any:
+        """
+        在数据库线程中以同步方式执行一段操作（适合批量写入等多语句场景）
+        
+        Args:
+            func: 接收 sqlite3.Connection 的同步函数
+        """
+        return await self._run(func, self._conn)
+    
+    def _wait_pending(self):
+        """等待未完成的线程池任务结束（在数据库线程中调用）"""
+        pending = self._pending
+        if pending is not None and not pending.done():
+            wait_futures([pending])
+
+
+# SQLite 性能配置档
+# cache_size 为负数时单位是 KiB（每个连接独立的页缓存上限）；mmap_size 单位为字节，0 表示不使用内存映射；
+# wal_autocheckpoint 单位为页，只对可写连接生效；cached_statements 为每个连接缓存的预编译语句数
+PERFORMANCE_PROFILES = {
+    # 内存受限的小机器：接近 SQLite 默认值
+    "low-memory": {
+        "cache_size": -2000,
+        "mmap_size": 0,
+        "temp_store": "DEFAULT",
+        "wal_autocheckpoint": 1000,
+        "cached_statements": 64,
+    },
+    # 默认：适度的页缓存和内存映射，临时表/排序放在内存
+    "balanced": {
+        "cache_size": -16000,
+        "mmap_size": 64 * 1024 * 1024,
+        "temp_store": "MEMORY",
+        "wal_autocheckpoint": 1000,
+        "cached_statements": 256,
+    },
+    # 报表等整表读取较多时使用：大页缓存 + 大范围内存映射，减少 checkpoint 频率
+    "throughput": {
+        "cache_size": -64000,
+        "mmap_size": 256 * 1024 * 1024,
+        "temp_store": "MEMORY",
+        "wal_autocheckpoint": 4000,
+        "cached_statements": 512,
+    },
+}
+
+
+class _TracedCursor(sqlite3.Cursor):
+    """
+    计时游标（启用查询计时时使用）
+    累计 execute 和逐行读取结果的耗时，结果读完、游标再次执行或被丢弃时上报一次
+    """
+    
+    # [tracer, sql, params, 累计耗时, 已读取行数]
+    _trace = None
+    
+    def execute(self, sql, parameters=()):
+        self._finish()
+        tracer = _query_tracer
+        start = time.perf_counter()
+        super().execute(sql, parameters)
+        if tracer is not None:
+            self._trace = [tracer, sql, parameters, time.perf_counter() - start, 0]
+            if self.description is None:
+                # 写操作：没有结果集，行数为影响的行数
+                self._trace[4] = self.rowcount
+                self._finish()
+        return self
+    
+    def executemany(self, sql, seq_of_parameters):
+        self._finish()
+        tracer = _query_tracer
+        start = time.perf_counter()
+        super().executemany(sql, seq_of_parameters)
+        if tracer is not None:
+            self._trace = [tracer, sql, None, time.perf_counter() - start, self.rowcount]
+            self._finish()
+        return self
+    
+    def fetchone(self):
+        start = time.perf_counter()
+        row = super().fetchone()
+        self._account(time.perf_counter() - start, 0 if row is None else 1, row is None)
+        return row
+    
+    def fetchmany(self, size=None):
+        size = self.arraysize if size is None else size
+        start = time.perf_counter()
+        rows = super().fetchmany(size)
+        self._account(time.perf_counter() - start, len(rows), len(rows) < size)
+        return rows
+    
+    def fetchall(self):
+        start = time.perf_counter()
+        rows = super().fetchall()
+        self._account(time.perf_counter() - start, len(rows), True)
+        return rows
+    
+    def __next__(self):
+        start = time.perf_counter()
+        try:
+            row = super().__next__()
+        except StopIteration:
+            self._account(time.perf_counter() - start, 0, True)
+            raise
+        self._account(time.perf_counter() - start, 1, False)
+        return row
+    
+    def __del__(self):
+        self._finish()
+    
+    def _account(self, seconds: float, rows: int, done: bool):
+        trace = self._trace
+        if trace is not None:
+            trace[3] += seconds
+            trace[4] += rows
+            if done:
+                self._finish()
+    
+    def _finish(self):
+        trace = self._trace
+        if trace is not None:
+            self._trace = None
+            tracer, sql, params, seconds, rows = trace
+            if seconds >= tracer.threshold:
+                tracer.submit(sql, params, seconds, rows)
+
+
+class _PooledConnection(sqlite3.Connection):
+    """连接池中的 sqlite3 连接，附带生命周期信息（创建时间、使用次数、是否需要校验）"""
+    
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.created_at = time.monotonic()
+        self.last_used = self.created_at
+        self.uses = 0
+        # 使用过程中出现过 SQLite 错误，下次借出前需要校验
+        self.suspect = False
+    
+    def execute(self, sql, parameters=()):
+        if _query_tracer is None:
+            return super().execute(sql, parameters)
+        return self.cursor(_TracedCursor).execute(sql, parameters)
+    
+    def executemany(self, sql, seq_of_parameters):
+        if _query_tracer is None:
+            return super().executemany(sql, seq_of_parameters)
+        return self.cursor(_TracedCursor).executemany(sql, seq_of_parameters)
+
+
+class _ConnectionWaiter:
+    """
+    等待连接的请求（由归还连接的线程直接交付）
+    同步等待者阻塞在 threading.Event 上；异步等待者只等待事件循环中的 future（不占用线程），
+    由归还连接的线程通过 call_soon_threadsafe 唤醒
+    """
+    
+    __slots__ = ('conn', 'event', 'loop', 'future')
+    
+    def __init__(self, loop: Optional[asyncio.AbstractEventLoop] = None):
+        """
+        Args:
+            loop: 异步等待者所在的事件循环（同步等待时为 None）
+        """
+        self.conn: Optional[sqlite3.Connection] = None
+        self.loop = loop
+        self.event = threading.Event() if loop is None else None
+        self.future = loop.create_future() if loop is not None else None
+    
+    def wake(self):
+        """唤醒等待者（可以在任意线程中调用）"""
+        if self.loop is None:
+            self.event.set()
+            return
+        try:
+            self.loop.call_soon_threadsafe(_resolve_waiter, self.future)
+        except RuntimeError:
+            # 事件循环已关闭（进程正在退出）
+            pass
+
+
+def _resolve_waiter(future: asyncio.Future):
+    # 等待者可能已超时或被取消，future 已结束
+    if not future.done():
+        future.set_result(None)
+
+
+class _ConnectionQueue:
+    """
+    FIFO 连接队列
+    有空闲连接或未达容量时立即返回；否则按到达顺序排队，
+    连接归还时直接交给最早的等待者（无轮询延迟，新请求也不能插队）
+    """
+    
+    def __init__(self, capacity: int, factory: Callable[[], Optional[sqlite3.Connection]]):
+        """
+        Args:
+            capacity: 最多可借出的连接数
+            factory: 创建新连接的函数，失败返回 None
+        """
+        self.capacity = capacity
+        self._factory = factory
+        self._idle: deque = deque()
+        self._waiters: deque = deque()
+        self._lock = threading.Lock()
+        self.in_use = 0
+        self.size = 0  # 当前打开的连接数（空闲 + 借出）
+        self.wait_histogram = LatencyHistogram()
+    
+    @property
+    def idle_count(self) -> int:
+        return len(self._idle)
+    
+    @property
+    def waiting(self) -> int:
+        return len(self._waiters)
+    
+    def add_idle(self, conn: sqlite3.Connection):
+        """放入一个预创建的空闲连接"""
+        with self._lock:
+            self._idle.append(conn)
+            self.size += 1
+    
+    def get(self, timeout: float) -> Optional[sqlite3.Connection]:
+        """
+        获取连接
+        
+        Args:
+            timeout: 最长等待时间（秒）
+        
+        Returns:
+            SQLite 连接对象，超时返回 None
+        """
+        start = time.monotonic()
+        waiter = None
+        with self._lock:
+            conn = self._take_locked() if not self._waiters else None
+            if conn is None:
+                waiter = _ConnectionWaiter()
+                self._waiters.append(waiter)
+        
+        if waiter is not None:
+            waiter.event.wait(timeout)
+            conn = self._claim(waiter)
+        
+        self.wait_histogram.observe(time.monotonic() - start)
+        return conn
+    
+    async def get_async(self, timeout: float, executor: ThreadPoolExecutor) -> Optional[sqlite3.Connection]:
+        """
+        异步获取连接：排队时只等待 future，不占用线程；需要新建连接时在 executor 中创建
+        
+        等待中被取消（客户端断开、asyncio.wait_for 超时、关闭服务）时，已经交付给本等待者的连接放回队列
+        
+        Args:
+            timeout: 最长等待时间（秒）
+            executor: 创建连接使用的线程池
+        
+        Returns:
+            SQLite 连接对象，超时返回 None
+        """
+        loop = asyncio.get_running_loop()
+        start = time.monotonic()
+        conn = None
+        create = False
+        waiter = None
+        with self._lock:
+            if not self._waiters and self._idle:
+                self.in_use += 1
+                conn = self._idle.pop()  # 优先复用最近归还的连接（页缓存更热）
+            elif not self._waiters and self.in_use < self.capacity:
+                # 先占用容量，在锁外创建连接
+                self.in_use += 1
+                self.size += 1
+                create = True
+            else:
+                waiter = _ConnectionWaiter(loop)
+                self._waiters.append(waiter)
+        
+        if create:
+            conn = await self._create_reserved(executor)
+            if conn is None:
+                # 创建失败：释放容量，与同步获取一样排队等待归还的连接
+                with self._lock:
+                    self.in_use -= 1
+                    self.size -= 1
+                    waiter = _ConnectionWaiter(loop)
+                    self._waiters.append(waiter)
+        
+        if waiter is not None:
+            try:
+                await asyncio.wait_for(waiter.future, max(0.0, timeout - (time.monotonic() - start)))
+            except asyncio.TimeoutError:
+                pass
+            except asyncio.CancelledError:
+                abandoned = self._claim(waiter)
+                if abandoned is not None:
+                    self.put(abandoned)
+                raise
+            conn = self._claim(waiter)
+        
+        self.wait_histogram.observe(time.monotonic() - start)
+        return conn
+    
+    async def _create_reserved(self, executor: ThreadPoolExecutor) -> Optional[sqlite3.Connection]:
+        """为已占用的容量在 executor 中创建连接；调用方被取消时，创建完成的连接放回队列"""
+        try:
+            future = executor.submit(self._factory)
+            return await asyncio.shield(asyncio.wrap_future(future))
+        except asyncio.CancelledError:
+            future.add_done_callback(self._return_created)
+            raise
+        except Exception as e:
+            logger.error(f"创建数据库连接失败: {e}")
+            return None
+    
+    def _return_created(self, future: Future):
+        """放回调用方已取消时创建的连接（创建失败时释放占用的容量）"""
+        conn = None
+        if not future.cancelled() and future.exception() is None:
+            conn = future.result()
+        if conn is not None:
+            self.put(conn)
+            return
+        with self._lock:
+            self.in_use -= 1
+            self.size -= 1
+    
+    def _claim(self, waiter: _ConnectionWaiter) -> Optional[sqlite3.Connection]:
+        """结束等待：返回已交付的连接，未交付时移出等待队列"""
+        with self._lock:
+            # 超时与交付可能同时发生，以是否拿到连接为准
+            conn = waiter.conn
+            if conn is None:
+                self._waiters.remove(waiter)
+        return conn
+    
+    def put(self, conn: sqlite3.Connection):
+        """归还连接：有等待者时直接交给最早的等待者，否则放回空闲队列"""
+        with self._lock:
+            if self._waiters:
+                self._hand_off_locked(conn)
+            else:
+                self.in_use -= 1
+                self._idle.append(conn)
+    
+    def discard(self):
+        """丢弃一个借出的连接（已损坏或已关闭），空出的容量优先为等待者新建连接"""
+        with self._lock:
+            self.in_use -= 1
+            self.size -= 1
+            if self._waiters:
+                conn = self._take_locked()
+                if conn is not None:
+                    self._hand_off_locked(conn)
+    
+    def trim(self, idle_timeout: float, min_idle: int) -> List[sqlite3.Connection]:
+        """
+        取出空闲超过 idle_timeout 的连接（至少保留 min_idle 个），由调用方关闭
+        
+        Returns:
+            被移出队列的连接
+        """
+        now = time.monotonic()
+        removed = []
+        with self._lock:
+            # 空闲队列按归还时间排列，最久未用的在左侧
+            while len(self._idle) > min_idle and now - self._idle[0].last_used > idle_timeout:
+                removed.append(self._idle.popleft())
+            self.size -= len(removed)
+        return removed
+    
+    def close(self):
+        """关闭所有空闲连接"""
+        with self._lock:
+            while self._idle:
+                self.size -= 1
+                try:
+                    self._idle.popleft().close()
+                except Exception:
+                    pass
+    
+    def _take_locked(self) -> Optional[sqlite3.Connection]:
+        if self._idle:
+            self.in_use += 1
+            return self._idle.pop()  # 优先复用最近归还的连接（页缓存更热）
+        if self.in_use < self.capacity:
+            conn = self._factory()
+            if conn is not None:
+                self.in_use += 1
+                self.size += 1
+                return conn
+        return None
+    
+    def _hand_off_locked(self, conn: sqlite3.Connection):
+        # 连接直接转交，借出数不变
+        waiter = self._waiters.popleft()
+        waiter.conn = conn
+        waiter.wake()
+
+
+class GroupCommitter:
+    """
+    组提交
+    将几毫秒内到达的小写事务合并到同一个事务中提交（一次 COMMIT / WAL fsync），
+    每个调用方的操作放在独立的 SAVEPOINT 中执行，成功或失败互不影响
+    
+    Usage:
+        row_id = await pool.group_commit(
+            lambda conn: conn.execute("INSERT INTO t (x) VALUES (?)", (1,)).lastrowid
+        )
+    """
+    
+    def __init__(self, pool: "SQLiteConnectionPool", max_latency: float = 0.005, max_batch: int = 64):
+        """
+        Args:
+            pool: 连接池
+            max_latency: 第一个写操作到达后最多等待多久再提交（秒）
+            max_batch: 单个批次最多包含的写操作数，达到后立即提交
+        """
+        self._pool = pool
+        self.max_latency = max_latency
+        self.max_batch = max(1, max_batch)
+        self._queue: List[tuple] = []
+        self._flusher: Optional[asyncio.Task] = None
+        self._batch_full: Optional[asyncio.Event] = None
+        self._stats = {
+            'batches': 0,
+            'items': 0,
+            'failed_items': 0,
+            'failed_batches': 0,
+            'max_batch_size': 0
+        }
+    
+    async def submit(self, func: Callable[[sqlite3.Connection], Any]) -> Any:
+        """
+        提交一个写操作，等待所在批次提交后返回 func 的返回值
+        
+        Args:
+            func: 接收 sqlite3.Connection 的同步函数（在数据库线程中执行）
+        
+        Returns:
+            func 的返回值；func 抛出的异常或批次提交失败的异常会原样抛给调用方
+        """
+        if self._pool._request_connection(writable=True) is not None:
+            # 当前任务已持有可写连接：直接在该连接上执行（随请求事务一起提交），
+            # 避免等待另一个连接而与自己持有的连接互相阻塞
+            async with self._pool.acquire() as conn:
+                ok, value = (await conn.run_sync(lambda raw: self._apply_batch(raw, [func])))[0]
+            if not ok:
+                raise value
+            return value
+        
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        self._queue.append((func, future))
+        if self._batch_full is None:
+            self._batch_full = asyncio.Event()
+        if self._flusher is None or self._flusher.done():
+            # 批次包含多个请求的写操作，在空的上下文中运行：不继承第一个提交者的请求计时、
+            # 日志级别和 SQL 时限（否则之后所有批次的 db / db-wait 耗时都会记到那个请求上）
+            self._flusher = contextvars.Context().run(loop.create_task, self._flush_loop())
+        elif len(self._queue) >= self.max_batch:
+            self._batch_full.set()
+        return await future
+    
+    async def _flush_loop(self):
+        """收集并提交批次，直到队列为空"""
+        while self._queue:
+            if len(self._queue) < self.max_batch:
+                try:
+                    await asyncio.wait_for(self._batch_full.wait(), self.max_latency)
+                except asyncio.TimeoutError:
+                    pass
+            self._batch_full.clear()
+            batch = self._queue[:self.max_batch]
+            del self._queue[:self.max_batch]
+            # 跳过已被取消的调用方
+            batch = [(func, future) for func, future in batch if not future.done()]
+            if batch:
+                await self._commit_batch(batch)
+    
+    async def _commit_batch(self, batch: List[tuple]):
+        funcs = [func for func, _ in batch]
+        try:
+            async with self._pool.acquire() as conn:
+                results = await conn.run_sync(lambda raw: self._apply_batch(raw, funcs))
+        except Exception as e:
+            self._stats['failed_batches'] += 1
+            logger.warning(f"组提交失败（{len(batch)} 个写操作）: {e}")
+            for _, future in batch:
+                if not future.done():
+                    future.set_exception(e)
+            return
+        
+        self._stats['batches'] += 1
+        self._stats['items'] += len(batch)
+        self._stats['max_batch_size'] = max(self._stats['max_batch_size'], len(batch))
+        for (_, future), (ok, value) in zip(batch, results):
+            if not ok:
+                self._stats['failed_items'] += 1
+            if future.done():
+                continue
+            if ok:
+                future.set_result(value)
+            else:
+                future.set_exception(value)
+    
+    @staticmethod
+    def _apply_batch(conn: sqlite3.Connection, funcs: List[Callable]) -> List[tuple]:
+        """在同一个事务中依次执行各写操作，每个操作一个 SAVEPOINT（在数据库线程中执行）"""
+        if not conn.in_transaction:
+            conn.execute("BEGIN IMMEDIATE")
+        results = []
+        for func in funcs:
+            conn.execute("SAVEPOINT group_commit_item")
+            try:
+                value = func(conn)
+            except Exception as e:
+                conn.execute("ROLLBACK TO group_commit_item")
+                conn.execute("RELEASE group_commit_item")
+                results.append((False, e))
+            else:
+                conn.execute("RELEASE group_commit_item")
+                results.append((True, value))
+        return results
+    
+    def get_stats(self) -> dict:
+        """获取组提交统计信息"""
+        batches = self._stats['batches']
+        return {
+            **self._stats,
+            'pending': len(self._queue),
+            'avg_batch_size': round(self._stats['items'] / batches, 2) if batches else 0.0,
+            'max_latency_ms': self.max_latency * 1000,
+            'max_batch': self.max_batch
+        }
+
 
 class SQLiteConnectionPool:
     """
@@ -32,7 +737,15 @@ class SQLiteConnectionPool:
         timeout: float = 30.0,
         busy_timeout: int = 5000,  # SQLite busy timeout (毫秒)
         retry_attempts: int = 3,
-        retry_delay: float = 0.1
+        retry_delay: float = 0.1,
+        mode: str = "shared",
+        group_commit_latency: float = 0.005,
+        group_commit_batch: int = 64,
+        max_lifetime: float = 3600.0,
+        max_uses: int = 10000,
+        idle_timeout: float = 300.0,
+        min_idle: int = 1,
+        profile: str = "balanced"
     ):
         """
         初始化连接池
@@ -44,29 +757,73 @@ class SQLiteConnectionPool:
             busy_timeout: SQLite busy timeout（毫秒），默认 5 秒
             retry_attempts: 重试次数
             retry_delay: 重试延迟（秒）
+            mode: 连接池模式
+                - "shared": 所有连接均可读写（默认）
+                - "split": 读写分离，1 个专用写连接（写请求排队串行执行）+ max_connections - 1 个只读连接
+            group_commit_latency: 组提交最大等待时间（秒）
+            group_commit_batch: 组提交单批最大写操作数
+            max_lifetime: 连接最长存活时间（秒），超过后归还时关闭并重建，0 表示不限制
+            max_uses: 连接最多借出次数，超过后归还时关闭并重建，0 表示不限制
+            idle_timeout: 空闲连接保留时间（秒），超过后由 trim_idle() 关闭，0 表示不回收
+            min_idle: 回收空闲连接时至少保留的连接数
+            profile: 性能配置档（见 PERFORMANCE_PROFILES）：low-memory / balanced / throughput
         """
+        if mode not in ("shared", "split"):
+            raise ValueError(f"不支持的连接池模式: {mode}")
+        if profile not in PERFORMANCE_PROFILES:
+            raise ValueError(f"不支持的性能配置档: {profile}")
+        
         self.db_path = db_path
         self.max_connections = max_connections
         self.timeout = timeout
         self.busy_timeout = busy_timeout
         self.retry_attempts = retry_attempts
         self.retry_delay = retry_delay
+        self.mode = mode
+        self._split = mode == "split"
+        self.max_lifetime = max_lifetime
+        self.max_uses = max_uses
+        self.idle_timeout = idle_timeout
+        self.min_idle = min_idle
+        self.profile = profile
+        self._profile_settings = PERFORMANCE_PROFILES[profile]
+        # 普通连接池的容量（读写分离模式下只存放只读连接）
+        self._pool_capacity = max(1, max_connections - 1) if self._split else max_connections
         
-        # 连接池队列
-        self._pool: Queue = Queue(maxsize=max_connections)
-        # 当前使用的连接数
-        self._active_connections = 0
+        # 连接队列（FIFO，归还时直接交给最早的等待者）
+        self._pool = _ConnectionQueue(
+            self._pool_capacity,
+            lambda: self._create_connection(readonly=self._split)
+        )
+        # 写连接队列（仅读写分离模式）：容量为 1，写请求按到达顺序排队获取唯一的写连接
+        self._writer_queue = _ConnectionQueue(1, self._create_writer)
+        self._writer: Optional[sqlite3.Connection] = None
         # 线程锁
         self._lock = threading.Lock()
+        # 执行 SQLite 调用的线程池（大小与最大连接数一致，保证每个借出的连接都有线程可用）
+        self._executor = ThreadPoolExecutor(
+            max_workers=self._pool_capacity + (1 if self._split else 0),
+            thread_name_prefix="sqlite-worker"
+        )
         # 统计信息
         self._stats = {
-            'total_connections': 0,
-            'active_connections': 0,
-            'pool_size': 0,
             'retry_count': 0,
-            'busy_errors': 0
+            'busy_errors': 0,
+            'reused_acquisitions': 0,
+            'transaction_retries': 0,
+            'transaction_failures': 0,
+            'recycled_connections': 0,
+            'discarded_connections': 0,
+            'trimmed_connections': 0,
+            'validations': 0,
+            'writer_acquisitions': 0,
+            'writer_waits': 0,
+            'query_timeouts': 0
         }
         
+        # 组提交（合并小写事务）
+        self._group_committer = GroupCommitter(self, group_commit_latency, group_commit_batch)
+        
         # 确保数据库目录存在
         db_dir = os.path.dirname(db_path)
         if db_dir and not os.path.exists(db_dir):
@@ -78,38 +835,78 @@ class SQLiteConnectionPool:
         # 初始化数据库结构
         self._initialize_database()
         
-        logger.info(f"SQLite 连接池初始化完成: {db_path}, 最大连接数: {max_connections}")
+        logger.info(f"SQLite 连接池初始化完成: {db_path}, 最大连接数: {max_connections}, 模式: {mode}, 性能配置: {profile}")
     
     def _initialize_pool(self):
         """初始化连接池，预创建连接"""
-        for _ in range(min(3, self.max_connections)):  # 预创建 3 个连接
-            conn = self._create_connection()
+        if self._split:
+            # 先创建写连接：它负责创建数据库文件并开启 WAL，只读连接才能打开
+            writer = self._create_writer()
+            if writer is None:
+                raise RuntimeError(f"无法创建数据库写连接: {self.db_path}")
+            self._writer_queue.add_idle(writer)
+        
+        for _ in range(min(3, self._pool_capacity)):  # 预创建 3 个连接
+            conn = self._create_connection(readonly=self._split)
             if conn:
-                self._pool.put(conn)
-                self._stats['total_connections'] += 1
+                self._pool.add_idle(conn)
+    
+    def _create_writer(self) -> Optional[sqlite3.Connection]:
+        """创建写连接（读写分离模式），并记录为当前写连接"""
+        conn = self._create_connection()
+        if conn is not None:
+            self._writer = conn
+        return conn
     
-    def _create_connection(self) -> Optional[sqlite3.Connection]:
+    def _create_connection(self, readonly: bool = False) -> Optional[sqlite3.Connection]:
         """
         创建新的数据库连接
         
+        Args:
+            readonly: 是否创建只读连接（mode=ro + query_only，仅读写分离模式使用）
+        
         Returns:
             SQLite 连接对象，失败返回 None
         """
+        settings = self._profile_settings
         try:
-            conn = sqlite3.connect(
-                self.db_path,
-                timeout=self.busy_timeout / 1000.0,  # 转换为秒
-                check_same_thread=False  # 允许多线程使用
-            )
-            
-            # 配置连接
-            conn.execute("PRAGMA journal_mode = WAL")  # 启用 WAL 模式，提高并发性能
-            conn.execute("PRAGMA synchronous = NORMAL")  # 平衡性能和安全性
+            if readonly:
+                conn = sqlite3.connect(
+                    f"{Path(self.db_path).resolve().as_uri()}?mode=ro",
+                    uri=True,
+                    timeout=self.busy_timeout / 1000.0,
+                    check_same_thread=False,
+                    factory=_PooledConnection,
+                    cached_statements=settings["cached_statements"]
+                )
+                conn.execute("PRAGMA query_only = 1")  # 双重保险：拒绝任何写操作
+            else:
+                conn = sqlite3.connect(
+                    self.db_path,
+                    timeout=self.busy_timeout / 1000.0,  # 转换为秒
+                    check_same_thread=False,  # 允许多线程使用
+                    factory=_PooledConnection,
+                    cached_statements=settings["cached_statements"]
+                )
+                
+                # 配置连接
+                # 增量自动清理：大批量删除后由后台维护任务执行 incremental_vacuum 归还空闲页
+                # （只对尚未建表、未开启 WAL 的新数据库生效，已有数据库需要一次完整 VACUUM 才能切换）
+                conn.execute("PRAGMA auto_vacuum = INCREMENTAL")
+                conn.execute("PRAGMA journal_mode = WAL")  # 启用 WAL 模式，提高并发性能
+                conn.execute("PRAGMA synchronous = NORMAL")  # 平衡性能和安全性
+                conn.execute(f"PRAGMA wal_autocheckpoint = {settings['wal_autocheckpoint']}")
             conn.execute("PRAGMA foreign_keys = ON")  # 启用外键约束
             conn.execute(f"PRAGMA busy_timeout = {self.busy_timeout}")  # 设置 busy timeout
+            # 性能配置档
+            conn.execute(f"PRAGMA cache_size = {settings['cache_size']}")
+            conn.execute(f"PRAGMA mmap_size = {settings['mmap_size']}")
+            conn.execute(f"PRAGMA temp_store = {settings['temp_store']}")
             
             # 设置行工厂，返回字典格式
             conn.row_factory = sqlite3.Row
+            # 请求级 SQL 执行时限（见 set_query_budget）
+            conn.set_progress_handler(_deadline_exceeded, PROGRESS_CHECK_INTERVAL)
             
             return conn
         except Exception as e:
@@ -117,24 +914,10 @@ class SQLiteConnectionPool:
             return None
     
     def _initialize_database(self):
-        """初始化数据库结构（如果不存在）"""
+        """初始化数据库结构（如果不存在），并执行未完成的迁移（见 server/migrations.py）"""
         try:
             with self.get_connection() as conn:
-                # 检查数据库版本
-                cursor = conn.execute("PRAGMA user_version")
-                version = cursor.fetchone()[0]
-                
-                if version == 0:
-                    # 首次创建数据库
-                    logger.info("首次创建数据库，执行初始化脚本...")
-                    self._create_tables(conn)
-                    self._set_version(conn, 20)
-                else:
-                    # 升级数据库
-                    logger.info(f"数据库版本: {version}, 检查是否需要升级...")
-                    self._upgrade_database(conn, version, 20)
-                    # 无论版本如何，都检查并修复 user_settings 表的列（兼容性修复）
-                    self._ensure_user_settings_columns(conn)
+                migrate(conn, self._create_tables)
         except Exception as e:
             logger.error(f"数据库初始化失败: {e}")
             raise
@@ -447,670 +1230,17 @@ class SQLiteConnectionPool:
         conn.execute('CREATE INDEX IF NOT EXISTS idx_workspace_members_workspaceId ON workspace_members(workspaceId)')
         conn.execute('CREATE INDEX IF NOT EXISTS idx_workspace_members_userId ON workspace_members(userId)')
         
-        conn.commit()
         logger.info("数据库表创建完成")
     
-    def _set_version(self, conn: sqlite3.Connection, version: int):
-        """设置数据库版本"""
-        conn.execute(f"PRAGMA user_version = {version}")
-        conn.commit()
-    
-    def _ensure_user_settings_columns(self, conn: sqlite3.Connection):
-        """确保 user_settings 表有所有必需的列（兼容性修复）"""
-        try:
-            cursor = conn.execute("PRAGMA table_info(user_settings)")
-            columns = [row[1] for row in cursor.fetchall()]
-            
-            if 'notify_device_online' not in columns:
-                logger.info("补充添加 notify_device_online 列到 user_settings 表")
-                conn.execute('ALTER TABLE user_settings ADD COLUMN notify_device_online INTEGER DEFAULT 1')
-                conn.commit()
-            
-            if 'notify_device_offline' not in columns:
-                logger.info("补充添加 notify_device_offline 列到 user_settings 表")
-                conn.execute('ALTER TABLE user_settings ADD COLUMN notify_device_offline INTEGER DEFAULT 1')
-                conn.commit()
-        except Exception as e:
-            logger.warning(f"检查 user_settings 表列时出错: {e}")
-    
-    def _upgrade_database(self, conn: sqlite3.Connection, old_version: int, new_version: int):
-        """升级数据库结构"""
-        if old_version >= new_version:
-            return
-        
-        logger.info(f"开始数据库升级: {old_version} -> {new_version}")
-        
-        # 版本 5: 添加 employees, income, remittance 表
-        if old_version < 5:
-            logger.info("升级到版本 5: 添加 employees, income, remittance 表")
-            conn.execute('''
-                CREATE TABLE IF NOT EXISTS employees (
-                    id INTEGER PRIMARY KEY AUTOINCREMENT,
-                    userId INTEGER NOT NULL,
-                    name TEXT NOT NULL,
-                    note TEXT,
-                    created_at TEXT DEFAULT (datetime('now')),
-                    updated_at TEXT DEFAULT (datetime('now')),
-                    FOREIGN KEY (userId) REFERENCES users (id) ON DELETE CASCADE,
-                    UNIQUE(userId, name)
-                )
-            ''')
-            conn.execute('''
-                CREATE TABLE IF NOT EXISTS income (
-                    id INTEGER PRIMARY KEY AUTOINCREMENT,
-                    userId INTEGER NOT NULL,
-                    incomeDate TEXT NOT NULL,
-                    customerId INTEGER,
-                    amount REAL NOT NULL,
-                    discount REAL DEFAULT 0,
-                    employeeId INTEGER,
-                    paymentMethod TEXT NOT NULL CHECK(paymentMethod IN ('现金', '微信转账', '银行卡')),
-                    note TEXT,
-                    created_at TEXT DEFAULT (datetime('now')),
-                    FOREIGN KEY (userId) REFERENCES users (id) ON DELETE CASCADE,
-                    FOREIGN KEY (customerId) REFERENCES customers (id) ON DELETE SET NULL,
-                    FOREIGN KEY (employeeId) REFERENCES employees (id) ON DELETE SET NULL)
-            ''')
-            conn.execute('''
-                CREATE TABLE IF NOT EXISTS remittance (
-                    id INTEGER PRIMARY KEY AUTOINCREMENT,
-                    userId INTEGER NOT NULL,
-                    remittanceDate TEXT NOT NULL,
-                    supplierId INTEGER,
-                    amount REAL NOT NULL,
-                    employeeId INTEGER,
-                    paymentMethod TEXT NOT NULL CHECK(paymentMethod IN ('现金', '微信转账', '银行卡')),
-                    note TEXT,
-                    created_at TEXT DEFAULT (datetime('now')),
-                    FOREIGN KEY (userId) REFERENCES users (id) ON DELETE CASCADE,
-                    FOREIGN KEY (supplierId) REFERENCES suppliers (id) ON DELETE SET NULL,
-                    FOREIGN KEY (employeeId) REFERENCES employees (id) ON DELETE SET NULL)
-            ''')
-        
-        # 版本 11: 为 products 表添加 supplierId 字段
-        if old_version < 11:
-            logger.info("升级到版本 11: 为 products 表添加 supplierId 字段")
-            try:
-                conn.execute('ALTER TABLE products ADD COLUMN supplierId INTEGER')
-            except sqlite3.OperationalError:
-                # 字段可能已存在
-                pass
-        
-        # 版本 12: 添加自动备份字段和在线用户表
-        if old_version < 12:
-            logger.info("升级到版本 12: 添加自动备份字段和在线用户表")
-            # 检查并添加自动备份字段
-            cursor = conn.execute("PRAGMA table_info(user_settings)")
-            columns = [row[1] for row in cursor.fetchall()]
-            
-            if 'auto_backup_enabled' not in columns:
-                conn.execute('ALTER TABLE user_settings ADD COLUMN auto_backup_enabled INTEGER DEFAULT 0')
-            if 'auto_backup_interval' not in columns:
-                conn.execute('ALTER TABLE user_settings ADD COLUMN auto_backup_interval INTEGER DEFAULT 15')
-            if 'auto_backup_max_count' not in columns:
-                conn.execute('ALTER TABLE user_settings ADD COLUMN auto_backup_max_count INTEGER DEFAULT 20')
-            if 'last_backup_time' not in columns:
-                conn.execute('ALTER TABLE user_settings ADD COLUMN last_backup_time TEXT')
-            if 'show_online_users' not in columns:
-                conn.execute('ALTER TABLE user_settings ADD COLUMN show_online_users INTEGER DEFAULT 1')
-            if 'notify_device_online' not in columns:
-                conn.execute('ALTER TABLE user_settings ADD COLUMN notify_device_online INTEGER DEFAULT 1')
-            if 'notify_device_offline' not in columns:
-                conn.execute('ALTER TABLE user_settings ADD COLUMN notify_device_offline INTEGER DEFAULT 1')
-            
-            # 创建在线用户表（支持多设备）
-            conn.execute('''
-                CREATE TABLE IF NOT EXISTS online_users (
-                    userId INTEGER NOT NULL,
-                    deviceId TEXT NOT NULL,
-                    username TEXT NOT NULL,
-                    last_heartbeat TEXT DEFAULT (datetime('now')),
-                    current_action TEXT,
-                    PRIMARY KEY (userId, deviceId),
-                    FOREIGN KEY (userId) REFERENCES users (id) ON DELETE CASCADE)
-            ''')
-        
-        # 添加版本字段和索引（如果不存在）
-        try:
-            conn.execute('ALTER TABLE products ADD COLUMN version INTEGER DEFAULT 1')
-        except sqlite3.OperationalError:
-            pass
-        
-        try:
-            conn.execute('ALTER TABLE products ADD COLUMN created_at TEXT DEFAULT (datetime("now"))')
-        except sqlite3.OperationalError:
-            pass
-        
-        try:
-            conn.execute('ALTER TABLE products ADD COLUMN updated_at TEXT DEFAULT (datetime("now"))')
-        except sqlite3.OperationalError:
-            pass
-        
-        # 版本 14: 添加 platform 字段到 online_users 表
-        if old_version < 14:
-            logger.info("升级到版本 14: 添加 platform 字段到 online_users 表")
-            try:
-                # 检查表是否存在
-                cursor = conn.execute("SELECT name FROM sqlite_master WHERE type='table' AND name='online_users'")
-                if cursor.fetchone():
-                    # 尝试添加 platform 字段
-                    try:
-                        conn.execute('ALTER TABLE online_users ADD COLUMN platform TEXT')
-                        logger.info("已添加 platform 字段到 online_users 表")
-                    except sqlite3.OperationalError:
-                        # 字段可能已存在，忽略错误
-                        logger.debug("platform 字段可能已存在")
-            except Exception as e:
-                logger.error(f"升级 online_users 表失败: {e}", exc_info=True)
-                raise
-        
-        # 版本 15: 添加 device_name 字段到 online_users 表
-        if old_version < 15:
-            logger.info("升级到版本 15: 添加 device_name 字段到 online_users 表")
-            try:
-                # 检查表是否存在
-                cursor = conn.execute("SELECT name FROM sqlite_master WHERE type='table' AND name='online_users'")
-                if cursor.fetchone():
-                    # 尝试添加 device_name 字段
-                    try:
-                        conn.execute('ALTER TABLE online_users ADD COLUMN device_name TEXT')
-                        logger.info("已添加 device_name 字段到 online_users 表")
-                    except sqlite3.OperationalError:
-                        # 字段可能已存在，忽略错误
-                        logger.debug("device_name 字段可能已存在")
-            except Exception as e:
-                logger.error(f"升级 online_users 表失败: {e}", exc_info=True)
-                raise
-        
-        # 版本 16: 确保 device_name 字段存在（如果从版本 15 直接升级）
-        if old_version < 16:
-            logger.info("升级到版本 16: 确保 device_name 字段存在")
-            try:
-                # 检查表是否存在
-                cursor = conn.execute("SELECT name FROM sqlite_master WHERE type='table' AND name='online_users'")
-                if cursor.fetchone():
-                    # 检查字段是否存在
-                    cursor = conn.execute("PRAGMA table_info(online_users)")
-                    columns = [row[1] for row in cursor.fetchall()]
-                    if 'device_name' not in columns:
-                        try:
-                            conn.execute('ALTER TABLE online_users ADD COLUMN device_name TEXT')
-                            logger.info("已添加 device_name 字段到 online_users 表")
-                        except sqlite3.OperationalError:
-                            logger.debug("device_name 字段可能已存在")
-            except Exception as e:
-                logger.error(f"升级 online_users 表失败: {e}", exc_info=True)
-                raise
-        
-        # 版本 17: 添加操作日志表，并确保 user_settings 表有所有必需的列
-        if old_version < 17:
-            logger.info("升级到版本 17: 添加操作日志表，并确保 user_settings 表完整性")
-            try:
-                # 确保 user_settings 表有所有必需的列（兼容性修复）
-                cursor = conn.execute("PRAGMA table_info(user_settings)")
-                columns = [row[1] for row in cursor.fetchall()]
-                
-                if 'notify_device_online' not in columns:
-                    logger.info("添加 notify_device_online 列到 user_settings 表")
-                    conn.execute('ALTER TABLE user_settings ADD COLUMN notify_device_online INTEGER DEFAULT 1')
-                
-                if 'notify_device_offline' not in columns:
-                    logger.info("添加 notify_device_offline 列到 user_settings 表")
-                    conn.execute('ALTER TABLE user_settings ADD COLUMN notify_device_offline INTEGER DEFAULT 1')
-                
-                # 创建操作日志表
-                conn.execute('''
-                    CREATE TABLE IF NOT EXISTS operation_logs (
-                        id INTEGER PRIMARY KEY AUTOINCREMENT,
-                        userId INTEGER NOT NULL,
-                        username TEXT NOT NULL,
-                        operation_type TEXT NOT NULL CHECK(operation_type IN ('CREATE', 'UPDATE', 'DELETE', 'COVER')),
-                        entity_type TEXT NOT NULL,
-                        entity_id INTEGER,
-                        entity_name TEXT,
-                        old_data TEXT,
-                        new_data TEXT,
-                        changes TEXT,
-                        ip_address TEXT,
-                        device_info TEXT,
-                        operation_time TEXT DEFAULT (datetime('now')),
-                        note TEXT,
-                        FOREIGN KEY (userId) REFERENCES users (id) ON DELETE CASCADE
-                    )
-                ''')
-                logger.info("已创建 operation_logs 表")
-                
-                # 创建索引
-                conn.execute('CREATE INDEX IF NOT EXISTS idx_logs_userId_time ON operation_logs(userId, operation_time DESC)')
-                conn.execute('CREATE INDEX IF NOT EXISTS idx_logs_entity ON operation_logs(entity_type, entity_id)')
-                conn.execute('CREATE INDEX IF NOT EXISTS idx_logs_type ON operation_logs(operation_type)')
-                logger.info("已创建 operation_logs 表的索引")
-            except Exception as e:
-                logger.error(f"升级到版本 17 失败: {e}", exc_info=True)
-                raise
-        
-        # 版本 18: 添加 Workspace 支持
-        if old_version < 18:
-            logger.info("升级到版本 18: 添加 Workspace 支持")
-            try:
-                # 创建 Workspace 相关表
-                conn.execute('''
-                    CREATE TABLE IF NOT EXISTS workspaces (
-                        id INTEGER PRIMARY KEY AUTOINCREMENT,
-                        name TEXT NOT NULL,
-                        description TEXT,
-                        ownerId INTEGER NOT NULL,
-                        storage_type TEXT NOT NULL CHECK(storage_type IN ('local', 'server')),
-                        is_shared INTEGER DEFAULT 0,
-                        created_at TEXT DEFAULT (datetime('now')),
-                        updated_at TEXT DEFAULT (datetime('now')),
-                        FOREIGN KEY (ownerId) REFERENCES users (id) ON DELETE CASCADE
-                    )
-                ''')
-                logger.info("已创建 workspaces 表")
-                
-                conn.execute('''
-                    CREATE TABLE IF NOT EXISTS workspace_members (
-                        id INTEGER PRIMARY KEY AUTOINCREMENT,
-                        workspaceId INTEGER NOT NULL,
-                        userId INTEGER NOT NULL,
-                        role TEXT NOT NULL CHECK(role IN ('owner', 'admin', 'editor', 'viewer')),
-                        permissions TEXT,
-                        invited_by INTEGER,
-                        joined_at TEXT DEFAULT (datetime('now')),
-                        FOREIGN KEY (workspaceId) REFERENCES workspaces (id) ON DELETE CASCADE,
-                        FOREIGN KEY (userId) REFERENCES users (id) ON DELETE CASCADE,
-                        FOREIGN KEY (invited_by) REFERENCES users (id) ON DELETE SET NULL,
-                        UNIQUE(workspaceId, userId)
-                    )
-                ''')
-                logger.info("已创建 workspace_members 表")
-                
-                conn.execute('''
-                    CREATE TABLE IF NOT EXISTS workspace_invitations (
-                        id INTEGER PRIMARY KEY AUTOINCREMENT,
-                        workspaceId INTEGER NOT NULL,
-                        email TEXT,
-                        userId INTEGER,
-                        role TEXT NOT NULL CHECK(role IN ('admin', 'editor', 'viewer')),
-                        token TEXT NOT NULL UNIQUE,
-                        invited_by INTEGER NOT NULL,
-                        expires_at TEXT NOT NULL,
-                        status TEXT DEFAULT 'pending' CHECK(status IN ('pending', 'accepted', 'rejected', 'expired')),
-                        created_at TEXT DEFAULT (datetime('now')),
-                        FOREIGN KEY (workspaceId) REFERENCES workspaces (id) ON DELETE CASCADE,
-                        FOREIGN KEY (userId) REFERENCES users (id) ON DELETE SET NULL,
-                        FOREIGN KEY (invited_by) REFERENCES users (id) ON DELETE CASCADE
-                    )
-                ''')
-                logger.info("已创建 workspace_invitations 表")
-                
-                # 为所有业务表添加 workspaceId 字段（允许 NULL，保持兼容）
-                business_tables = [
-                    'products', 'suppliers', 'customers', 'employees',
-                    'purchases', 'sales', 'returns', 'income', 'remittance',
-                    'operation_logs'
-                ]
-                
-                for table in business_tables:
-                    try:
-                        cursor = conn.execute(f"PRAGMA table_info({table})")
-                        columns = [row[1] for row in cursor.fetchall()]
-                        
-                        if 'workspaceId' not in columns:
-                            logger.info(f"为 {table} 表添加 workspaceId 字段")
-                            conn.execute(f'ALTER TABLE {table} ADD COLUMN workspaceId INTEGER')
-                            # 注意：SQLite 不支持在 ALTER TABLE 时添加外键约束
-                            # 外键约束会在下次创建表时自动添加
-                    except Exception as e:
-                        logger.warning(f"为 {table} 表添加 workspaceId 字段失败: {e}")
-                
-                # 为现有用户创建默认 workspace
-                logger.info("为现有用户创建默认 workspace...")
-                cursor = conn.execute("SELECT id, username FROM users")
-                users = cursor.fetchall()
-                
-                for user_row in users:
-                    user_id = user_row[0]
-                    username = user_row[1]
-                    
-                    # 检查用户是否已有 workspace
-                    cursor = conn.execute(
-                        "SELECT id FROM workspaces WHERE ownerId = ? LIMIT 1",
-                        (user_id,)
-                    )
-                    existing_workspace = cursor.fetchone()
-                    
-                    if not existing_workspace:
-                        # 创建默认 workspace
-                        cursor = conn.execute('''
-                            INSERT INTO workspaces (name, ownerId, storage_type, is_shared, created_at, updated_at)
-                            VALUES (?, ?, 'server', 0, datetime('now'), datetime('now'))
-                        ''', (f"{username}的账本", user_id))
-                        workspace_id = cursor.lastrowid
-                        
-                        # 将用户添加为 workspace 的 owner
-                        conn.execute('''
-                            INSERT INTO workspace_members (workspaceId, userId, role, joined_at)
-                            VALUES (?, ?, 'owner', datetime('now'))
-                        ''', (workspace_id, user_id))
-                        
-                        # 将用户的所有现有数据迁移到默认 workspace
-                        for table in business_tables:
-                            if table == 'operation_logs':
-                                continue  # operation_logs 不需要迁移
-                            try:
-                                conn.execute(
-                                    f"UPDATE {table} SET workspaceId = ? WHERE userId = ? AND workspaceId IS NULL",
-                                    (workspace_id, user_id)
-                                )
-                            except Exception as e:
-                                logger.warning(f"迁移 {table} 表数据失败: {e}")
-                        
-                        logger.info(f"为用户 {username} (ID: {user_id}) 创建默认 workspace (ID: {workspace_id})")
-                
-                # 创建索引
-                conn.execute('CREATE INDEX IF NOT EXISTS idx_products_workspaceId ON products(workspaceId)')
-                conn.execute('CREATE INDEX IF NOT EXISTS idx_suppliers_workspaceId ON suppliers(workspaceId)')
-                conn.execute('CREATE INDEX IF NOT EXISTS idx_customers_workspaceId ON customers(workspaceId)')
-                conn.execute('CREATE INDEX IF NOT EXISTS idx_employees_workspaceId ON employees(workspaceId)')
-                conn.execute('CREATE INDEX IF NOT EXISTS idx_purchases_workspaceId ON purchases(workspaceId)')
-                conn.execute('CREATE INDEX IF NOT EXISTS idx_sales_workspaceId ON sales(workspaceId)')
-                conn.execute('CREATE INDEX IF NOT EXISTS idx_returns_workspaceId ON returns(workspaceId)')
-                conn.execute('CREATE INDEX IF NOT EXISTS idx_income_workspaceId ON income(workspaceId)')
-                conn.execute('CREATE INDEX IF NOT EXISTS idx_remittance_workspaceId ON remittance(workspaceId)')
-                conn.execute('CREATE INDEX IF NOT EXISTS idx_logs_workspaceId ON operation_logs(workspaceId)')
-                conn.execute('CREATE INDEX IF NOT EXISTS idx_workspace_members_workspaceId ON workspace_members(workspaceId)')
-                conn.execute('CREATE INDEX IF NOT EXISTS idx_workspace_members_userId ON workspace_members(userId)')
-                logger.info("已创建 workspace 相关索引")
-                
-                conn.commit()
-                logger.info("升级到版本 18 完成：Workspace 支持已添加")
-            except Exception as e:
-                logger.error(f"升级到版本 18 失败: {e}", exc_info=True)
-                conn.rollback()
-                raise
-        
-        # 版本 19: 修改唯一性约束从 UNIQUE(userId, name) 改为 UNIQUE(workspaceId, name)
-        if old_version < 19:
-            logger.info("升级到版本 19: 修改唯一性约束为 workspace 级别")
-            try:
-                # 需要修改的表：products, suppliers, customers, employees
-                tables_to_migrate = [
-                    ('products', 'supplierId'),
-                    ('suppliers', None),
-                    ('customers', None),
-                    ('employees', None)
-                ]
-                
-                for table_name, fk_column in tables_to_migrate:
-                    logger.info(f"迁移 {table_name} 表的唯一性约束...")
-                    
-                    # 检查是否有workspaceId为NULL的数据
-                    cursor = conn.execute(f"SELECT COUNT(*) FROM {table_name} WHERE workspaceId IS NULL")
-                    null_count = cursor.fetchone()[0]
-                    
-                    if null_count > 0:
-                        logger.warning(f"{table_name} 表中有 {null_count} 条记录的 workspaceId 为 NULL，这些记录将保留但不再允许新创建")
-                    
-                    # 创建新表（带新的唯一性约束）
-                    if table_name == 'products':
-                        conn.execute(f'''
-                            CREATE TABLE {table_name}_new (
-                                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                                userId INTEGER NOT NULL,
-                                workspaceId INTEGER,
-                                name TEXT NOT NULL,
-                                description TEXT,
-                                stock REAL DEFAULT 0,
-                                unit TEXT NOT NULL CHECK(unit IN ('斤', '公斤', '袋')),
-                                supplierId INTEGER,
-                                version INTEGER DEFAULT 1,
-                                created_at TEXT DEFAULT (datetime('now')),
-                                updated_at TEXT DEFAULT (datetime('now')),
-                                FOREIGN KEY (userId) REFERENCES users (id) ON DELETE CASCADE,
-                                FOREIGN KEY (workspaceId) REFERENCES workspaces (id) ON DELETE CASCADE,
-                                FOREIGN KEY (supplierId) REFERENCES suppliers (id) ON DELETE SET NULL,
-                                UNIQUE(workspaceId, name)
-                            )
-                        ''')
-                    elif table_name == 'suppliers':
-                        conn.execute(f'''
-                            CREATE TABLE {table_name}_new (
-                                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                                userId INTEGER NOT NULL,
-                                workspaceId INTEGER,
-                                name TEXT NOT NULL,
-                                note TEXT,
-                                created_at TEXT DEFAULT (datetime('now')),
-                                updated_at TEXT DEFAULT (datetime('now')),
-                                FOREIGN KEY (userId) REFERENCES users (id) ON DELETE CASCADE,
-                                FOREIGN KEY (workspaceId) REFERENCES workspaces (id) ON DELETE CASCADE,
-                                UNIQUE(workspaceId, name)
-                            )
-                        ''')
-                    elif table_name == 'customers':
-                        conn.execute(f'''
-                            CREATE TABLE {table_name}_new (
-                                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                                userId INTEGER NOT NULL,
-                                workspaceId INTEGER,
-                                name TEXT NOT NULL,
-                                note TEXT,
-                                created_at TEXT DEFAULT (datetime('now')),
-                                updated_at TEXT DEFAULT (datetime('now')),
-                                FOREIGN KEY (userId) REFERENCES users (id) ON DELETE CASCADE,
-                                FOREIGN KEY (workspaceId) REFERENCES workspaces (id) ON DELETE CASCADE,
-                                UNIQUE(workspaceId, name)
-                            )
-                        ''')
-                    elif table_name == 'employees':
-                        conn.execute(f'''
-                            CREATE TABLE {table_name}_new (
-                                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                                userId INTEGER NOT NULL,
-                                workspaceId INTEGER,
-                                name TEXT NOT NULL,
-                                note TEXT,
-                                created_at TEXT DEFAULT (datetime('now')),
-                                updated_at TEXT DEFAULT (datetime('now')),
-                                FOREIGN KEY (userId) REFERENCES users (id) ON DELETE CASCADE,
-                                FOREIGN KEY (workspaceId) REFERENCES workspaces (id) ON DELETE CASCADE,
-                                UNIQUE(workspaceId, name)
-                            )
-                        ''')
-                    
-                    # 迁移数据：只迁移workspaceId不为NULL的数据
-                    # workspaceId为NULL的旧数据将被删除（不符合新的业务逻辑：每个workspace数据完全独立）
-                    conn.execute(f'''
-                        INSERT INTO {table_name}_new 
-                        SELECT * FROM {table_name}
-                        WHERE workspaceId IS NOT NULL
-                    ''')
-                    
-                    if null_count > 0:
-                        logger.warning(f"{table_name} 表中有 {null_count} 条记录的 workspaceId 为 NULL，这些记录将被删除（不符合新的业务逻辑）")
-                    
-                    # 删除旧表
-                    conn.execute(f'DROP TABLE {table_name}')
-                    
-                    # 重命名新表
-                    conn.execute(f'ALTER TABLE {table_name}_new RENAME TO {table_name}')
-                    
-                    logger.info(f"{table_name} 表迁移完成")
-                
-                conn.commit()
-                logger.info("升级到版本 19 完成：唯一性约束已改为 workspace 级别")
-            except Exception as e:
-                logger.error(f"升级到版本 19 失败: {e}", exc_info=True)
-                conn.rollback()
-                raise
-        
-        # 版本 20: 更新 operation_logs 表的 CHECK 约束，添加 COVER 操作类型
-        if old_version < 20:
-            logger.info("升级到版本 20: 更新 operation_logs 表的 CHECK 约束，添加 COVER 操作类型")
-            try:
-                # 检查 operation_logs 表是否存在
-                cursor = conn.execute("SELECT name FROM sqlite_master WHERE type='table' AND name='operation_logs'")
-                if cursor.fetchone():
-                    # 表存在，需要重建以更新 CHECK 约束
-                    logger.info("重建 operation_logs 表以更新 CHECK 约束...")
-                    
-                    # 1. 创建新表（带新的 CHECK 约束）
-                    conn.execute('''
-                        CREATE TABLE operation_logs_new (
-                            id INTEGER PRIMARY KEY AUTOINCREMENT,
-                            userId INTEGER NOT NULL,
-                            workspaceId INTEGER,
-                            username TEXT NOT NULL,
-                            operation_type TEXT NOT NULL CHECK(operation_type IN ('CREATE', 'UPDATE', 'DELETE', 'COVER')),
-                            entity_type TEXT NOT NULL,
-                            entity_id INTEGER,
-                            entity_name TEXT,
-                            old_data TEXT,
-                            new_data TEXT,
-                            changes TEXT,
-                            ip_address TEXT,
-                            device_info TEXT,
-                            operation_time TEXT DEFAULT (datetime('now')),
-                            note TEXT,
-                            FOREIGN KEY (userId) REFERENCES users (id) ON DELETE CASCADE,
-                            FOREIGN KEY (workspaceId) REFERENCES workspaces (id) ON DELETE SET NULL
-                        )
-                    ''')
-                    
-                    # 2. 复制数据（只复制符合新约束的数据）
-                    conn.execute('''
-                        INSERT INTO operation_logs_new 
-                        SELECT * FROM operation_logs
-                        WHERE operation_type IN ('CREATE', 'UPDATE', 'DELETE', 'COVER')
-                    ''')
-                    
-                    # 3. 删除旧表
-                    conn.execute('DROP TABLE operation_logs')
-                    
-                    # 4. 重命名新表
-                    conn.execute('ALTER TABLE operation_logs_new RENAME TO operation_logs')
-                    
-                    # 5. 重新创建索引
-                    conn.execute('CREATE INDEX IF NOT EXISTS idx_logs_userId_time ON operation_logs(userId, operation_time DESC)')
-                    conn.execute('CREATE INDEX IF NOT EXISTS idx_logs_entity ON operation_logs(entity_type, entity_id)')
-                    conn.execute('CREATE INDEX IF NOT EXISTS idx_logs_type ON operation_logs(operation_type)')
-                    conn.execute('CREATE INDEX IF NOT EXISTS idx_logs_workspaceId ON operation_logs(workspaceId)')
-                    
-                    logger.info("已更新 operation_logs 表的 CHECK 约束，添加了 COVER 操作类型")
-                else:
-                    # 表不存在，直接创建（带新的 CHECK 约束）
-                    logger.info("创建 operation_logs 表（带 COVER 操作类型）...")
-                    conn.execute('''
-                        CREATE TABLE IF NOT EXISTS operation_logs (
-                            id INTEGER PRIMARY KEY AUTOINCREMENT,
-                            userId INTEGER NOT NULL,
-                            workspaceId INTEGER,
-                            username TEXT NOT NULL,
-                            operation_type TEXT NOT NULL CHECK(operation_type IN ('CREATE', 'UPDATE', 'DELETE', 'COVER')),
-                            entity_type TEXT NOT NULL,
-                            entity_id INTEGER,
-                            entity_name TEXT,
-                            old_data TEXT,
-                            new_data TEXT,
-                            changes TEXT,
-                            ip_address TEXT,
-                            device_info TEXT,
-                            operation_time TEXT DEFAULT (datetime('now')),
-                            note TEXT,
-                            FOREIGN KEY (userId) REFERENCES users (id) ON DELETE CASCADE,
-                            FOREIGN KEY (workspaceId) REFERENCES workspaces (id) ON DELETE SET NULL
-                        )
-                    ''')
-                    
-                    # 创建索引
-                    conn.execute('CREATE INDEX IF NOT EXISTS idx_logs_userId_time ON operation_logs(userId, operation_time DESC)')
-                    conn.execute('CREATE INDEX IF NOT EXISTS idx_logs_entity ON operation_logs(entity_type, entity_id)')
-                    conn.execute('CREATE INDEX IF NOT EXISTS idx_logs_type ON operation_logs(operation_type)')
-                    conn.execute('CREATE INDEX IF NOT EXISTS idx_logs_workspaceId ON operation_logs(workspaceId)')
-                    
-                    logger.info("已创建 operation_logs 表（带 COVER 操作类型）")
-                
-                conn.commit()
-                logger.info("升级到版本 20 完成：operation_logs 表已更新")
-            except Exception as e:
-                logger.error(f"升级到版本 20 失败: {e}", exc_info=True)
-                conn.rollback()
-                raise
-        
-        # 版本 13: 修改 online_users 表支持多设备
-        if old_version < 13:
-            logger.info("升级到版本 13: 修改 online_users 表支持多设备")
-            try:
-                # 检查表是否存在
-                cursor = conn.execute("SELECT name FROM sqlite_master WHERE type='table' AND name='online_users'")
-                if cursor.fetchone():
-                    # 删除旧表（会丢失在线状态，但这是必要的）
-                    conn.execute("DROP TABLE IF EXISTS online_users")
-                    logger.info("已删除旧的 online_users 表")
-                
-                # 创建新表（支持多设备）
-                conn.execute('''
-                    CREATE TABLE IF NOT EXISTS online_users (
-                        userId INTEGER NOT NULL,
-                        deviceId TEXT NOT NULL,
-                        username TEXT NOT NULL,
-                        last_heartbeat TEXT DEFAULT (datetime('now')),
-                        current_action TEXT,
-                        platform TEXT,
-                        device_name TEXT,
-                        PRIMARY KEY (userId, deviceId),
-                        FOREIGN KEY (userId) REFERENCES users (id) ON DELETE CASCADE)
-                ''')
-                logger.info("已创建新的 online_users 表（支持多设备）")
-            except Exception as e:
-                logger.error(f"升级 online_users 表失败: {e}", exc_info=True)
-                raise
-        
-        # 创建索引
-        conn.execute('CREATE INDEX IF NOT EXISTS idx_products_userId ON products(userId)')
-        conn.execute('CREATE INDEX IF NOT EXISTS idx_purchases_userId ON purchases(userId)')
-        conn.execute('CREATE INDEX IF NOT EXISTS idx_sales_userId ON sales(userId)')
-        conn.execute('CREATE INDEX IF NOT EXISTS idx_returns_userId ON returns(userId)')
-        conn.execute('CREATE INDEX IF NOT EXISTS idx_income_userId ON income(userId)')
-        conn.execute('CREATE INDEX IF NOT EXISTS idx_remittance_userId ON remittance(userId)')
-        
-        # 确保 user_settings 表有所有必需的列（兼容性修复，防止遗漏）
-        try:
-            cursor = conn.execute("PRAGMA table_info(user_settings)")
-            columns = [row[1] for row in cursor.fetchall()]
-            
-            if 'notify_device_online' not in columns:
-                logger.info("补充添加 notify_device_online 列到 user_settings 表")
-                conn.execute('ALTER TABLE user_settings ADD COLUMN notify_device_online INTEGER DEFAULT 1')
-            
-            if 'notify_device_offline' not in columns:
-                logger.info("补充添加 notify_device_offline 列到 user_settings 表")
-                conn.execute('ALTER TABLE user_settings ADD COLUMN notify_device_offline INTEGER DEFAULT 1')
-        except Exception as e:
-            logger.debug(f"检查 user_settings 表列时出错: {e}")
-
-        # 确保操作日志表的索引存在（如果表已存在）
-        try:
-            cursor = conn.execute("SELECT name FROM sqlite_master WHERE type='table' AND name='operation_logs'")
-            if cursor.fetchone():
-                conn.execute('CREATE INDEX IF NOT EXISTS idx_logs_userId_time ON operation_logs(userId, operation_time DESC)')
-                conn.execute('CREATE INDEX IF NOT EXISTS idx_logs_entity ON operation_logs(entity_type, entity_id)')
-                conn.execute('CREATE INDEX IF NOT EXISTS idx_logs_type ON operation_logs(operation_type)')
-        except Exception as e:
-            logger.debug(f"创建操作日志索引时出错（可能表不存在）: {e}")
-
-        self._set_version(conn, new_version)
-        conn.commit()
-        logger.info("数据库升级完成")
-    
     @contextmanager
-    def get_connection(self):
+    def get_connection(self, readonly: bool = False):
         """
         获取数据库连接的上下文管理器
         自动处理连接的获取、归还和错误重试
         
+        Args:
+            readonly: 仅执行查询（读写分离模式下使用只读连接，共享模式下忽略）
+        
         Usage:
             with pool.get_connection() as conn:
                 cursor = conn.execute("SELECT * FROM users")
@@ -1118,23 +1248,23 @@ class SQLiteConnectionPool:
         """
         conn = None
         try:
-            conn = self._acquire_connection()
+            conn = self._acquire_connection(readonly)
             yield conn
             conn.commit()  # 自动提交事务
         except sqlite3.OperationalError as e:
             if conn:
+                conn.suspect = True
                 conn.rollback()  # 回滚事务
             
             # 处理 SQLITE_BUSY 错误
-            if "database is locked" in str(e).lower() or "database is locked" in str(e):
-                self._stats['busy_errors'] += 1
-                logger.warning(f"数据库锁定错误，将重试: {e}")
-                raise DatabaseBusyError(f"数据库暂时繁忙，请稍后重试: {e}")
-            else:
-                logger.error(f"数据库操作错误: {e}")
+            error = self._translate_operational_error(e)
+            if error is e:
                 raise
+            raise error
         except Exception as e:
             if conn:
+                if isinstance(e, sqlite3.Error):
+                    conn.suspect = True
                 conn.rollback()
             logger.error(f"数据库操作异常: {e}")
             raise
@@ -1142,77 +1272,360 @@ class SQLiteConnectionPool:
             if conn:
                 self._release_connection(conn)
     
-    def _acquire_connection(self) -> sqlite3.Connection:
+    def _submit(self, func: Callable, *args) -> Future:
+        """将 SQLite 调用提交到数据库线程池（保留当前 contextvars 上下文）"""
+        ctx = contextvars.copy_context()
+        return self._executor.submit(ctx.run, func, *args)
+    
+    async def run(self, func: Callable, *args) -> Any:
+        """在数据库线程池中执行同步函数"""
+        return await asyncio.wrap_future(self._submit(func, *args))
+    
+    @asynccontextmanager
+    async def acquire(self, readonly: bool = False):
+        """
+        异步获取数据库连接的上下文管理器
+        连接的获取、SQL 执行和归还都不会阻塞事件循环；正常退出时自动提交，异常时回滚
+        
+        Args:
+            readonly: 仅执行查询。读写分离模式下使用只读连接，不与写请求排队；共享模式下忽略
+        
+        如果当前任务已经持有连接（请求级连接），嵌套的 acquire() 直接复用该连接
+        （可以读到本事务未提交的修改），提交和回滚由最外层负责。
+        读写分离模式下持有的是只读连接而需要写入时，才会另外获取写连接
+        
+        Usage:
+            async with pool.acquire() as conn:
+                cursor = await conn.execute("SELECT * FROM users")
+                results = await cursor.fetchall()
+        """
+        held = self._request_connection(writable=not readonly)
+        if held is not None:
+            self._stats['reused_acquisitions'] += 1
+            yield held
+            return
+        
+        writable = not (self._split and readonly)
+        wait_start = time.perf_counter()
+        raw = await self._acquire_connection_async(readonly)
+        record(PHASE_DB_WAIT, time.perf_counter() - wait_start)
+        conn = AsyncConnection(self, raw)
+        token = _request_connection.set((self, asyncio.current_task(), conn, writable))
+        # SQL 时限从拿到连接时开始计时（等待连接的时间不计入）
+        budget = _query_budget.get()
+        deadline_token = _query_deadline.set(time.monotonic() + budget if budget else None)
+        try:
+            yield conn
+            await conn.commit()  # 自动提交事务
+        except sqlite3.OperationalError as e:
+            raw.suspect = True
+            await self._rollback_quietly(conn)
+            raise self._translate_operational_error(e)
+        except Exception as e:
+            if isinstance(e, sqlite3.Error):
+                raw.suspect = True
+            await self._rollback_quietly(conn)
+            logger.error(f"数据库操作异常: {e}")
+            raise
+        finally:
+            _request_connection.reset(token)
+            _query_deadline.reset(deadline_token)
+            # 归还连接不受请求取消影响，避免连接泄漏
+            await asyncio.shield(self.run(self._release_async_connection, conn))
+    
+    def _request_connection(self, writable: bool = False) -> Optional[AsyncConnection]:
+        """
+        获取当前任务持有的本连接池连接
+        
+        Args:
+            writable: 是否要求连接可写（读写分离模式下只读连接不满足）
+        
+        Returns:
+            可复用的连接，没有则返回 None
+        """
+        held = _request_connection.get()
+        if held is None or held[0] is not self or held[1] is not asyncio.current_task():
+            return None
+        if writable and not held[3]:
+            return None
+        return held[2]
+    
+    async def transaction(
+        self,
+        func: Callable[[AsyncConnection], Awaitable[Any]],
+        *,
+        immediate: bool = True,
+        retries: Optional[int] = None,
+        backoff: Optional[float] = None
+    ) -> Any:
+        """
+        在事务中执行一个完整的工作单元，遇到 SQLITE_BUSY 或乐观锁冲突时整体重试
+        
+        func 会在重试时从头重新执行（重新读取库存、重新计算、重新写入），
+        因此其中只能包含数据库操作和可重复执行的校验；发生乐观锁冲突时应抛出 OptimisticLockError
+        
+        Args:
+            func: 接收 AsyncConnection 的异步函数，不要自行提交或回滚
+            immediate: 使用 BEGIN IMMEDIATE 在事务开始时就获取写锁，避免读后升级写锁时失败
+            retries: 最多重试次数（默认使用类初始化时的 retry_attempts）
+            backoff: 首次重试前的等待时间（秒，指数退避并带随机抖动；默认使用 retry_delay）
+        
+        Returns:
+            func 的返回值
+        
+        Raises:
+            DatabaseBusyError: 重试后数据库仍然繁忙
+            OptimisticLockError: 重试后仍然发生乐观锁冲突
+        
+        Usage:
+            async def _sell(conn):
+                ...
+                if cursor.rowcount == 0:
+                    raise OptimisticLockError("产品库存已被其他操作修改")
+                return sale_id
+            
+            sale_id = await pool.transaction(_sell)
+        """
+        if retries is None:
+            retries = self.retry_attempts
+        if backoff is None:
+            backoff = self.retry_delay
+        
+        async with self.acquire() as conn:
+            if conn.in_transaction:
+                # 已处于外层事务中：无法单独重试，由外层负责提交和回滚
+                return await func(conn)
+            
+            attempt = 0
+            while True:
+                try:
+                    await conn.execute("BEGIN IMMEDIATE" if immediate else "BEGIN")
+                    result = await func(conn)
+                    await conn.commit()
+                    return result
+                except (sqlite3.OperationalError, DatabaseBusyError, OptimisticLockError) as e:
+                    await self._rollback_quietly(conn)
+                    busy = isinstance(e, DatabaseBusyError) or "database is locked" in str(e).lower()
+                    if not busy and not isinstance(e, OptimisticLockError):
+                        raise
+                    if attempt >= retries:
+                        self._stats['transaction_failures'] += 1
+                        if isinstance(e, sqlite3.OperationalError):
+                            raise self._translate_operational_error(e)
+                        raise
+                    attempt += 1
+                    self._stats['transaction_retries'] += 1
+                    delay = backoff * (2 ** (attempt - 1)) * random.uniform(0.5, 1.5)
+                    logger.info(f"事务冲突，{delay * 1000:.0f}ms 后整体重试 ({attempt}/{retries}): {e}")
+                    await asyncio.sleep(delay)
+                except BaseException:
+                    await self._rollback_quietly(conn)
+                    raise
+    
+    async def group_commit(self, func: Callable[[sqlite3.Connection], Any]) -> Any:
+        """
+        通过组提交执行一个小写事务（心跳、操作日志、单行创建等）
+        
+        Args:
+            func: 接收 sqlite3.Connection 的同步函数，只应执行本次写操作所需的语句，不要自行提交
+        
+        Returns:
+            func 的返回值
+        """
+        return await self._group_committer.submit(func)
+    
+    async def _rollback_quietly(self, conn: AsyncConnection):
+        try:
+            await conn.rollback()
+        except Exception as e:
+            logger.warning(f"回滚事务失败: {e}")
+    
+    def _translate_operational_error(self, e: sqlite3.OperationalError) -> Exception:
+        """将 SQLite 锁定错误转换为 DatabaseBusyError，其他错误原样返回"""
+        if "database is locked" in str(e).lower():
+            self._stats['busy_errors'] += 1
+            logger.warning(f"数据库锁定错误，将重试: {e}")
+            return DatabaseBusyError(f"数据库暂时繁忙，请稍后重试: {e}")
+        logger.error(f"数据库操作错误: {e}")
+        return e
+    
+    def _release_async_connection(self, conn: AsyncConnection):
+        """归还异步连接（在数据库线程中执行，先等待该连接上未完成的调用）"""
+        conn._wait_pending()
+        self._release_connection(conn.raw)
+    
+    def _acquire_connection(self, readonly: bool = False) -> sqlite3.Connection:
         """
         从连接池获取连接
         
+        Args:
+            readonly: 仅执行查询（读写分离模式下从只读连接池获取）
+        
+        Returns:
+            SQLite 连接对象
+        """
+        queue = self._queue_for(readonly)
+        conn = self._checkout(queue)
+        if conn is None:
+            raise self._timeout_error(queue)
+        return conn
+    
+    async def _acquire_connection_async(self, readonly: bool = False) -> sqlite3.Connection:
+        """
+        从连接池获取连接（异步）：排队等待不占用线程，被取消时不会丢失连接
+        
+        Args:
+            readonly: 仅执行查询（读写分离模式下从只读连接池获取）
+        
         Returns:
             SQLite 连接对象
         """
-        start_time = time.time()
+        queue = self._queue_for(readonly)
+        conn = await self._checkout_async(queue)
+        if conn is None:
+            raise self._timeout_error(queue)
+        return conn
+    
+    def _queue_for(self, readonly: bool) -> "_ConnectionQueue":
+        """
+        选择连接队列
+        读写分离模式下写请求在唯一的写连接队列上按到达顺序等待，进程内的写操作不会再互相争抢 SQLite 写锁
+        """
+        if not self._split or readonly:
+            return self._pool
+        with self._lock:
+            self._stats['writer_acquisitions'] += 1
+            if self._writer_queue.in_use:
+                self._stats['writer_waits'] += 1
+        return self._writer_queue
+    
+    def _timeout_error(self, queue: "_ConnectionQueue") -> "ConnectionTimeoutError":
+        if queue is self._writer_queue:
+            return ConnectionTimeoutError(f"等待数据库写连接超时 ({self.timeout}秒)")
+        return ConnectionTimeoutError(
+            f"获取数据库连接超时 ({self.timeout}秒)，当前活跃连接: {self._pool.in_use}/{self._pool_capacity}"
+        )
+    
+    def _checkout(self, queue: "_ConnectionQueue") -> Optional[sqlite3.Connection]:
+        """
+        从连接队列借出连接，只对使用中出过错的连接做校验（懒校验）
         
+        Returns:
+            SQLite 连接对象，超时返回 None
+        """
+        deadline = time.monotonic() + self.timeout
         while True:
-            # 尝试从池中获取连接
+            conn = queue.get(max(0.0, deadline - time.monotonic()))
+            if conn is None:
+                return None
+            if self._ready(conn, queue):
+                return conn
+    
+    async def _checkout_async(self, queue: "_ConnectionQueue") -> Optional[sqlite3.Connection]:
+        """
+        _checkout 的异步版本：校验连接（执行 SQL）在数据库线程池中进行
+        
+        Returns:
+            SQLite 连接对象，超时返回 None
+        """
+        deadline = time.monotonic() + self.timeout
+        while True:
+            conn = await queue.get_async(max(0.0, deadline - time.monotonic()), self._executor)
+            if conn is None:
+                return None
+            if not conn.suspect:
+                conn.uses += 1
+                return conn
+            future = self._executor.submit(self._ready, conn, queue)
             try:
-                conn = self._pool.get(timeout=0.1)
-                with self._lock:
-                    self._active_connections += 1
-                    self._stats['active_connections'] = self._active_connections
-                    self._stats['pool_size'] = self._pool.qsize()
+                ready = await asyncio.shield(asyncio.wrap_future(future))
+            except asyncio.CancelledError:
+                future.add_done_callback(lambda f, conn=conn: self._release_validated(conn, f))
+                raise
+            if ready:
                 return conn
-            except Empty:
-                # 池中没有可用连接
-                with self._lock:
-                    if self._active_connections < self.max_connections:
-                        # 创建新连接
-                        conn = self._create_connection()
-                        if conn:
-                            self._active_connections += 1
-                            self._stats['total_connections'] += 1
-                            self._stats['active_connections'] = self._active_connections
-                            return conn
-                
-                # 检查超时
-                elapsed = time.time() - start_time
-                if elapsed >= self.timeout:
-                    raise ConnectionTimeoutError(
-                        f"获取数据库连接超时 ({self.timeout}秒)，当前活跃连接: {self._active_connections}/{self.max_connections}"
-                    )
-                
-                # 等待一小段时间后重试
-                time.sleep(0.05)
+    
+    def _ready(self, conn: sqlite3.Connection, queue: "_ConnectionQueue") -> bool:
+        """
+        借出前的准备：使用中出过错的连接先执行 SELECT 1 校验，损坏的连接直接丢弃
+        
+        Returns:
+            连接是否可以借出
+        """
+        if conn.suspect:
+            with self._lock:
+                self._stats['validations'] += 1
+            try:
+                conn.execute("SELECT 1")
+                conn.suspect = False
+            except sqlite3.Error as e:
+                logger.warning(f"检测到损坏的连接，丢弃: {e}")
+                self._drop_connection(conn, queue, 'discarded_connections')
+                return False
+        conn.uses += 1
+        return True
+    
+    def _release_validated(self, conn: sqlite3.Connection, future: Future):
+        """归还调用方已取消时校验完成的连接（校验失败的连接已被丢弃）"""
+        if not future.cancelled() and future.exception() is None and future.result():
+            self._release_connection(conn)
     
     def _release_connection(self, conn: sqlite3.Connection):
-        """将连接归还到连接池"""
+        """
+        将连接归还到连接池
+        热路径上不做 SELECT 1 校验，也不持有连接池的全局锁：
+        仅在仍有未结束的事务时回滚，到达最大存活时间或使用次数的连接关闭后由新连接替代
+        """
+        queue = self._writer_queue if self._split and conn is self._writer else self._pool
+        
         try:
-            # 重置连接状态
-            conn.rollback()  # 回滚任何未提交的事务
-            
+            if conn.in_transaction:
+                conn.rollback()  # 回滚任何未提交的事务
+        except sqlite3.Error as e:
+            logger.warning(f"归还连接时回滚失败，丢弃: {e}")
+            self._drop_connection(conn, queue, 'discarded_connections')
+            return
+        
+        now = time.monotonic()
+        if (self.max_lifetime and now - conn.created_at > self.max_lifetime) or \
+                (self.max_uses and conn.uses >= self.max_uses):
+            self._drop_connection(conn, queue, 'recycled_connections')
+            return
+        
+        conn.last_used = now
+        queue.put(conn)
+    
+    def _drop_connection(self, conn: sqlite3.Connection, queue: "_ConnectionQueue", counter: str):
+        """关闭借出的连接并释放其容量（等待者会得到新建的连接）"""
+        self._close_quietly(conn)
+        with self._lock:
+            self._stats[counter] += 1
+        queue.discard()
+    
+    def trim_idle(self) -> int:
+        """
+        关闭空闲超过 idle_timeout 的连接（至少保留 min_idle 个）
+        
+        Returns:
+            关闭的连接数
+        """
+        if not self.idle_timeout:
+            return 0
+        removed = self._pool.trim(self.idle_timeout, self.min_idle)
+        for conn in removed:
+            self._close_quietly(conn)
+        if removed:
             with self._lock:
-                self._active_connections -= 1
-                self._stats['active_connections'] = self._active_connections
-                
-                # 检查连接是否仍然有效
-                try:
-                    conn.execute("SELECT 1")
-                except sqlite3.Error:
-                    # 连接已损坏，不归还到池中
-                    logger.warning("检测到损坏的连接，丢弃")
-                    return
-                
-                # 归还到池中
-                try:
-                    self._pool.put_nowait(conn)
-                    self._stats['pool_size'] = self._pool.qsize()
-                except:
-                    # 池已满，关闭连接
-                    conn.close()
-        except Exception as e:
-            logger.error(f"释放连接时出错: {e}")
-            try:
-                conn.close()
-            except:
-                pass
+                self._stats['trimmed_connections'] += len(removed)
+            logger.debug(f"回收空闲连接: {len(removed)} 个")
+        return len(removed)
+    
+    @staticmethod
+    def _close_quietly(conn: sqlite3.Connection):
+        try:
+            conn.close()
+        except Exception:
+            pass
     
     def execute_with_retry(
         self,
@@ -1263,27 +1676,40 @@ class SQLiteConnectionPool:
     def get_stats(self) -> dict:
         """获取连接池统计信息"""
         with self._lock:
-            return {
+            stats = {
                 **self._stats,
-                'pool_size': self._pool.qsize(),
-                'active_connections': self._active_connections,
-                'max_connections': self.max_connections
+                'total_connections': self._pool.size + self._writer_queue.size,
+                'pool_size': self._pool.idle_count,
+                'active_connections': self._pool.in_use,
+                'waiting': self._pool.waiting,
+                'max_connections': self.max_connections,
+                'mode': self.mode,
+                'profile': self.profile,
+                'writer_busy': self._split and self._writer_queue.in_use > 0,
+                # 每次获取连接的等待时间分布（毫秒）
+                'acquire_wait': self._pool.wait_histogram.snapshot(),
+                'group_commit': self._group_committer.get_stats()
             }
+        if self._split:
+            stats['writer_waiting'] = self._writer_queue.waiting
+            stats['writer_wait'] = self._writer_queue.wait_histogram.snapshot()
+        return stats
+    
+    def wait_histograms(self) -> Dict[str, LatencyHistogram]:
+        """获取连接等待时间直方图：pool（普通连接）及 writer（读写分离模式的专用写连接）"""
+        histograms = {'pool': self._pool.wait_histogram}
+        if self._split:
+            histograms['writer'] = self._writer_queue.wait_histogram
+        return histograms
     
     def close_all(self):
         """关闭所有连接"""
         logger.info("关闭所有数据库连接...")
-        while not self._pool.empty():
-            try:
-                conn = self._pool.get_nowait()
-                conn.close()
-            except:
-                pass
+        self._pool.close()
+        self._writer_queue.close()
+        self._writer = None
         
-        with self._lock:
-            self._active_connections = 0
-            self._stats['active_connections'] = 0
-            self._stats['pool_size'] = 0
+        self._executor.shutdown(wait=False)
 
 
 # 全局连接池实例
@@ -1378,3 +1804,21 @@ class ConnectionTimeoutError(Exception):
     pass
 
 
+class QueryTimeoutError(HTTPException):
+    """
+    SQL 执行超过当前请求的时限被中断（见 set_query_budget）
+    继承 HTTPException，路由中的 except HTTPException: raise 会原样抛出，由全局异常处理器返回 QUERY_TIMEOUT
+    """
+    
+    def __init__(self):
+        super().__init__(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail="查询耗时过长已被中断，请缩小查询范围或减小每页数量后重试"
+        )
+
+
+class OptimisticLockError(Exception):
+    """乐观锁冲突（数据已被其他操作修改），pool.transaction() 会整体重试"""
+    pass
+
+
@@ -0,0 +1,206 @@
+"""
+日志配置
+所有日志记录先放入内存队列（QueueHandler），由后台线程（QueueListener）格式化并写入控制台 / 文件，
+请求处理过程中不会因为磁盘 I/O 阻塞；支持 JSON 格式、按路由采样访问日志、按路由提高日志级别和按大小轮转
+"""
+
+import atexit
+import contextvars
+import json
+import logging
+import logging.handlers
+import queue
+import random
+from datetime import datetime, timezone
+from typing import Optional, Dict, List, Tuple
+
+# 访问日志使用的 logger
+access_logger = logging.getLogger("server.access")
+
+# 访问日志的结构化字段（通过 extra 传入）
+ACCESS_FIELDS = ("method", "path", "status", "duration_ms", "client")
+
+TEXT_FORMAT = '%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+
+# 当前请求所属路由的最低日志级别（低于该级别的记录直接丢弃）
+_route_level: contextvars.ContextVar[int] = contextvars.ContextVar("route_level", default=logging.NOTSET)
+
+# 按路径前缀匹配的访问日志采样率 / 日志级别覆盖（最长前缀优先）
+_sample_rates: List[Tuple[str, float]] = []
+_level_overrides: List[Tuple[str, int]] = []
+# 慢请求始终记录（毫秒）
+_slow_request_ms = 1000.0
+
+_listener: Optional[logging.handlers.QueueListener] = None
+_queue_handler: Optional["_NonBlockingQueueHandler"] = None
+
+
+class JsonFormatter(logging.Formatter):
+    """每条日志输出为一行 JSON"""
+
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            "ts": datetime.fromtimestamp(record.created, timezone.utc).isoformat(timespec="milliseconds"),
+            "level": record.levelname,
+            "logger": record.name,
+            "msg": record.getMessage(),
+        }
+        for name in ACCESS_FIELDS:
+            value = getattr(record, name, None)
+            if value is not None:
+                entry[name] = value
+        if record.exc_info:
+            entry["exc"] = self.formatException(record.exc_info)
+        elif record.exc_text:
+            entry["exc"] = record.exc_text
+        return json.dumps(entry, ensure_ascii=False)
+
+
+class _RouteLevelFilter(logging.Filter):
+    """丢弃低于当前路由最低级别的日志"""
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        return record.levelno >= _route_level.get()
+
+
+class _NonBlockingQueueHandler(logging.handlers.QueueHandler):
+    """队列满时丢弃日志并计数，调用方永不等待"""
+
+    def __init__(self, log_queue: queue.Queue):
+        super().__init__(log_queue)
+        self.dropped = 0
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        # 只合并 msg % args（参数可能在之后被修改），格式化交给后台线程
+        record.msg = record.getMessage()
+        record.args = None
+        if record.exc_info:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+    def enqueue(self, record: logging.LogRecord):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+
+def _parse_rules(spec: str, convert) -> List[Tuple[str, object]]:
+    """解析 "前缀=值,前缀=值" 格式的配置，按前缀长度降序排列"""
+    rules = []
+    for item in (spec or "").split(","):
+        if "=" not in item:
+            continue
+        prefix, value = item.rsplit("=", 1)
+        rules.append((prefix.strip(), convert(value.strip())))
+    rules.sort(key=lambda rule: len(rule[0]), reverse=True)
+    return rules
+
+
+def _match(rules: List[Tuple[str, object]], path: str, default):
+    for prefix, value in rules:
+        if path.startswith(prefix):
+            return value
+    return default
+
+
+def setup_logging(
+    level: str = "INFO",
+    log_format: str = "text",
+    log_file: Optional[str] = None,
+    max_bytes: int = 10 * 1024 * 1024,
+    backup_count: int = 5,
+    sample_rates: str = "",
+    level_overrides: str = "",
+    slow_request_ms: float = 1000.0,
+    queue_size: int = 10000
+):
+    """
+    配置根 logger：QueueHandler -> 后台线程 -> 控制台（及轮转文件）
+
+    Args:
+        level: 日志级别
+        log_format: text / json
+        log_file: 日志文件路径（为空时只输出到控制台）
+        max_bytes: 单个日志文件最大字节数，超出后轮转
+        backup_count: 保留的历史日志文件数
+        sample_rates: 访问日志采样率，如 "/api/users/heartbeat=0.01,/api/users/online=0.1"
+        level_overrides: 按路由提高日志级别，如 "/api/users/heartbeat=WARNING"
+        slow_request_ms: 超过该耗时的请求始终记录访问日志（毫秒）
+        queue_size: 日志队列容量，队列满时新日志被丢弃
+    """
+    global _listener, _queue_handler, _sample_rates, _level_overrides, _slow_request_ms
+
+    stop_logging()
+
+    formatter = JsonFormatter() if log_format == "json" else logging.Formatter(TEXT_FORMAT)
+    handlers: List[logging.Handler] = [logging.StreamHandler()]
+    if log_file:
+        handlers.append(logging.handlers.RotatingFileHandler(
+            log_file, maxBytes=max_bytes, backupCount=backup_count, encoding="utf-8"
+        ))
+    for handler in handlers:
+        handler.setFormatter(formatter)
+
+    log_queue: queue.Queue = queue.Queue(maxsize=queue_size)
+    _queue_handler = _NonBlockingQueueHandler(log_queue)
+    _queue_handler.addFilter(_RouteLevelFilter())
+    _listener = logging.handlers.QueueListener(log_queue, *handlers, respect_handler_level=True)
+    _listener.start()
+    # 进程退出前写完队列中剩余的日志
+    atexit.register(stop_logging)
+
+    root = logging.getLogger()
+    for handler in root.handlers[:]:
+        root.removeHandler(handler)
+    root.addHandler(_queue_handler)
+    root.setLevel(level.upper())
+
+    _sample_rates = _parse_rules(sample_rates, float)
+    _level_overrides = _parse_rules(level_overrides, lambda v: logging.getLevelName(v.upper()))
+    _slow_request_ms = slow_request_ms
+
+
+def stop_logging():
+    """停止后台线程（写完队列中剩余的日志）"""
+    global _listener
+    if _listener is not None:
+        _listener.stop()
+        _listener = None
+
+
+def set_route_level(path: str) -> Optional[contextvars.Token]:
+    """
+    根据路径设置当前请求的最低日志级别
+
+    Returns:
+        用于 reset_route_level 的 token；该路径没有级别覆盖时返回 None
+    """
+    level = _match(_level_overrides, path, None)
+    if level is None:
+        return None
+    return _route_level.set(level)
+
+
+def reset_route_level(token: Optional[contextvars.Token]):
+    """恢复 set_route_level 之前的日志级别"""
+    if token is not None:
+        _route_level.reset(token)
+
+
+def should_log_access(path: str, status_code: Optional[int], duration_ms: float) -> bool:
+    """
+    是否记录这次请求的访问日志（错误和慢请求始终记录，其余按路由采样率抽样）
+    """
+    if status_code is None or status_code >= 400 or duration_ms >= _slow_request_ms:
+        return True
+    rate = _match(_sample_rates, path, 1.0)
+    return rate >= 1.0 or random.random() < rate
+
+
+def get_logging_stats() -> Dict[str, int]:
+    """获取日志队列统计信息"""
+    if _queue_handler is None:
+        return {'queued': 0, 'dropped': 0}
+    return {'queued': _queue_handler.queue.qsize(), 'dropped': _queue_handler.dropped}
@@ -8,13 +8,26 @@ import os
 import asyncio
 from contextlib import asynccontextmanager
 from fastapi import FastAPI
-from fastapi.responses import JSONResponse
+from fastapi.responses import JSONResponse, Response
 from fastapi.middleware.gzip import GZipMiddleware
-from fastapi.middleware.cors import CORSMiddleware
 
-from server.database import init_database, get_pool
+from server.database import init_database, get_pool, set_query_tracer
+from server.services.db_maintenance import init_maintenance, get_maintenance
+from server.services.password_hasher import init_password_hasher, get_password_hasher
+from server.services.slow_query_log import init_slow_query_log, get_slow_query_log
 from server.constants import APP_VERSION
-from server.middleware import setup_middleware
+from server.logging_config import setup_logging, get_logging_stats
+from server.timing import TimedRoute, route_timings
+from server.metrics import CONTENT_TYPE as METRICS_CONTENT_TYPE, render_metrics, track_background_task
+from server.middleware import (
+    setup_middleware,
+    init_rate_limiter,
+    get_rate_limiter,
+    set_admin_usernames,
+    configure_query_deadlines,
+    get_query_deadlines,
+    get_query_timeouts,
+)
 from server.routers import (
     auth,
     users,
@@ -30,26 +43,62 @@ from server.routers import (
     settings,
     help,
     audit_logs,
-    workspaces
+    workspaces,
+    admin
 )
 
-# 配置日志
-logging.basicConfig(
-    level=logging.INFO,
-    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
-)
-logger = logging.getLogger(__name__)
-
 # 从环境变量获取配置，如果没有则使用默认值
 # 默认路径为 data/agrisalews.db，相对于server目录
 # 如果从项目根目录运行，可以使用 server/data/agrisalews.db
 # 如果server目录是独立的，使用 data/agrisalews.db
 DB_PATH = os.getenv("DB_PATH", "data/agrisalews.db")
 DB_MAX_CONNECTIONS = int(os.getenv("DB_MAX_CONNECTIONS", "10"))
+DB_PROFILE = os.getenv("DB_PROFILE", "balanced")  # low-memory / balanced / throughput
 DB_BUSY_TIMEOUT = int(os.getenv("DB_BUSY_TIMEOUT", "5000"))
+DB_POOL_MODE = os.getenv("DB_POOL_MODE", "shared")  # shared / split（读写分离）
+DB_GROUP_COMMIT_LATENCY_MS = float(os.getenv("DB_GROUP_COMMIT_LATENCY_MS", "5"))
+DB_GROUP_COMMIT_BATCH = int(os.getenv("DB_GROUP_COMMIT_BATCH", "64"))
+DB_CONN_MAX_LIFETIME = float(os.getenv("DB_CONN_MAX_LIFETIME", "3600"))  # 秒，0 表示不限制
+DB_CONN_MAX_USES = int(os.getenv("DB_CONN_MAX_USES", "10000"))  # 0 表示不限制
+DB_CONN_IDLE_TIMEOUT = float(os.getenv("DB_CONN_IDLE_TIMEOUT", "300"))  # 秒，0 表示不回收
+DB_MAINTENANCE_INTERVAL = float(os.getenv("DB_MAINTENANCE_INTERVAL", "30"))  # 秒
+DB_MAINTENANCE_IDLE_SECONDS = float(os.getenv("DB_MAINTENANCE_IDLE_SECONDS", "60"))  # 秒
+AUTH_HASH_WORKERS = int(os.getenv("AUTH_HASH_WORKERS", "0"))  # 0 表示按 CPU 核数（最多 4）
+AUTH_HASH_QUEUE = int(os.getenv("AUTH_HASH_QUEUE", "32"))
+RATE_LIMIT_ENABLED = os.getenv("RATE_LIMIT_ENABLED", "false").lower() in ("1", "true", "yes")
+RATE_LIMIT_SHARED_DB = os.getenv("RATE_LIMIT_SHARED_DB", "")  # 多 worker 进程共享限流状态的 SQLite 文件，为空表示进程内状态
+RATE_LIMIT_MAX_KEYS = int(os.getenv("RATE_LIMIT_MAX_KEYS", "10000"))
 SECRET_KEY = os.getenv("SECRET_KEY", "your-secret-key-change-this-in-production")
 HOST = os.getenv("HOST", "0.0.0.0")
 PORT = int(os.getenv("PORT", "9000"))  # 默认端口 9000
+LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO")
+LOG_FORMAT = os.getenv("LOG_FORMAT", "text")  # text / json
+LOG_FILE = os.getenv("LOG_FILE", "")  # 为空时只输出到控制台
+LOG_MAX_BYTES = int(os.getenv("LOG_MAX_BYTES", str(10 * 1024 * 1024)))
+LOG_BACKUP_COUNT = int(os.getenv("LOG_BACKUP_COUNT", "5"))
+# 访问日志采样率（路径前缀=比例），错误和慢请求始终记录
+LOG_SAMPLE_RATES = os.getenv("LOG_SAMPLE_RATES", "/api/users/heartbeat=0.01,/api/users/online=0.1,/metrics=0")
+# 按路由提高请求内的日志级别（路径前缀=级别）
+LOG_LEVEL_OVERRIDES = os.getenv("LOG_LEVEL_OVERRIDES", "/api/users/heartbeat=WARNING,/api/users/online=WARNING")
+LOG_SLOW_REQUEST_MS = float(os.getenv("LOG_SLOW_REQUEST_MS", "1000"))
+SLOW_QUERY_MS = float(os.getenv("SLOW_QUERY_MS", "0"))  # 慢查询阈值（毫秒），0 表示不记录
+SLOW_QUERY_LOG_FILE = os.getenv("SLOW_QUERY_LOG_FILE", "")  # 为空时写入数据库所在目录的 slow_queries.log
+ADMIN_USERNAMES = os.getenv("ADMIN_USERNAMES", "")  # 可以访问 /api/admin 运维接口的用户名（逗号分隔）
+# 各路由类别的 SQL 执行时限（毫秒，0 表示不限制），超时的查询被中断并返回 503 QUERY_TIMEOUT
+QUERY_DEADLINES_MS = os.getenv("QUERY_DEADLINES_MS", "interactive=2000,report=10000,export=30000")
+
+# 配置日志（写入在后台线程中完成，请求处理不等待磁盘 I/O）
+setup_logging(
+    level=LOG_LEVEL,
+    log_format=LOG_FORMAT,
+    log_file=LOG_FILE or None,
+    max_bytes=LOG_MAX_BYTES,
+    backup_count=LOG_BACKUP_COUNT,
+    sample_rates=LOG_SAMPLE_RATES,
+    level_overrides=LOG_LEVEL_OVERRIDES,
+    slow_request_ms=LOG_SLOW_REQUEST_MS
+)
+logger = logging.getLogger(__name__)
 
 
 @asynccontextmanager
@@ -66,10 +115,17 @@ async def lifespan(app: FastAPI):
         pool = init_database(
             db_path=DB_PATH,
             max_connections=DB_MAX_CONNECTIONS,
-            busy_timeout=DB_BUSY_TIMEOUT
+            profile=DB_PROFILE,
+            busy_timeout=DB_BUSY_TIMEOUT,
+            mode=DB_POOL_MODE,
+            group_commit_latency=DB_GROUP_COMMIT_LATENCY_MS / 1000.0,
+            group_commit_batch=DB_GROUP_COMMIT_BATCH,
+            max_lifetime=DB_CONN_MAX_LIFETIME,
+            max_uses=DB_CONN_MAX_USES,
+            idle_timeout=DB_CONN_IDLE_TIMEOUT
         )
         logger.info(f"数据库连接池初始化成功: {DB_PATH}")
-        logger.info(f"最大连接数: {DB_MAX_CONNECTIONS}, 繁忙超时: {DB_BUSY_TIMEOUT}ms")
+        logger.info(f"最大连接数: {DB_MAX_CONNECTIONS}, 繁忙超时: {DB_BUSY_TIMEOUT}ms, 模式: {DB_POOL_MODE}, 性能配置: {DB_PROFILE}")
     except Exception as e:
         logger.error(f"数据库初始化失败: {e}", exc_info=True)
         raise
@@ -82,9 +138,30 @@ async def lifespan(app: FastAPI):
     else:
         logger.warning("⚠️  警告: 使用默认 JWT 密钥，生产环境请设置 SECRET_KEY 环境变量")
     
+    set_admin_usernames(name.strip() for name in ADMIN_USERNAMES.split(","))
+    
+    # 慢查询日志：记录超过阈值的 SQL 及其执行计划
+    if SLOW_QUERY_MS > 0:
+        slow_query_log = init_slow_query_log(
+            pool.db_path,
+            SLOW_QUERY_MS,
+            log_file=SLOW_QUERY_LOG_FILE or os.path.join(os.path.dirname(pool.db_path), "slow_queries.log"),
+            max_bytes=LOG_MAX_BYTES,
+            backup_count=LOG_BACKUP_COUNT
+        )
+        set_query_tracer(slow_query_log)
+    
+    # 初始化密码哈希线程池（bcrypt 不在事件循环中执行）
+    init_password_hasher(
+        max_workers=AUTH_HASH_WORKERS or None,
+        max_queue=AUTH_HASH_QUEUE
+    )
+    
     # 启动后台任务：定期清理过期的在线用户
+    cleanup_health = track_background_task("online_cleanup")
+    
     async def cleanup_task():
-        """后台任务：定期清理过期的在线用户"""
+        """后台任务：定期清理过期的在线用户，并回收长时间空闲的数据库连接"""
         from server.routers.users import _cleanup_expired_users
         cleanup_interval = 15  # 每15秒清理一次
         
@@ -93,19 +170,34 @@ async def lifespan(app: FastAPI):
                 await asyncio.sleep(cleanup_interval)
                 pool = get_pool()
                 if pool:
-                    with pool.get_connection() as conn:
-                        deleted_count = _cleanup_expired_users(conn)
+                    async with pool.acquire() as conn:
+                        deleted_count = await _cleanup_expired_users(conn)
                         if deleted_count > 0:
                             logger.debug(f"后台清理过期在线用户: 删除了 {deleted_count} 条记录")
+                    await pool.run(pool.trim_idle)
+                cleanup_health.success()
             except Exception as e:
+                cleanup_health.failure()
                 logger.error(f"后台清理任务出错: {e}", exc_info=True)
                 # 出错后等待更长时间再重试
                 await asyncio.sleep(60)
     
     # 启动后台清理任务
     cleanup_task_handle = asyncio.create_task(cleanup_task())
+    cleanup_health.task = cleanup_task_handle
     logger.info("后台清理任务已启动（每15秒清理一次过期在线用户）")
     
+    # 启动数据库维护任务：WAL checkpoint、统计信息更新、增量清理
+    maintenance = init_maintenance(
+        get_pool(),
+        interval=DB_MAINTENANCE_INTERVAL,
+        idle_seconds=DB_MAINTENANCE_IDLE_SECONDS
+    )
+    maintenance_health = track_background_task("db_maintenance")
+    maintenance_task_handle = asyncio.create_task(maintenance.run(maintenance_health))
+    maintenance_health.task = maintenance_task_handle
+    logger.info(f"数据库维护任务已启动（每{DB_MAINTENANCE_INTERVAL:g}秒执行一次）")
+    
     yield
     
     # 停止后台任务
@@ -115,6 +207,18 @@ async def lifespan(app: FastAPI):
     except asyncio.CancelledError:
         logger.info("后台清理任务已停止")
     
+    maintenance_task_handle.cancel()
+    try:
+        await maintenance_task_handle
+    except asyncio.CancelledError:
+        logger.info("数据库维护任务已停止")
+    
+    # 关闭前把 WAL 合并回主库并截断 -wal 文件
+    try:
+        await maintenance.checkpoint("TRUNCATE")
+    except Exception as e:
+        logger.warning(f"关闭前 WAL checkpoint 失败: {e}")
+    
     # 关闭时执行
     logger.info("正在关闭应用...")
     try:
@@ -124,6 +228,11 @@ async def lifespan(app: FastAPI):
             logger.info("数据库连接池已关闭")
     except Exception as e:
         logger.error(f"关闭数据库连接池时出错: {e}")
+    set_query_tracer(None)
+    slow_query_log = get_slow_query_log()
+    if slow_query_log is not None:
+        slow_query_log.close()
+    get_password_hasher().shutdown()
 
 
 # 创建 FastAPI 应用实例
@@ -136,20 +245,14 @@ app = FastAPI(
     lifespan=lifespan
 )
 
-# 设置中间件
-setup_middleware(app)
-
 # 添加响应压缩中间件（提高 Cloudflare Tunnel 传输效率）
 app.add_middleware(GZipMiddleware, minimum_size=1000)  # 只压缩大于 1KB 的响应
 
-# 添加 CORS 中间件（如果需要）
-app.add_middleware(
-    CORSMiddleware,
-    allow_origins=["*"],  # 生产环境应该限制具体域名
-    allow_credentials=True,
-    allow_methods=["*"],
-    allow_headers=["*"],
-)
+# 设置中间件（CORS、速率限制、请求日志、错误处理；位于 GZip 外层）
+if RATE_LIMIT_ENABLED:
+    init_rate_limiter(shared_db_path=RATE_LIMIT_SHARED_DB or None, max_keys=RATE_LIMIT_MAX_KEYS)
+configure_query_deadlines(QUERY_DEADLINES_MS)
+setup_middleware(app)
 
 # 注册路由
 app.include_router(auth.router)
@@ -167,9 +270,13 @@ app.include_router(remittance.router)
 app.include_router(settings.router)
 app.include_router(help.router)
 app.include_router(audit_logs.router)
+app.include_router(admin.router)
 
 logger.info("所有路由已注册")
 
+# 系统路由也记录处理函数耗时
+app.router.route_class = TimedRoute
+
 
 @app.get("/", tags=["系统"])
 async def root():
@@ -194,17 +301,34 @@ async def health_check():
     try:
         # 检查数据库连接
         pool = get_pool()
-        with pool.get_connection() as conn:
-            conn.execute("SELECT 1").fetchone()
+        async with pool.acquire(readonly=True) as conn:
+            await conn.fetchone("SELECT 1")
         
-        return JSONResponse(
-            status_code=200,
-            content={
-                "status": "healthy",
-                "database": "connected",
-                "version": "1.1.0"
-            }
-        )
+        content = {
+            "status": "healthy",
+            "database": "connected",
+            "version": "1.1.0"
+        }
+        maintenance = get_maintenance()
+        if maintenance is not None:
+            # WAL 大小、最近一次 checkpoint / 统计信息更新 / 增量清理的耗时和结果
+            content["maintenance"] = await maintenance.get_stats()
+        # 密码哈希线程池的并发、排队和拒绝次数
+        content["password_hasher"] = get_password_hasher().get_stats()
+        content["logging"] = get_logging_stats()
+        limiter = get_rate_limiter()
+        if limiter is not None:
+            content["rate_limit"] = limiter.get_stats()
+        slow_query_log = get_slow_query_log()
+        if slow_query_log is not None:
+            content["slow_queries"] = slow_query_log.get_stats()
+        # 各路由类别的 SQL 时限和因超时被中断的请求数
+        content["query_deadlines"] = {
+            "limits_ms": get_query_deadlines(),
+            "timeouts": get_query_timeouts()
+        }
+        
+        return JSONResponse(status_code=200, content=content)
     except Exception as e:
         logger.error(f"健康检查失败: {e}")
         return JSONResponse(
@@ -217,6 +341,25 @@ async def health_check():
         )
 
 
+@app.get("/health/timings", tags=["系统"])
+async def health_timings():
+    """
+    按路由统计的各阶段耗时直方图
+    阶段：auth（认证）、perm（workspace 权限）、db-wait（等待连接）、db（SQL 执行）、
+    app（处理函数）、serialize（序列化）、total（总耗时）
+    """
+    return route_timings.snapshot()
+
+
+@app.get("/metrics", tags=["系统"])
+async def metrics():
+    """
+    Prometheus 指标（文本格式）
+    连接池、SQLite 繁忙/重试、按路由的请求数和延迟、操作日志写入延迟、后台任务状态
+    """
+    return Response(content=render_metrics(), media_type=METRICS_CONTENT_TYPE)
+
+
 @app.get("/api/info", tags=["系统"])
 async def api_info():
     """
@@ -239,7 +382,8 @@ async def api_info():
             "income": "/api/income",
             "remittance": "/api/remittance",
             "settings": "/api/settings",
-            "audit-logs": "/api/audit-logs"
+            "audit-logs": "/api/audit-logs",
+            "admin": "/api/admin"
         },
         "docs": "/docs",
         "redoc": "/redoc"
@@ -0,0 +1,280 @@
+"""
+Prometheus 指标
+以文本格式（text exposition format 0.0.4）导出连接池、SQLite 繁忙/重试、按路由的请求数和延迟、
+操作日志写入延迟和后台任务状态；只读取内存中的计数器和直方图，不访问数据库，可以每 5 秒抓取一次
+"""
+
+import asyncio
+import time
+from typing import Optional, Dict, List, Iterable, Tuple
+
+from server.database import get_pool
+from server.logging_config import get_logging_stats
+from server.middleware.query_deadline import get_query_timeouts
+from server.middleware.rate_limit import get_rate_limiter
+from server.services.audit_log_service import audit_log_write_latency, get_audit_log_write_failures
+from server.services.db_maintenance import get_maintenance
+from server.services.password_hasher import get_password_hasher
+from server.services.slow_query_log import get_slow_query_log
+from server.timing import LatencyHistogram, route_timings, PHASE_TOTAL
+
+# /metrics 响应的 Content-Type
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+# 指标名前缀
+PREFIX = "agrisale"
+
+# 连接池计数器：get_stats() 中的键 -> (指标名, 说明)
+_POOL_COUNTERS = {
+    'busy_errors': ("db_busy_errors_total", "SQLite 返回 database is locked / busy 的次数"),
+    'retry_count': ("db_retries_total", "单条 SQL 因数据库繁忙重试的次数"),
+    'transaction_retries': ("db_transaction_retries_total", "事务因数据库繁忙整体重试的次数"),
+    'transaction_failures': ("db_transaction_failures_total", "重试后仍失败的事务数"),
+    'reused_acquisitions': ("db_pool_reused_acquisitions_total", "复用请求级连接（未从连接池获取）的次数"),
+    'recycled_connections': ("db_pool_recycled_connections_total", "达到最长存活时间或最多借出次数后重建的连接数"),
+    'discarded_connections': ("db_pool_discarded_connections_total", "校验失败后丢弃的连接数"),
+    'trimmed_connections': ("db_pool_trimmed_connections_total", "因空闲超时关闭的连接数"),
+    'writer_acquisitions': ("db_pool_writer_acquisitions_total", "获取专用写连接的次数（读写分离模式）"),
+    'writer_waits': ("db_pool_writer_waits_total", "获取专用写连接时需要排队的次数（读写分离模式）"),
+}
+
+
+class BackgroundTaskHealth:
+    """后台任务状态：是否在运行、执行次数、失败次数、最近一次成功的时间"""
+
+    def __init__(self, name: str):
+        self.name = name
+        self.task: Optional[asyncio.Task] = None
+        self.runs = 0
+        self.errors = 0
+        self.last_success: Optional[float] = None  # Unix 时间戳
+
+    @property
+    def running(self) -> bool:
+        return self.task is not None and not self.task.done()
+
+    def success(self):
+        """记录一次成功执行"""
+        self.runs += 1
+        self.last_success = time.time()
+
+    def failure(self):
+        """记录一次失败执行"""
+        self.runs += 1
+        self.errors += 1
+
+
+# 任务名 -> 状态
+_background_tasks: Dict[str, BackgroundTaskHealth] = {}
+
+
+def track_background_task(name: str) -> BackgroundTaskHealth:
+    """
+    登记一个后台任务（同名任务重新登记时替换旧的状态）
+
+    Usage:
+        health = track_background_task("online_cleanup")
+        health.task = asyncio.create_task(loop(health))
+    """
+    health = BackgroundTaskHealth(name)
+    _background_tasks[name] = health
+    return health
+
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_value(value) -> str:
+    if isinstance(value, bool):
+        return "1" if value else "0"
+    if isinstance(value, float):
+        if value == float("inf"):
+            return "+Inf"
+        return repr(value)
+    return str(value)
+
+
+class _Exposition:
+    """拼接文本格式的指标"""
+
+    def __init__(self):
+        self._lines: List[str] = []
+
+    def _header(self, name: str, kind: str, help_text: str):
+        self._lines.append(f"# HELP {PREFIX}_{name} {help_text}")
+        self._lines.append(f"# TYPE {PREFIX}_{name} {kind}")
+
+    def _sample(self, name: str, labels: Dict[str, object], value):
+        if labels:
+            label_text = ",".join(f'{key}="{_escape(val)}"' for key, val in labels.items())
+            self._lines.append(f"{PREFIX}_{name}{{{label_text}}} {_format_value(value)}")
+        else:
+            self._lines.append(f"{PREFIX}_{name} {_format_value(value)}")
+
+    def metric(self, name: str, kind: str, help_text: str, samples: Iterable[Tuple[Dict[str, object], object]]):
+        """输出一个 gauge / counter（samples 为 (标签, 值) 列表）"""
+        samples = list(samples)
+        if not samples:
+            return
+        self._header(name, kind, help_text)
+        for labels, value in samples:
+            self._sample(name, labels, value)
+
+    def histogram(self, name: str, help_text: str, samples: Iterable[Tuple[Dict[str, object], LatencyHistogram]]):
+        """输出一个以秒为单位的直方图"""
+        samples = list(samples)
+        if not samples:
+            return
+        self._header(name, "histogram", help_text)
+        for labels, histogram in samples:
+            buckets, count, sum_ms = histogram.cumulative()
+            for bound_ms, cumulative in buckets:
+                self._sample(f"{name}_bucket", {**labels, "le": _format_value(bound_ms / 1000)}, cumulative)
+            self._sample(f"{name}_sum", labels, sum_ms / 1000)
+            self._sample(f"{name}_count", labels, count)
+
+    def summary(self, name: str, help_text: str, samples: Iterable[Tuple[Dict[str, object], int, float]]):
+        """输出一个只有总数和总和（不含分位数）的 summary（samples 为 (标签, 次数, 总和) 列表）"""
+        samples = list(samples)
+        if not samples:
+            return
+        self._header(name, "summary", help_text)
+        for labels, count, total in samples:
+            self._sample(f"{name}_sum", labels, total)
+            self._sample(f"{name}_count", labels, count)
+
+    def render(self) -> str:
+        return "\n".join(self._lines) + "\n"
+
+
+def _collect_pool(out: _Exposition):
+    try:
+        pool = get_pool()
+    except RuntimeError:
+        return
+    stats = pool.get_stats()
+    out.metric("db_pool_connections", "gauge", "连接池中的连接数", [
+        ({"state": "active"}, stats['active_connections']),
+        ({"state": "idle"}, stats['pool_size']),
+    ])
+    out.metric("db_pool_max_connections", "gauge", "连接池最大连接数", [({}, stats['max_connections'])])
+    waiting = [({"queue": "pool"}, stats['waiting'])]
+    if 'writer_waiting' in stats:
+        waiting.append(({"queue": "writer"}, stats['writer_waiting']))
+    out.metric("db_pool_waiting", "gauge", "正在等待连接的请求数", waiting)
+    for key, (name, help_text) in _POOL_COUNTERS.items():
+        out.metric(name, "counter", help_text, [({}, stats.get(key, 0))])
+    out.histogram(
+        "db_pool_acquire_wait_seconds", "获取数据库连接的等待时间",
+        (({"queue": queue}, histogram) for queue, histogram in pool.wait_histograms().items())
+    )
+
+    group_commit = stats['group_commit']
+    out.metric("db_group_commit_batches_total", "counter", "组提交批次数", [({}, group_commit['batches'])])
+    out.metric("db_group_commit_items_total", "counter", "组提交合并的写操作数", [({}, group_commit['items'])])
+    out.metric("db_group_commit_pending", "gauge", "等待组提交的写操作数", [({}, group_commit['pending'])])
+
+
+def _collect_routes(out: _Exposition):
+    items = route_timings.items()
+    out.metric(
+        "http_requests_total", "counter", "按路由和状态码统计的请求数",
+        (
+            ({"method": method, "route": route, "status": status}, count)
+            for (method, route, status), count in sorted(route_timings.responses().items())
+        )
+    )
+    out.histogram(
+        "http_request_duration_seconds", "请求总耗时",
+        (
+            ({"method": method, "route": route}, histograms[PHASE_TOTAL])
+            for (method, route), histograms in items if PHASE_TOTAL in histograms
+        )
+    )
+    # 各阶段只导出总耗时和次数（完整直方图见 /health/timings），控制抓取的数据量
+    phases = []
+    for (method, route), histograms in items:
+        for name, histogram in histograms.items():
+            if name != PHASE_TOTAL:
+                _, count, sum_ms = histogram.cumulative()
+                phases.append(({"method": method, "route": route, "phase": name}, count, sum_ms / 1000))
+    out.summary("http_request_phase_seconds", "请求各阶段耗时", phases)
+
+
+def _collect_audit_log(out: _Exposition):
+    out.histogram("audit_log_write_seconds", "操作日志写入耗时", [({}, audit_log_write_latency)])
+    out.metric(
+        "audit_log_write_failures_total", "counter", "操作日志写入失败次数",
+        [({}, get_audit_log_write_failures())]
+    )
+
+
+def _collect_background_tasks(out: _Exposition):
+    tasks = list(_background_tasks.values())
+    out.metric(
+        "background_task_up", "gauge", "后台任务是否在运行",
+        (({"task": t.name}, t.running) for t in tasks)
+    )
+    out.metric(
+        "background_task_runs_total", "counter", "后台任务执行次数",
+        (({"task": t.name}, t.runs) for t in tasks)
+    )
+    out.metric(
+        "background_task_errors_total", "counter", "后台任务失败次数",
+        (({"task": t.name}, t.errors) for t in tasks)
+    )
+    out.metric(
+        "background_task_last_success_timestamp_seconds", "gauge", "后台任务最近一次成功执行的时间",
+        (({"task": t.name}, t.last_success) for t in tasks if t.last_success is not None)
+    )
+
+    maintenance = get_maintenance()
+    if maintenance is not None:
+        out.metric("db_wal_size_bytes", "gauge", "当前 -wal 文件大小", [({}, maintenance.wal_size())])
+
+
+def _collect_services(out: _Exposition):
+    hasher = get_password_hasher().get_stats()
+    out.metric("password_hash_running", "gauge", "正在执行的密码哈希数", [({}, hasher['running'])])
+    out.metric("password_hash_waiting", "gauge", "排队等待的密码哈希数", [({}, hasher['waiting'])])
+    out.metric("password_hash_completed_total", "counter", "完成的密码哈希数", [({}, hasher['completed'])])
+    out.metric(
+        "password_hash_rejected_total", "counter", "因排队已满或等待超时被拒绝（429）的密码哈希数",
+        [({}, hasher['rejected'] + hasher['timeouts'])]
+    )
+
+    limiter = get_rate_limiter()
+    if limiter is not None:
+        stats = limiter.get_stats()
+        out.metric("rate_limit_decisions_total", "counter", "速率限制判定次数", [
+            ({"result": "allowed"}, stats['allowed']),
+            ({"result": "limited"}, stats['limited']),
+            ({"result": "error"}, stats['errors']),
+        ])
+
+    out.metric(
+        "query_timeouts_total", "counter", "SQL 执行超过请求时限被中断的请求数",
+        (({"class": route_class}, count) for route_class, count in sorted(get_query_timeouts().items()))
+    )
+
+    slow_query_log = get_slow_query_log()
+    if slow_query_log is not None:
+        stats = slow_query_log.get_stats()
+        out.metric("slow_queries_total", "counter", "记录的慢查询数", [({}, stats['recorded'])])
+        out.metric("slow_queries_dropped_total", "counter", "因处理队列已满丢弃的慢查询数", [({}, stats['dropped'])])
+
+    logging_stats = get_logging_stats()
+    out.metric("log_queue_size", "gauge", "日志队列中等待写入的记录数", [({}, logging_stats['queued'])])
+    out.metric("log_dropped_total", "counter", "因日志队列已满丢弃的记录数", [({}, logging_stats['dropped'])])
+
+
+def render_metrics() -> str:
+    """生成 /metrics 的响应内容"""
+    out = _Exposition()
+    _collect_pool(out)
+    _collect_routes(out)
+    _collect_audit_log(out)
+    _collect_background_tasks(out)
+    _collect_services(out)
+    return out.render()
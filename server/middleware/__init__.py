@@ -8,21 +8,23 @@ from server.middleware.core import (
     # 密码加密
     verify_password,
     get_password_hash,
+    verify_password_async,
+    get_password_hash_async,
     # JWT Token 管理
     create_access_token,
     decode_access_token,
     # 认证依赖
     get_current_user,
     get_current_user_optional,
+    invalidate_principal,
+    require_admin,
     security,
     # 中间件
-    logging_middleware,
-    error_handler_middleware,
-    cors_middleware,
-    rate_limit_middleware,
+    APIMiddleware,
     # 配置函数
     setup_middleware,
     update_secret_key,
+    set_admin_usernames,
     # 辅助函数
     get_user_id_from_token,
     # 装饰器
@@ -31,6 +33,22 @@ from server.middleware.core import (
     check_rate_limit,
 )
 
+# 从 rate_limit 模块导入
+from server.middleware.rate_limit import (
+    RateLimit,
+    RouteBudget,
+    RateLimiter,
+    init_rate_limiter,
+    get_rate_limiter,
+)
+
+# 从 query_deadline 模块导入
+from server.middleware.query_deadline import (
+    configure_query_deadlines,
+    get_query_deadlines,
+    get_query_timeouts,
+)
+
 # 从 workspace_permission 模块导入
 from server.middleware.workspace_permission import (
     get_workspace_id,
@@ -41,6 +59,8 @@ from server.middleware.workspace_permission import (
     require_workspace_permission,
     get_workspace_storage_type,
     require_server_storage,
+    resolve_workspace_access,
+    invalidate_workspace_access,
     PERMISSIONS,
 )
 
@@ -48,27 +68,38 @@ __all__ = [
     # 密码加密
     "verify_password",
     "get_password_hash",
+    "verify_password_async",
+    "get_password_hash_async",
     # JWT Token 管理
     "create_access_token",
     "decode_access_token",
     # 认证依赖
     "get_current_user",
     "get_current_user_optional",
+    "invalidate_principal",
+    "require_admin",
     "security",
     # 中间件
-    "logging_middleware",
-    "error_handler_middleware",
-    "cors_middleware",
-    "rate_limit_middleware",
+    "APIMiddleware",
     # 配置函数
     "setup_middleware",
     "update_secret_key",
+    "set_admin_usernames",
     # 辅助函数
     "get_user_id_from_token",
     # 装饰器
     "require_auth",
     # 速率限制
     "check_rate_limit",
+    "RateLimit",
+    "RouteBudget",
+    "RateLimiter",
+    "init_rate_limiter",
+    "get_rate_limiter",
+    # SQL 执行时限
+    "configure_query_deadlines",
+    "get_query_deadlines",
+    "get_query_timeouts",
     # Workspace 权限
     "get_workspace_id",
     "check_workspace_access",
@@ -78,6 +109,8 @@ __all__ = [
     "require_workspace_permission",
     "get_workspace_storage_type",
     "require_server_storage",
+    "resolve_workspace_access",
+    "invalidate_workspace_access",
     "PERMISSIONS",
 ]
 
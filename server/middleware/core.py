@@ -6,21 +6,51 @@
 import time
 import logging
 import traceback
-from typing import Optional, Annotated
+from collections import OrderedDict
+from typing import Optional, Annotated, Tuple
 from datetime import datetime, timedelta
 from functools import wraps
 
 from fastapi import Request, HTTPException, status, Depends, Header
-from fastapi.responses import JSONResponse
+from fastapi.responses import JSONResponse, PlainTextResponse
+from fastapi.exception_handlers import http_exception_handler
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
 from jose import JWTError, jwt
 from passlib.context import CryptContext
-
-from server.database import get_pool, DatabaseBusyError, ConnectionTimeoutError
+from starlette.datastructures import Headers, MutableHeaders, QueryParams
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+from server.database import (
+    get_pool,
+    set_query_budget,
+    reset_query_budget,
+    DatabaseBusyError,
+    ConnectionTimeoutError,
+    QueryTimeoutError,
+)
+from server.services.password_hasher import get_password_hasher, PasswordHasherBusyError
+from server.middleware.rate_limit import (
+    RateLimit,
+    MemoryRateLimitStore,
+    EXEMPT_PATHS,
+    get_rate_limiter,
+    retry_after_header,
+)
+from server.middleware.query_deadline import route_class_for, query_deadline_for, record_query_timeout
 from server.models import ErrorResponse
+from server.logging_config import access_logger, set_route_level, reset_route_level, should_log_access
+from server.timing import (
+    timed,
+    start_request,
+    end_request,
+    current_timings,
+    record,
+    server_timing_header,
+    route_timings,
+    PHASE_AUTH,
+    PHASE_SERIALIZE,
+)
 
-# 配置日志
-logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
 # JWT 配置
@@ -28,6 +58,17 @@ SECRET_KEY = "your-secret-key-change-this-in-production"  # 生产环境必须
 ALGORITHM = "HS256"
 ACCESS_TOKEN_EXPIRE_MINUTES = 60 * 24  # 24 小时
 
+# 已认证用户缓存：token -> (过期时间（time.monotonic()）, 用户信息)
+# 命中时跳过 JWT 解码和用户查询；过期时间不超过 token 自身的 exp
+PRINCIPAL_CACHE_SIZE = 10000
+PRINCIPAL_CACHE_TTL = 300  # 秒，用户被其他进程删除时最多延迟这么久生效
+_principal_cache: "OrderedDict[str, Tuple[float, dict]]" = OrderedDict()
+# 每次清除缓存时递增；查询期间发生过清除的结果不写入缓存
+_principal_generation = 0
+
+# 可以访问 /api/admin 运维接口的用户名（由 ADMIN_USERNAMES 环境变量配置，为空时所有人都无权访问）
+ADMIN_USERNAMES: frozenset = frozenset()
+
 # 密码加密上下文
 pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
 
@@ -85,6 +126,55 @@ def get_password_hash(password: str) -> str:
     return pwd_context.hash(password)
 
 
+def _hasher_busy(e: PasswordHasherBusyError) -> HTTPException:
+    """密码哈希线程池过载时返回的 429 响应"""
+    logger.warning(f"密码哈希线程池繁忙: {e}")
+    return HTTPException(
+        status_code=status.HTTP_429_TOO_MANY_REQUESTS,
+        detail="登录请求过多，请稍后重试",
+        headers={"Retry-After": "1"},
+    )
+
+
+async def verify_password_async(plain_password: str, hashed_password: str) -> bool:
+    """
+    验证密码（在密码哈希线程池中执行，不阻塞事件循环）
+    
+    Args:
+        plain_password: 明文密码
+        hashed_password: 哈希密码
+    
+    Returns:
+        是否匹配
+    
+    Raises:
+        HTTPException: 线程池过载时返回 429
+    """
+    try:
+        return await get_password_hasher().run(verify_password, plain_password, hashed_password)
+    except PasswordHasherBusyError as e:
+        raise _hasher_busy(e)
+
+
+async def get_password_hash_async(password: str) -> str:
+    """
+    生成密码哈希（在密码哈希线程池中执行，不阻塞事件循环）
+    
+    Args:
+        password: 明文密码
+    
+    Returns:
+        哈希密码
+    
+    Raises:
+        HTTPException: 线程池过载时返回 429
+    """
+    try:
+        return await get_password_hasher().run(get_password_hash, password)
+    except PasswordHasherBusyError as e:
+        raise _hasher_busy(e)
+
+
 # ==================== JWT Token 管理 ====================
 
 def create_access_token(data: dict, expires_delta: Optional[timedelta] = None) -> str:
@@ -130,6 +220,55 @@ def decode_access_token(token: str) -> Optional[dict]:
 
 # ==================== 认证依赖 ====================
 
+def _get_cached_principal(token: str) -> Optional[dict]:
+    """从缓存获取 token 对应的用户信息，未命中或已过期返回 None"""
+    entry = _principal_cache.get(token)
+    if entry is None:
+        return None
+    if entry[0] <= time.monotonic():
+        _principal_cache.pop(token, None)
+        return None
+    _principal_cache.move_to_end(token)
+    return entry[1]
+
+
+def _cache_principal(token: str, principal: dict, exp: Optional[float], generation: int):
+    """缓存已验证的用户信息（查询期间缓存被清除过则不写入）"""
+    if generation != _principal_generation:
+        return
+    ttl = PRINCIPAL_CACHE_TTL
+    if exp is not None:
+        ttl = min(ttl, exp - time.time())
+    if ttl <= 0:
+        return
+    _principal_cache[token] = (time.monotonic() + ttl, principal)
+    _principal_cache.move_to_end(token)
+    while len(_principal_cache) > PRINCIPAL_CACHE_SIZE:
+        _principal_cache.popitem(last=False)
+
+
+def invalidate_principal(token: Optional[str] = None, user_id: Optional[int] = None):
+    """
+    清除已认证用户缓存（登出、修改密码、注销账户后调用）
+    
+    Args:
+        token: 只清除该 token
+        user_id: 清除该用户的所有 token
+        两者都为 None 时清除全部
+    """
+    global _principal_generation
+    _principal_generation += 1
+    if token is None and user_id is None:
+        _principal_cache.clear()
+        return
+    if token is not None:
+        _principal_cache.pop(token, None)
+    if user_id is not None:
+        for key in [k for k, (_, p) in _principal_cache.items() if p["user_id"] == user_id]:
+            del _principal_cache[key]
+
+
+@timed(PHASE_AUTH)
 async def get_current_user(
     credentials: HTTPAuthorizationCredentials = Depends(security)
 ) -> dict:
@@ -146,6 +285,11 @@ async def get_current_user(
         HTTPException: Token 无效或用户不存在
     """
     token = credentials.credentials
+    principal = _get_cached_principal(token)
+    if principal is not None:
+        return principal
+    
+    generation = _principal_generation
     payload = decode_access_token(token)
     
     if payload is None:
@@ -168,12 +312,12 @@ async def get_current_user(
     # 验证用户是否仍然存在
     pool = get_pool()
     try:
-        with pool.get_connection() as conn:
-            cursor = conn.execute(
+        async with pool.acquire(readonly=True) as conn:
+            cursor = await conn.execute(
                 "SELECT id, username FROM users WHERE id = ? AND username = ?",
                 (user_id, username)
             )
-            user = cursor.fetchone()
+            user = await cursor.fetchone()
             
             if user is None:
                 raise HTTPException(
@@ -182,10 +326,14 @@ async def get_current_user(
                     headers={"WWW-Authenticate": "Bearer"},
                 )
             
-            return {
+            principal = {
                 "user_id": user_id,
                 "username": username
             }
+            _cache_principal(token, principal, payload.get("exp"), generation)
+            return principal
+    except HTTPException:
+        raise
     except Exception as e:
         logger.error(f"验证用户时出错: {e}")
         raise HTTPException(
@@ -194,6 +342,24 @@ async def get_current_user(
         )
 
 
+async def require_admin(current_user: dict = Depends(get_current_user)) -> dict:
+    """
+    要求当前用户为管理员（用于运维接口）
+    
+    Returns:
+        用户信息字典
+    
+    Raises:
+        HTTPException: 不是管理员时返回 403
+    """
+    if current_user["username"] not in ADMIN_USERNAMES:
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail="需要管理员权限"
+        )
+    return current_user
+
+
 async def get_current_user_optional(
     authorization: Optional[str] = Header(None)
 ) -> Optional[dict]:
@@ -215,6 +381,10 @@ async def get_current_user_optional(
         if scheme.lower() != "bearer":
             return None
         
+        principal = _get_cached_principal(token)
+        if principal is not None:
+            return principal
+        
         payload = decode_access_token(token)
         if payload is None:
             return None
@@ -235,55 +405,63 @@ async def get_current_user_optional(
 
 # ==================== 中间件 ====================
 
-async def logging_middleware(request: Request, call_next):
-    """
-    请求日志中间件
-    记录所有请求的详细信息
-    """
-    start_time = time.time()
-    
-    # 记录请求信息
-    logger.info(
-        f"请求: {request.method} {request.url.path} - "
-        f"客户端: {request.client.host if request.client else 'unknown'}"
-    )
-    
-    # 处理请求
-    try:
-        response = await call_next(request)
-        
-        # 计算处理时间
-        process_time = time.time() - start_time
-        
-        # 记录响应信息
-        logger.info(
-            f"响应: {request.method} {request.url.path} - "
-            f"状态码: {response.status_code} - "
-            f"耗时: {process_time:.3f}秒"
-        )
-        
-        # 添加处理时间到响应头
-        response.headers["X-Process-Time"] = str(process_time)
-        
-        return response
-    except Exception as e:
-        process_time = time.time() - start_time
-        logger.error(
-            f"请求处理异常: {request.method} {request.url.path} - "
-            f"错误: {str(e)} - 耗时: {process_time:.3f}秒"
-        )
-        raise
+# CORS 响应头（生产环境应该限制具体域名）
+CORS_ALLOW_METHODS = "GET, POST, PUT, DELETE, OPTIONS, PATCH"
+CORS_ALLOW_HEADERS = "Content-Type, Authorization, X-Requested-With"
+CORS_MAX_AGE = "3600"
 
 
-async def error_handler_middleware(request: Request, call_next):
+def _add_vary(headers: MutableHeaders, *values: str):
+    """向 Vary 响应头追加字段（不重复）"""
+    current = [v.strip() for v in headers.get("vary", "").split(",") if v.strip()]
+    lowered = {v.lower() for v in current}
+    current.extend(v for v in values if v.lower() not in lowered)
+    headers["Vary"] = ", ".join(current)
+
+
+def _apply_response_headers(headers: MutableHeaders, method: str, origin: Optional[str]):
     """
-    全局错误处理中间件
-    捕获所有异常并返回统一的错误响应
+    添加 CORS 头和缓存控制头
+    
+    Args:
+        headers: 响应头
+        method: 请求方法
+        origin: 请求的 Origin 头（允许携带凭据时必须回显具体来源，不能用 *）
     """
-    try:
-        response = await call_next(request)
-        return response
-    except DatabaseBusyError as e:
+    headers["Access-Control-Allow-Origin"] = origin or "*"
+    headers["Access-Control-Allow-Methods"] = CORS_ALLOW_METHODS
+    headers["Access-Control-Allow-Headers"] = CORS_ALLOW_HEADERS
+    headers["Access-Control-Allow-Credentials"] = "true"
+    headers["Access-Control-Max-Age"] = CORS_MAX_AGE
+    
+    # 对于 GET 请求，添加缓存控制（API 数据使用较短的缓存时间（5分钟），避免数据不一致）
+    if method == "GET":
+        headers["Cache-Control"] = "private, max-age=300"
+        _add_vary(headers, "Accept-Encoding", "Origin")
+    else:
+        _add_vary(headers, "Origin")
+
+
+def _preflight_response(request_headers: Headers) -> PlainTextResponse:
+    """CORS 预检请求的响应（允许的请求头按请求回显）"""
+    headers = {
+        "Access-Control-Allow-Origin": request_headers["origin"],
+        "Access-Control-Allow-Methods": CORS_ALLOW_METHODS,
+        "Access-Control-Allow-Credentials": "true",
+        "Access-Control-Max-Age": CORS_MAX_AGE,
+        "Vary": "Origin, Access-Control-Request-Method, Access-Control-Request-Headers",
+    }
+    requested_headers = request_headers.get("access-control-request-headers")
+    if requested_headers is not None:
+        headers["Access-Control-Allow-Headers"] = requested_headers
+    if request_headers["access-control-request-method"] not in CORS_ALLOW_METHODS.split(", "):
+        return PlainTextResponse("Disallowed CORS method", status_code=400, headers=headers)
+    return PlainTextResponse("OK", status_code=200, headers=headers)
+
+
+def _error_response(e: Exception) -> JSONResponse:
+    """把未处理的异常转换为统一的错误响应"""
+    if isinstance(e, DatabaseBusyError):
         logger.warning(f"数据库繁忙: {e}")
         return JSONResponse(
             status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
@@ -294,7 +472,7 @@ async def error_handler_middleware(request: Request, call_next):
                 details={"retry_after": 1}
             ).model_dump()
         )
-    except ConnectionTimeoutError as e:
+    if isinstance(e, ConnectionTimeoutError):
         logger.error(f"连接超时: {e}")
         return JSONResponse(
             status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
@@ -304,49 +482,116 @@ async def error_handler_middleware(request: Request, call_next):
                 error_code="CONNECTION_TIMEOUT"
             ).model_dump()
         )
-    except HTTPException as e:
-        # FastAPI 的 HTTPException 直接返回
-        raise e
-    except Exception as e:
-        # 其他未预期的异常
-        logger.error(f"未处理的异常: {e}\n{traceback.format_exc()}")
-        return JSONResponse(
-            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
-            content=ErrorResponse(
-                success=False,
-                message="服务器内部错误",
-                error_code="INTERNAL_SERVER_ERROR",
-                details={"error": str(e)} if logger.level == logging.DEBUG else None
-            ).model_dump()
-        )
+    # 其他未预期的异常
+    logger.error(f"未处理的异常: {e}\n{traceback.format_exc()}")
+    return JSONResponse(
+        status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+        content=ErrorResponse(
+            success=False,
+            message="服务器内部错误",
+            error_code="INTERNAL_SERVER_ERROR",
+            details={"error": str(e)} if logger.level == logging.DEBUG else None
+        ).model_dump()
+    )
 
 
-async def cors_middleware(request: Request, call_next):
+class APIMiddleware:
     """
-    CORS 中间件
-    处理跨域请求
+    纯 ASGI 中间件，依次处理：
+    - CORS：预检请求直接返回，其他响应添加 CORS 头和 GET 缓存控制头
+    - 速率限制（未调用 init_rate_limiter 时直接放行）
+    - 访问日志（每个请求一条，按路由采样）和 X-Process-Time 响应头；按路由提高请求内的日志级别
+    - 统一错误处理：未处理的异常转换为 ErrorResponse（数据库繁忙 / 连接超时返回 503）
+    - SQL 执行时限：按路由类别设置本请求的 SQL 时限，获取到数据库连接时才开始计时（见 server/middleware/query_deadline.py）
+    
+    只在 http.response.start 消息上修改响应头，不创建额外的任务和响应流
     """
-    # 处理预检请求
-    if request.method == "OPTIONS":
-        response = JSONResponse(content={})
-    else:
-        response = await call_next(request)
     
-    # 添加 CORS 头
-    response.headers["Access-Control-Allow-Origin"] = "*"  # 生产环境应该限制具体域名
-    response.headers["Access-Control-Allow-Methods"] = "GET, POST, PUT, DELETE, OPTIONS, PATCH"
-    response.headers["Access-Control-Allow-Headers"] = "Content-Type, Authorization, X-Requested-With"
-    response.headers["Access-Control-Allow-Credentials"] = "true"
-    response.headers["Access-Control-Max-Age"] = "3600"
+    def __init__(self, app: ASGIApp):
+        self.app = app
     
-    # 添加性能优化响应头
-    # 对于 GET 请求，添加缓存控制（可根据需要调整）
-    if request.method == "GET":
-        # 对于 API 数据，使用较短的缓存时间（5分钟），避免数据不一致
-        response.headers["Cache-Control"] = "private, max-age=300"
-        response.headers["Vary"] = "Accept-Encoding"
-    
-    return response
+    async def __call__(self, scope: Scope, receive: Receive, send: Send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        
+        start_time = time.perf_counter()
+        method = scope["method"]
+        path = scope["path"]
+        client = scope.get("client")
+        request_headers = Headers(scope=scope)
+        origin = request_headers.get("origin")
+        preflight = (
+            method == "OPTIONS"
+            and origin is not None
+            and "access-control-request-method" in request_headers
+        )
+        status_code = None
+        level_token = set_route_level(path)
+        timing_token = start_request()
+        budget_token = set_query_budget(
+            query_deadline_for(route_class_for(method, path, _page_size(scope)))
+        )
+        timings = current_timings()
+        
+        async def send_wrapper(message: Message):
+            nonlocal status_code
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+                headers = MutableHeaders(scope=message)
+                if not preflight:
+                    _apply_response_headers(headers, method, origin)
+                now = time.perf_counter()
+                handler_end = timings.get("_handler_end")
+                if handler_end is not None:
+                    record(PHASE_SERIALIZE, now - handler_end)
+                headers["X-Process-Time"] = str(now - start_time)
+                headers["Server-Timing"] = server_timing_header(timings, now - start_time)
+            await send(message)
+        
+        try:
+            if preflight:
+                response = _preflight_response(request_headers)
+            elif method == "OPTIONS":
+                response = JSONResponse(content={})
+            else:
+                response = await _rate_limit_response(scope)
+            
+            if response is not None:
+                await response(scope, receive, send_wrapper)
+            else:
+                await self.app(scope, receive, send_wrapper)
+        except Exception as e:
+            if status_code is not None:
+                # 响应已经开始发送，无法再替换为错误响应
+                logger.error(
+                    f"请求处理异常: {method} {path} - 错误: {str(e)} - "
+                    f"耗时: {time.perf_counter() - start_time:.3f}秒"
+                )
+                raise
+            await _error_response(e)(scope, receive, send_wrapper)
+        finally:
+            reset_route_level(level_token)
+            end_request(timing_token)
+            reset_query_budget(budget_token)
+        
+        total_seconds = time.perf_counter() - start_time
+        route_timings.observe(
+            method, getattr(scope.get("route"), "path", None), timings, total_seconds, status_code
+        )
+        duration_ms = total_seconds * 1000
+        if should_log_access(path, status_code, duration_ms):
+            client_host = client[0] if client else "unknown"
+            access_logger.info(
+                f"{method} {path} - 状态码: {status_code} - 耗时: {duration_ms:.1f}ms - 客户端: {client_host}",
+                extra={
+                    "method": method,
+                    "path": path,
+                    "status": status_code,
+                    "duration_ms": round(duration_ms, 3),
+                    "client": client_host,
+                }
+            )
 
 
 # ==================== 用户 ID 提取辅助函数 ====================
@@ -366,6 +611,9 @@ def get_user_id_from_token(request: Request) -> Optional[int]:
         if auth_header:
             scheme, token = auth_header.split()
             if scheme.lower() == "bearer":
+                principal = _get_cached_principal(token)
+                if principal is not None:
+                    return principal["user_id"]
                 payload = decode_access_token(token)
                 if payload:
                     return payload.get("user_id")
@@ -393,19 +641,16 @@ def require_auth(func):
     return wrapper
 
 
-# ==================== 速率限制（可选） ====================
-
-from collections import defaultdict
-from datetime import datetime, timedelta
+# ==================== 速率限制 ====================
 
-_rate_limit_store = defaultdict(list)
-_rate_limit_window = timedelta(minutes=1)
-_rate_limit_max_requests = 60
+# check_rate_limit 使用的独立额度：每个标识符每分钟 60 次
+_rate_limit_store = MemoryRateLimitStore(max_keys=10000)
+_rate_limit = RateLimit(requests=60, period=60)
 
 
 def check_rate_limit(identifier: str) -> bool:
     """
-    检查速率限制
+    检查速率限制（每个标识符每分钟 60 次）
     
     Args:
         identifier: 标识符（通常是 IP 地址或用户 ID）
@@ -413,43 +658,51 @@ def check_rate_limit(identifier: str) -> bool:
     Returns:
         是否允许请求
     """
-    now = datetime.utcnow()
-    
-    # 清理过期记录
-    _rate_limit_store[identifier] = [
-        timestamp for timestamp in _rate_limit_store[identifier]
-        if now - timestamp < _rate_limit_window
-    ]
-    
-    # 检查是否超过限制
-    if len(_rate_limit_store[identifier]) >= _rate_limit_max_requests:
-        return False
-    
-    # 记录本次请求
-    _rate_limit_store[identifier].append(now)
-    return True
+    return _rate_limit_store.hit(identifier, _rate_limit)[0]
 
 
-async def rate_limit_middleware(request: Request, call_next):
+def _page_size(scope: Scope) -> Optional[int]:
+    """查询参数 page_size（没有或无效时返回 None），用于匹配路由额度和 SQL 时限类别"""
+    if not scope.get("query_string"):
+        return None
+    page_size = QueryParams(scope["query_string"]).get("page_size")
+    return int(page_size) if page_size and page_size.isdigit() else None
+
+
+async def _rate_limit_response(scope: Scope) -> Optional[JSONResponse]:
     """
-    速率限制中间件（可选，根据需要启用）
+    速率限制检查
+    按路由额度（数据导入、大分页列表、登录注册、心跳、其他）分别计数；
+    已认证请求按用户计数，其余按客户端 IP 计数
+    
+    Returns:
+        超出额度时返回 429 响应，否则返回 None
     """
-    # 获取客户端标识符
-    client_ip = request.client.host if request.client else "unknown"
+    limiter = get_rate_limiter()
+    path = scope["path"]
+    if limiter is None or path in EXEMPT_PATHS:
+        return None
     
-    # 检查速率限制
-    if not check_rate_limit(client_ip):
-        logger.warning(f"速率限制: {client_ip} 请求过于频繁")
-        return JSONResponse(
-            status_code=status.HTTP_429_TOO_MANY_REQUESTS,
-            content=ErrorResponse(
-                success=False,
-                message="请求过于频繁，请稍后再试",
-                error_code="RATE_LIMIT_EXCEEDED"
-            ).model_dump()
-        )
+    request = Request(scope)
+    budget = limiter.budget_for(scope["method"], path, _page_size(scope))
+    client_ip = request.client.host if request.client else "unknown"
+    user_id = None if budget.per_ip else get_user_id_from_token(request)
+    identity = f"user:{user_id}" if user_id is not None else f"ip:{client_ip}"
     
-    return await call_next(request)
+    allowed, retry_after, _ = await limiter.check(budget, identity)
+    if allowed:
+        return None
+    logger.warning(f"速率限制: {identity} 请求过于频繁（{budget.name}: {path}）")
+    return JSONResponse(
+        status_code=status.HTTP_429_TOO_MANY_REQUESTS,
+        headers={"Retry-After": retry_after_header(retry_after)},
+        content=ErrorResponse(
+            success=False,
+            message="请求过于频繁，请稍后再试",
+            error_code="RATE_LIMIT_EXCEEDED",
+            details={"retry_after": round(retry_after, 3), "budget": budget.name}
+        ).model_dump()
+    )
 
 
 # ==================== 配置函数 ====================
@@ -461,23 +714,52 @@ def setup_middleware(app):
     Args:
         app: FastAPI 应用实例
     """
-    # 注意：中间件的顺序很重要，后添加的中间件会先执行
-    
-    # 1. CORS 中间件（最外层）
-    app.middleware("http")(cors_middleware)
-    
-    # 2. 错误处理中间件
-    app.middleware("http")(error_handler_middleware)
-    
-    # 3. 日志中间件
-    app.middleware("http")(logging_middleware)
-    
-    # 4. 速率限制中间件（可选，根据需要启用）
-    # app.middleware("http")(rate_limit_middleware)
+    # CORS、速率限制、请求日志和错误处理合并在一个纯 ASGI 中间件中；
+    # 最后添加，位于其他中间件（如 GZip）外层
+    app.add_middleware(APIMiddleware)
+    app.add_exception_handler(HTTPException, _http_exception_handler)
     
     logger.info("中间件设置完成")
 
 
+def _query_timeout_cause(exc: BaseException) -> Optional[QueryTimeoutError]:
+    """异常本身或引起它的异常（路由中 except Exception 转换成的 500）是否为 SQL 超时"""
+    seen = set()
+    while exc is not None and id(exc) not in seen:
+        if isinstance(exc, QueryTimeoutError):
+            return exc
+        seen.add(id(exc))
+        exc = exc.__cause__ or exc.__context__
+    return None
+
+
+async def _http_exception_handler(request: Request, exc: HTTPException):
+    """
+    HTTPException 的响应：SQL 执行超过请求时限被中断时（包括被路由包装成 500 的情况）
+    返回 503 QUERY_TIMEOUT，其余交给 FastAPI 默认处理
+    """
+    timeout_error = _query_timeout_cause(exc)
+    if timeout_error is None:
+        return await http_exception_handler(request, exc)
+    
+    route_class = route_class_for(request.method, request.url.path, _page_size(request.scope))
+    timeout = query_deadline_for(route_class)
+    record_query_timeout(route_class)
+    logger.warning(f"SQL 执行超时已中断: {request.method} {request.url.path}（{route_class}，时限 {timeout}秒）")
+    return JSONResponse(
+        status_code=timeout_error.status_code,
+        content=ErrorResponse(
+            success=False,
+            message=timeout_error.detail,
+            error_code="QUERY_TIMEOUT",
+            details={
+                "route_class": route_class,
+                "timeout_ms": round(timeout * 1000) if timeout else None
+            }
+        ).model_dump()
+    )
+
+
 def update_secret_key(new_secret_key: str):
     """
     更新 JWT 密钥（用于生产环境配置）
@@ -487,5 +769,18 @@ def update_secret_key(new_secret_key: str):
     """
     global SECRET_KEY
     SECRET_KEY = new_secret_key
+    # 旧密钥签发的 token 不再有效
+    invalidate_principal()
     logger.info("JWT 密钥已更新")
 
+
+def set_admin_usernames(usernames):
+    """
+    设置管理员用户名
+    
+    Args:
+        usernames: 用户名列表
+    """
+    global ADMIN_USERNAMES
+    ADMIN_USERNAMES = frozenset(name for name in usernames if name)
+
@@ -0,0 +1,151 @@
+"""
+SQL 执行时限
+按路由类别（交互式列表、报表、导入导出）为每个请求设置 SQL 时限，从获取到数据库连接时开始计时
+（等待连接、密码哈希排队等不计入），由连接上的 SQLite 进度回调检查，超时的语句被中断并返回 503 QUERY_TIMEOUT，
+避免一个失控的查询长时间占用数据库连接和线程
+"""
+
+import logging
+import re
+from dataclasses import dataclass, field
+from typing import Optional, List, Dict, FrozenSet
+
+from server.middleware.rate_limit import route_matches
+
+logger = logging.getLogger(__name__)
+
+# 路由类别
+INTERACTIVE = "interactive"
+REPORT = "report"
+EXPORT = "export"
+
+# 各类别默认的 SQL 时限（毫秒，0 表示不限制）
+DEFAULT_DEADLINES_MS: Dict[str, float] = {
+    INTERACTIVE: 2000,
+    REPORT: 10000,
+    EXPORT: 30000,
+}
+
+
+@dataclass(frozen=True)
+class RouteClass:
+    """
+    SQL 时限类别规则（匹配方式与速率限制的 RouteBudget 相同）
+
+    Attributes:
+        name: 类别名称（INTERACTIVE / REPORT / EXPORT）
+        pattern: 路径正则（None 表示匹配所有路径）
+        methods: 匹配的 HTTP 方法（空表示全部）
+        min_page_size: 仅当查询参数 page_size 不小于该值时匹配
+    """
+    name: str
+    pattern: Optional[str] = None
+    methods: FrozenSet[str] = frozenset()
+    min_page_size: Optional[int] = None
+    _regex: Optional[re.Pattern] = field(default=None, init=False, repr=False, compare=False)
+
+    def __post_init__(self):
+        if self.pattern is not None:
+            object.__setattr__(self, "_regex", re.compile(self.pattern))
+
+    def matches(self, method: str, path: str, page_size: Optional[int]) -> bool:
+        return route_matches(self._regex, self.methods, self.min_page_size, method, path, page_size)
+
+
+# 按顺序匹配，第一个匹配的规则生效；都不匹配时为 INTERACTIVE
+ROUTE_CLASSES: List[RouteClass] = [
+    # 数据导入：单次请求写入大量数据
+    RouteClass(
+        EXPORT,
+        pattern=r"^/api/(settings|workspaces/\d+)/import-data$",
+        methods=frozenset({"POST"}),
+    ),
+    # 删除 workspace / 注销账户：级联删除全部业务数据
+    RouteClass(
+        EXPORT,
+        pattern=r"^/api/(workspaces/\d+/delete|auth/account/delete)$",
+        methods=frozenset({"POST"}),
+    ),
+    # 大分页列表查询（客户端导出数据时使用 page_size 最大 10000）
+    RouteClass(
+        EXPORT,
+        methods=frozenset({"GET"}),
+        min_page_size=1000,
+    ),
+    # 不分页的全量列表和全量搜索
+    RouteClass(
+        REPORT,
+        pattern=r"^/api/[\w-]+/(search/)?all$",
+        methods=frozenset({"GET"}),
+    ),
+    # 操作日志查询（按时间范围、关键字过滤，数据量随使用时间增长）和运维接口
+    RouteClass(
+        REPORT,
+        pattern=r"^/api/(audit-logs|admin)(/|$)",
+        methods=frozenset({"GET"}),
+    ),
+]
+
+# 当前生效的时限（秒，None 表示不限制）
+_deadlines: Dict[str, Optional[float]] = {
+    name: ms / 1000.0 for name, ms in DEFAULT_DEADLINES_MS.items()
+}
+
+
+def configure_query_deadlines(spec: str = ""):
+    """
+    配置各类别的 SQL 时限
+
+    Args:
+        spec: "类别=毫秒" 逗号分隔，如 "interactive=2000,report=10000,export=30000"；
+              未列出的类别使用默认值，0 表示该类别不限制
+    """
+    deadlines_ms = dict(DEFAULT_DEADLINES_MS)
+    for item in (spec or "").split(","):
+        if "=" not in item:
+            continue
+        name, value = (part.strip() for part in item.split("=", 1))
+        if name not in deadlines_ms:
+            logger.warning(f"未知的 SQL 时限类别: {name}（可选: {', '.join(deadlines_ms)}）")
+            continue
+        deadlines_ms[name] = float(value)
+
+    _deadlines.clear()
+    _deadlines.update({name: ms / 1000.0 if ms > 0 else None for name, ms in deadlines_ms.items()})
+    logger.info(
+        "SQL 执行时限: " + ", ".join(
+            f"{name}={f'{ms:g}ms' if ms > 0 else '不限制'}" for name, ms in deadlines_ms.items()
+        )
+    )
+
+
+def route_class_for(method: str, path: str, page_size: Optional[int] = None) -> str:
+    """获取请求所属的 SQL 时限类别"""
+    for route_class in ROUTE_CLASSES:
+        if route_class.matches(method, path, page_size):
+            return route_class.name
+    return INTERACTIVE
+
+
+def query_deadline_for(route_class: str) -> Optional[float]:
+    """获取类别的 SQL 时限（秒，None 表示不限制）"""
+    return _deadlines.get(route_class)
+
+
+def get_query_deadlines() -> Dict[str, Optional[float]]:
+    """各类别当前的 SQL 时限（毫秒，None 表示不限制）"""
+    return {name: seconds * 1000 if seconds else None for name, seconds in _deadlines.items()}
+
+
+# 各类别因超时被中断的请求数
+_timeouts: Dict[str, int] = {}
+
+
+def record_query_timeout(route_class: str):
+    """记录一次 SQL 超时"""
+    _timeouts[route_class] = _timeouts.get(route_class, 0) + 1
+
+
+def get_query_timeouts() -> Dict[str, int]:
+    """各类别因 SQL 超时被中断的请求数"""
+    return dict(_timeouts)
@@ -0,0 +1,349 @@
+"""
+速率限制
+基于 GCRA（通用信元速率算法，等价于令牌桶）：每个键只保存一个"理论到达时间"（TAT），
+每次检查 O(1)；键数量由 LRU 限制，内存不会随客户端数量无限增长。
+可选用一个小的 SQLite 文件保存状态，让多个 worker 进程共享同一份额度
+"""
+
+import asyncio
+import logging
+import math
+import re
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from typing import Optional, List, Tuple, FrozenSet
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass(frozen=True)
+class RateLimit:
+    """
+    速率限制额度：period 秒内最多 requests 次请求，允许瞬时突发 burst 次（默认等于 requests）
+    """
+    requests: int
+    period: float
+    burst: Optional[int] = None
+
+    @property
+    def interval(self) -> float:
+        """两次请求之间的平均间隔（秒）"""
+        return self.period / self.requests
+
+    @property
+    def capacity(self) -> float:
+        """允许的最大突发量对应的时间窗口（秒）"""
+        return self.interval * (self.burst or self.requests)
+
+
+@dataclass(frozen=True)
+class RouteBudget:
+    """
+    路由额度：匹配的请求使用独立的限额（与其他路由互不占用）
+
+    Attributes:
+        name: 额度名称（同时作为限流键的前缀）
+        limit: 速率限制
+        pattern: 路径正则（None 表示匹配所有路径）
+        methods: 匹配的 HTTP 方法（空表示全部）
+        min_page_size: 仅当查询参数 page_size 不小于该值时匹配（用于大分页列表查询）
+        per_ip: 按客户端 IP 而不是用户计数（登录、注册等未认证接口）
+    """
+    name: str
+    limit: RateLimit
+    pattern: Optional[str] = None
+    methods: FrozenSet[str] = frozenset()
+    min_page_size: Optional[int] = None
+    per_ip: bool = False
+    _regex: Optional[re.Pattern] = field(default=None, init=False, repr=False, compare=False)
+
+    def __post_init__(self):
+        if self.pattern is not None:
+            object.__setattr__(self, "_regex", re.compile(self.pattern))
+
+    def matches(self, method: str, path: str, page_size: Optional[int]) -> bool:
+        return route_matches(self._regex, self.methods, self.min_page_size, method, path, page_size)
+
+
+def route_matches(
+    regex: Optional[re.Pattern],
+    methods: FrozenSet[str],
+    min_page_size: Optional[int],
+    method: str,
+    path: str,
+    page_size: Optional[int]
+) -> bool:
+    """
+    请求是否匹配路由规则（路由额度、SQL 时限类别共用）
+
+    Args:
+        regex: 路径正则（None 表示匹配所有路径）
+        methods: 匹配的 HTTP 方法（空表示全部）
+        min_page_size: 仅当 page_size 不小于该值时匹配（None 表示不限）
+        method: 请求方法
+        path: 请求路径
+        page_size: 查询参数 page_size（没有或无效时为 None）
+    """
+    if methods and method not in methods:
+        return False
+    if regex is not None and not regex.match(path):
+        return False
+    if min_page_size is not None and (page_size is None or page_size < min_page_size):
+        return False
+    return True
+
+
+# 按顺序匹配，第一个匹配的额度生效；都不匹配时使用 DEFAULT_BUDGET
+ROUTE_BUDGETS: List[RouteBudget] = [
+    # 数据导入：单次请求写入大量数据
+    RouteBudget(
+        "import",
+        RateLimit(requests=5, period=60, burst=2),
+        pattern=r"^/api/(settings|workspaces/\d+)/import-data$",
+        methods=frozenset({"POST"}),
+    ),
+    # 大分页列表查询（page_size 最大 10000）
+    # 客户端的统计、报表和自动备份一次并发取多个全量列表（如首页 6 个、财务统计 5 个，
+    # 自动备份 6 个），连续打开几个页面不能触发限流（客户端没有处理 429）
+    RouteBudget(
+        "bulk_list",
+        RateLimit(requests=120, period=60, burst=40),
+        methods=frozenset({"GET"}),
+        min_page_size=1000,
+    ),
+    # 登录 / 注册：每次都要计算 bcrypt，按 IP 限制
+    RouteBudget(
+        "auth",
+        RateLimit(requests=20, period=60, burst=10),
+        pattern=r"^/api/auth/(login|register)$",
+        methods=frozenset({"POST"}),
+        per_ip=True,
+    ),
+    # 心跳：开销很小，但客户端会持续定时发送，单独计数，不占用普通接口的额度
+    RouteBudget(
+        "heartbeat",
+        RateLimit(requests=60, period=60, burst=20),
+        pattern=r"^/api/users/heartbeat$",
+    ),
+]
+
+DEFAULT_BUDGET = RouteBudget("default", RateLimit(requests=600, period=60, burst=120))
+
+# 不限流的路径
+EXEMPT_PATHS = frozenset({"/", "/health", "/metrics", "/docs", "/redoc", "/openapi.json"})
+
+
+class MemoryRateLimitStore:
+    """进程内状态：键 -> TAT，按 LRU 淘汰（被淘汰的键相当于额度已恢复满）"""
+
+    shared = False
+
+    def __init__(self, max_keys: int = 10000):
+        self.max_keys = max_keys
+        self._tats: "OrderedDict[str, float]" = OrderedDict()
+
+    def now(self) -> float:
+        return time.monotonic()
+
+    def hit(self, key: str, limit: RateLimit) -> Tuple[bool, float, int]:
+        """
+        记录一次请求
+
+        Returns:
+            (是否允许, 需要等待的秒数, 剩余可突发次数)
+        """
+        now = self.now()
+        tat = max(self._tats.get(key, now), now)
+        allowed, retry_after, remaining, new_tat = _gcra(tat, now, limit)
+        if allowed:
+            self._tats[key] = new_tat
+            self._tats.move_to_end(key)
+            while len(self._tats) > self.max_keys:
+                self._tats.popitem(last=False)
+        return allowed, retry_after, remaining
+
+    def __len__(self) -> int:
+        return len(self._tats)
+
+
+class SQLiteRateLimitStore:
+    """
+    多进程共享状态：保存在独立的 SQLite 文件中（不占用业务数据库的写锁）
+    TAT 已过期的行与不存在等价，定期清理
+    """
+
+    shared = True
+
+    # 每多少次写入清理一次过期行
+    PRUNE_EVERY = 1000
+
+    def __init__(self, path: str, busy_timeout: int = 100):
+        """
+        Args:
+            path: SQLite 文件路径
+            busy_timeout: 等待其他进程释放写锁的最长时间（毫秒）
+        """
+        self.path = path
+        self._lock = threading.Lock()
+        self._writes = 0
+        self._conn = sqlite3.connect(path, timeout=busy_timeout / 1000, check_same_thread=False,
+                                     isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode = WAL")
+        self._conn.execute("PRAGMA synchronous = OFF")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS rate_limits (key TEXT PRIMARY KEY, tat REAL NOT NULL) WITHOUT ROWID"
+        )
+
+    def now(self) -> float:
+        # 跨进程比较，必须使用墙上时钟
+        return time.time()
+
+    def hit(self, key: str, limit: RateLimit) -> Tuple[bool, float, int]:
+        with self._lock:
+            conn = self._conn
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                now = self.now()
+                row = conn.execute("SELECT tat FROM rate_limits WHERE key = ?", (key,)).fetchone()
+                tat = max(row[0], now) if row else now
+                allowed, retry_after, remaining, new_tat = _gcra(tat, now, limit)
+                if allowed:
+                    conn.execute(
+                        "INSERT INTO rate_limits (key, tat) VALUES (?, ?) "
+                        "ON CONFLICT(key) DO UPDATE SET tat = excluded.tat",
+                        (key, new_tat)
+                    )
+                    self._writes += 1
+                    if self._writes % self.PRUNE_EVERY == 0:
+                        conn.execute("DELETE FROM rate_limits WHERE tat < ?", (now,))
+                conn.execute("COMMIT")
+            except BaseException:
+                conn.execute("ROLLBACK")
+                raise
+        return allowed, retry_after, remaining
+
+    def __len__(self) -> int:
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM rate_limits").fetchone()[0]
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+
+def _gcra(tat: float, now: float, limit: RateLimit) -> Tuple[bool, float, int, float]:
+    """
+    GCRA 判定
+
+    Args:
+        tat: 当前理论到达时间（已与 now 取较大值）
+        now: 当前时间
+        limit: 速率限制
+
+    Returns:
+        (是否允许, 需要等待的秒数, 剩余可突发次数, 新的 TAT)
+    """
+    new_tat = tat + limit.interval
+    over = new_tat - now - limit.capacity
+    if over > 0:
+        return False, over, 0, tat
+    remaining = int((limit.capacity - (new_tat - now)) / limit.interval + 1e-9)
+    return True, 0.0, remaining, new_tat
+
+
+class RateLimiter:
+    """按路由额度和身份（用户或 IP）限流"""
+
+    def __init__(
+        self,
+        store=None,
+        budgets: Optional[List[RouteBudget]] = None,
+        default: RouteBudget = DEFAULT_BUDGET
+    ):
+        """
+        Args:
+            store: 状态存储（默认 MemoryRateLimitStore）
+            budgets: 路由额度列表（默认 ROUTE_BUDGETS）
+            default: 未匹配任何路由额度时使用的额度
+        """
+        self.store = store if store is not None else MemoryRateLimitStore()
+        self.budgets = ROUTE_BUDGETS if budgets is None else budgets
+        self.default = default
+        self._stats = {'allowed': 0, 'limited': 0, 'errors': 0}
+
+    def budget_for(self, method: str, path: str, page_size: Optional[int] = None) -> RouteBudget:
+        """获取请求对应的路由额度"""
+        for budget in self.budgets:
+            if budget.matches(method, path, page_size):
+                return budget
+        return self.default
+
+    async def check(self, budget: RouteBudget, identity: str) -> Tuple[bool, float, int]:
+        """
+        检查并记录一次请求
+
+        Args:
+            budget: 路由额度
+            identity: 身份标识（如 "user:1" 或 "ip:1.2.3.4"）
+
+        Returns:
+            (是否允许, 需要等待的秒数, 剩余可突发次数)；共享状态不可用时放行
+        """
+        key = f"{budget.name}:{identity}"
+        try:
+            if self.store.shared:
+                result = await asyncio.to_thread(self.store.hit, key, budget.limit)
+            else:
+                result = self.store.hit(key, budget.limit)
+        except sqlite3.Error as e:
+            self._stats['errors'] += 1
+            logger.warning(f"速率限制状态读写失败，本次请求放行: {e}")
+            return True, 0.0, 0
+        self._stats['allowed' if result[0] else 'limited'] += 1
+        return result
+
+    def get_stats(self) -> dict:
+        """获取限流统计信息"""
+        return {
+            **self._stats,
+            'store': 'sqlite' if self.store.shared else 'memory',
+            'keys': len(self.store),
+        }
+
+
+# 全局限流器实例（未初始化时不限流）
+_limiter: Optional[RateLimiter] = None
+
+
+def init_rate_limiter(shared_db_path: Optional[str] = None, max_keys: int = 10000) -> RateLimiter:
+    """
+    初始化全局限流器
+
+    Args:
+        shared_db_path: 共享状态的 SQLite 文件路径（多 worker 进程部署时使用），None 表示进程内状态
+        max_keys: 进程内状态最多保存的键数
+
+    Returns:
+        限流器实例
+    """
+    global _limiter
+    if shared_db_path:
+        store = SQLiteRateLimitStore(shared_db_path)
+    else:
+        store = MemoryRateLimitStore(max_keys=max_keys)
+    _limiter = RateLimiter(store)
+    logger.info(f"速率限制已启用（{'共享状态: ' + shared_db_path if shared_db_path else '进程内状态'}）")
+    return _limiter
+
+
+def get_rate_limiter() -> Optional[RateLimiter]:
+    """获取全局限流器（未启用时返回 None）"""
+    return _limiter
+
+
+def retry_after_header(seconds: float) -> str:
+    """Retry-After 响应头的值（向上取整的秒数）"""
+    return str(max(1, math.ceil(seconds)))
@@ -1,12 +1,19 @@
 """
 Workspace 权限检查中间件
 提供 Workspace 访问权限验证和权限检查功能
+
+在已持有数据库连接的请求中调用时，这里的查询会复用该请求级连接（见 SQLiteConnectionPool.acquire）
+用户在 Workspace 中的角色和 Workspace 的存储类型由一次联表查询得到，并缓存在有界 LRU 中；
+成员和 Workspace 变更后需调用 invalidate_workspace_access() 清除缓存
 """
 
 import logging
-from typing import Optional
+import time
+from collections import OrderedDict
+from typing import Optional, Tuple
 from fastapi import HTTPException, status, Header, Depends
-from server.database import get_pool
+from server.database import get_pool, DatabaseBusyError, ConnectionTimeoutError
+from server.timing import timed, PHASE_PERMISSION
 from server.middleware.core import get_current_user
 
 logger = logging.getLogger(__name__)
@@ -48,6 +55,114 @@ PERMISSIONS = {
 }
 
 
+# 访问上下文缓存：(workspace_id, user_id) -> (写入时间, storage_type, role)
+# user_id 为 None 的条目只缓存存储类型；role 为 None 表示用户无权访问
+_ACCESS_CACHE_SIZE = 4096
+# 多进程部署时其他进程的变更无法通知到本进程，缓存最多保留这么久（秒）
+_ACCESS_CACHE_TTL = 60.0
+_access_cache: "OrderedDict[Tuple[int, Optional[int]], Tuple[float, str, Optional[str]]]" = OrderedDict()
+# 每次清除缓存时递增；查询期间发生过清除的结果不写入缓存，避免写回旧数据
+_access_generation = 0
+
+
+@timed(PHASE_PERMISSION)
+async def resolve_workspace_access(
+    workspace_id: int,
+    user_id: Optional[int]
+) -> Optional[Tuple[str, Optional[str]]]:
+    """
+    获取 Workspace 的存储类型和用户在其中的角色（一次联表查询，结果带缓存）
+    
+    Args:
+        workspace_id: Workspace ID
+        user_id: 用户 ID，为 None 时只获取存储类型
+    
+    Returns:
+        (storage_type, role)，role 为 None 表示用户无权访问；Workspace 不存在时返回 None
+    """
+    key = (workspace_id, user_id)
+    entry = _access_cache.get(key)
+    if entry is not None and time.monotonic() - entry[0] < _ACCESS_CACHE_TTL:
+        _access_cache.move_to_end(key)
+        return entry[1], entry[2]
+    
+    generation = _access_generation
+    pool = get_pool()
+    async with pool.acquire(readonly=True) as conn:
+        if user_id is None:
+            row = await conn.fetchone(
+                "SELECT storage_type, NULL, NULL FROM workspaces WHERE id = ?",
+                (workspace_id,)
+            )
+        else:
+            row = await conn.fetchone(
+                """
+                SELECT w.storage_type, w.ownerId, m.role
+                FROM workspaces w
+                LEFT JOIN workspace_members m ON m.workspaceId = w.id AND m.userId = ?
+                WHERE w.id = ?
+                """,
+                (user_id, workspace_id)
+            )
+    
+    if row is None:
+        # 不缓存不存在的 Workspace（之后可能被创建）
+        return None
+    
+    storage_type = row[0]
+    # 拥有者优先于成员表中的角色
+    role = 'owner' if user_id is not None and row[1] == user_id else row[2]
+    
+    if generation == _access_generation:
+        _access_cache[key] = (time.monotonic(), storage_type, role)
+        _access_cache.move_to_end(key)
+        while len(_access_cache) > _ACCESS_CACHE_SIZE:
+            _access_cache.popitem(last=False)
+    return storage_type, role
+
+
+def invalidate_workspace_access(
+    workspace_id: Optional[int] = None,
+    user_id: Optional[int] = None
+):
+    """
+    清除 Workspace 访问上下文缓存（在成员或 Workspace 变更提交后调用）
+    
+    Args:
+        workspace_id: 只清除该 Workspace 的条目
+        user_id: 只清除该用户的条目（与 workspace_id 同时指定时只清除这一对）
+        两者都为 None 时清除全部
+    """
+    global _access_generation
+    _access_generation += 1
+    if workspace_id is None and user_id is None:
+        _access_cache.clear()
+        return
+    for key in list(_access_cache):
+        if (workspace_id is None or key[0] == workspace_id) and \
+                (user_id is None or key[1] is None or key[1] == user_id):
+            del _access_cache[key]
+
+
+async def _resolve_or_none(
+    workspace_id: int,
+    user_id: Optional[int]
+) -> Optional[Tuple[str, Optional[str]]]:
+    """
+    resolve_workspace_access() 出错时记录日志并按无权限处理
+    
+    SQL 超时（QueryTimeoutError 等 HTTPException）、数据库繁忙和获取连接超时不是"无权限"，
+    原样抛出，由全局异常处理器返回 503
+    """
+    try:
+        return await resolve_workspace_access(workspace_id, user_id)
+    except (HTTPException, DatabaseBusyError, ConnectionTimeoutError):
+        raise
+    except Exception as e:
+        logger.error(f"获取 workspace 访问上下文失败: {e}", exc_info=True)
+        return None
+
+
 async def get_workspace_id(
     x_workspace_id: Optional[int] = Header(None, alias="X-Workspace-ID")
 ) -> Optional[int]:
@@ -77,30 +192,8 @@ async def check_workspace_access(
     Returns:
         是否有访问权限
     """
-    pool = get_pool()
-    try:
-        with pool.get_connection() as conn:
-            # 检查用户是否是 workspace 的成员
-            cursor = conn.execute(
-                "SELECT role FROM workspace_members WHERE workspaceId = ? AND userId = ?",
-                (workspace_id, user_id)
-            )
-            member = cursor.fetchone()
-            
-            if member:
-                return True
-            
-            # 检查用户是否是 workspace 的拥有者（通过 workspaces 表）
-            cursor = conn.execute(
-                "SELECT id FROM workspaces WHERE id = ? AND ownerId = ?",
-                (workspace_id, user_id)
-            )
-            owner = cursor.fetchone()
-            
-            return owner is not None
-    except Exception as e:
-        logger.error(f"检查 workspace 访问权限失败: {e}", exc_info=True)
-        return False
+    access = await _resolve_or_none(workspace_id, user_id)
+    return access is not None and access[1] is not None
 
 
 async def get_workspace_role(
@@ -117,31 +210,8 @@ async def get_workspace_role(
     Returns:
         用户角色（'owner', 'admin', 'editor', 'viewer'），如果用户不是成员则返回 None
     """
-    pool = get_pool()
-    try:
-        with pool.get_connection() as conn:
-            # 首先检查是否是拥有者
-            cursor = conn.execute(
-                "SELECT id FROM workspaces WHERE id = ? AND ownerId = ?",
-                (workspace_id, user_id)
-            )
-            if cursor.fetchone():
-                return 'owner'
-            
-            # 检查是否是成员
-            cursor = conn.execute(
-                "SELECT role FROM workspace_members WHERE workspaceId = ? AND userId = ?",
-                (workspace_id, user_id)
-            )
-            member = cursor.fetchone()
-            
-            if member:
-                return member[0]
-            
-            return None
-    except Exception as e:
-        logger.error(f"获取 workspace 角色失败: {e}", exc_info=True)
-        return None
+    access = await _resolve_or_none(workspace_id, user_id)
+    return access[1] if access is not None else None
 
 
 async def check_workspace_permission(
@@ -163,15 +233,7 @@ async def check_workspace_permission(
     Raises:
         HTTPException: 如果用户没有访问权限
     """
-    # 首先检查访问权限
-    has_access = await check_workspace_access(workspace_id, user_id)
-    if not has_access:
-        raise HTTPException(
-            status_code=status.HTTP_403_FORBIDDEN,
-            detail="无权访问该 Workspace"
-        )
-    
-    # 获取用户角色
+    # 检查访问权限并获取用户角色
     role = await get_workspace_role(workspace_id, user_id)
     if role is None:
         raise HTTPException(
@@ -231,21 +293,8 @@ async def get_workspace_storage_type(
     Returns:
         存储类型（'local' 或 'server'），如果 workspace 不存在则返回 None
     """
-    pool = get_pool()
-    try:
-        with pool.get_connection() as conn:
-            cursor = conn.execute(
-                "SELECT storage_type FROM workspaces WHERE id = ?",
-                (workspace_id,)
-            )
-            row = cursor.fetchone()
-            
-            if row:
-                return row[0]
-            return None
-    except Exception as e:
-        logger.error(f"获取 workspace 存储类型失败: {e}", exc_info=True)
-        return None
+    access = await _resolve_or_none(workspace_id, None)
+    return access[0] if access is not None else None
 
 
 async def require_server_storage(
@@ -271,22 +320,15 @@ async def require_server_storage(
             detail="缺少 X-Workspace-ID 请求头"
         )
     
-    # 检查访问权限
-    has_access = await check_workspace_access(workspace_id, user_id)
-    if not has_access:
+    # 检查访问权限并获取存储类型（与后续的权限检查共用同一条缓存）
+    access = await _resolve_or_none(workspace_id, user_id)
+    if access is None or access[1] is None:
         raise HTTPException(
             status_code=status.HTTP_403_FORBIDDEN,
             detail="无权访问该 Workspace"
         )
     
-    # 获取存储类型
-    storage_type = await get_workspace_storage_type(workspace_id)
-    if storage_type is None:
-        raise HTTPException(
-            status_code=status.HTTP_404_NOT_FOUND,
-            detail="Workspace 不存在"
-        )
-    
+    storage_type = access[0]
     if storage_type == 'local':
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
@@ -327,15 +369,7 @@ async def get_workspace_context(
     
     user_id = current_user["user_id"]
     
-    # 检查访问权限
-    has_access = await check_workspace_access(workspace_id, user_id)
-    if not has_access:
-        raise HTTPException(
-            status_code=status.HTTP_403_FORBIDDEN,
-            detail="无权访问该 Workspace"
-        )
-    
-    # 获取用户角色
+    # 检查访问权限并获取用户角色
     role = await get_workspace_role(workspace_id, user_id)
     if role is None:
         raise HTTPException(
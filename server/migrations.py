@@ -0,0 +1,984 @@
+"""
+数据库迁移
+按版本号注册的迁移步骤 + 启动时的快速路径：
+
+- 数据库版本（PRAGMA user_version）已是最新，且表结构指纹与上次检查通过时记录的一致时，
+  跳过所有迁移和表结构检查，启动只需几次查询
+- 否则按版本顺序执行尚未执行的迁移（每个版本单独提交，中断后从下一个版本继续），
+  然后执行表结构检查（补充缺失的列和索引），最后记录新的指纹
+- 需要重建整张表的迁移使用 rebuild_table()：分批复制数据，每批单独提交并记录进度，
+  中断后从上次的位置继续，不会长时间锁住整个数据库
+"""
+
+import hashlib
+import logging
+import sqlite3
+import time
+from contextlib import contextmanager
+from dataclasses import dataclass
+from typing import Callable, List, Optional
+
+from server.pagination import day_expression
+
+logger = logging.getLogger(__name__)
+
+# _create_tables() 创建的表结构对应的版本；新数据库建表后从这里继续执行后续迁移
+BASELINE_VERSION = 20
+
+# 表重建时每批复制的行数
+REBUILD_BATCH_SIZE = 5000
+
+# 迁移引擎自己的表（不计入表结构指纹）
+_META_TABLES = ("schema_meta", "schema_migrations")
+
+
+@dataclass
+class Migration:
+    """一个迁移步骤"""
+    version: int
+    description: str
+    func: Callable[[sqlite3.Connection], None]
+    # False 表示迁移自己管理事务（如分批重建表），不包在单个事务中执行
+    transactional: bool = True
+
+
+MIGRATIONS: List[Migration] = []
+
+
+def migration(version: int, description: str, transactional: bool = True):
+    """
+    注册迁移步骤的装饰器
+    
+    Args:
+        version: 执行后数据库所处的版本
+        description: 迁移说明
+        transactional: 是否在单个事务中执行
+    """
+    def decorator(func: Callable[[sqlite3.Connection], None]):
+        if any(m.version == version for m in MIGRATIONS):
+            raise ValueError(f"迁移版本重复: {version}")
+        MIGRATIONS.append(Migration(version, description, func, transactional))
+        MIGRATIONS.sort(key=lambda m: m.version)
+        return func
+    return decorator
+
+
+def schema_version() -> int:
+    """最新的数据库版本"""
+    return max([BASELINE_VERSION] + [m.version for m in MIGRATIONS])
+
+
+def schema_fingerprint(conn: sqlite3.Connection) -> str:
+    """
+    计算表结构指纹（sqlite_master 中所有表、索引、触发器、视图定义的哈希）
+    """
+    placeholders = ", ".join("?" for _ in _META_TABLES)
+    rows = conn.execute(
+        f"""
+        SELECT type, name, tbl_name, sql FROM sqlite_master
+        WHERE name NOT LIKE 'sqlite_%' AND name NOT IN ({placeholders})
+        ORDER BY type, name
+        """,
+        _META_TABLES
+    ).fetchall()
+    digest = hashlib.sha256()
+    for row in rows:
+        digest.update("\x1f".join(str(value) for value in row).encode("utf-8"))
+        digest.update(b"\x1e")
+    return digest.hexdigest()
+
+
+def migrate(conn: sqlite3.Connection, create_tables: Callable[[sqlite3.Connection], None]) -> bool:
+    """
+    将数据库升级到最新版本
+    
+    Args:
+        conn: 数据库连接（不能处于事务中）
+        create_tables: 创建全部表的函数（新数据库使用），创建的结构对应 BASELINE_VERSION
+    
+    Returns:
+        是否执行了迁移或表结构检查（False 表示走了快速路径）
+    """
+    target = schema_version()
+    version = conn.execute("PRAGMA user_version").fetchone()[0]
+    
+    # 快速路径：版本和指纹都与上次检查通过时一致
+    if version == target and _get_meta(conn, "fingerprint") == schema_fingerprint(conn):
+        logger.info(f"数据库版本: {version}, 表结构未变化，跳过迁移检查")
+        return False
+    
+    start = time.perf_counter()
+    conn.commit()
+    _ensure_meta_tables(conn)
+    
+    if version == 0:
+        # 首次创建数据库
+        logger.info("首次创建数据库，执行初始化脚本...")
+        with _transaction(conn):
+            create_tables(conn)
+            conn.execute(f"PRAGMA user_version = {BASELINE_VERSION}")
+            _record(conn, BASELINE_VERSION, "初始化数据库结构", start)
+        version = BASELINE_VERSION
+    elif version < target:
+        logger.info(f"开始数据库升级: {version} -> {target}")
+    elif version > target:
+        logger.warning(f"数据库版本 ({version}) 高于当前程序支持的版本 ({target})，只执行表结构检查")
+    else:
+        logger.info(f"数据库版本: {version}, 表结构有变化，检查表结构...")
+    
+    # 重建表期间关闭外键约束：DROP 旧表时不触发级联删除/置空（必须在事务外设置）
+    conn.execute("PRAGMA foreign_keys = OFF")
+    try:
+        for m in MIGRATIONS:
+            if m.version <= version or m.version > target:
+                continue
+            _apply(conn, m)
+            version = m.version
+        
+        with _transaction(conn):
+            _check_schema(conn)
+        
+        violations = conn.execute("PRAGMA foreign_key_check").fetchall()
+        if violations:
+            logger.warning(f"外键检查发现 {len(violations)} 条不一致的记录（示例: {tuple(violations[0])}）")
+    finally:
+        conn.execute("PRAGMA foreign_keys = ON")
+    
+    with _transaction(conn):
+        _set_meta(conn, "fingerprint", schema_fingerprint(conn))
+    logger.info(f"数据库结构已是最新（版本 {version}），耗时 {(time.perf_counter() - start) * 1000:.0f}ms")
+    return True
+
+
+def rebuild_table(
+    conn: sqlite3.Connection,
+    table: str,
+    definition: str,
+    where: Optional[str] = None,
+    batch_size: Optional[int] = None
+) -> int:
+    """
+    用新的表定义重建表（SQLite 不支持修改约束，只能建新表、复制数据、替换旧表）
+    数据按 rowid 分批复制，每批单独提交并在 schema_meta 中记录进度；
+    中断后再次执行会从上次的位置继续。最后一批与删除旧表、重命名新表、重建索引在同一个事务中完成
+    
+    Args:
+        conn: 数据库连接（不能处于事务中）
+        table: 表名
+        definition: 新表的列和约束定义（CREATE TABLE 括号内的部分）
+        where: 只复制满足条件的行（可选）
+        batch_size: 每批复制的行数，默认 REBUILD_BATCH_SIZE
+    
+    Returns:
+        本次复制的行数
+    """
+    batch_size = batch_size or REBUILD_BATCH_SIZE
+    new_table = f"{table}_new"
+    key = f"rebuild:{table}"
+    state = _get_meta(conn, key)
+    
+    if state == "done":
+        logger.info(f"{table} 表已重建，跳过")
+        return 0
+    if state is None or not _table_exists(conn, new_table):
+        with _transaction(conn):
+            conn.execute(f"DROP TABLE IF EXISTS {new_table}")
+            conn.execute(f"CREATE TABLE {new_table} ({definition})")
+            _set_meta(conn, key, "0")
+        last_rowid = 0
+    else:
+        last_rowid = int(state)
+        logger.info(f"继续重建 {table} 表（从 rowid {last_rowid} 之后开始）")
+    
+    # 按列名复制，新旧表列顺序不同也不会错位
+    old_columns = set(_columns(conn, table))
+    column_list = ", ".join(c for c in _columns(conn, new_table) if c in old_columns)
+    condition = f" AND ({where})" if where else ""
+    
+    total = conn.execute(f"SELECT COUNT(*) FROM {table}").fetchone()[0]
+    scanned = conn.execute(f"SELECT COUNT(*) FROM {table} WHERE rowid <= ?", (last_rowid,)).fetchone()[0]
+    copied = 0
+    
+    while True:
+        # 本批的最后一个 rowid；不足一批时为 None，表示这是最后一批
+        row = conn.execute(
+            f"SELECT rowid FROM {table} WHERE rowid > ? ORDER BY rowid LIMIT 1 OFFSET ?",
+            (last_rowid, batch_size - 1)
+        ).fetchone()
+        upper = row[0] if row else None
+        
+        with _transaction(conn):
+            if upper is not None:
+                cursor = conn.execute(
+                    f"INSERT INTO {new_table} ({column_list}) SELECT {column_list} FROM {table} "
+                    f"WHERE rowid > ? AND rowid <= ?{condition}",
+                    (last_rowid, upper)
+                )
+                copied += cursor.rowcount
+                scanned += batch_size
+                _set_meta(conn, key, str(upper))
+            else:
+                cursor = conn.execute(
+                    f"INSERT INTO {new_table} ({column_list}) SELECT {column_list} FROM {table} "
+                    f"WHERE rowid > ?{condition}",
+                    (last_rowid,)
+                )
+                copied += cursor.rowcount
+                scanned = total
+                _swap_table(conn, table, new_table)
+                _set_meta(conn, key, "done")
+        
+        logger.info(f"重建 {table} 表: {scanned}/{total} 行 ({scanned * 100 // max(total, 1)}%)")
+        if upper is None:
+            break
+        last_rowid = upper
+    
+    return copied
+
+
+def _swap_table(conn: sqlite3.Connection, table: str, new_table: str):
+    """用新表替换旧表，并重建旧表上的索引和触发器（在调用方的事务中执行）"""
+    objects = conn.execute(
+        "SELECT type, name, sql FROM sqlite_master "
+        "WHERE tbl_name = ? AND type IN ('index', 'trigger') AND sql IS NOT NULL",
+        (table,)
+    ).fetchall()
+    conn.execute(f"DROP TABLE {table}")
+    conn.execute(f"ALTER TABLE {new_table} RENAME TO {table}")
+    for obj_type, name, sql in objects:
+        try:
+            conn.execute(sql)
+        except sqlite3.OperationalError as e:
+            logger.warning(f"重建 {table} 表后无法恢复{'索引' if obj_type == 'index' else '触发器'} {name}: {e}")
+
+
+def _apply(conn: sqlite3.Connection, m: Migration):
+    """执行一个迁移步骤并记录版本"""
+    logger.info(f"升级到版本 {m.version}: {m.description}")
+    start = time.perf_counter()
+    if m.transactional:
+        with _transaction(conn):
+            m.func(conn)
+            conn.execute(f"PRAGMA user_version = {m.version}")
+            _record(conn, m.version, m.description, start)
+    else:
+        m.func(conn)
+        with _transaction(conn):
+            conn.execute(f"PRAGMA user_version = {m.version}")
+            _record(conn, m.version, m.description, start)
+            # 本版本的表重建已全部完成，清除进度记录
+            conn.execute("DELETE FROM schema_meta WHERE key LIKE 'rebuild:%'")
+
+
+@contextmanager
+def _transaction(conn: sqlite3.Connection):
+    """显式事务（BEGIN IMMEDIATE ... COMMIT），出错时回滚"""
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        yield
+        conn.commit()
+    except BaseException:
+        conn.rollback()
+        raise
+
+
+def _ensure_meta_tables(conn: sqlite3.Connection):
+    conn.execute("CREATE TABLE IF NOT EXISTS schema_meta (key TEXT PRIMARY KEY, value TEXT)")
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS schema_migrations (
+            version INTEGER PRIMARY KEY,
+            description TEXT NOT NULL,
+            applied_at TEXT DEFAULT (datetime('now')),
+            duration_ms REAL
+        )
+    ''')
+    conn.commit()
+
+
+def _record(conn: sqlite3.Connection, version: int, description: str, start: float):
+    conn.execute(
+        "INSERT OR REPLACE INTO schema_migrations (version, description, applied_at, duration_ms) "
+        "VALUES (?, ?, datetime('now'), ?)",
+        (version, description, round((time.perf_counter() - start) * 1000, 3))
+    )
+
+
+def _get_meta(conn: sqlite3.Connection, key: str) -> Optional[str]:
+    try:
+        row = conn.execute("SELECT value FROM schema_meta WHERE key = ?", (key,)).fetchone()
+    except sqlite3.OperationalError:
+        # 旧数据库还没有 schema_meta 表
+        return None
+    return row[0] if row else None
+
+
+def _set_meta(conn: sqlite3.Connection, key: str, value: str):
+    conn.execute("INSERT OR REPLACE INTO schema_meta (key, value) VALUES (?, ?)", (key, value))
+
+
+def _table_exists(conn: sqlite3.Connection, table: str) -> bool:
+    return conn.execute(
+        "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = ?", (table,)
+    ).fetchone() is not None
+
+
+def _columns(conn: sqlite3.Connection, table: str) -> List[str]:
+    return [row[1] for row in conn.execute(f"PRAGMA table_info({table})").fetchall()]
+
+
+def _has_index_on(conn: sqlite3.Connection, table: str, columns: List[str]) -> bool:
+    """表上是否已有以 columns 开头的索引（含 UNIQUE 约束自动创建的索引）"""
+    for index in conn.execute(f"PRAGMA index_list({table})").fetchall():
+        indexed = [row[2] for row in conn.execute(f"PRAGMA index_info({index[1]})").fetchall()]
+        if indexed[:len(columns)] == columns:
+            return True
+    return False
+
+
+# ==================== 迁移步骤 ====================
+
+@migration(5, "添加 employees, income, remittance 表")
+def _v5(conn: sqlite3.Connection):
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS employees (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            userId INTEGER NOT NULL,
+            name TEXT NOT NULL,
+            note TEXT,
+            created_at TEXT DEFAULT (datetime('now')),
+            updated_at TEXT DEFAULT (datetime('now')),
+            FOREIGN KEY (userId) REFERENCES users (id) ON DELETE CASCADE,
+            UNIQUE(userId, name)
+        )
+    ''')
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS income (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            userId INTEGER NOT NULL,
+            incomeDate TEXT NOT NULL,
+            customerId INTEGER,
+            amount REAL NOT NULL,
+            discount REAL DEFAULT 0,
+            employeeId INTEGER,
+            paymentMethod TEXT NOT NULL CHECK(paymentMethod IN ('现金', '微信转账', '银行卡')),
+            note TEXT,
+            created_at TEXT DEFAULT (datetime('now')),
+            FOREIGN KEY (userId) REFERENCES users (id) ON DELETE CASCADE,
+            FOREIGN KEY (customerId) REFERENCES customers (id) ON DELETE SET NULL,
+            FOREIGN KEY (employeeId) REFERENCES employees (id) ON DELETE SET NULL)
+    ''')
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS remittance (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            userId INTEGER NOT NULL,
+            remittanceDate TEXT NOT NULL,
+            supplierId INTEGER,
+            amount REAL NOT NULL,
+            employeeId INTEGER,
+            paymentMethod TEXT NOT NULL CHECK(paymentMethod IN ('现金', '微信转账', '银行卡')),
+            note TEXT,
+            created_at TEXT DEFAULT (datetime('now')),
+            FOREIGN KEY (userId) REFERENCES users (id) ON DELETE CASCADE,
+            FOREIGN KEY (supplierId) REFERENCES suppliers (id) ON DELETE SET NULL,
+            FOREIGN KEY (employeeId) REFERENCES employees (id) ON DELETE SET NULL)
+    ''')
+
+
+@migration(11, "为 products 表添加 supplierId 字段")
+def _v11(conn: sqlite3.Connection):
+    try:
+        conn.execute('ALTER TABLE products ADD COLUMN supplierId INTEGER')
+    except sqlite3.OperationalError:
+        # 字段可能已存在
+        pass
+
+
+@migration(12, "添加自动备份字段和在线用户表")
+def _v12(conn: sqlite3.Connection):
+    # 检查并添加自动备份字段
+    cursor = conn.execute("PRAGMA table_info(user_settings)")
+    columns = [row[1] for row in cursor.fetchall()]
+
+    if 'auto_backup_enabled' not in columns:
+        conn.execute('ALTER TABLE user_settings ADD COLUMN auto_backup_enabled INTEGER DEFAULT 0')
+    if 'auto_backup_interval' not in columns:
+        conn.execute('ALTER TABLE user_settings ADD COLUMN auto_backup_interval INTEGER DEFAULT 15')
+    if 'auto_backup_max_count' not in columns:
+        conn.execute('ALTER TABLE user_settings ADD COLUMN auto_backup_max_count INTEGER DEFAULT 20')
+    if 'last_backup_time' not in columns:
+        conn.execute('ALTER TABLE user_settings ADD COLUMN last_backup_time TEXT')
+    if 'show_online_users' not in columns:
+        conn.execute('ALTER TABLE user_settings ADD COLUMN show_online_users INTEGER DEFAULT 1')
+    if 'notify_device_online' not in columns:
+        conn.execute('ALTER TABLE user_settings ADD COLUMN notify_device_online INTEGER DEFAULT 1')
+    if 'notify_device_offline' not in columns:
+        conn.execute('ALTER TABLE user_settings ADD COLUMN notify_device_offline INTEGER DEFAULT 1')
+
+    # 创建在线用户表（支持多设备）
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS online_users (
+            userId INTEGER NOT NULL,
+            deviceId TEXT NOT NULL,
+            username TEXT NOT NULL,
+            last_heartbeat TEXT DEFAULT (datetime('now')),
+            current_action TEXT,
+            PRIMARY KEY (userId, deviceId),
+            FOREIGN KEY (userId) REFERENCES users (id) ON DELETE CASCADE)
+    ''')
+
+
+@migration(13, "修改 online_users 表支持多设备")
+def _v13(conn: sqlite3.Connection):
+    try:
+        # 检查表是否存在
+        cursor = conn.execute("SELECT name FROM sqlite_master WHERE type='table' AND name='online_users'")
+        if cursor.fetchone():
+            # 删除旧表（会丢失在线状态，但这是必要的）
+            conn.execute("DROP TABLE IF EXISTS online_users")
+            logger.info("已删除旧的 online_users 表")
+
+        # 创建新表（支持多设备）
+        conn.execute('''
+            CREATE TABLE IF NOT EXISTS online_users (
+                userId INTEGER NOT NULL,
+                deviceId TEXT NOT NULL,
+                username TEXT NOT NULL,
+                last_heartbeat TEXT DEFAULT (datetime('now')),
+                current_action TEXT,
+                platform TEXT,
+                device_name TEXT,
+                PRIMARY KEY (userId, deviceId),
+                FOREIGN KEY (userId) REFERENCES users (id) ON DELETE CASCADE)
+        ''')
+        logger.info("已创建新的 online_users 表（支持多设备）")
+    except Exception as e:
+        logger.error(f"升级 online_users 表失败: {e}", exc_info=True)
+        raise
+
+
+@migration(14, "添加 platform 字段到 online_users 表")
+def _v14(conn: sqlite3.Connection):
+    try:
+        # 检查表是否存在
+        cursor = conn.execute("SELECT name FROM sqlite_master WHERE type='table' AND name='online_users'")
+        if cursor.fetchone():
+            # 尝试添加 platform 字段
+            try:
+                conn.execute('ALTER TABLE online_users ADD COLUMN platform TEXT')
+                logger.info("已添加 platform 字段到 online_users 表")
+            except sqlite3.OperationalError:
+                # 字段可能已存在，忽略错误
+                logger.debug("platform 字段可能已存在")
+    except Exception as e:
+        logger.error(f"升级 online_users 表失败: {e}", exc_info=True)
+        raise
+
+
+@migration(15, "添加 device_name 字段到 online_users 表")
+def _v15(conn: sqlite3.Connection):
+    try:
+        # 检查表是否存在
+        cursor = conn.execute("SELECT name FROM sqlite_master WHERE type='table' AND name='online_users'")
+        if cursor.fetchone():
+            # 尝试添加 device_name 字段
+            try:
+                conn.execute('ALTER TABLE online_users ADD COLUMN device_name TEXT')
+                logger.info("已添加 device_name 字段到 online_users 表")
+            except sqlite3.OperationalError:
+                # 字段可能已存在，忽略错误
+                logger.debug("device_name 字段可能已存在")
+    except Exception as e:
+        logger.error(f"升级 online_users 表失败: {e}", exc_info=True)
+        raise
+
+
+@migration(16, "确保 device_name 字段存在")
+def _v16(conn: sqlite3.Connection):
+    try:
+        # 检查表是否存在
+        cursor = conn.execute("SELECT name FROM sqlite_master WHERE type='table' AND name='online_users'")
+        if cursor.fetchone():
+            # 检查字段是否存在
+            cursor = conn.execute("PRAGMA table_info(online_users)")
+            columns = [row[1] for row in cursor.fetchall()]
+            if 'device_name' not in columns:
+                try:
+                    conn.execute('ALTER TABLE online_users ADD COLUMN device_name TEXT')
+                    logger.info("已添加 device_name 字段到 online_users 表")
+                except sqlite3.OperationalError:
+                    logger.debug("device_name 字段可能已存在")
+    except Exception as e:
+        logger.error(f"升级 online_users 表失败: {e}", exc_info=True)
+        raise
+
+
+@migration(17, "添加操作日志表，并确保 user_settings 表完整性")
+def _v17(conn: sqlite3.Connection):
+    try:
+        # 确保 user_settings 表有所有必需的列（兼容性修复）
+        cursor = conn.execute("PRAGMA table_info(user_settings)")
+        columns = [row[1] for row in cursor.fetchall()]
+
+        if 'notify_device_online' not in columns:
+            logger.info("添加 notify_device_online 列到 user_settings 表")
+            conn.execute('ALTER TABLE user_settings ADD COLUMN notify_device_online INTEGER DEFAULT 1')
+
+        if 'notify_device_offline' not in columns:
+            logger.info("添加 notify_device_offline 列到 user_settings 表")
+            conn.execute('ALTER TABLE user_settings ADD COLUMN notify_device_offline INTEGER DEFAULT 1')
+
+        # 创建操作日志表
+        conn.execute('''
+            CREATE TABLE IF NOT EXISTS operation_logs (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                userId INTEGER NOT NULL,
+                username TEXT NOT NULL,
+                operation_type TEXT NOT NULL CHECK(operation_type IN ('CREATE', 'UPDATE', 'DELETE', 'COVER')),
+                entity_type TEXT NOT NULL,
+                entity_id INTEGER,
+                entity_name TEXT,
+                old_data TEXT,
+                new_data TEXT,
+                changes TEXT,
+                ip_address TEXT,
+                device_info TEXT,
+                operation_time TEXT DEFAULT (datetime('now')),
+                note TEXT,
+                FOREIGN KEY (userId) REFERENCES users (id) ON DELETE CASCADE
+            )
+        ''')
+        logger.info("已创建 operation_logs 表")
+
+        # 创建索引
+        conn.execute('CREATE INDEX IF NOT EXISTS idx_logs_userId_time ON operation_logs(userId, operation_time DESC)')
+        conn.execute('CREATE INDEX IF NOT EXISTS idx_logs_entity ON operation_logs(entity_type, entity_id)')
+        conn.execute('CREATE INDEX IF NOT EXISTS idx_logs_type ON operation_logs(operation_type)')
+        logger.info("已创建 operation_logs 表的索引")
+    except Exception as e:
+        logger.error(f"升级到版本 17 失败: {e}", exc_info=True)
+        raise
+
+
+@migration(18, "添加 Workspace 支持")
+def _v18(conn: sqlite3.Connection):
+    try:
+        # 创建 Workspace 相关表
+        conn.execute('''
+            CREATE TABLE IF NOT EXISTS workspaces (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                name TEXT NOT NULL,
+                description TEXT,
+                ownerId INTEGER NOT NULL,
+                storage_type TEXT NOT NULL CHECK(storage_type IN ('local', 'server')),
+                is_shared INTEGER DEFAULT 0,
+                created_at TEXT DEFAULT (datetime('now')),
+                updated_at TEXT DEFAULT (datetime('now')),
+                FOREIGN KEY (ownerId) REFERENCES users (id) ON DELETE CASCADE
+            )
+        ''')
+        logger.info("已创建 workspaces 表")
+
+        conn.execute('''
+            CREATE TABLE IF NOT EXISTS workspace_members (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                workspaceId INTEGER NOT NULL,
+                userId INTEGER NOT NULL,
+                role TEXT NOT NULL CHECK(role IN ('owner', 'admin', 'editor', 'viewer')),
+                permissions TEXT,
+                invited_by INTEGER,
+                joined_at TEXT DEFAULT (datetime('now')),
+                FOREIGN KEY (workspaceId) REFERENCES workspaces (id) ON DELETE CASCADE,
+                FOREIGN KEY (userId) REFERENCES users (id) ON DELETE CASCADE,
+                FOREIGN KEY (invited_by) REFERENCES users (id) ON DELETE SET NULL,
+                UNIQUE(workspaceId, userId)
+            )
+        ''')
+        logger.info("已创建 workspace_members 表")
+
+        conn.execute('''
+            CREATE TABLE IF NOT EXISTS workspace_invitations (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                workspaceId INTEGER NOT NULL,
+                email TEXT,
+                userId INTEGER,
+                role TEXT NOT NULL CHECK(role IN ('admin', 'editor', 'viewer')),
+                token TEXT NOT NULL UNIQUE,
+                invited_by INTEGER NOT NULL,
+                expires_at TEXT NOT NULL,
+                status TEXT DEFAULT 'pending' CHECK(status IN ('pending', 'accepted', 'rejected', 'expired')),
+                created_at TEXT DEFAULT (datetime('now')),
+                FOREIGN KEY (workspaceId) REFERENCES workspaces (id) ON DELETE CASCADE,
+                FOREIGN KEY (userId) REFERENCES users (id) ON DELETE SET NULL,
+                FOREIGN KEY (invited_by) REFERENCES users (id) ON DELETE CASCADE
+            )
+        ''')
+        logger.info("已创建 workspace_invitations 表")
+
+        # 为所有业务表添加 workspaceId 字段（允许 NULL，保持兼容）
+        business_tables = [
+            'products', 'suppliers', 'customers', 'employees',
+            'purchases', 'sales', 'returns', 'income', 'remittance',
+            'operation_logs'
+        ]
+
+        for table in business_tables:
+            try:
+                cursor = conn.execute(f"PRAGMA table_info({table})")
+                columns = [row[1] for row in cursor.fetchall()]
+
+                if 'workspaceId' not in columns:
+                    logger.info(f"为 {table} 表添加 workspaceId 字段")
+                    conn.execute(f'ALTER TABLE {table} ADD COLUMN workspaceId INTEGER')
+                    # 注意：SQLite 不支持在 ALTER TABLE 时添加外键约束
+                    # 外键约束会在下次创建表时自动添加
+            except Exception as e:
+                logger.warning(f"为 {table} 表添加 workspaceId 字段失败: {e}")
+
+        # 为现有用户创建默认 workspace
+        logger.info("为现有用户创建默认 workspace...")
+        cursor = conn.execute("SELECT id, username FROM users")
+        users = cursor.fetchall()
+
+        for user_row in users:
+            user_id = user_row[0]
+            username = user_row[1]
+
+            # 检查用户是否已有 workspace
+            cursor = conn.execute(
+                "SELECT id FROM workspaces WHERE ownerId = ? LIMIT 1",
+                (user_id,)
+            )
+            existing_workspace = cursor.fetchone()
+
+            if not existing_workspace:
+                # 创建默认 workspace
+                cursor = conn.execute('''
+                    INSERT INTO workspaces (name, ownerId, storage_type, is_shared, created_at, updated_at)
+                    VALUES (?, ?, 'server', 0, datetime('now'), datetime('now'))
+                ''', (f"{username}的账本", user_id))
+                workspace_id = cursor.lastrowid
+
+                # 将用户添加为 workspace 的 owner
+                conn.execute('''
+                    INSERT INTO workspace_members (workspaceId, userId, role, joined_at)
+                    VALUES (?, ?, 'owner', datetime('now'))
+                ''', (workspace_id, user_id))
+
+                # 将用户的所有现有数据迁移到默认 workspace
+                for table in business_tables:
+                    if table == 'operation_logs':
+                        continue  # operation_logs 不需要迁移
+                    try:
+                        conn.execute(
+                            f"UPDATE {table} SET workspaceId = ? WHERE userId = ? AND workspaceId IS NULL",
+                            (workspace_id, user_id)
+                        )
+                    except Exception as e:
+                        logger.warning(f"迁移 {table} 表数据失败: {e}")
+
+                logger.info(f"为用户 {username} (ID: {user_id}) 创建默认 workspace (ID: {workspace_id})")
+
+        # 创建索引
+        conn.execute('CREATE INDEX IF NOT EXISTS idx_products_workspaceId ON products(workspaceId)')
+        conn.execute('CREATE INDEX IF NOT EXISTS idx_suppliers_workspaceId ON suppliers(workspaceId)')
+        conn.execute('CREATE INDEX IF NOT EXISTS idx_customers_workspaceId ON customers(workspaceId)')
+        conn.execute('CREATE INDEX IF NOT EXISTS idx_employees_workspaceId ON employees(workspaceId)')
+        conn.execute('CREATE INDEX IF NOT EXISTS idx_purchases_workspaceId ON purchases(workspaceId)')
+        conn.execute('CREATE INDEX IF NOT EXISTS idx_sales_workspaceId ON sales(workspaceId)')
+        conn.execute('CREATE INDEX IF NOT EXISTS idx_returns_workspaceId ON returns(workspaceId)')
+        conn.execute('CREATE INDEX IF NOT EXISTS idx_income_workspaceId ON income(workspaceId)')
+        conn.execute('CREATE INDEX IF NOT EXISTS idx_remittance_workspaceId ON remittance(workspaceId)')
+        conn.execute('CREATE INDEX IF NOT EXISTS idx_logs_workspaceId ON operation_logs(workspaceId)')
+        conn.execute('CREATE INDEX IF NOT EXISTS idx_workspace_members_workspaceId ON workspace_members(workspaceId)')
+        conn.execute('CREATE INDEX IF NOT EXISTS idx_workspace_members_userId ON workspace_members(userId)')
+        logger.info("已创建 workspace 相关索引")
+
+    except Exception as e:
+        logger.error(f"升级到版本 18 失败: {e}", exc_info=True)
+        raise
+
+
+# 版本 19 重建后的表定义：唯一性约束从 UNIQUE(userId, name) 改为 UNIQUE(workspaceId, name)
+_V19_DEFINITIONS = {
+    'products': '''
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        userId INTEGER NOT NULL,
+        workspaceId INTEGER,
+        name TEXT NOT NULL,
+        description TEXT,
+        stock REAL DEFAULT 0,
+        unit TEXT NOT NULL CHECK(unit IN ('斤', '公斤', '袋')),
+        supplierId INTEGER,
+        version INTEGER DEFAULT 1,
+        created_at TEXT DEFAULT (datetime('now')),
+        updated_at TEXT DEFAULT (datetime('now')),
+        FOREIGN KEY (userId) REFERENCES users (id) ON DELETE CASCADE,
+        FOREIGN KEY (workspaceId) REFERENCES workspaces (id) ON DELETE CASCADE,
+        FOREIGN KEY (supplierId) REFERENCES suppliers (id) ON DELETE SET NULL,
+        UNIQUE(workspaceId, name)
+    ''',
+}
+for _table in ('suppliers', 'customers', 'employees'):
+    _V19_DEFINITIONS[_table] = '''
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        userId INTEGER NOT NULL,
+        workspaceId INTEGER,
+        name TEXT NOT NULL,
+        note TEXT,
+        created_at TEXT DEFAULT (datetime('now')),
+        updated_at TEXT DEFAULT (datetime('now')),
+        FOREIGN KEY (userId) REFERENCES users (id) ON DELETE CASCADE,
+        FOREIGN KEY (workspaceId) REFERENCES workspaces (id) ON DELETE CASCADE,
+        UNIQUE(workspaceId, name)
+    '''
+
+
+@migration(19, "修改唯一性约束为 workspace 级别", transactional=False)
+def _v19(conn: sqlite3.Connection):
+    for table_name, definition in _V19_DEFINITIONS.items():
+        logger.info(f"迁移 {table_name} 表的唯一性约束...")
+        
+        # workspaceId 为 NULL 的旧数据不再迁移（不符合新的业务逻辑：每个 workspace 数据完全独立）
+        if _get_meta(conn, f"rebuild:{table_name}") != "done":
+            null_count = conn.execute(
+                f"SELECT COUNT(*) FROM {table_name} WHERE workspaceId IS NULL"
+            ).fetchone()[0]
+            if null_count > 0:
+                logger.warning(f"{table_name} 表中有 {null_count} 条记录的 workspaceId 为 NULL，这些记录将被删除（不符合新的业务逻辑）")
+        
+        rebuild_table(conn, table_name, definition, where="workspaceId IS NOT NULL")
+        logger.info(f"{table_name} 表迁移完成")
+
+
+_OPERATION_LOGS_DEFINITION = '''
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    userId INTEGER NOT NULL,
+    workspaceId INTEGER,
+    username TEXT NOT NULL,
+    operation_type TEXT NOT NULL CHECK(operation_type IN ('CREATE', 'UPDATE', 'DELETE', 'COVER')),
+    entity_type TEXT NOT NULL,
+    entity_id INTEGER,
+    entity_name TEXT,
+    old_data TEXT,
+    new_data TEXT,
+    changes TEXT,
+    ip_address TEXT,
+    device_info TEXT,
+    operation_time TEXT DEFAULT (datetime('now')),
+    note TEXT,
+    FOREIGN KEY (userId) REFERENCES users (id) ON DELETE CASCADE,
+    FOREIGN KEY (workspaceId) REFERENCES workspaces (id) ON DELETE SET NULL
+'''
+
+
+@migration(20, "更新 operation_logs 表的 CHECK 约束，添加 COVER 操作类型", transactional=False)
+def _v20(conn: sqlite3.Connection):
+    if _table_exists(conn, 'operation_logs'):
+        # 表存在，需要重建以更新 CHECK 约束（只复制符合新约束的数据）
+        logger.info("重建 operation_logs 表以更新 CHECK 约束...")
+        rebuild_table(
+            conn, 'operation_logs', _OPERATION_LOGS_DEFINITION,
+            where="operation_type IN ('CREATE', 'UPDATE', 'DELETE', 'COVER')"
+        )
+    else:
+        # 表不存在，直接创建（带新的 CHECK 约束）
+        logger.info("创建 operation_logs 表（带 COVER 操作类型）...")
+        conn.execute(f"CREATE TABLE IF NOT EXISTS operation_logs ({_OPERATION_LOGS_DEFINITION})")
+    
+    with _transaction(conn):
+        conn.execute('CREATE INDEX IF NOT EXISTS idx_logs_userId_time ON operation_logs(userId, operation_time DESC)')
+        conn.execute('CREATE INDEX IF NOT EXISTS idx_logs_entity ON operation_logs(entity_type, entity_id)')
+        conn.execute('CREATE INDEX IF NOT EXISTS idx_logs_type ON operation_logs(operation_type)')
+        conn.execute('CREATE INDEX IF NOT EXISTS idx_logs_workspaceId ON operation_logs(workspaceId)')
+    logger.info("已更新 operation_logs 表的 CHECK 约束，添加了 COVER 操作类型")
+
+
+# 由触发器维护按 workspace 统计行数的表（列表接口没有筛选条件时直接读取，不再 COUNT(*)）
+COUNTED_TABLES = (
+    "products", "suppliers", "customers", "employees",
+    "purchases", "sales", "returns", "income", "remittance",
+    "operation_logs",
+)
+
+
+def rebuild_row_counts(conn: sqlite3.Connection):
+    """按当前数据重新计算 workspace_row_counts（在调用方的事务中执行）"""
+    conn.execute("DELETE FROM workspace_row_counts")
+    for table in COUNTED_TABLES:
+        conn.execute(
+            f"""
+            INSERT INTO workspace_row_counts (workspaceId, table_name, row_count)
+            SELECT t.workspaceId, ?, COUNT(*) FROM {table} t
+            JOIN workspaces w ON w.id = t.workspaceId
+            GROUP BY t.workspaceId
+            """,
+            (table,)
+        )
+
+
+@migration(21, "添加按 workspace 维护的行数统计（触发器）")
+def _v21(conn: sqlite3.Connection):
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS workspace_row_counts (
+            workspaceId INTEGER NOT NULL,
+            table_name TEXT NOT NULL,
+            row_count INTEGER NOT NULL DEFAULT 0,
+            PRIMARY KEY (workspaceId, table_name),
+            FOREIGN KEY (workspaceId) REFERENCES workspaces (id) ON DELETE CASCADE
+        ) WITHOUT ROWID
+    ''')
+    for table in COUNTED_TABLES:
+        increment = f'''
+            INSERT INTO workspace_row_counts (workspaceId, table_name, row_count)
+            SELECT NEW.workspaceId, '{table}', 1 WHERE NEW.workspaceId IS NOT NULL
+            ON CONFLICT (workspaceId, table_name) DO UPDATE SET row_count = row_count + 1;
+        '''
+        # 删除时只做 UPDATE：删除 workspace 级联删除数据时，统计行可能已先被级联删除
+        decrement = f'''
+            UPDATE workspace_row_counts SET row_count = row_count - 1
+            WHERE workspaceId = OLD.workspaceId AND table_name = '{table}';
+        '''
+        conn.execute(f'''
+            CREATE TRIGGER IF NOT EXISTS trg_{table}_count_insert AFTER INSERT ON {table}
+            WHEN NEW.workspaceId IS NOT NULL
+            BEGIN {increment} END
+        ''')
+        conn.execute(f'''
+            CREATE TRIGGER IF NOT EXISTS trg_{table}_count_delete AFTER DELETE ON {table}
+            WHEN OLD.workspaceId IS NOT NULL
+            BEGIN {decrement} END
+        ''')
+        conn.execute(f'''
+            CREATE TRIGGER IF NOT EXISTS trg_{table}_count_move AFTER UPDATE OF workspaceId ON {table}
+            WHEN OLD.workspaceId IS NOT NEW.workspaceId
+            BEGIN {decrement} {increment} END
+        ''')
+    rebuild_row_counts(conn)
+
+
+# 交易表 -> 日期列（列表按天筛选）
+DATED_TABLES = {
+    "purchases": "purchaseDate",
+    "sales": "saleDate",
+    "returns": "returnDate",
+    "income": "incomeDate",
+    "remittance": "remittanceDate",
+}
+
+
+@migration(22, "为交易表添加 (workspaceId, 日期, id) 表达式索引")
+def _v22(conn: sqlite3.Connection):
+    # 日期列是 ISO8601 字符串（可能带时区），按天比较需要 date(列)；
+    # 函数包裹列后普通索引无法使用，建立同一表达式的索引使日期范围筛选成为索引范围扫描
+    for table, column in DATED_TABLES.items():
+        conn.execute(
+            f'CREATE INDEX IF NOT EXISTS idx_{table}_workspace_day '
+            f'ON {table}(workspaceId, {day_expression(column)}, id)'
+        )
+
+
+# 列表排序索引：表 -> 排序列（与各路由的 *_KEYSET 一致，workspaceId 等值过滤后按索引顺序读取，不再临时排序）
+LIST_INDEXES = {
+    "purchases": "purchaseDate, id",
+    "sales": "saleDate, id",
+    "returns": "returnDate, id",
+    "income": "incomeDate, id",
+    "remittance": "remittanceDate, id",
+    "products": "updated_at, id",
+    "suppliers": "updated_at DESC, name, id",
+    "customers": "updated_at DESC, name, id",
+    "employees": "updated_at DESC, name, id",
+}
+
+# 外键索引：(表, 外键列, 之后的排序列)
+# 删除客户 / 供应商 / 员工时 ON DELETE SET NULL 按外键列查找引用行；
+# 列表按客户 / 供应商筛选时同一索引也提供排序（外键 ID 全局唯一，不需要再加 workspaceId）
+FOREIGN_KEY_INDEXES = [
+    ("purchases", "supplierId", "purchaseDate, id"),
+    ("sales", "customerId", "saleDate, id"),
+    ("returns", "customerId", "returnDate, id"),
+    ("income", "customerId", "incomeDate, id"),
+    ("income", "employeeId", None),
+    ("remittance", "supplierId", "remittanceDate, id"),
+    ("remittance", "employeeId", None),
+    ("products", "supplierId", "updated_at, id"),
+    ("workspaces", "ownerId", None),
+    ("workspace_invitations", "workspaceId", None),
+]
+
+
+@migration(23, "按列表排序、筛选和外键级联的查询形态重建索引")
+def _v23(conn: sqlite3.Connection):
+    for table, order_columns in LIST_INDEXES.items():
+        conn.execute(f'CREATE INDEX IF NOT EXISTS idx_{table}_workspace_list ON {table}(workspaceId, {order_columns})')
+        # 单列 workspaceId 索引是新索引的前缀，保留只会增加写入开销
+        conn.execute(f'DROP INDEX IF EXISTS idx_{table}_workspaceId')
+
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_logs_workspace_time ON operation_logs(workspaceId, operation_time, id)')
+    conn.execute('DROP INDEX IF EXISTS idx_logs_workspaceId')
+
+    for table, column, order_columns in FOREIGN_KEY_INDEXES:
+        columns = f"{column}, {order_columns}" if order_columns else column
+        conn.execute(f'CREATE INDEX IF NOT EXISTS idx_{table}_{column} ON {table}({columns})')
+
+    # 创建进货 / 销售 / 退货时按名称查找产品；新数据库由 UNIQUE(workspaceId, name) 提供索引，
+    # 较早升级上来的数据库可能没有该约束
+    if not _has_index_on(conn, "products", ["workspaceId", "name"]):
+        conn.execute('CREATE INDEX IF NOT EXISTS idx_products_workspace_name ON products(workspaceId, name)')
+
+
+# ==================== 表结构检查 ====================
+
+def _check_schema(conn: sqlite3.Connection):
+    """
+    补充缺失的列和索引（兼容性修复）
+    只在版本或表结构指纹变化时执行，表结构未变化的启动不会再逐表检查
+    """
+    # products 表的乐观锁版本字段和时间字段
+    try:
+        conn.execute('ALTER TABLE products ADD COLUMN version INTEGER DEFAULT 1')
+    except sqlite3.OperationalError:
+        pass
+
+    try:
+        conn.execute('ALTER TABLE products ADD COLUMN created_at TEXT DEFAULT (datetime("now"))')
+    except sqlite3.OperationalError:
+        pass
+
+    try:
+        conn.execute('ALTER TABLE products ADD COLUMN updated_at TEXT DEFAULT (datetime("now"))')
+    except sqlite3.OperationalError:
+        pass
+
+    # 创建索引
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_products_userId ON products(userId)')
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_purchases_userId ON purchases(userId)')
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_sales_userId ON sales(userId)')
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_returns_userId ON returns(userId)')
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_income_userId ON income(userId)')
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_remittance_userId ON remittance(userId)')
+
+    # 确保 user_settings 表有所有必需的列（兼容性修复，防止遗漏）
+    try:
+        cursor = conn.execute("PRAGMA table_info(user_settings)")
+        columns = [row[1] for row in cursor.fetchall()]
+
+        if 'notify_device_online' not in columns:
+            logger.info("补充添加 notify_device_online 列到 user_settings 表")
+            conn.execute('ALTER TABLE user_settings ADD COLUMN notify_device_online INTEGER DEFAULT 1')
+
+        if 'notify_device_offline' not in columns:
+            logger.info("补充添加 notify_device_offline 列到 user_settings 表")
+            conn.execute('ALTER TABLE user_settings ADD COLUMN notify_device_offline INTEGER DEFAULT 1')
+    except Exception as e:
+        logger.debug(f"检查 user_settings 表列时出错: {e}")
+
+    # 确保操作日志表的索引存在（如果表已存在）
+    try:
+        cursor = conn.execute("SELECT name FROM sqlite_master WHERE type='table' AND name='operation_logs'")
+        if cursor.fetchone():
+            conn.execute('CREATE INDEX IF NOT EXISTS idx_logs_userId_time ON operation_logs(userId, operation_time DESC)')
+            conn.execute('CREATE INDEX IF NOT EXISTS idx_logs_entity ON operation_logs(entity_type, entity_id)')
+            conn.execute('CREATE INDEX IF NOT EXISTS idx_logs_type ON operation_logs(operation_type)')
+    except Exception as e:
+        logger.debug(f"创建操作日志索引时出错（可能表不存在）: {e}")
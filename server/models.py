@@ -52,10 +52,11 @@ class PaginationParams(BaseModel):
 class PaginatedResponse(BaseModel):
     """分页响应"""
     items: List[Any]
-    total: int
+    total: Optional[int] = None  # 总数（使用游标且未要求 include_total 时为 None）
     page: int
     page_size: int
-    total_pages: int
+    total_pages: Optional[int] = None
+    next_cursor: Optional[str] = None  # 下一页的游标（没有更多数据时为 None）
 
 
 # ==================== 用户相关模型 ====================
@@ -808,8 +809,9 @@ class AuditLogFilter(BaseModel):
 class AuditLogListResponse(BaseModel):
     """操作日志列表响应"""
     logs: List[AuditLogResponse]
-    total: int
+    total: Optional[int] = None  # 总数（使用游标且未要求 include_total 时为 None）
     page: int
     page_size: int
-    total_pages: int
+    total_pages: Optional[int] = None
+    next_cursor: Optional[str] = None  # 下一页的游标（没有更多数据时为 None）
 
@@ -0,0 +1,253 @@
+"""
+键集（游标）分页
+按排序键（如 saleDate DESC, id DESC）记住上一页最后一行，下一页用 WHERE (saleDate, id) < (?, ?) 直接定位，
+不再像 LIMIT ? OFFSET ? 那样扫描并丢弃前面所有页的行，翻到第 500 页和第 1 页的开销相同。
+游标是排序键值的 base64url(JSON)，对客户端不透明
+
+总数：没有筛选条件时读取触发器维护的 workspace_row_counts；有筛选条件（或按 userId 查询）时，
+按页码查询总是用 COUNT(*) 计算（兼容按总页数分页的客户端），游标翻页只在调用方要求时计算。
+不使用 COUNT(*) OVER ()：窗口函数要先取出全部匹配行再排序，分页查询无法再按索引顺序提前结束
+
+日期筛选：交易表有 (workspaceId, date(日期列), id) 表达式索引，按天的范围条件必须由 date_range_conditions()
+生成，保证表达式与索引定义一致（不一致时 SQLite 不会使用该索引，退化为扫描整个 workspace）
+"""
+
+import base64
+import binascii
+import json
+from dataclasses import dataclass
+from typing import Optional, List, Tuple, Sequence, Any
+
+from fastapi import HTTPException, status
+
+
+@dataclass(frozen=True)
+class SortColumn:
+    """
+    排序列
+
+    Attributes:
+        name: 列名（必须出现在 SELECT 列表中，且不带别名）
+        descending: 是否降序
+        nullable: 是否可能为 NULL（只允许第一列为 NULL；SQLite 中 NULL 最小：降序时排在最后，升序时排在最前）
+    """
+    name: str
+    descending: bool = True
+    nullable: bool = False
+
+
+class Keyset:
+    """
+    分页排序键，最后一列必须唯一（通常为 id）
+
+    Usage:
+        SALES_KEYSET = Keyset(SortColumn("saleDate", nullable=True), SortColumn("id"))
+        values = SALES_KEYSET.decode(cursor)
+        ...
+        rows, next_cursor, total = await fetch_page(conn, "sales", columns, where_clause, params, SALES_KEYSET, values, page, page_size)
+    """
+
+    def __init__(self, *columns: SortColumn):
+        if any(column.nullable for column in columns[1:]):
+            raise ValueError("只有第一个排序列可以为 NULL")
+        self.columns = columns
+
+    @property
+    def order_by(self) -> str:
+        """ORDER BY 子句（不含关键字）"""
+        return ", ".join(f"{c.name} {'DESC' if c.descending else 'ASC'}" for c in self.columns)
+
+    def encode(self, row) -> str:
+        """用一行（sqlite3.Row）的排序键值生成游标"""
+        values = [row[column.name] for column in self.columns]
+        data = json.dumps(values, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+        return base64.urlsafe_b64encode(data).decode("ascii").rstrip("=")
+
+    def decode(self, cursor: Optional[str]) -> Optional[list]:
+        """
+        解析游标
+
+        Returns:
+            排序键值列表；cursor 为空时返回 None
+
+        Raises:
+            HTTPException: 游标格式无效（400）
+        """
+        if not cursor:
+            return None
+        try:
+            data = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4))
+            values = json.loads(data.decode("utf-8"))
+        except (binascii.Error, ValueError, UnicodeDecodeError):
+            values = None
+        if (
+            not isinstance(values, list)
+            or len(values) != len(self.columns)
+            or not all(value is None or isinstance(value, (str, int, float)) for value in values)
+            or any(value is None for value, c in zip(values, self.columns) if not c.nullable)
+        ):
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail="无效的分页游标"
+            )
+        return values
+
+    def segments(self, values: Optional[list]) -> List[Tuple[str, list]]:
+        """
+        游标之后的行对应的查询条件，按排序顺序分段（每段都能使用 (..., 排序列) 索引的范围扫描）
+
+        可为 NULL 的第一列分为非 NULL 和 NULL 两段，避免使用 "... OR col IS NULL" 使索引只能按等值前缀查找
+
+        Returns:
+            [(条件 SQL（空字符串表示不限制）, 参数), ...]
+        """
+        if values is None:
+            return [("", [])]
+        first = self.columns[0]
+        if not first.nullable:
+            return [self._after(self.columns, values)]
+
+        rest_sql, rest_params = self._after(self.columns[1:], values[1:])
+        is_null = f"{first.name} IS NULL"
+        if values[0] is None:
+            # 游标位于 NULL 段内：降序时 NULL 段是最后一段，升序时之后还有全部非 NULL 的行
+            segments = [(f"{is_null} AND {rest_sql}", rest_params)]
+            if not first.descending:
+                segments.append((f"{first.name} IS NOT NULL", []))
+            return segments
+        segments = [self._after(self.columns, values)]
+        if first.descending:
+            segments.append((is_null, []))
+        return segments
+
+    @staticmethod
+    def _after(columns: Sequence[SortColumn], values: Sequence[Any]) -> Tuple[str, list]:
+        """按排序顺序位于 values 之后的条件（values 均不为 NULL）"""
+        if len({column.descending for column in columns}) == 1:
+            # 同向排序：行值比较，SQLite 可直接用于索引范围扫描
+            op = "<" if columns[0].descending else ">"
+            if len(columns) == 1:
+                return f"{columns[0].name} {op} ?", [values[0]]
+            names = ", ".join(column.name for column in columns)
+            marks = ", ".join("?" for _ in columns)
+            return f"({names}) {op} ({marks})", list(values)
+        # 混合方向（如 updated_at DESC, name ASC, id ASC）：展开为 a <= ? AND (a < ? OR (a = ? AND (...)))，
+        # 冗余的 a <= ? 让 SQLite 可以在 (..., a, ...) 索引上定位起点，而不是从头扫描并逐行判断 OR
+        first = columns[0]
+        op = "<" if first.descending else ">"
+        rest_sql, rest_params = Keyset._after(columns[1:], values[1:])
+        return (
+            f"({first.name} {op}= ? AND ({first.name} {op} ? OR ({first.name} = ? AND {rest_sql})))",
+            [values[0], values[0], values[0], *rest_params]
+        )
+
+
+def day_expression(column: str) -> str:
+    """日期列按天比较使用的表达式（与 migrations 中表达式索引的定义共用）"""
+    return f"date({column})"
+
+
+def date_range_conditions(
+    column: str,
+    start_date: Optional[str],
+    end_date: Optional[str]
+) -> Tuple[List[str], list]:
+    """
+    按天的日期范围条件（包含起止日期，可走 (workspaceId, date(列), id) 索引的范围扫描）
+
+    Args:
+        column: 日期列名
+        start_date: 开始日期（ISO8601，为空时不限制）
+        end_date: 结束日期（ISO8601，为空时不限制）
+
+    Returns:
+        (条件列表, 参数列表)
+    """
+    day = day_expression(column)
+    conditions: List[str] = []
+    params: list = []
+    if start_date and end_date:
+        conditions.append(f"{day} BETWEEN date(?) AND date(?)")
+        params.extend([start_date, end_date])
+    elif start_date:
+        conditions.append(f"{day} >= date(?)")
+        params.append(start_date)
+    elif end_date:
+        conditions.append(f"{day} <= date(?)")
+        params.append(end_date)
+    return conditions, params
+
+
+async def maintained_count(conn, table: str, workspace_id: int) -> int:
+    """workspace 中某个业务表的行数（由触发器维护，见 migrations.COUNTED_TABLES）"""
+    row = await conn.fetchone(
+        "SELECT row_count FROM workspace_row_counts WHERE workspaceId = ? AND table_name = ?",
+        (workspace_id, table)
+    )
+    return row[0] if row else 0
+
+
+def page_count(total: Optional[int], page_size: int) -> Optional[int]:
+    """总页数（总数未知时为 None）"""
+    return None if total is None else (total + page_size - 1) // page_size
+
+
+async def fetch_page(
+    conn,
+    table: str,
+    columns: str,
+    where_clause: str,
+    params: Sequence[Any],
+    keyset: Keyset,
+    cursor_values: Optional[list],
+    page: int,
+    page_size: int,
+    include_total: bool = False,
+    workspace_id: Optional[int] = None
+) -> Tuple[list, Optional[str], Optional[int]]:
+    """
+    查询一页数据：提供游标时从游标之后开始（忽略 page），否则按 page 使用 OFFSET（兼容旧客户端）
+
+    Args:
+        conn: AsyncConnection
+        table: 表名
+        columns: SELECT 的列（必须包含排序列）
+        where_clause: 过滤条件（不含 WHERE）
+        params: 过滤条件的参数
+        keyset: 排序键
+        cursor_values: keyset.decode(cursor) 的结果
+        page: 页码（没有游标时使用）
+        page_size: 每页数量
+        include_total: 使用游标时是否也计算筛选条件下的总数（按页码查询时总是计算）
+        workspace_id: 过滤条件只有 workspaceId = ? 时传入，总数直接读取维护的行数
+
+    Returns:
+        (行列表, 下一页的游标（没有更多数据时为 None）, 总数（未计算时为 None）)
+    """
+    total = await maintained_count(conn, table, workspace_id) if workspace_id is not None else None
+    offset = 0 if cursor_values is not None else (page - 1) * page_size
+    select_sql = f"SELECT {columns} FROM {table}"
+
+    rows: list = []
+    for condition, condition_params in keyset.segments(cursor_values):
+        where = f"{where_clause} AND {condition}" if condition else where_clause
+        # 多取一行用于判断是否还有下一页
+        cursor = await conn.execute(
+            f"{select_sql} WHERE {where} ORDER BY {keyset.order_by} LIMIT ? OFFSET ?",
+            (*params, *condition_params, page_size + 1 - len(rows), offset)
+        )
+        rows.extend(await cursor.fetchall())
+        if len(rows) > page_size:
+            break
+
+    if total is None and (include_total or cursor_values is None):
+        if cursor_values is None and len(rows) <= page_size and (rows or offset == 0):
+            # 按页码查询的最后一页：总数就是前面各页加上本页的行数
+            total = offset + len(rows)
+        else:
+            total = (await conn.fetchone(f"SELECT COUNT(*) FROM {table} WHERE {where_clause}", tuple(params)))[0]
+
+    if len(rows) > page_size:
+        rows = rows[:page_size]
+        return rows, keyset.encode(rows[-1]), total
+    return rows, None, total
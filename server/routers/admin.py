@@ -0,0 +1,99 @@
+"""
+运维管理路由
+慢查询日志查询（仅管理员，管理员由 ADMIN_USERNAMES 环境变量配置）
+"""
+
+import logging
+from typing import Optional
+from fastapi import APIRouter, HTTPException, status, Depends, Query
+
+from server.middleware import require_admin
+from server.models import BaseResponse
+from server.services.slow_query_log import SlowQueryLog, get_slow_query_log
+from server.timing import TimedRoute
+
+# 配置日志
+logger = logging.getLogger(__name__)
+
+# 创建路由
+router = APIRouter(prefix="/api/admin", tags=["运维管理"], route_class=TimedRoute)
+
+
+def _get_slow_query_log() -> SlowQueryLog:
+    slow_query_log = get_slow_query_log()
+    if slow_query_log is None:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="慢查询日志未启用（设置 SLOW_QUERY_MS 环境变量后重启服务）"
+        )
+    return slow_query_log
+
+
+@router.get("/slow-queries", response_model=BaseResponse)
+async def get_slow_queries(
+    limit: int = Query(100, ge=1, le=500, description="最多返回的条数"),
+    min_ms: float = Query(0, ge=0, description="只返回耗时不低于该值的记录（毫秒）"),
+    fingerprint: Optional[str] = Query(None, description="查询形状（规范化 SQL 的哈希）"),
+    search: Optional[str] = Query(None, description="SQL 关键字（如表名）"),
+    current_user: dict = Depends(require_admin)
+):
+    """
+    获取最近的慢查询（新的在前）
+
+    每条记录包含规范化 SQL、脱敏后的参数、耗时、行数和 EXPLAIN QUERY PLAN 结果
+
+    Args:
+        limit: 最多返回的条数
+        min_ms: 最小耗时（毫秒）
+        fingerprint: 查询形状
+        search: SQL 关键字
+        current_user: 当前用户信息（管理员）
+
+    Returns:
+        慢查询列表和统计信息
+    """
+    slow_query_log = _get_slow_query_log()
+    return BaseResponse(
+        success=True,
+        message="查询成功",
+        data={
+            "stats": slow_query_log.get_stats(),
+            "queries": slow_query_log.recent(limit, min_ms, fingerprint, search)
+        }
+    )
+
+
+@router.get("/slow-queries/summary", response_model=BaseResponse)
+async def get_slow_query_summary(
+    limit: int = Query(50, ge=1, le=500, description="最多返回的查询形状数"),
+    current_user: dict = Depends(require_admin)
+):
+    """
+    按查询形状汇总慢查询（按总耗时降序）
+
+    Args:
+        limit: 最多返回的查询形状数
+        current_user: 当前用户信息（管理员）
+
+    Returns:
+        每种查询形状的次数、总耗时、平均 / 最大耗时和最近一次的执行计划
+    """
+    slow_query_log = _get_slow_query_log()
+    return BaseResponse(
+        success=True,
+        message="查询成功",
+        data=slow_query_log.summary(limit)
+    )
+
+
+@router.delete("/slow-queries", response_model=BaseResponse)
+async def clear_slow_queries(current_user: dict = Depends(require_admin)):
+    """
+    清空内存中的慢查询记录（日志文件不受影响）
+
+    Args:
+        current_user: 当前用户信息（管理员）
+    """
+    _get_slow_query_log().clear()
+    logger.info(f"慢查询记录已由 {current_user['username']} 清空")
+    return BaseResponse(success=True, message="已清空")
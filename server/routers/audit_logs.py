@@ -22,18 +22,21 @@ from server.models import (
     OperationType
 )
 from server.services.audit_log_service import AuditLogService
+from server.timing import TimedRoute
 
 # 配置日志
 logger = logging.getLogger(__name__)
 
 # 创建路由
-router = APIRouter(prefix="/api/audit-logs", tags=["操作日志"])
+router = APIRouter(prefix="/api/audit-logs", tags=["操作日志"], route_class=TimedRoute)
 
 
 @router.get("", response_model=BaseResponse)
 async def get_audit_logs(
     page: int = Query(1, ge=1, description="页码，从1开始"),
     page_size: int = Query(20, ge=1, le=100, description="每页数量（最大100）"),
+    cursor: Optional[str] = Query(None, description="分页游标（上一页返回的 next_cursor，提供时忽略 page）"),
+    include_total: bool = Query(False, description="使用游标时是否也返回总数（按页码查询时总是返回，无限滚动不需要）"),
     operation_type: Optional[str] = Query(None, description="操作类型筛选（CREATE/UPDATE/DELETE/COVER）"),
     entity_type: Optional[str] = Query(None, description="实体类型筛选"),
     start_time: Optional[str] = Query(None, description="开始时间（ISO8601格式，如：2025-01-01T00:00:00）"),
@@ -48,6 +51,8 @@ async def get_audit_logs(
     Args:
         page: 页码
         page_size: 每页数量
+        cursor: 分页游标
+        include_total: 使用游标时是否也返回总数
         operation_type: 操作类型筛选
         entity_type: 实体类型筛选
         start_time: 开始时间
@@ -87,11 +92,13 @@ async def get_audit_logs(
             )
         
         # 查询日志
-        logs, total = AuditLogService.get_logs(
+        logs, total, next_cursor = await AuditLogService.get_logs(
             user_id=user_id,
             workspace_id=workspace_id,
             page=page,
             page_size=page_size,
+            cursor=cursor,
+            include_total=include_total,
             operation_type=operation_type,
             entity_type=entity_type,
             start_time=start_time,
@@ -103,7 +110,7 @@ async def get_audit_logs(
         log_responses = [AuditLogResponse(**log) for log in logs]
         
         # 计算总页数
-        total_pages = ceil(total / page_size) if page_size > 0 else 0
+        total_pages = ceil(total / page_size) if total is not None else None
         
         return BaseResponse(
             success=True,
@@ -113,7 +120,8 @@ async def get_audit_logs(
                 total=total,
                 page=page,
                 page_size=page_size,
-                total_pages=total_pages
+                total_pages=total_pages,
+                next_cursor=next_cursor
             ).model_dump()
         )
     except HTTPException:
@@ -163,7 +171,7 @@ async def get_audit_log_detail(
                     detail="无读取权限"
                 )
         
-        log_detail = AuditLogService.get_log_detail(log_id, user_id, workspace_id)
+        log_detail = await AuditLogService.get_log_detail(log_id, user_id, workspace_id)
         
         if not log_detail:
             raise HTTPException(
@@ -226,7 +234,7 @@ async def cleanup_old_logs(
         # 注意：这里可以根据需要添加管理员权限检查
         # 目前允许所有用户清理自己的日志（或workspace的日志）
         
-        deleted_count = AuditLogService.cleanup_old_logs(days=days, user_id=user_id, workspace_id=workspace_id)
+        deleted_count = await AuditLogService.cleanup_old_logs(days=days, user_id=user_id, workspace_id=workspace_id)
         
         return BaseResponse(
             success=True,
@@ -11,11 +11,13 @@ from fastapi.security import HTTPAuthorizationCredentials
 
 from server.database import get_pool
 from server.middleware import (
-    get_password_hash,
-    verify_password,
+    get_password_hash_async,
+    verify_password_async,
     create_access_token,
     get_current_user,
-    security
+    security,
+    invalidate_workspace_access,
+    invalidate_principal
 )
 from server.models import (
     UserCreate,
@@ -28,12 +30,13 @@ from server.models import (
     BaseResponse,
     ErrorResponse
 )
+from server.timing import TimedRoute
 
 # 配置日志
 logger = logging.getLogger(__name__)
 
 # 创建路由
-router = APIRouter(prefix="/api/auth", tags=["认证"])
+router = APIRouter(prefix="/api/auth", tags=["认证"], route_class=TimedRoute)
 
 
 @router.post("/register", response_model=BaseResponse, status_code=status.HTTP_201_CREATED)
@@ -50,25 +53,26 @@ async def register(user_data: UserCreate):
     pool = get_pool()
     
     try:
-        with pool.get_connection() as conn:
+        async with pool.acquire(readonly=True) as conn:
             # 检查用户名是否已存在
-            cursor = conn.execute(
+            cursor = await conn.execute(
                 "SELECT id FROM users WHERE username = ?",
                 (user_data.username,)
             )
-            existing_user = cursor.fetchone()
-            
-            if existing_user:
-                raise HTTPException(
-                    status_code=status.HTTP_400_BAD_REQUEST,
-                    detail="用户名已存在，请选择其他用户名"
-                )
-            
-            # 加密密码
-            hashed_password = get_password_hash(user_data.password)
-            
+            existing_user = await cursor.fetchone()
+        
+        if existing_user:
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail="用户名已存在，请选择其他用户名"
+            )
+        
+        # 加密密码（在密码哈希线程池中执行，期间不占用数据库连接）
+        hashed_password = await get_password_hash_async(user_data.password)
+        
+        async with pool.acquire() as conn:
             # 创建用户
-            cursor = conn.execute(
+            cursor = await conn.execute(
                 """
                 INSERT INTO users (username, password, created_at)
                 VALUES (?, ?, datetime('now'))
@@ -78,7 +82,7 @@ async def register(user_data: UserCreate):
             user_id = cursor.lastrowid
             
             # 创建用户设置记录
-            conn.execute(
+            await conn.execute(
                 """
                 INSERT INTO user_settings (userId, created_at, updated_at)
                 VALUES (?, datetime('now'), datetime('now'))
@@ -86,7 +90,7 @@ async def register(user_data: UserCreate):
                 (user_id,)
             )
             
-            conn.commit()
+            await conn.commit()
             
             # 生成 Token
             token_data = {
@@ -96,7 +100,7 @@ async def register(user_data: UserCreate):
             token = create_access_token(data=token_data)
             
             # 不在这里创建在线用户记录，让客户端在心跳时创建（避免出现默认设备）
-            conn.commit()
+            await conn.commit()
             
             # 构建响应
             user_response = UserResponse(
@@ -143,43 +147,44 @@ async def login(login_data: UserLogin):
     pool = get_pool()
     
     try:
-        with pool.get_connection() as conn:
+        async with pool.acquire(readonly=True) as conn:
             # 查询用户
-            cursor = conn.execute(
+            cursor = await conn.execute(
                 "SELECT id, username, password FROM users WHERE username = ?",
                 (login_data.username,)
             )
-            user = cursor.fetchone()
-            
-            if user is None:
-                raise HTTPException(
-                    status_code=status.HTTP_401_UNAUTHORIZED,
-                    detail="用户名或密码错误"
-                )
-            
-            user_id, username, hashed_password = user
-            
-            # 验证密码
-            if not verify_password(login_data.password, hashed_password):
-                raise HTTPException(
-                    status_code=status.HTTP_401_UNAUTHORIZED,
-                    detail="用户名或密码错误"
-                )
-            
+            user = await cursor.fetchone()
+        
+        if user is None:
+            raise HTTPException(
+                status_code=status.HTTP_401_UNAUTHORIZED,
+                detail="用户名或密码错误"
+            )
+        
+        user_id, username, hashed_password = user
+        
+        # 验证密码（在密码哈希线程池中执行，期间不占用数据库连接）
+        if not await verify_password_async(login_data.password, hashed_password):
+            raise HTTPException(
+                status_code=status.HTTP_401_UNAUTHORIZED,
+                detail="用户名或密码错误"
+            )
+        
+        async with pool.acquire() as conn:
             # 更新最后登录时间
-            conn.execute(
+            await conn.execute(
                 "UPDATE users SET last_login_at = datetime('now') WHERE id = ?",
                 (user_id,)
             )
             
             # 不在这里创建在线用户记录，让客户端在心跳时创建（避免出现默认设备）
             # 同时清理可能存在的旧默认设备记录
-            conn.execute(
+            await conn.execute(
                 "DELETE FROM online_users WHERE userId = ? AND deviceId = 'default'",
                 (user_id,)
             )
             
-            conn.commit()
+            await conn.commit()
             
             # 生成 Token
             token_data = {
@@ -222,7 +227,8 @@ async def login(login_data: UserLogin):
 @router.post("/logout", response_model=BaseResponse)
 async def logout(
     logout_data: Optional[LogoutRequest] = None,
-    current_user: dict = Depends(get_current_user)
+    current_user: dict = Depends(get_current_user),
+    credentials: HTTPAuthorizationCredentials = Depends(security)
 ):
     """
     用户登出（只删除当前设备的记录）
@@ -230,6 +236,7 @@ async def logout(
     Args:
         logout_data: 可选的登出数据（包含 device_id）
         current_user: 当前用户信息（从 Token 获取）
+        credentials: HTTP Bearer 认证凭据
     
     Returns:
         登出成功响应
@@ -242,10 +249,10 @@ async def logout(
     device_id = logout_data.device_id if logout_data and logout_data.device_id else None
     
     try:
-        with pool.get_connection() as conn:
+        async with pool.acquire() as conn:
             if device_id:
                 # 只删除当前设备的记录
-                conn.execute(
+                await conn.execute(
                     "DELETE FROM online_users WHERE userId = ? AND deviceId = ?",
                     (user_id, device_id)
                 )
@@ -255,7 +262,8 @@ async def logout(
                 # 这样可以避免误删其他设备的记录
                 logger.info(f"用户登出: {username} (ID: {user_id}), 未提供设备ID，等待心跳超时")
             
-            conn.commit()
+            await conn.commit()
+            invalidate_principal(token=credentials.credentials)
             
             return BaseResponse(
                 success=True,
@@ -285,12 +293,12 @@ async def get_current_user_info(current_user: dict = Depends(get_current_user)):
     user_id = current_user["user_id"]
     
     try:
-        with pool.get_connection() as conn:
-            cursor = conn.execute(
+        async with pool.acquire(readonly=True) as conn:
+            cursor = await conn.execute(
                 "SELECT id, username, created_at, last_login_at FROM users WHERE id = ?",
                 (user_id,)
             )
-            user = cursor.fetchone()
+            user = await cursor.fetchone()
             
             if user is None:
                 raise HTTPException(
@@ -378,36 +386,39 @@ async def change_password(
     user_id = current_user["user_id"]
     
     try:
-        with pool.get_connection() as conn:
+        async with pool.acquire(readonly=True) as conn:
             # 查询当前密码
-            cursor = conn.execute(
+            cursor = await conn.execute(
                 "SELECT password FROM users WHERE id = ?",
                 (user_id,)
             )
-            user = cursor.fetchone()
-            
-            if user is None:
-                raise HTTPException(
-                    status_code=status.HTTP_404_NOT_FOUND,
-                    detail="用户不存在"
-                )
-            
-            hashed_password = user[0]
-            
-            # 验证旧密码
-            if not verify_password(password_data.old_password, hashed_password):
-                raise HTTPException(
-                    status_code=status.HTTP_401_UNAUTHORIZED,
-                    detail="当前密码不正确"
-                )
-            
+            user = await cursor.fetchone()
+        
+        if user is None:
+            raise HTTPException(
+                status_code=status.HTTP_404_NOT_FOUND,
+                detail="用户不存在"
+            )
+        
+        hashed_password = user[0]
+        
+        # 验证旧密码、生成新密码哈希（在密码哈希线程池中执行，期间不占用数据库连接）
+        if not await verify_password_async(password_data.old_password, hashed_password):
+            raise HTTPException(
+                status_code=status.HTTP_401_UNAUTHORIZED,
+                detail="当前密码不正确"
+            )
+        
+        new_hashed_password = await get_password_hash_async(password_data.new_password)
+        
+        async with pool.acquire() as conn:
             # 更新密码
-            new_hashed_password = get_password_hash(password_data.new_password)
-            conn.execute(
+            await conn.execute(
                 "UPDATE users SET password = ? WHERE id = ?",
                 (new_hashed_password, user_id)
             )
-            conn.commit()
+            await conn.commit()
+            invalidate_principal(user_id=user_id)
             
             logger.info(f"用户修改密码成功: {current_user['username']} (ID: {user_id})")
             
@@ -453,38 +464,39 @@ async def delete_account(
     username = current_user["username"]
     
     try:
-        with pool.get_connection() as conn:
+        async with pool.acquire(readonly=True) as conn:
             # 查询用户密码
-            cursor = conn.execute(
+            cursor = await conn.execute(
                 "SELECT password FROM users WHERE id = ?",
                 (user_id,)
             )
-            user = cursor.fetchone()
-            
-            if user is None:
-                raise HTTPException(
-                    status_code=status.HTTP_404_NOT_FOUND,
-                    detail="用户不存在"
-                )
-            
-            hashed_password = user[0]
-            
-            # 验证密码
-            if not verify_password(password_data.password, hashed_password):
-                raise HTTPException(
-                    status_code=status.HTTP_401_UNAUTHORIZED,
-                    detail="密码不正确，无法注销账户"
-                )
-            
+            user = await cursor.fetchone()
+        
+        if user is None:
+            raise HTTPException(
+                status_code=status.HTTP_404_NOT_FOUND,
+                detail="用户不存在"
+            )
+        
+        hashed_password = user[0]
+        
+        # 验证密码（在密码哈希线程池中执行，期间不占用数据库连接）
+        if not await verify_password_async(password_data.password, hashed_password):
+            raise HTTPException(
+                status_code=status.HTTP_401_UNAUTHORIZED,
+                detail="密码不正确，无法注销账户"
+            )
+        
+        async with pool.acquire() as conn:
             # 处理用户拥有的 Workspace：
             # 1. 如果 Workspace 有其他成员（无论是共享还是非共享），转移所有权给第一个成员（按加入时间排序）
             # 2. 如果 Workspace 没有其他成员，保留 Workspace 但标记为待删除（通过 CASCADE 删除）
-            cursor = conn.execute('''
+            cursor = await conn.execute('''
                 SELECT id, name, is_shared
                 FROM workspaces
                 WHERE ownerId = ?
             ''', (user_id,))
-            owned_workspaces = cursor.fetchall()
+            owned_workspaces = await cursor.fetchall()
             
             transferred_workspaces = []
             deleted_workspaces = []
@@ -495,40 +507,40 @@ async def delete_account(
                 is_shared = bool(workspace_row[2])
                 
                 # 查找该 Workspace 的其他成员（排除当前用户）
-                cursor = conn.execute('''
+                cursor = await conn.execute('''
                     SELECT userId, role, joined_at
                     FROM workspace_members
                     WHERE workspaceId = ? AND userId != ?
                     ORDER BY joined_at ASC
                     LIMIT 1
                 ''', (workspace_id, user_id))
-                other_member = cursor.fetchone()
+                other_member = await cursor.fetchone()
                 
                 if other_member:
                     # 有其他成员，转移所有权（无论是否共享）
                     new_owner_id = other_member[0]
                     
                     # 先更新 Workspace 的 ownerId（必须在删除用户之前，避免 CASCADE 删除）
-                    conn.execute('''
+                    await conn.execute('''
                         UPDATE workspaces
                         SET ownerId = ?, updated_at = datetime('now')
                         WHERE id = ?
                     ''', (new_owner_id, workspace_id))
                     
                     # 将新 owner 的成员角色更新为 'owner'（如果存在）
-                    conn.execute('''
+                    await conn.execute('''
                         UPDATE workspace_members
                         SET role = 'owner'
                         WHERE workspaceId = ? AND userId = ?
                     ''', (workspace_id, new_owner_id))
                     
                     # 如果新 owner 还不是成员，添加为 owner
-                    cursor_check = conn.execute('''
+                    cursor_check = await conn.execute('''
                         SELECT id FROM workspace_members
                         WHERE workspaceId = ? AND userId = ?
                     ''', (workspace_id, new_owner_id))
-                    if not cursor_check.fetchone():
-                        conn.execute('''
+                    if not await cursor_check.fetchone():
+                        await conn.execute('''
                             INSERT INTO workspace_members (workspaceId, userId, role, joined_at)
                             VALUES (?, ?, 'owner', datetime('now'))
                         ''', (workspace_id, new_owner_id))
@@ -549,11 +561,14 @@ async def delete_account(
             # - 所有业务表 (userId) -> ON DELETE CASCADE
             # - user_settings (userId) -> ON DELETE CASCADE
             # - online_users (userId) -> ON DELETE CASCADE
-            conn.execute(
+            await conn.execute(
                 "DELETE FROM users WHERE id = ?",
                 (user_id,)
             )
-            conn.commit()
+            await conn.commit()
+            # 所有权转移和级联删除涉及多个 Workspace，清除全部访问上下文缓存
+            invalidate_workspace_access()
+            invalidate_principal(user_id=user_id)
             
             # 记录转移和删除的 Workspace 信息
             if transferred_workspaces:
@@ -8,12 +8,13 @@ from pathlib import Path
 from fastapi import APIRouter
 from fastapi.responses import PlainTextResponse, FileResponse
 from fastapi.responses import HTMLResponse
+from server.timing import TimedRoute
 
 # 配置日志
 logger = logging.getLogger(__name__)
 
 # 创建路由
-router = APIRouter(prefix="/api/help", tags=["帮助"])
+router = APIRouter(prefix="/api/help", tags=["帮助"], route_class=TimedRoute)
 
 # 帮助文档路径（相对于 server 目录）
 HELP_FILE_PATH = Path(__file__).parent.parent / "help.md"
@@ -24,18 +24,25 @@ from server.models import (
     DateRangeFilter
 )
 from server.services.audit_log_service import AuditLogService
+from server.pagination import Keyset, SortColumn, fetch_page, page_count, date_range_conditions
+from server.timing import TimedRoute
 
 # 配置日志
 logger = logging.getLogger(__name__)
 
 # 创建路由
-router = APIRouter(prefix="/api/income", tags=["进账管理"])
+router = APIRouter(prefix="/api/income", tags=["进账管理"], route_class=TimedRoute)
+
+# 列表排序键（游标分页）
+INCOME_KEYSET = Keyset(SortColumn("incomeDate"), SortColumn("id"))
 
 
 @router.get("", response_model=BaseResponse)
 async def get_income_records(
     page: int = Query(1, ge=1, description="页码"),
     page_size: int = Query(20, ge=1, le=10000, description="每页数量（最大 10000）"),
+    cursor: Optional[str] = Query(None, description="分页游标（上一页返回的 next_cursor，提供时忽略 page）"),
+    include_total: bool = Query(False, description="使用游标时是否也返回总数（按页码查询时总是返回，无限滚动不需要）"),
     search: Optional[str] = Query(None, description="搜索关键词（备注）"),
     start_date: Optional[str] = Query(None, description="开始日期（ISO8601格式）"),
     end_date: Optional[str] = Query(None, description="结束日期（ISO8601格式）"),
@@ -49,6 +56,8 @@ async def get_income_records(
     Args:
         page: 页码
         page_size: 每页数量
+        cursor: 分页游标
+        include_total: 使用游标时是否也返回总数
         search: 搜索关键词
         start_date: 开始日期
         end_date: 结束日期
@@ -59,11 +68,12 @@ async def get_income_records(
     Returns:
         进账记录列表（分页）
     """
+    cursor_values = INCOME_KEYSET.decode(cursor)
     pool = get_pool()
     user_id = current_user["user_id"]
     
     try:
-        with pool.get_connection() as conn:
+        async with pool.acquire(readonly=True) as conn:
             # 构建查询条件
             # 如果提供了workspace_id，使用workspace过滤；否则使用userId过滤（向后兼容）
             if workspace_id is not None:
@@ -88,14 +98,10 @@ async def get_income_records(
                 where_conditions.append("note LIKE ?")
                 params.append(f"%{search}%")
             
-            # 日期范围筛选
-            if start_date:
-                where_conditions.append("date(incomeDate) >= date(?)")
-                params.append(start_date)
-            
-            if end_date:
-                where_conditions.append("date(incomeDate) <= date(?)")
-                params.append(end_date)
+            # 日期范围筛选（按天，使用 (workspaceId, date(incomeDate), id) 索引）
+            date_conditions, date_params = date_range_conditions("incomeDate", start_date, end_date)
+            where_conditions.extend(date_conditions)
+            params.extend(date_params)
             
             # 客户筛选
             if customer_id is not None:
@@ -107,30 +113,24 @@ async def get_income_records(
             
             where_clause = " AND ".join(where_conditions)
             
-            # 获取总数
-            count_cursor = conn.execute(
-                f"SELECT COUNT(*) FROM income WHERE {where_clause}",
-                tuple(params)
-            )
-            total = count_cursor.fetchone()[0]
-            
-            # 计算分页
-            offset = (page - 1) * page_size
-            total_pages = (total + page_size - 1) // page_size
-            
-            # 获取进账记录列表
-            cursor = conn.execute(
-                f"""
-                SELECT id, userId, incomeDate, customerId, amount, discount, employeeId,
-                       paymentMethod, note, created_at
-                FROM income
-                WHERE {where_clause}
-                ORDER BY incomeDate DESC, id DESC
-                LIMIT ? OFFSET ?
+            # 获取进账记录列表（提供游标时从游标之后开始，不使用 OFFSET）
+            rows, next_cursor, total = await fetch_page(
+                conn,
+                "income",
+                """
+                id, userId, incomeDate, customerId, amount, discount, employeeId,
+                paymentMethod, note, created_at
                 """,
-                tuple(params) + (page_size, offset)
+                where_clause,
+                params,
+                INCOME_KEYSET,
+                cursor_values,
+                page,
+                page_size,
+                include_total=include_total,
+                # 只按 workspace 过滤时，总数读取触发器维护的行数
+                workspace_id=workspace_id if len(where_conditions) == 1 and workspace_id is not None else None
             )
-            rows = cursor.fetchall()
             
             # 转换为响应模型
             income_records = []
@@ -154,7 +154,8 @@ async def get_income_records(
                 total=total,
                 page=page,
                 page_size=page_size,
-                total_pages=total_pages
+                total_pages=page_count(total, page_size),
+                next_cursor=next_cursor
             )
             
             return BaseResponse(
@@ -192,7 +193,7 @@ async def get_income_record(
     user_id = current_user["user_id"]
     
     try:
-        with pool.get_connection() as conn:
+        async with pool.acquire(readonly=True) as conn:
             # 构建查询条件
             if workspace_id is not None:
                 # 检查是否为服务器存储类型（本地 workspace 的业务数据存储在客户端）
@@ -211,7 +212,7 @@ async def get_income_record(
                 where_clause = "id = ? AND userId = ?"
                 params = (income_id, user_id)
             
-            cursor = conn.execute(
+            cursor = await conn.execute(
                 f"""
                 SELECT id, userId, incomeDate, customerId, amount, discount, employeeId,
                        paymentMethod, note, created_at
@@ -220,7 +221,7 @@ async def get_income_record(
                 """,
                 params
             )
-            row = cursor.fetchone()
+            row = await cursor.fetchone()
             
             if row is None:
                 raise HTTPException(
@@ -278,7 +279,7 @@ async def create_income_record(
     user_id = current_user["user_id"]
     
     try:
-        with pool.get_connection() as conn:
+        async with pool.acquire() as conn:
             # 如果提供了workspace_id，检查权限
             if workspace_id is not None:
                 # 检查是否为服务器存储类型（本地 workspace 的业务数据存储在客户端）
@@ -292,11 +293,11 @@ async def create_income_record(
                     )
                 # 验证客户是否存在（如果提供了customerId，必须属于同一workspace）
                 if income_data.customerId is not None:
-                    customer_cursor = conn.execute(
+                    customer_cursor = await conn.execute(
                         "SELECT id FROM customers WHERE id = ? AND workspaceId = ?",
                         (income_data.customerId, workspace_id)
                     )
-                    if customer_cursor.fetchone() is None:
+                    if await customer_cursor.fetchone() is None:
                         raise HTTPException(
                             status_code=status.HTTP_400_BAD_REQUEST,
                             detail="客户不存在或不属于该 Workspace"
@@ -304,18 +305,18 @@ async def create_income_record(
                 
                 # 验证员工是否存在（如果提供了employeeId，必须属于同一workspace）
                 if income_data.employeeId is not None:
-                    employee_cursor = conn.execute(
+                    employee_cursor = await conn.execute(
                         "SELECT id FROM employees WHERE id = ? AND workspaceId = ?",
                         (income_data.employeeId, workspace_id)
                     )
-                    if employee_cursor.fetchone() is None:
+                    if await employee_cursor.fetchone() is None:
                         raise HTTPException(
                             status_code=status.HTTP_400_BAD_REQUEST,
                             detail="员工不存在或不属于该 Workspace"
                         )
                 
                 # 插入进账记录（包含workspaceId）
-                cursor = conn.execute(
+                cursor = await conn.execute(
                     """
                     INSERT INTO income (userId, workspaceId, incomeDate, customerId, amount, discount, employeeId, paymentMethod, note, created_at)
                     VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, datetime('now'))
@@ -336,11 +337,11 @@ async def create_income_record(
                 # 向后兼容：不设置workspaceId
                 # 验证客户是否存在（如果提供了 customerId）
                 if income_data.customerId is not None:
-                    customer_cursor = conn.execute(
+                    customer_cursor = await conn.execute(
                         "SELECT id FROM customers WHERE id = ? AND userId = ?",
                         (income_data.customerId, user_id)
                     )
-                    if customer_cursor.fetchone() is None:
+                    if await customer_cursor.fetchone() is None:
                         raise HTTPException(
                             status_code=status.HTTP_400_BAD_REQUEST,
                             detail="客户不存在或无权限访问"
@@ -348,18 +349,18 @@ async def create_income_record(
                 
                 # 验证员工是否存在（如果提供了 employeeId）
                 if income_data.employeeId is not None:
-                    employee_cursor = conn.execute(
+                    employee_cursor = await conn.execute(
                         "SELECT id FROM employees WHERE id = ? AND userId = ?",
                         (income_data.employeeId, user_id)
                     )
-                    if employee_cursor.fetchone() is None:
+                    if await employee_cursor.fetchone() is None:
                         raise HTTPException(
                             status_code=status.HTTP_400_BAD_REQUEST,
                             detail="员工不存在或无权限访问"
                         )
                 
                 # 插入进账记录（不包含workspaceId）
-                cursor = conn.execute(
+                cursor = await conn.execute(
                     """
                     INSERT INTO income (userId, incomeDate, customerId, amount, discount, employeeId, paymentMethod, note, created_at)
                     VALUES (?, ?, ?, ?, ?, ?, ?, ?, datetime('now'))
@@ -376,10 +377,10 @@ async def create_income_record(
                     )
                 )
             income_id = cursor.lastrowid
-            conn.commit()
+            await conn.commit()
             
             # 获取创建的进账记录
-            cursor = conn.execute(
+            cursor = await conn.execute(
                 """
                 SELECT id, userId, incomeDate, customerId, amount, discount, employeeId,
                        paymentMethod, note, created_at
@@ -388,7 +389,7 @@ async def create_income_record(
                 """,
                 (income_id,)
             )
-            row = cursor.fetchone()
+            row = await cursor.fetchone()
             
             income = IncomeResponse(
                 id=row[0],
@@ -412,15 +413,15 @@ async def create_income_record(
                 # 获取客户名称用于日志显示
                 customer_name = "未知客户"
                 if income_data.customerId:
-                    customer_cursor = conn.execute(
+                    customer_cursor = await conn.execute(
                         "SELECT name FROM customers WHERE id = ?",
                         (income_data.customerId,)
                     )
-                    customer_row = customer_cursor.fetchone()
+                    customer_row = await customer_cursor.fetchone()
                     if customer_row:
                         customer_name = customer_row[0]
                 entity_name = f"{customer_name} (金额: ¥{income_data.amount})"
-                AuditLogService.log_create(
+                await AuditLogService.log_create(
                     user_id=user_id,
                     username=current_user.get("username", "unknown"),
                     entity_type="income",
@@ -471,7 +472,7 @@ async def update_income_record(
     user_id = current_user["user_id"]
     
     try:
-        with pool.get_connection() as conn:
+        async with pool.acquire() as conn:
             # 构建查询条件
             if workspace_id is not None:
                 # 检查是否为服务器存储类型（本地 workspace 的业务数据存储在客户端）
@@ -491,7 +492,7 @@ async def update_income_record(
                 params = (income_id, user_id)
             
             # 获取当前进账记录完整信息用于日志记录
-            cursor = conn.execute(
+            cursor = await conn.execute(
                 f"""
                 SELECT id, userId, incomeDate, customerId, amount, discount, employeeId,
                        paymentMethod, note, created_at
@@ -500,7 +501,7 @@ async def update_income_record(
                 """,
                 params
             )
-            row = cursor.fetchone()
+            row = await cursor.fetchone()
             
             if row is None:
                 raise HTTPException(
@@ -526,16 +527,16 @@ async def update_income_record(
             if income_data.customerId is not None:
                 if income_data.customerId != 0:
                     if workspace_id is not None:
-                        customer_cursor = conn.execute(
+                        customer_cursor = await conn.execute(
                             "SELECT id FROM customers WHERE id = ? AND workspaceId = ?",
                             (income_data.customerId, workspace_id)
                         )
                     else:
-                        customer_cursor = conn.execute(
+                        customer_cursor = await conn.execute(
                             "SELECT id FROM customers WHERE id = ? AND userId = ?",
                             (income_data.customerId, user_id)
                         )
-                    if customer_cursor.fetchone() is None:
+                    if await customer_cursor.fetchone() is None:
                         raise HTTPException(
                             status_code=status.HTTP_400_BAD_REQUEST,
                             detail="客户不存在或不属于该 Workspace"
@@ -545,16 +546,16 @@ async def update_income_record(
             if income_data.employeeId is not None:
                 if income_data.employeeId != 0:
                     if workspace_id is not None:
-                        employee_cursor = conn.execute(
+                        employee_cursor = await conn.execute(
                             "SELECT id FROM employees WHERE id = ? AND workspaceId = ?",
                             (income_data.employeeId, workspace_id)
                         )
                     else:
-                        employee_cursor = conn.execute(
+                        employee_cursor = await conn.execute(
                             "SELECT id FROM employees WHERE id = ? AND userId = ?",
                             (income_data.employeeId, user_id)
                         )
-                    if employee_cursor.fetchone() is None:
+                    if await employee_cursor.fetchone() is None:
                         raise HTTPException(
                             status_code=status.HTTP_400_BAD_REQUEST,
                             detail="员工不存在或不属于该 Workspace"
@@ -616,11 +617,11 @@ async def update_income_record(
                 """
                 update_values.append(user_id)
             
-            conn.execute(update_sql, tuple(update_values))
-            conn.commit()
+            await conn.execute(update_sql, tuple(update_values))
+            await conn.commit()
             
             # 获取更新后的进账记录
-            cursor = conn.execute(
+            cursor = await conn.execute(
                 """
                 SELECT id, userId, incomeDate, customerId, amount, discount, employeeId,
                        paymentMethod, note, created_at
@@ -629,7 +630,7 @@ async def update_income_record(
                 """,
                 (income_id,)
             )
-            row = cursor.fetchone()
+            row = await cursor.fetchone()
             
             income = IncomeResponse(
                 id=row[0],
@@ -651,15 +652,15 @@ async def update_income_record(
                 # 获取客户名称用于日志显示
                 customer_name = "未知客户"
                 if income.customerId:
-                    customer_cursor = conn.execute(
+                    customer_cursor = await conn.execute(
                         "SELECT name FROM customers WHERE id = ?",
                         (income.customerId,)
                     )
-                    customer_row = customer_cursor.fetchone()
+                    customer_row = await customer_cursor.fetchone()
                     if customer_row:
                         customer_name = customer_row[0]
                 entity_name = f"{customer_name} (金额: ¥{income.amount})"
-                AuditLogService.log_update(
+                await AuditLogService.log_update(
                     user_id=user_id,
                     username=current_user.get("username", "unknown"),
                     entity_type="income",
@@ -709,7 +710,7 @@ async def delete_income_record(
     user_id = current_user["user_id"]
     
     try:
-        with pool.get_connection() as conn:
+        async with pool.acquire() as conn:
             # 构建查询条件
             if workspace_id is not None:
                 # 检查是否为服务器存储类型（本地 workspace 的业务数据存储在客户端）
@@ -729,7 +730,7 @@ async def delete_income_record(
                 params = (income_id, user_id)
             
             # 获取进账记录完整信息用于日志记录
-            cursor = conn.execute(
+            cursor = await conn.execute(
                 f"""
                 SELECT id, userId, incomeDate, customerId, amount, discount, employeeId,
                        paymentMethod, note, created_at
@@ -738,7 +739,7 @@ async def delete_income_record(
                 """,
                 params
             )
-            row = cursor.fetchone()
+            row = await cursor.fetchone()
             
             if row is None:
                 raise HTTPException(
@@ -762,11 +763,11 @@ async def delete_income_record(
             amount = row[4]
             
             # 删除进账记录
-            conn.execute(
+            await conn.execute(
                 f"DELETE FROM income WHERE {where_clause}",
                 params
             )
-            conn.commit()
+            await conn.commit()
             
             logger.info(f"删除进账记录成功: 金额 {amount} (ID: {income_id}, 用户: {user_id})")
             
@@ -776,15 +777,15 @@ async def delete_income_record(
                 customer_name = "未知客户"
                 customer_id = row[3]  # customerId
                 if customer_id:
-                    customer_cursor = conn.execute(
+                    customer_cursor = await conn.execute(
                         "SELECT name FROM customers WHERE id = ?",
                         (customer_id,)
                     )
-                    customer_row = customer_cursor.fetchone()
+                    customer_row = await customer_cursor.fetchone()
                     if customer_row:
                         customer_name = customer_row[0]
                 entity_name = f"{customer_name} (金额: ¥{amount})"
-                AuditLogService.log_delete(
+                await AuditLogService.log_delete(
                     user_id=user_id,
                     username=current_user.get("username", "unknown"),
                     entity_type="income",
@@ -7,7 +7,7 @@ import logging
 from typing import Optional, List
 from fastapi import APIRouter, HTTPException, status, Depends, Query, Header
 
-from server.database import get_pool, DatabaseBusyError
+from server.database import get_pool, DatabaseBusyError, OptimisticLockError
 from server.middleware import get_current_user
 from server.middleware.workspace_permission import (
     get_workspace_id,
@@ -26,18 +26,25 @@ from server.models import (
     ProductFilter
 )
 from server.services.audit_log_service import AuditLogService
+from server.pagination import Keyset, SortColumn, fetch_page, page_count
+from server.timing import TimedRoute
 
 # 配置日志
 logger = logging.getLogger(__name__)
 
 # 创建路由
-router = APIRouter(prefix="/api/products", tags=["产品管理"])
+router = APIRouter(prefix="/api/products", tags=["产品管理"], route_class=TimedRoute)
+
+# 列表排序键（游标分页）
+PRODUCTS_KEYSET = Keyset(SortColumn("updated_at", nullable=True), SortColumn("id"))
 
 
 @router.get("", response_model=BaseResponse)
 async def get_products(
     page: int = Query(1, ge=1, description="页码"),
     page_size: int = Query(20, ge=1, le=10000, description="每页数量（最大 10000）"),
+    cursor: Optional[str] = Query(None, description="分页游标（上一页返回的 next_cursor，提供时忽略 page）"),
+    include_total: bool = Query(False, description="使用游标时是否也返回总数（按页码查询时总是返回，无限滚动不需要）"),
     search: Optional[str] = Query(None, description="搜索关键词（产品名称或描述）"),
     supplier_id: Optional[int] = Query(None, description="供应商ID筛选"),
     workspace_id: Optional[int] = Header(None, alias="X-Workspace-ID"),
@@ -49,6 +56,8 @@ async def get_products(
     Args:
         page: 页码
         page_size: 每页数量
+        cursor: 分页游标
+        include_total: 使用游标时是否也返回总数
         search: 搜索关键词
         supplier_id: 供应商ID筛选
         workspace_id: Workspace ID（可选，如果提供则只查询该workspace的数据）
@@ -57,11 +66,12 @@ async def get_products(
     Returns:
         产品列表（分页）
     """
+    cursor_values = PRODUCTS_KEYSET.decode(cursor)
     pool = get_pool()
     user_id = current_user["user_id"]
     
     try:
-        with pool.get_connection() as conn:
+        async with pool.acquire(readonly=True) as conn:
             # 构建查询条件
             # 如果提供了workspace_id，使用workspace过滤；否则使用userId过滤（向后兼容）
             if workspace_id is not None:
@@ -98,30 +108,24 @@ async def get_products(
             
             where_clause = " AND ".join(where_conditions)
             
-            # 获取总数
-            count_cursor = conn.execute(
-                f"SELECT COUNT(*) FROM products WHERE {where_clause}",
-                tuple(params)
-            )
-            total = count_cursor.fetchone()[0]
-            
-            # 计算分页
-            offset = (page - 1) * page_size
-            total_pages = (total + page_size - 1) // page_size
-            
-            # 获取产品列表
-            cursor = conn.execute(
-                f"""
-                SELECT id, userId, name, description, stock, unit, supplierId, version, 
-                       created_at, updated_at
-                FROM products
-                WHERE {where_clause}
-                ORDER BY updated_at DESC, id DESC
-                LIMIT ? OFFSET ?
+            # 获取产品列表（提供游标时从游标之后开始，不使用 OFFSET）
+            rows, next_cursor, total = await fetch_page(
+                conn,
+                "products",
+                """
+                id, userId, name, description, stock, unit, supplierId, version, 
+                created_at, updated_at
                 """,
-                tuple(params) + (page_size, offset)
+                where_clause,
+                params,
+                PRODUCTS_KEYSET,
+                cursor_values,
+                page,
+                page_size,
+                include_total=include_total,
+                # 只按 workspace 过滤时，总数读取触发器维护的行数
+                workspace_id=workspace_id if len(where_conditions) == 1 and workspace_id is not None else None
             )
-            rows = cursor.fetchall()
             
             # 转换为响应模型
             products = []
@@ -145,7 +149,8 @@ async def get_products(
                 total=total,
                 page=page,
                 page_size=page_size,
-                total_pages=total_pages
+                total_pages=page_count(total, page_size),
+                next_cursor=next_cursor
             )
             
             return BaseResponse(
@@ -183,7 +188,7 @@ async def get_product(
     user_id = current_user["user_id"]
     
     try:
-        with pool.get_connection() as conn:
+        async with pool.acquire(readonly=True) as conn:
             # 构建查询条件
             if workspace_id is not None:
                 # 检查是否为服务器存储类型（本地 workspace 的业务数据存储在客户端）
@@ -202,7 +207,7 @@ async def get_product(
                 where_clause = "id = ? AND userId = ?"
                 params = (product_id, user_id)
             
-            cursor = conn.execute(
+            cursor = await conn.execute(
                 f"""
                 SELECT id, userId, name, description, stock, unit, supplierId, version,
                        created_at, updated_at
@@ -211,7 +216,7 @@ async def get_product(
                 """,
                 params
             )
-            row = cursor.fetchone()
+            row = await cursor.fetchone()
             
             if row is None:
                 raise HTTPException(
@@ -269,7 +274,7 @@ async def create_product(
     user_id = current_user["user_id"]
     
     try:
-        with pool.get_connection() as conn:
+        async with pool.acquire() as conn:
             # 如果提供了workspace_id，检查权限和存储类型
             if workspace_id is not None:
                 # 检查是否为服务器存储类型（本地 workspace 的业务数据存储在客户端）
@@ -282,11 +287,11 @@ async def create_product(
                         detail="无创建权限"
                     )
                 # 检查同一workspace下产品名称是否已存在
-                cursor = conn.execute(
+                cursor = await conn.execute(
                     "SELECT id FROM products WHERE workspaceId = ? AND name = ?",
                     (workspace_id, product_data.name)
                 )
-                existing = cursor.fetchone()
+                existing = await cursor.fetchone()
                 
                 if existing:
                     raise HTTPException(
@@ -296,18 +301,18 @@ async def create_product(
                 
                 # 验证供应商是否存在（如果提供了 supplierId）
                 if product_data.supplierId is not None:
-                    supplier_cursor = conn.execute(
+                    supplier_cursor = await conn.execute(
                         "SELECT id FROM suppliers WHERE id = ? AND workspaceId = ?",
                         (product_data.supplierId, workspace_id)
                     )
-                    if supplier_cursor.fetchone() is None:
+                    if await supplier_cursor.fetchone() is None:
                         raise HTTPException(
                             status_code=status.HTTP_400_BAD_REQUEST,
                             detail="供应商不存在或无权限访问"
                         )
                 
                 # 插入产品（包含workspaceId）
-                cursor = conn.execute(
+                cursor = await conn.execute(
                     """
                     INSERT INTO products (userId, workspaceId, name, description, stock, unit, supplierId, version, created_at, updated_at)
                     VALUES (?, ?, ?, ?, ?, ?, ?, 1, datetime('now'), datetime('now'))
@@ -325,11 +330,11 @@ async def create_product(
             else:
                 # 向后兼容：不设置workspaceId
                 # 检查同一用户下产品名称是否已存在
-                cursor = conn.execute(
+                cursor = await conn.execute(
                     "SELECT id FROM products WHERE userId = ? AND name = ?",
                     (user_id, product_data.name)
                 )
-                existing = cursor.fetchone()
+                existing = await cursor.fetchone()
                 
                 if existing:
                     raise HTTPException(
@@ -339,18 +344,18 @@ async def create_product(
                 
                 # 验证供应商是否存在（如果提供了 supplierId）
                 if product_data.supplierId is not None:
-                    supplier_cursor = conn.execute(
+                    supplier_cursor = await conn.execute(
                         "SELECT id FROM suppliers WHERE id = ? AND userId = ?",
                         (product_data.supplierId, user_id)
                     )
-                    if supplier_cursor.fetchone() is None:
+                    if await supplier_cursor.fetchone() is None:
                         raise HTTPException(
                             status_code=status.HTTP_400_BAD_REQUEST,
                             detail="供应商不存在或无权限访问"
                         )
                 
                 # 插入产品（不包含workspaceId）
-                cursor = conn.execute(
+                cursor = await conn.execute(
                     """
                     INSERT INTO products (userId, name, description, stock, unit, supplierId, version, created_at, updated_at)
                     VALUES (?, ?, ?, ?, ?, ?, 1, datetime('now'), datetime('now'))
@@ -365,10 +370,10 @@ async def create_product(
                     )
                 )
             product_id = cursor.lastrowid
-            conn.commit()
+            await conn.commit()
             
             # 获取创建的产品
-            cursor = conn.execute(
+            cursor = await conn.execute(
                 """
                 SELECT id, userId, name, description, stock, unit, supplierId, version,
                        created_at, updated_at
@@ -377,7 +382,7 @@ async def create_product(
                 """,
                 (product_id,)
             )
-            row = cursor.fetchone()
+            row = await cursor.fetchone()
             
             product = ProductResponse(
                 id=row[0],
@@ -396,7 +401,7 @@ async def create_product(
             
             # 记录操作日志
             try:
-                AuditLogService.log_create(
+                await AuditLogService.log_create(
                     user_id=user_id,
                     username=current_user.get("username", "unknown"),
                     entity_type="product",
@@ -447,144 +452,149 @@ async def update_product(
     user_id = current_user["user_id"]
     
     try:
-        with pool.get_connection() as conn:
-            # 构建查询条件
-            if workspace_id is not None:
-                # 检查是否为服务器存储类型（本地 workspace 的业务数据存储在客户端）
-                await require_server_storage(workspace_id, user_id)
-                # 检查更新权限
-                can_update = await check_workspace_permission(workspace_id, user_id, 'update')
-                if not can_update:
+        async with pool.acquire() as conn:
+            async def _update_product(conn):
+                # 读取当前产品、校验并更新；并发冲突时由 pool.transaction 整体重试
+                # 构建查询条件
+                if workspace_id is not None:
+                    # 检查是否为服务器存储类型（本地 workspace 的业务数据存储在客户端）
+                    await require_server_storage(workspace_id, user_id)
+                    # 检查更新权限
+                    can_update = await check_workspace_permission(workspace_id, user_id, 'update')
+                    if not can_update:
+                        raise HTTPException(
+                            status_code=status.HTTP_403_FORBIDDEN,
+                            detail="无更新权限"
+                        )
+                    where_clause = "id = ? AND workspaceId = ?"
+                    params = (product_id, workspace_id)
+                else:
+                    # 向后兼容：使用userId过滤
+                    where_clause = "id = ? AND userId = ?"
+                    params = (product_id, user_id)
+                
+                # 获取当前产品信息
+                cursor = await conn.execute(
+                    f"""
+                    SELECT id, userId, name, description, stock, unit, supplierId, version
+                    FROM products
+                    WHERE {where_clause}
+                    """,
+                    params
+                )
+                row = await cursor.fetchone()
+                
+                if row is None:
                     raise HTTPException(
-                        status_code=status.HTTP_403_FORBIDDEN,
-                        detail="无更新权限"
+                        status_code=status.HTTP_404_NOT_FOUND,
+                        detail="产品不存在或无权限访问"
                     )
-                where_clause = "id = ? AND workspaceId = ?"
-                params = (product_id, workspace_id)
-            else:
-                # 向后兼容：使用userId过滤
-                where_clause = "id = ? AND userId = ?"
-                params = (product_id, user_id)
-            
-            # 获取当前产品信息
-            cursor = conn.execute(
-                f"""
-                SELECT id, userId, name, description, stock, unit, supplierId, version
-                FROM products
-                WHERE {where_clause}
-                """,
-                params
-            )
-            row = cursor.fetchone()
-            
-            if row is None:
-                raise HTTPException(
-                    status_code=status.HTTP_404_NOT_FOUND,
-                    detail="产品不存在或无权限访问"
-                )
-            
-            current_version = row[7] if row[7] else 1
-            
-            # 保存旧数据用于日志记录
-            old_data = {
-                "id": row[0],
-                "userId": row[1],
-                "name": row[2],
-                "description": row[3],
-                "stock": row[4],
-                "unit": row[5],
-                "supplierId": row[6],
-                "version": current_version
-            }
-            
-            # 乐观锁检查
-            if product_data.version is not None and product_data.version != current_version:
-                raise HTTPException(
-                    status_code=status.HTTP_409_CONFLICT,
-                    detail=f"产品已被其他操作修改，当前版本: {current_version}，您的版本: {product_data.version}。请刷新后重试。"
-                )
-            
-            # 检查产品名称唯一性（如果修改了名称）
-            if product_data.name and product_data.name != row[2]:
-                name_cursor = conn.execute(
-                    "SELECT id FROM products WHERE userId = ? AND name = ? AND id != ?",
-                    (user_id, product_data.name, product_id)
-                )
-                if name_cursor.fetchone():
+                
+                current_version = row[7] if row[7] else 1
+                
+                # 保存旧数据用于日志记录
+                old_data = {
+                    "id": row[0],
+                    "userId": row[1],
+                    "name": row[2],
+                    "description": row[3],
+                    "stock": row[4],
+                    "unit": row[5],
+                    "supplierId": row[6],
+                    "version": current_version
+                }
+                
+                # 乐观锁检查
+                if product_data.version is not None and product_data.version != current_version:
                     raise HTTPException(
-                        status_code=status.HTTP_400_BAD_REQUEST,
-                        detail=f"产品名称 '{product_data.name}' 已存在"
+                        status_code=status.HTTP_409_CONFLICT,
+                        detail=f"产品已被其他操作修改，当前版本: {current_version}，您的版本: {product_data.version}。请刷新后重试。"
                     )
-            
-            # 验证供应商（如果修改了供应商）
-            if product_data.supplierId is not None and product_data.supplierId != row[6]:
-                if product_data.supplierId != 0:  # 0 表示未分配
-                    supplier_cursor = conn.execute(
-                        "SELECT id FROM suppliers WHERE id = ? AND userId = ?",
-                        (product_data.supplierId, user_id)
+                
+                # 检查产品名称唯一性（如果修改了名称）
+                if product_data.name and product_data.name != row[2]:
+                    name_cursor = await conn.execute(
+                        "SELECT id FROM products WHERE userId = ? AND name = ? AND id != ?",
+                        (user_id, product_data.name, product_id)
                     )
-                    if supplier_cursor.fetchone() is None:
+                    if await name_cursor.fetchone():
                         raise HTTPException(
                             status_code=status.HTTP_400_BAD_REQUEST,
-                            detail="供应商不存在或无权限访问"
+                            detail=f"产品名称 '{product_data.name}' 已存在"
                         )
+                
+                # 验证供应商（如果修改了供应商）
+                if product_data.supplierId is not None and product_data.supplierId != row[6]:
+                    if product_data.supplierId != 0:  # 0 表示未分配
+                        supplier_cursor = await conn.execute(
+                            "SELECT id FROM suppliers WHERE id = ? AND userId = ?",
+                            (product_data.supplierId, user_id)
+                        )
+                        if await supplier_cursor.fetchone() is None:
+                            raise HTTPException(
+                                status_code=status.HTTP_400_BAD_REQUEST,
+                                detail="供应商不存在或无权限访问"
+                            )
+                
+                # 构建更新字段
+                update_fields = []
+                update_values = []
+                
+                if product_data.name is not None:
+                    update_fields.append("name = ?")
+                    update_values.append(product_data.name)
+                
+                if product_data.description is not None:
+                    update_fields.append("description = ?")
+                    update_values.append(product_data.description)
+                
+                if product_data.stock is not None:
+                    update_fields.append("stock = ?")
+                    update_values.append(product_data.stock)
+                
+                if product_data.unit is not None:
+                    update_fields.append("unit = ?")
+                    update_values.append(product_data.unit.value)
+                
+                if product_data.supplierId is not None:
+                    update_fields.append("supplierId = ?")
+                    update_values.append(product_data.supplierId if product_data.supplierId != 0 else None)
+                
+                if not update_fields:
+                    raise HTTPException(
+                        status_code=status.HTTP_400_BAD_REQUEST,
+                        detail="没有提供要更新的字段"
+                    )
+                
+                # 更新版本号（乐观锁）
+                update_fields.append("version = version + 1")
+                update_fields.append("updated_at = datetime('now')")
+                update_values.append(product_id)
+                
+                # 执行更新
+                if workspace_id is not None:
+                    update_sql = f"""
+                        UPDATE products
+                        SET {', '.join(update_fields)}
+                        WHERE id = ? AND workspaceId = ?
+                    """
+                    update_values.append(workspace_id)
+                else:
+                    update_sql = f"""
+                        UPDATE products
+                        SET {', '.join(update_fields)}
+                        WHERE id = ? AND userId = ?
+                    """
+                    update_values.append(user_id)
+                
+                await conn.execute(update_sql, tuple(update_values))
+                
+                return old_data
             
-            # 构建更新字段
-            update_fields = []
-            update_values = []
-            
-            if product_data.name is not None:
-                update_fields.append("name = ?")
-                update_values.append(product_data.name)
-            
-            if product_data.description is not None:
-                update_fields.append("description = ?")
-                update_values.append(product_data.description)
-            
-            if product_data.stock is not None:
-                update_fields.append("stock = ?")
-                update_values.append(product_data.stock)
-            
-            if product_data.unit is not None:
-                update_fields.append("unit = ?")
-                update_values.append(product_data.unit.value)
-            
-            if product_data.supplierId is not None:
-                update_fields.append("supplierId = ?")
-                update_values.append(product_data.supplierId if product_data.supplierId != 0 else None)
-            
-            if not update_fields:
-                raise HTTPException(
-                    status_code=status.HTTP_400_BAD_REQUEST,
-                    detail="没有提供要更新的字段"
-                )
-            
-            # 更新版本号（乐观锁）
-            update_fields.append("version = version + 1")
-            update_fields.append("updated_at = datetime('now')")
-            update_values.append(product_id)
-            
-            # 执行更新
-            if workspace_id is not None:
-                update_sql = f"""
-                    UPDATE products
-                    SET {', '.join(update_fields)}
-                    WHERE id = ? AND workspaceId = ?
-                """
-                update_values.append(workspace_id)
-            else:
-                update_sql = f"""
-                    UPDATE products
-                    SET {', '.join(update_fields)}
-                    WHERE id = ? AND userId = ?
-                """
-                update_values.append(user_id)
-            
-            conn.execute(update_sql, tuple(update_values))
-            conn.commit()
+            old_data = await pool.transaction(_update_product)
             
             # 获取更新后的产品
-            cursor = conn.execute(
+            cursor = await conn.execute(
                 """
                 SELECT id, userId, name, description, stock, unit, supplierId, version,
                        created_at, updated_at
@@ -593,7 +603,7 @@ async def update_product(
                 """,
                 (product_id,)
             )
-            row = cursor.fetchone()
+            row = await cursor.fetchone()
             
             product = ProductResponse(
                 id=row[0],
@@ -612,7 +622,7 @@ async def update_product(
             
             # 记录操作日志
             try:
-                AuditLogService.log_update(
+                await AuditLogService.log_update(
                     user_id=user_id,
                     username=current_user.get("username", "unknown"),
                     entity_type="product",
@@ -633,6 +643,12 @@ async def update_product(
             
     except HTTPException:
         raise
+    except DatabaseBusyError as e:
+        logger.warning(f"更新产品时数据库繁忙: {e}")
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail="数据库暂时繁忙，请稍后重试"
+        )
     except Exception as e:
         logger.error(f"更新产品失败: {e}", exc_info=True)
         raise HTTPException(
@@ -662,7 +678,7 @@ async def delete_product(
     user_id = current_user["user_id"]
     
     try:
-        with pool.get_connection() as conn:
+        async with pool.acquire() as conn:
             # 构建查询条件
             if workspace_id is not None:
                 # 检查是否为服务器存储类型（本地 workspace 的业务数据存储在客户端）
@@ -682,7 +698,7 @@ async def delete_product(
                 params = (product_id, user_id)
             
             # 获取产品完整信息用于日志记录
-            cursor = conn.execute(
+            cursor = await conn.execute(
                 f"""
                 SELECT id, userId, name, description, stock, unit, supplierId, version,
                        created_at, updated_at
@@ -691,7 +707,7 @@ async def delete_product(
                 """,
                 params
             )
-            row = cursor.fetchone()
+            row = await cursor.fetchone()
             
             if row is None:
                 raise HTTPException(
@@ -715,17 +731,17 @@ async def delete_product(
             product_name = row[2]
             
             # 删除产品（外键约束会自动处理关联数据）
-            conn.execute(
+            await conn.execute(
                 f"DELETE FROM products WHERE {where_clause}",
                 params
             )
-            conn.commit()
+            await conn.commit()
             
             logger.info(f"删除产品成功: {product_name} (ID: {product_id}, 用户: {user_id})")
             
             # 记录操作日志
             try:
-                AuditLogService.log_delete(
+                await AuditLogService.log_delete(
                     user_id=user_id,
                     username=current_user.get("username", "unknown"),
                     entity_type="product",
@@ -777,93 +793,94 @@ async def update_product_stock(
     user_id = current_user["user_id"]
     
     try:
-        with pool.get_connection() as conn:
-            # 构建查询条件
-            if workspace_id is not None:
-                # 检查是否为服务器存储类型（本地 workspace 的业务数据存储在客户端）
-                await require_server_storage(workspace_id, user_id)
-                # 检查更新权限
-                can_update = await check_workspace_permission(workspace_id, user_id, 'update')
-                if not can_update:
-                    raise HTTPException(
-                        status_code=status.HTTP_403_FORBIDDEN,
-                        detail="无更新权限"
-                    )
-                where_clause = "id = ? AND workspaceId = ?"
-                params = (product_id, workspace_id)
-            else:
-                # 向后兼容：使用userId过滤
-                where_clause = "id = ? AND userId = ?"
-                params = (product_id, user_id)
-            
-            # 获取当前产品信息
-            cursor = conn.execute(
-                f"""
-                SELECT id, userId, name, stock, version
-                FROM products
-                WHERE {where_clause}
-                """,
-                params
-            )
-            row = cursor.fetchone()
-            
-            if row is None:
-                raise HTTPException(
-                    status_code=status.HTTP_404_NOT_FOUND,
-                    detail="产品不存在或无权限访问"
-                )
-            
-            current_stock = row[3]
-            current_version = row[4] if row[4] else 1
-            
-            # 乐观锁检查
-            if stock_data.version != current_version:
-                raise HTTPException(
-                    status_code=status.HTTP_409_CONFLICT,
-                    detail=f"产品库存已被其他操作修改，当前版本: {current_version}，您的版本: {stock_data.version}。请刷新后重试。"
-                )
-            
-            # 计算新库存
-            new_stock = current_stock + stock_data.quantity
-            
-            # 检查库存不能为负
-            if new_stock < 0:
-                raise HTTPException(
-                    status_code=status.HTTP_400_BAD_REQUEST,
-                    detail=f"库存不足，当前库存: {current_stock}，无法减少 {abs(stock_data.quantity)}"
-                )
-            
-            # 更新库存和版本号
-            if workspace_id is not None:
-                conn.execute(
-                    """
-                    UPDATE products
-                    SET stock = ?, version = version + 1, updated_at = datetime('now')
-                    WHERE id = ? AND workspaceId = ? AND version = ?
-                    """,
-                    (new_stock, product_id, workspace_id, current_version)
-                )
-            else:
-                conn.execute(
-                    """
-                    UPDATE products
-                    SET stock = ?, version = version + 1, updated_at = datetime('now')
-                    WHERE id = ? AND userId = ? AND version = ?
+        async with pool.acquire() as conn:
+            async def _update_product_stock(conn):
+                # 读取当前库存、校验并更新库存；数据库繁忙或并发冲突时由 pool.transaction 整体重试
+                # 构建查询条件
+                if workspace_id is not None:
+                    # 检查是否为服务器存储类型（本地 workspace 的业务数据存储在客户端）
+                    await require_server_storage(workspace_id, user_id)
+                    # 检查更新权限
+                    can_update = await check_workspace_permission(workspace_id, user_id, 'update')
+                    if not can_update:
+                        raise HTTPException(
+                            status_code=status.HTTP_403_FORBIDDEN,
+                            detail="无更新权限"
+                        )
+                    where_clause = "id = ? AND workspaceId = ?"
+                    params = (product_id, workspace_id)
+                else:
+                    # 向后兼容：使用userId过滤
+                    where_clause = "id = ? AND userId = ?"
+                    params = (product_id, user_id)
+                
+                # 获取当前产品信息
+                cursor = await conn.execute(
+                    f"""
+                    SELECT id, userId, name, stock, version
+                    FROM products
+                    WHERE {where_clause}
                     """,
-                    (new_stock, product_id, user_id, current_version)
-                )
-            
-            # 检查是否更新成功（乐观锁）
-            if conn.total_changes == 0:
-                raise HTTPException(
-                    status_code=status.HTTP_409_CONFLICT,
-                    detail="产品库存已被其他操作修改，请刷新后重试"
+                    params
                 )
+                row = await cursor.fetchone()
+                
+                if row is None:
+                    raise HTTPException(
+                        status_code=status.HTTP_404_NOT_FOUND,
+                        detail="产品不存在或无权限访问"
+                    )
+                
+                current_stock = row[3]
+                current_version = row[4] if row[4] else 1
+                
+                # 乐观锁检查
+                if stock_data.version != current_version:
+                    raise HTTPException(
+                        status_code=status.HTTP_409_CONFLICT,
+                        detail=f"产品库存已被其他操作修改，当前版本: {current_version}，您的版本: {stock_data.version}。请刷新后重试。"
+                    )
+                
+                # 计算新库存
+                new_stock = current_stock + stock_data.quantity
+                
+                # 检查库存不能为负
+                if new_stock < 0:
+                    raise HTTPException(
+                        status_code=status.HTTP_400_BAD_REQUEST,
+                        detail=f"库存不足，当前库存: {current_stock}，无法减少 {abs(stock_data.quantity)}"
+                    )
+                
+                # 更新库存和版本号
+                if workspace_id is not None:
+                    update_cursor = await conn.execute(
+                        """
+                        UPDATE products
+                        SET stock = ?, version = version + 1, updated_at = datetime('now')
+                        WHERE id = ? AND workspaceId = ? AND version = ?
+                        """,
+                        (new_stock, product_id, workspace_id, current_version)
+                    )
+                else:
+                    update_cursor = await conn.execute(
+                        """
+                        UPDATE products
+                        SET stock = ?, version = version + 1, updated_at = datetime('now')
+                        WHERE id = ? AND userId = ? AND version = ?
+                        """,
+                        (new_stock, product_id, user_id, current_version)
+                    )
+                
+                # 检查是否更新成功（乐观锁）
+                if update_cursor.rowcount == 0:
+                    raise OptimisticLockError("产品库存已被其他操作修改，请刷新后重试")
+                
+                return current_stock, new_stock
             
-            conn.commit()
+            current_stock, new_stock = await pool.transaction(_update_product_stock)
             
             # 获取更新后的产品
-            cursor = conn.execute(
+            cursor = await conn.execute(
                 """
                 SELECT id, userId, name, description, stock, unit, supplierId, version,
                        created_at, updated_at
@@ -872,7 +889,7 @@ async def update_product_stock(
                 """,
                 (product_id,)
             )
-            row = cursor.fetchone()
+            row = await cursor.fetchone()
             
             product = ProductResponse(
                 id=row[0],
@@ -900,6 +917,12 @@ async def update_product_stock(
             
     except HTTPException:
         raise
+    except OptimisticLockError as e:
+        logger.warning(f"更新库存时发生并发冲突（已重试）: {e}")
+        raise HTTPException(
+            status_code=status.HTTP_409_CONFLICT,
+            detail=str(e)
+        )
     except DatabaseBusyError as e:
         logger.warning(f"更新库存时数据库繁忙: {e}")
         raise HTTPException(
@@ -950,10 +973,10 @@ async def search_all_products(
             )
     
     try:
-        with pool.get_connection() as conn:
+        async with pool.acquire(readonly=True) as conn:
             search_pattern = f"%{search}%"
             if workspace_id is not None:
-                cursor = conn.execute(
+                cursor = await conn.execute(
                     """
                     SELECT id, userId, name, description, stock, unit, supplierId, version,
                            created_at, updated_at
@@ -965,7 +988,7 @@ async def search_all_products(
                     (workspace_id, search_pattern, search_pattern)
                 )
             else:
-                cursor = conn.execute(
+                cursor = await conn.execute(
                     """
                     SELECT id, userId, name, description, stock, unit, supplierId, version,
                            created_at, updated_at
@@ -976,7 +999,7 @@ async def search_all_products(
                     """,
                     (user_id, search_pattern, search_pattern)
                 )
-            rows = cursor.fetchall()
+            rows = await cursor.fetchall()
             
             products = []
             for row in rows:
@@ -7,7 +7,7 @@ import logging
 from typing import Optional
 from fastapi import APIRouter, HTTPException, status, Depends, Query, Header
 
-from server.database import get_pool, DatabaseBusyError
+from server.database import get_pool, DatabaseBusyError, OptimisticLockError
 from server.middleware import get_current_user
 from server.middleware.workspace_permission import (
     check_workspace_access,
@@ -24,18 +24,25 @@ from server.models import (
     DateRangeFilter
 )
 from server.services.audit_log_service import AuditLogService
+from server.pagination import Keyset, SortColumn, fetch_page, page_count, date_range_conditions
+from server.timing import TimedRoute
 
 # 配置日志
 logger = logging.getLogger(__name__)
 
 # 创建路由
-router = APIRouter(prefix="/api/purchases", tags=["采购管理"])
+router = APIRouter(prefix="/api/purchases", tags=["采购管理"], route_class=TimedRoute)
+
+# 列表排序键（游标分页）
+PURCHASES_KEYSET = Keyset(SortColumn("purchaseDate", nullable=True), SortColumn("id"))
 
 
 @router.get("", response_model=BaseResponse)
 async def get_purchases(
     page: int = Query(1, ge=1, description="页码"),
     page_size: int = Query(20, ge=1, le=10000, description="每页数量（最大 10000）"),
+    cursor: Optional[str] = Query(None, description="分页游标（上一页返回的 next_cursor，提供时忽略 page）"),
+    include_total: bool = Query(False, description="使用游标时是否也返回总数（按页码查询时总是返回，无限滚动不需要）"),
     search: Optional[str] = Query(None, description="搜索关键词（产品名称）"),
     start_date: Optional[str] = Query(None, description="开始日期（ISO8601格式）"),
     end_date: Optional[str] = Query(None, description="结束日期（ISO8601格式）"),
@@ -49,6 +56,8 @@ async def get_purchases(
     Args:
         page: 页码
         page_size: 每页数量
+        cursor: 分页游标
+        include_total: 使用游标时是否也返回总数
         search: 搜索关键词
         start_date: 开始日期
         end_date: 结束日期
@@ -59,11 +68,12 @@ async def get_purchases(
     Returns:
         采购记录列表（分页）
     """
+    cursor_values = PURCHASES_KEYSET.decode(cursor)
     pool = get_pool()
     user_id = current_user["user_id"]
     
     try:
-        with pool.get_connection() as conn:
+        async with pool.acquire(readonly=True) as conn:
             # 构建查询条件
             # 如果提供了workspace_id，使用workspace过滤；否则使用userId过滤（向后兼容）
             if workspace_id is not None:
@@ -88,14 +98,10 @@ async def get_purchases(
                 where_conditions.append("productName LIKE ?")
                 params.append(f"%{search}%")
             
-            # 日期范围筛选
-            if start_date:
-                where_conditions.append("date(purchaseDate) >= date(?)")
-                params.append(start_date)
-            
-            if end_date:
-                where_conditions.append("date(purchaseDate) <= date(?)")
-                params.append(end_date)
+            # 日期范围筛选（按天，使用 (workspaceId, date(purchaseDate), id) 索引）
+            date_conditions, date_params = date_range_conditions("purchaseDate", start_date, end_date)
+            where_conditions.extend(date_conditions)
+            params.extend(date_params)
             
             # 供应商筛选
             if supplier_id is not None:
@@ -107,30 +113,24 @@ async def get_purchases(
             
             where_clause = " AND ".join(where_conditions)
             
-            # 获取总数
-            count_cursor = conn.execute(
-                f"SELECT COUNT(*) FROM purchases WHERE {where_clause}",
-                tuple(params)
-            )
-            total = count_cursor.fetchone()[0]
-            
-            # 计算分页
-            offset = (page - 1) * page_size
-            total_pages = (total + page_size - 1) // page_size
-            
-            # 获取采购记录列表
-            cursor = conn.execute(
-                f"""
-                SELECT id, userId, productName, quantity, purchaseDate, supplierId,
-                       totalPurchasePrice, note, created_at
-                FROM purchases
-                WHERE {where_clause}
-                ORDER BY purchaseDate DESC, id DESC
-                LIMIT ? OFFSET ?
+            # 获取采购记录列表（提供游标时从游标之后开始，不使用 OFFSET）
+            rows, next_cursor, total = await fetch_page(
+                conn,
+                "purchases",
+                """
+                id, userId, productName, quantity, purchaseDate, supplierId,
+                totalPurchasePrice, note, created_at
                 """,
-                tuple(params) + (page_size, offset)
+                where_clause,
+                params,
+                PURCHASES_KEYSET,
+                cursor_values,
+                page,
+                page_size,
+                include_total=include_total,
+                # 只按 workspace 过滤时，总数读取触发器维护的行数
+                workspace_id=workspace_id if len(where_conditions) == 1 and workspace_id is not None else None
             )
-            rows = cursor.fetchall()
             
             # 转换为响应模型
             purchases = []
@@ -153,7 +153,8 @@ async def get_purchases(
                 total=total,
                 page=page,
                 page_size=page_size,
-                total_pages=total_pages
+                total_pages=page_count(total, page_size),
+                next_cursor=next_cursor
             )
             
             return BaseResponse(
@@ -191,7 +192,7 @@ async def get_purchase(
     user_id = current_user["user_id"]
     
     try:
-        with pool.get_connection() as conn:
+        async with pool.acquire(readonly=True) as conn:
             # 构建查询条件
             if workspace_id is not None:
                 # 检查是否为服务器存储类型（本地 workspace 的业务数据存储在客户端）
@@ -210,7 +211,7 @@ async def get_purchase(
                 where_clause = "id = ? AND userId = ?"
                 params = (purchase_id, user_id)
             
-            cursor = conn.execute(
+            cursor = await conn.execute(
                 f"""
                 SELECT id, userId, productName, quantity, purchaseDate, supplierId,
                        totalPurchasePrice, note, created_at
@@ -219,7 +220,7 @@ async def get_purchase(
                 """,
                 params
             )
-            row = cursor.fetchone()
+            row = await cursor.fetchone()
             
             if row is None:
                 raise HTTPException(
@@ -280,88 +281,89 @@ async def create_purchase(
     user_id = current_user["user_id"]
     
     try:
-        with pool.get_connection() as conn:
-            # 如果提供了workspace_id，检查权限
-            if workspace_id is not None:
-                # 检查是否为服务器存储类型（本地 workspace 的业务数据存储在客户端）
-                await require_server_storage(workspace_id, user_id)
-                # 检查创建权限
-                can_create = await check_workspace_permission(workspace_id, user_id, 'create')
-                if not can_create:
-                    raise HTTPException(
-                        status_code=status.HTTP_403_FORBIDDEN,
-                        detail="无创建权限"
-                    )
-                # 验证产品是否存在（必须属于同一workspace）
-                product_cursor = conn.execute(
-                    "SELECT id, name, stock, version FROM products WHERE workspaceId = ? AND name = ?",
-                    (workspace_id, purchase_data.productName)
-                )
-                product = product_cursor.fetchone()
-                
-                if product is None:
-                    raise HTTPException(
-                        status_code=status.HTTP_400_BAD_REQUEST,
-                        detail=f"产品 '{purchase_data.productName}' 不存在或不属于该 Workspace"
-                    )
-                
-                product_id, product_name, current_stock, product_version = product
-                
-                # 验证供应商是否存在（如果提供了有效的 supplierId，必须属于同一workspace）
-                supplier_id = purchase_data.supplierId if purchase_data.supplierId and purchase_data.supplierId != 0 else None
-                if supplier_id is not None:
-                    supplier_cursor = conn.execute(
-                        "SELECT id FROM suppliers WHERE id = ? AND workspaceId = ?",
-                        (supplier_id, workspace_id)
+        async with pool.acquire() as conn:
+            async def _create_purchase(conn):
+                # 读取库存、校验并插入采购记录、增加库存；并发冲突时由 pool.transaction 整体重试
+                # 如果提供了workspace_id，检查权限
+                if workspace_id is not None:
+                    # 检查是否为服务器存储类型（本地 workspace 的业务数据存储在客户端）
+                    await require_server_storage(workspace_id, user_id)
+                    # 检查创建权限
+                    can_create = await check_workspace_permission(workspace_id, user_id, 'create')
+                    if not can_create:
+                        raise HTTPException(
+                            status_code=status.HTTP_403_FORBIDDEN,
+                            detail="无创建权限"
+                        )
+                    # 验证产品是否存在（必须属于同一workspace）
+                    product_cursor = await conn.execute(
+                        "SELECT id, name, stock, version FROM products WHERE workspaceId = ? AND name = ?",
+                        (workspace_id, purchase_data.productName)
                     )
-                    if supplier_cursor.fetchone() is None:
+                    product = await product_cursor.fetchone()
+                    
+                    if product is None:
                         raise HTTPException(
                             status_code=status.HTTP_400_BAD_REQUEST,
-                            detail="供应商不存在或不属于该 Workspace"
+                            detail=f"产品 '{purchase_data.productName}' 不存在或不属于该 Workspace"
                         )
-            else:
-                # 向后兼容：不设置workspaceId
-                # 验证产品是否存在
-                product_cursor = conn.execute(
-                    "SELECT id, name, stock, version FROM products WHERE userId = ? AND name = ?",
-                    (user_id, purchase_data.productName)
-                )
-                product = product_cursor.fetchone()
-                
-                if product is None:
-                    raise HTTPException(
-                        status_code=status.HTTP_400_BAD_REQUEST,
-                        detail=f"产品 '{purchase_data.productName}' 不存在"
+                    
+                    product_id, product_name, current_stock, product_version = product
+                    
+                    # 验证供应商是否存在（如果提供了有效的 supplierId，必须属于同一workspace）
+                    supplier_id = purchase_data.supplierId if purchase_data.supplierId and purchase_data.supplierId != 0 else None
+                    if supplier_id is not None:
+                        supplier_cursor = await conn.execute(
+                            "SELECT id FROM suppliers WHERE id = ? AND workspaceId = ?",
+                            (supplier_id, workspace_id)
+                        )
+                        if await supplier_cursor.fetchone() is None:
+                            raise HTTPException(
+                                status_code=status.HTTP_400_BAD_REQUEST,
+                                detail="供应商不存在或不属于该 Workspace"
+                            )
+                else:
+                    # 向后兼容：不设置workspaceId
+                    # 验证产品是否存在
+                    product_cursor = await conn.execute(
+                        "SELECT id, name, stock, version FROM products WHERE userId = ? AND name = ?",
+                        (user_id, purchase_data.productName)
                     )
+                    product = await product_cursor.fetchone()
+                    
+                    if product is None:
+                        raise HTTPException(
+                            status_code=status.HTTP_400_BAD_REQUEST,
+                            detail=f"产品 '{purchase_data.productName}' 不存在"
+                        )
+                    
+                    product_id, product_name, current_stock, product_version = product
+                    
+                    # 验证供应商是否存在（如果提供了有效的 supplierId）
+                    supplier_id = purchase_data.supplierId if purchase_data.supplierId and purchase_data.supplierId != 0 else None
+                    if supplier_id is not None:
+                        supplier_cursor = await conn.execute(
+                            "SELECT id FROM suppliers WHERE id = ? AND userId = ?",
+                            (supplier_id, user_id)
+                        )
+                        if await supplier_cursor.fetchone() is None:
+                            raise HTTPException(
+                                status_code=status.HTTP_400_BAD_REQUEST,
+                                detail="供应商不存在或无权限访问"
+                            )
                 
-                product_id, product_name, current_stock, product_version = product
-                
-                # 验证供应商是否存在（如果提供了有效的 supplierId）
-                supplier_id = purchase_data.supplierId if purchase_data.supplierId and purchase_data.supplierId != 0 else None
-                if supplier_id is not None:
-                    supplier_cursor = conn.execute(
-                        "SELECT id FROM suppliers WHERE id = ? AND userId = ?",
-                        (supplier_id, user_id)
-                    )
-                    if supplier_cursor.fetchone() is None:
+                # 如果是负数（采购退货），检查库存是否足够
+                if purchase_data.quantity < 0:
+                    if current_stock < abs(purchase_data.quantity):
                         raise HTTPException(
                             status_code=status.HTTP_400_BAD_REQUEST,
-                            detail="供应商不存在或无权限访问"
+                            detail=f"库存不足，当前库存: {current_stock}，无法退货 {abs(purchase_data.quantity)}"
                         )
-            
-            # 如果是负数（采购退货），检查库存是否足够
-            if purchase_data.quantity < 0:
-                if current_stock < abs(purchase_data.quantity):
-                    raise HTTPException(
-                        status_code=status.HTTP_400_BAD_REQUEST,
-                        detail=f"库存不足，当前库存: {current_stock}，无法退货 {abs(purchase_data.quantity)}"
-                    )
-            
-            # 在事务中执行：插入采购记录 + 更新库存
-            try:
+                
+                # 在事务中执行：插入采购记录 + 更新库存
                 # 插入采购记录
                 if workspace_id is not None:
-                    purchase_cursor = conn.execute(
+                    purchase_cursor = await conn.execute(
                         """
                         INSERT INTO purchases (userId, workspaceId, productName, quantity, purchaseDate, supplierId, totalPurchasePrice, note, created_at)
                         VALUES (?, ?, ?, ?, ?, ?, ?, ?, datetime('now'))
@@ -378,7 +380,7 @@ async def create_purchase(
                         )
                     )
                 else:
-                    purchase_cursor = conn.execute(
+                    purchase_cursor = await conn.execute(
                         """
                         INSERT INTO purchases (userId, productName, quantity, purchaseDate, supplierId, totalPurchasePrice, note, created_at)
                         VALUES (?, ?, ?, ?, ?, ?, ?, datetime('now'))
@@ -404,7 +406,7 @@ async def create_purchase(
                     )
                 
                 if workspace_id is not None:
-                    update_cursor = conn.execute(
+                    update_cursor = await conn.execute(
                         """
                         UPDATE products
                         SET stock = ?, version = version + 1, updated_at = datetime('now')
@@ -413,7 +415,7 @@ async def create_purchase(
                         (new_stock, product_id, workspace_id, product_version)
                     )
                 else:
-                    update_cursor = conn.execute(
+                    update_cursor = await conn.execute(
                         """
                         UPDATE products
                         SET stock = ?, version = version + 1, updated_at = datetime('now')
@@ -424,26 +426,14 @@ async def create_purchase(
                 
                 # 检查是否更新成功（乐观锁）
                 if update_cursor.rowcount == 0:
-                    raise HTTPException(
-                        status_code=status.HTTP_409_CONFLICT,
-                        detail="产品库存已被其他操作修改，请刷新后重试"
-                    )
+                    raise OptimisticLockError("产品库存已被其他操作修改，请刷新后重试")
                 
-                conn.commit()
-                
-            except HTTPException:
-                conn.rollback()
-                raise
-            except Exception as e:
-                conn.rollback()
-                logger.error(f"创建采购记录时数据库操作失败: {e}")
-                raise HTTPException(
-                    status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
-                    detail=f"创建采购记录失败: {str(e)}"
-                )
+                return purchase_id
+            
+            purchase_id = await pool.transaction(_create_purchase)
             
             # 获取创建的采购记录
-            cursor = conn.execute(
+            cursor = await conn.execute(
                 """
                 SELECT id, userId, productName, quantity, purchaseDate, supplierId,
                        totalPurchasePrice, note, created_at
@@ -452,7 +442,7 @@ async def create_purchase(
                 """,
                 (purchase_id,)
             )
-            row = cursor.fetchone()
+            row = await cursor.fetchone()
             
             purchase = PurchaseResponse(
                 id=row[0],
@@ -473,7 +463,7 @@ async def create_purchase(
             
             # 记录操作日志
             try:
-                AuditLogService.log_create(
+                await AuditLogService.log_create(
                     user_id=user_id,
                     username=current_user.get("username", "unknown"),
                     entity_type="purchase",
@@ -493,6 +483,12 @@ async def create_purchase(
             
     except HTTPException:
         raise
+    except OptimisticLockError as e:
+        logger.warning(f"创建采购记录时发生并发冲突（已重试）: {e}")
+        raise HTTPException(
+            status_code=status.HTTP_409_CONFLICT,
+            detail=str(e)
+        )
     except DatabaseBusyError as e:
         logger.warning(f"创建采购记录时数据库繁忙: {e}")
         raise HTTPException(
@@ -532,173 +528,174 @@ async def update_purchase(
     user_id = current_user["user_id"]
     
     try:
-        with pool.get_connection() as conn:
-            # 构建查询条件
-            if workspace_id is not None:
-                # 检查是否为服务器存储类型（本地 workspace 的业务数据存储在客户端）
-                await require_server_storage(workspace_id, user_id)
-                # 检查更新权限
-                can_update = await check_workspace_permission(workspace_id, user_id, 'update')
-                if not can_update:
-                    raise HTTPException(
-                        status_code=status.HTTP_403_FORBIDDEN,
-                        detail="无更新权限"
-                    )
-                where_clause = "id = ? AND workspaceId = ?"
-                params = (purchase_id, workspace_id)
-            else:
-                # 向后兼容：使用userId过滤
-                where_clause = "id = ? AND userId = ?"
-                params = (purchase_id, user_id)
-            
-            # 获取当前采购记录
-            cursor = conn.execute(
-                f"""
-                SELECT id, userId, productName, quantity, purchaseDate, supplierId,
-                       totalPurchasePrice, note
-                FROM purchases
-                WHERE {where_clause}
-                """,
-                params
-            )
-            row = cursor.fetchone()
-            
-            if row is None:
-                raise HTTPException(
-                    status_code=status.HTTP_404_NOT_FOUND,
-                    detail="采购记录不存在或无权限访问"
-                )
-            
-            old_quantity = row[3]
-            old_product_name = row[2]
-            
-            # 保存旧数据用于日志记录
-            old_data = {
-                "id": row[0],
-                "userId": row[1],
-                "productName": row[2],
-                "quantity": row[3],
-                "purchaseDate": row[4],
-                "supplierId": row[5],
-                "totalPurchasePrice": row[6],
-                "note": row[7]
-            }
-            
-            # 确定新的数量（如果提供了）
-            new_quantity = purchase_data.quantity if purchase_data.quantity is not None else old_quantity
-            new_product_name = purchase_data.productName if purchase_data.productName else old_product_name
-            
-            # 如果产品名称改变了，需要验证新产品是否存在
-            if purchase_data.productName and purchase_data.productName != old_product_name:
-                if workspace_id is not None:
-                    product_cursor = conn.execute(
-                        "SELECT id, stock, version FROM products WHERE workspaceId = ? AND name = ?",
-                        (workspace_id, purchase_data.productName)
-                    )
-                else:
-                    product_cursor = conn.execute(
-                        "SELECT id, stock, version FROM products WHERE userId = ? AND name = ?",
-                        (user_id, purchase_data.productName)
-                    )
-                new_product = product_cursor.fetchone()
-                if new_product is None:
-                    raise HTTPException(
-                        status_code=status.HTTP_400_BAD_REQUEST,
-                        detail=f"产品 '{purchase_data.productName}' 不存在或不属于该 Workspace"
-                    )
-            else:
-                # 获取原产品信息
+        async with pool.acquire() as conn:
+            async def _update_purchase(conn):
+                # 读取原记录和库存、校验并更新采购记录和库存；并发冲突时由 pool.transaction 整体重试
+                # 构建查询条件
                 if workspace_id is not None:
-                    product_cursor = conn.execute(
-                        "SELECT id, stock, version FROM products WHERE workspaceId = ? AND name = ?",
-                        (workspace_id, old_product_name)
-                    )
+                    # 检查是否为服务器存储类型（本地 workspace 的业务数据存储在客户端）
+                    await require_server_storage(workspace_id, user_id)
+                    # 检查更新权限
+                    can_update = await check_workspace_permission(workspace_id, user_id, 'update')
+                    if not can_update:
+                        raise HTTPException(
+                            status_code=status.HTTP_403_FORBIDDEN,
+                            detail="无更新权限"
+                        )
+                    where_clause = "id = ? AND workspaceId = ?"
+                    params = (purchase_id, workspace_id)
                 else:
-                    product_cursor = conn.execute(
-                        "SELECT id, stock, version FROM products WHERE userId = ? AND name = ?",
-                        (user_id, old_product_name)
-                    )
-                new_product = product_cursor.fetchone()
-                if new_product is None:
+                    # 向后兼容：使用userId过滤
+                    where_clause = "id = ? AND userId = ?"
+                    params = (purchase_id, user_id)
+                
+                # 获取当前采购记录
+                cursor = await conn.execute(
+                    f"""
+                    SELECT id, userId, productName, quantity, purchaseDate, supplierId,
+                           totalPurchasePrice, note
+                    FROM purchases
+                    WHERE {where_clause}
+                    """,
+                    params
+                )
+                row = await cursor.fetchone()
+                
+                if row is None:
                     raise HTTPException(
-                        status_code=status.HTTP_400_BAD_REQUEST,
-                        detail=f"产品 '{old_product_name}' 不存在或不属于该 Workspace"
+                        status_code=status.HTTP_404_NOT_FOUND,
+                        detail="采购记录不存在或无权限访问"
                     )
-            
-            product_id, current_stock, product_version = new_product
-            
-            # 计算库存变化差值
-            quantity_diff = new_quantity - old_quantity
-            
-            # 如果产品名称改变了，需要分别检查原产品和新产品的库存
-            product_changed = purchase_data.productName and purchase_data.productName != old_product_name
-            
-            if product_changed:
-                # 如果产品名称改变，需要检查：
-                # 1. 原产品库存是否足够恢复（减去原数量）
-                # 2. 新产品库存是否足够（如果新数量是负数，即采购退货）
                 
-                # 检查原产品库存
-                if workspace_id is not None:
-                    old_product_cursor = conn.execute(
-                        "SELECT id, stock, version FROM products WHERE workspaceId = ? AND name = ?",
-                        (workspace_id, old_product_name)
-                    )
-                else:
-                    old_product_cursor = conn.execute(
-                        "SELECT id, stock, version FROM products WHERE userId = ? AND name = ?",
-                        (user_id, old_product_name)
-                    )
-                old_product = old_product_cursor.fetchone()
-                if old_product:
-                    old_product_stock = old_product[1]
-                    if old_product_stock < old_quantity:
-                        raise HTTPException(
-                            status_code=status.HTTP_400_BAD_REQUEST,
-                            detail=f"原产品 '{old_product_name}' 库存不足，当前库存: {old_product_stock}，无法恢复 {old_quantity}"
-                        )
+                old_quantity = row[3]
+                old_product_name = row[2]
                 
-                # 如果新数量是负数（采购退货），检查新产品库存是否足够
-                if new_quantity < 0:
-                    if current_stock < abs(new_quantity):
-                        raise HTTPException(
-                            status_code=status.HTTP_400_BAD_REQUEST,
-                            detail=f"新产品 '{purchase_data.productName}' 库存不足，当前库存: {current_stock}，无法退货 {abs(new_quantity)}"
+                # 保存旧数据用于日志记录
+                old_data = {
+                    "id": row[0],
+                    "userId": row[1],
+                    "productName": row[2],
+                    "quantity": row[3],
+                    "purchaseDate": row[4],
+                    "supplierId": row[5],
+                    "totalPurchasePrice": row[6],
+                    "note": row[7]
+                }
+                
+                # 确定新的数量（如果提供了）
+                new_quantity = purchase_data.quantity if purchase_data.quantity is not None else old_quantity
+                new_product_name = purchase_data.productName if purchase_data.productName else old_product_name
+                
+                # 如果产品名称改变了，需要验证新产品是否存在
+                if purchase_data.productName and purchase_data.productName != old_product_name:
+                    if workspace_id is not None:
+                        product_cursor = await conn.execute(
+                            "SELECT id, stock, version FROM products WHERE workspaceId = ? AND name = ?",
+                            (workspace_id, purchase_data.productName)
                         )
-            else:
-                # 产品名称没变，只检查数量差值
-                # 如果是负数变化（减少库存），检查库存是否足够
-                if quantity_diff < 0:
-                    if current_stock < abs(quantity_diff):
+                    else:
+                        product_cursor = await conn.execute(
+                            "SELECT id, stock, version FROM products WHERE userId = ? AND name = ?",
+                            (user_id, purchase_data.productName)
+                        )
+                    new_product = await product_cursor.fetchone()
+                    if new_product is None:
                         raise HTTPException(
                             status_code=status.HTTP_400_BAD_REQUEST,
-                            detail=f"库存不足，当前库存: {current_stock}，无法减少 {abs(quantity_diff)}"
+                            detail=f"产品 '{purchase_data.productName}' 不存在或不属于该 Workspace"
                         )
-            
-            # 验证供应商（如果修改了供应商）
-            # 如果 supplierId 为 0 或 None，表示未分配供应商，允许更新
-            supplier_id = None
-            if purchase_data.supplierId is not None:
-                if purchase_data.supplierId != 0:
-                    supplier_id = purchase_data.supplierId
+                else:
+                    # 获取原产品信息
                     if workspace_id is not None:
-                        supplier_cursor = conn.execute(
-                            "SELECT id FROM suppliers WHERE id = ? AND workspaceId = ?",
-                            (supplier_id, workspace_id)
+                        product_cursor = await conn.execute(
+                            "SELECT id, stock, version FROM products WHERE workspaceId = ? AND name = ?",
+                            (workspace_id, old_product_name)
                         )
                     else:
-                        supplier_cursor = conn.execute(
-                            "SELECT id FROM suppliers WHERE id = ? AND userId = ?",
-                            (supplier_id, user_id)
+                        product_cursor = await conn.execute(
+                            "SELECT id, stock, version FROM products WHERE userId = ? AND name = ?",
+                            (user_id, old_product_name)
                         )
-                    if supplier_cursor.fetchone() is None:
+                    new_product = await product_cursor.fetchone()
+                    if new_product is None:
                         raise HTTPException(
                             status_code=status.HTTP_400_BAD_REQUEST,
-                            detail="供应商不存在或不属于该 Workspace"
+                            detail=f"产品 '{old_product_name}' 不存在或不属于该 Workspace"
                         )
-            
-            # 在事务中执行：更新采购记录 + 更新库存
-            try:
+                
+                product_id, current_stock, product_version = new_product
+                
+                # 计算库存变化差值
+                quantity_diff = new_quantity - old_quantity
+                
+                # 如果产品名称改变了，需要分别检查原产品和新产品的库存
+                product_changed = purchase_data.productName and purchase_data.productName != old_product_name
+                
+                if product_changed:
+                    # 如果产品名称改变，需要检查：
+                    # 1. 原产品库存是否足够恢复（减去原数量）
+                    # 2. 新产品库存是否足够（如果新数量是负数，即采购退货）
+                    
+                    # 检查原产品库存
+                    if workspace_id is not None:
+                        old_product_cursor = await conn.execute(
+                            "SELECT id, stock, version FROM products WHERE workspaceId = ? AND name = ?",
+                            (workspace_id, old_product_name)
+                        )
+                    else:
+                        old_product_cursor = await conn.execute(
+                            "SELECT id, stock, version FROM products WHERE userId = ? AND name = ?",
+                            (user_id, old_product_name)
+                        )
+                    old_product = await old_product_cursor.fetchone()
+                    if old_product:
+                        old_product_stock = old_product[1]
+                        if old_product_stock < old_quantity:
+                            raise HTTPException(
+                                status_code=status.HTTP_400_BAD_REQUEST,
+                                detail=f"原产品 '{old_product_name}' 库存不足，当前库存: {old_product_stock}，无法恢复 {old_quantity}"
+                            )
+                    
+                    # 如果新数量是负数（采购退货），检查新产品库存是否足够
+                    if new_quantity < 0:
+                        if current_stock < abs(new_quantity):
+                            raise HTTPException(
+                                status_code=status.HTTP_400_BAD_REQUEST,
+                                detail=f"新产品 '{purchase_data.productName}' 库存不足，当前库存: {current_stock}，无法退货 {abs(new_quantity)}"
+                            )
+                else:
+                    # 产品名称没变，只检查数量差值
+                    # 如果是负数变化（减少库存），检查库存是否足够
+                    if quantity_diff < 0:
+                        if current_stock < abs(quantity_diff):
+                            raise HTTPException(
+                                status_code=status.HTTP_400_BAD_REQUEST,
+                                detail=f"库存不足，当前库存: {current_stock}，无法减少 {abs(quantity_diff)}"
+                            )
+                
+                # 验证供应商（如果修改了供应商）
+                # 如果 supplierId 为 0 或 None，表示未分配供应商，允许更新
+                supplier_id = None
+                if purchase_data.supplierId is not None:
+                    if purchase_data.supplierId != 0:
+                        supplier_id = purchase_data.supplierId
+                        if workspace_id is not None:
+                            supplier_cursor = await conn.execute(
+                                "SELECT id FROM suppliers WHERE id = ? AND workspaceId = ?",
+                                (supplier_id, workspace_id)
+                            )
+                        else:
+                            supplier_cursor = await conn.execute(
+                                "SELECT id FROM suppliers WHERE id = ? AND userId = ?",
+                                (supplier_id, user_id)
+                            )
+                        if await supplier_cursor.fetchone() is None:
+                            raise HTTPException(
+                                status_code=status.HTTP_400_BAD_REQUEST,
+                                detail="供应商不存在或不属于该 Workspace"
+                            )
+                
+                # 在事务中执行：更新采购记录 + 更新库存
                 # 构建更新字段
                 update_fields = []
                 update_values = []
@@ -751,7 +748,7 @@ async def update_purchase(
                     """
                     update_values.append(user_id)
                 
-                conn.execute(update_sql, tuple(update_values))
+                await conn.execute(update_sql, tuple(update_values))
                 
                 # 更新产品库存
                 # product_changed 已在上面计算过
@@ -762,16 +759,16 @@ async def update_purchase(
                     if product_changed:
                         # 恢复原产品库存（减去原采购数量）
                         if workspace_id is not None:
-                            old_product_cursor = conn.execute(
+                            old_product_cursor = await conn.execute(
                                 "SELECT id, stock, version FROM products WHERE workspaceId = ? AND name = ?",
                                 (workspace_id, old_product_name)
                             )
                         else:
-                            old_product_cursor = conn.execute(
+                            old_product_cursor = await conn.execute(
                                 "SELECT id, stock, version FROM products WHERE userId = ? AND name = ?",
                                 (user_id, old_product_name)
                             )
-                        old_product = old_product_cursor.fetchone()
+                        old_product = await old_product_cursor.fetchone()
                         if old_product:
                             old_product_id, old_product_stock, old_product_version = old_product
                             old_new_stock = old_product_stock - old_quantity
@@ -781,7 +778,7 @@ async def update_purchase(
                                     detail="原产品库存不足，无法恢复"
                                 )
                             if workspace_id is not None:
-                                old_update_cursor = conn.execute(
+                                old_update_cursor = await conn.execute(
                                     """
                                     UPDATE products
                                     SET stock = ?, version = version + 1, updated_at = datetime('now')
@@ -790,7 +787,7 @@ async def update_purchase(
                                     (old_new_stock, old_product_id, workspace_id, old_product_version)
                                 )
                             else:
-                                old_update_cursor = conn.execute(
+                                old_update_cursor = await conn.execute(
                                     """
                                     UPDATE products
                                     SET stock = ?, version = version + 1, updated_at = datetime('now')
@@ -800,10 +797,7 @@ async def update_purchase(
                                 )
                             # 检查原产品库存更新是否成功（乐观锁）
                             if old_update_cursor.rowcount == 0:
-                                raise HTTPException(
-                                    status_code=status.HTTP_409_CONFLICT,
-                                    detail="原产品库存已被其他操作修改，请刷新后重试"
-                                )
+                                raise OptimisticLockError("原产品库存已被其他操作修改，请刷新后重试")
                         
                         # 更新新产品库存（加上新采购数量）
                         new_stock = current_stock + new_quantity
@@ -819,7 +813,7 @@ async def update_purchase(
                         )
                     
                     # 更新产品库存（使用乐观锁）
-                    update_cursor = conn.execute(
+                    update_cursor = await conn.execute(
                         """
                         UPDATE products
                         SET stock = ?, version = version + 1, updated_at = datetime('now')
@@ -830,26 +824,14 @@ async def update_purchase(
                     
                     # 检查是否更新成功（乐观锁）
                     if update_cursor.rowcount == 0:
-                        raise HTTPException(
-                            status_code=status.HTTP_409_CONFLICT,
-                            detail="产品库存已被其他操作修改，请刷新后重试"
-                        )
-                
-                conn.commit()
+                        raise OptimisticLockError("产品库存已被其他操作修改，请刷新后重试")
                 
-            except HTTPException:
-                conn.rollback()
-                raise
-            except Exception as e:
-                conn.rollback()
-                logger.error(f"更新采购记录时数据库操作失败: {e}")
-                raise HTTPException(
-                    status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
-                    detail=f"更新采购记录失败: {str(e)}"
-                )
+                return old_data
+            
+            old_data = await pool.transaction(_update_purchase)
             
             # 获取更新后的采购记录
-            cursor = conn.execute(
+            cursor = await conn.execute(
                 """
                 SELECT id, userId, productName, quantity, purchaseDate, supplierId,
                        totalPurchasePrice, note, created_at
@@ -858,7 +840,7 @@ async def update_purchase(
                 """,
                 (purchase_id,)
             )
-            row = cursor.fetchone()
+            row = await cursor.fetchone()
             
             purchase = PurchaseResponse(
                 id=row[0],
@@ -877,7 +859,7 @@ async def update_purchase(
             # 记录操作日志
             try:
                 entity_name = f"{purchase.productName} (数量: {purchase.quantity})"
-                AuditLogService.log_update(
+                await AuditLogService.log_update(
                     user_id=user_id,
                     username=current_user.get("username", "unknown"),
                     entity_type="purchase",
@@ -898,6 +880,12 @@ async def update_purchase(
             
     except HTTPException:
         raise
+    except OptimisticLockError as e:
+        logger.warning(f"更新采购记录时发生并发冲突（已重试）: {e}")
+        raise HTTPException(
+            status_code=status.HTTP_409_CONFLICT,
+            detail=str(e)
+        )
     except DatabaseBusyError as e:
         logger.warning(f"更新采购记录时数据库繁忙: {e}")
         raise HTTPException(
@@ -935,7 +923,8 @@ async def delete_purchase(
     user_id = current_user["user_id"]
     
     try:
-        with pool.get_connection() as conn:
+        async def _delete_purchase(conn):
+            # 读取记录和库存、回退库存并删除采购记录；并发冲突时由 pool.transaction 整体重试
             # 构建查询条件
             if workspace_id is not None:
                 # 检查是否为服务器存储类型（本地 workspace 的业务数据存储在客户端）
@@ -955,7 +944,7 @@ async def delete_purchase(
                 params = (purchase_id, user_id)
             
             # 获取采购记录完整信息用于日志记录
-            cursor = conn.execute(
+            cursor = await conn.execute(
                 f"""
                 SELECT id, userId, productName, quantity, purchaseDate, supplierId,
                        totalPurchasePrice, note, created_at
@@ -964,7 +953,7 @@ async def delete_purchase(
                 """,
                 params
             )
-            row = cursor.fetchone()
+            row = await cursor.fetchone()
             
             if row is None:
                 raise HTTPException(
@@ -990,16 +979,16 @@ async def delete_purchase(
             
             # 获取产品信息
             if workspace_id is not None:
-                product_cursor = conn.execute(
+                product_cursor = await conn.execute(
                     "SELECT id, stock, version FROM products WHERE workspaceId = ? AND name = ?",
                     (workspace_id, product_name)
                 )
             else:
-                product_cursor = conn.execute(
+                product_cursor = await conn.execute(
                     "SELECT id, stock, version FROM products WHERE userId = ? AND name = ?",
                     (user_id, product_name)
                 )
-            product = product_cursor.fetchone()
+            product = await product_cursor.fetchone()
             
             if product is None:
                 # 产品不存在，只删除采购记录
@@ -1008,79 +997,73 @@ async def delete_purchase(
                 product_id, current_stock, product_version = product
                 
                 # 在事务中执行：删除采购记录 + 恢复库存
-                try:
-                    # 恢复产品库存（减去采购数量，即增加库存）
-                    new_stock = current_stock - quantity
-                    
-                    # 更新产品库存（使用乐观锁）
-                    if workspace_id is not None:
-                        update_cursor = conn.execute(
-                            """
-                            UPDATE products
-                            SET stock = ?, version = version + 1, updated_at = datetime('now')
-                            WHERE id = ? AND workspaceId = ? AND version = ?
-                            """,
-                            (new_stock, product_id, workspace_id, product_version)
-                        )
-                    else:
-                        update_cursor = conn.execute(
-                            """
-                            UPDATE products
-                            SET stock = ?, version = version + 1, updated_at = datetime('now')
-                            WHERE id = ? AND userId = ? AND version = ?
-                            """,
-                            (new_stock, product_id, user_id, product_version)
-                        )
-                    
-                    # 检查是否更新成功（乐观锁）
-                    if update_cursor.rowcount == 0:
-                        raise HTTPException(
-                            status_code=status.HTTP_409_CONFLICT,
-                            detail="产品库存已被其他操作修改，请刷新后重试"
-                        )
+                # 恢复产品库存（减去采购数量，即增加库存）
+                new_stock = current_stock - quantity
                 
-                except HTTPException:
-                    conn.rollback()
-                    raise
-                except Exception as e:
-                    conn.rollback()
-                    logger.error(f"删除采购记录时恢复库存失败: {e}")
-                    raise HTTPException(
-                        status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
-                        detail=f"删除采购记录失败: {str(e)}"
+                # 更新产品库存（使用乐观锁）
+                if workspace_id is not None:
+                    update_cursor = await conn.execute(
+                        """
+                        UPDATE products
+                        SET stock = ?, version = version + 1, updated_at = datetime('now')
+                        WHERE id = ? AND workspaceId = ? AND version = ?
+                        """,
+                        (new_stock, product_id, workspace_id, product_version)
                     )
-            
+                else:
+                    update_cursor = await conn.execute(
+                        """
+                        UPDATE products
+                        SET stock = ?, version = version + 1, updated_at = datetime('now')
+                        WHERE id = ? AND userId = ? AND version = ?
+                        """,
+                        (new_stock, product_id, user_id, product_version)
+                    )
+                
+                # 检查是否更新成功（乐观锁）
+                if update_cursor.rowcount == 0:
+                    raise OptimisticLockError("产品库存已被其他操作修改，请刷新后重试")
+                
             # 删除采购记录
-            conn.execute(
+            await conn.execute(
                 f"DELETE FROM purchases WHERE {where_clause}",
                 params
             )
-            conn.commit()
-            
-            logger.info(f"删除采购记录成功: {product_name} 数量: {quantity} (ID: {purchase_id}, 用户: {user_id})")
-            
-            # 记录操作日志
-            try:
-                entity_name = f"{product_name} (数量: {quantity})"
-                AuditLogService.log_delete(
-                    user_id=user_id,
-                    username=current_user.get("username", "unknown"),
-                    entity_type="purchase",
-                    entity_id=purchase_id,
-                    entity_name=entity_name,
-                    old_data=old_data,
-                    workspace_id=workspace_id
-                )
-            except Exception as e:
-                logger.warning(f"记录采购删除日志失败: {e}")
             
-            return BaseResponse(
-                success=True,
-                message="删除采购记录成功"
+            return product_name, quantity, old_data
+        
+        product_name, quantity, old_data = await pool.transaction(_delete_purchase)
+        
+        logger.info(f"删除采购记录成功: {product_name} 数量: {quantity} (ID: {purchase_id}, 用户: {user_id})")
+        
+        # 记录操作日志
+        try:
+            entity_name = f"{product_name} (数量: {quantity})"
+            await AuditLogService.log_delete(
+                user_id=user_id,
+                username=current_user.get("username", "unknown"),
+                entity_type="purchase",
+                entity_id=purchase_id,
+                entity_name=entity_name,
+                old_data=old_data,
+                workspace_id=workspace_id
             )
-            
+        except Exception as e:
+            logger.warning(f"记录采购删除日志失败: {e}")
+        
+        return BaseResponse(
+            success=True,
+            message="删除采购记录成功"
+        )
+        
     except HTTPException:
         raise
+    except OptimisticLockError as e:
+        logger.warning(f"删除采购记录时发生并发冲突（已重试）: {e}")
+        raise HTTPException(
+            status_code=status.HTTP_409_CONFLICT,
+            detail=str(e)
+        )
     except DatabaseBusyError as e:
         logger.warning(f"删除采购记录时数据库繁忙: {e}")
         raise HTTPException(
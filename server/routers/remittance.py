@@ -24,18 +24,25 @@ from server.models import (
     DateRangeFilter
 )
 from server.services.audit_log_service import AuditLogService
+from server.pagination import Keyset, SortColumn, fetch_page, page_count, date_range_conditions
+from server.timing import TimedRoute
 
 # 配置日志
 logger = logging.getLogger(__name__)
 
 # 创建路由
-router = APIRouter(prefix="/api/remittance", tags=["汇款管理"])
+router = APIRouter(prefix="/api/remittance", tags=["汇款管理"], route_class=TimedRoute)
+
+# 列表排序键（游标分页）
+REMITTANCE_KEYSET = Keyset(SortColumn("remittanceDate"), SortColumn("id"))
 
 
 @router.get("", response_model=BaseResponse)
 async def get_remittance_records(
     page: int = Query(1, ge=1, description="页码"),
     page_size: int = Query(20, ge=1, le=10000, description="每页数量（最大 10000）"),
+    cursor: Optional[str] = Query(None, description="分页游标（上一页返回的 next_cursor，提供时忽略 page）"),
+    include_total: bool = Query(False, description="使用游标时是否也返回总数（按页码查询时总是返回，无限滚动不需要）"),
     search: Optional[str] = Query(None, description="搜索关键词（备注）"),
     start_date: Optional[str] = Query(None, description="开始日期（ISO8601格式）"),
     end_date: Optional[str] = Query(None, description="结束日期（ISO8601格式）"),
@@ -49,6 +56,8 @@ async def get_remittance_records(
     Args:
         page: 页码
         page_size: 每页数量
+        cursor: 分页游标
+        include_total: 使用游标时是否也返回总数
         search: 搜索关键词
         start_date: 开始日期
         end_date: 结束日期
@@ -59,11 +68,12 @@ async def get_remittance_records(
     Returns:
         汇款记录列表（分页）
     """
+    cursor_values = REMITTANCE_KEYSET.decode(cursor)
     pool = get_pool()
     user_id = current_user["user_id"]
     
     try:
-        with pool.get_connection() as conn:
+        async with pool.acquire(readonly=True) as conn:
             # 构建查询条件
             # 如果提供了workspace_id，使用workspace过滤；否则使用userId过滤（向后兼容）
             if workspace_id is not None:
@@ -88,14 +98,10 @@ async def get_remittance_records(
                 where_conditions.append("note LIKE ?")
                 params.append(f"%{search}%")
             
-            # 日期范围筛选
-            if start_date:
-                where_conditions.append("date(remittanceDate) >= date(?)")
-                params.append(start_date)
-            
-            if end_date:
-                where_conditions.append("date(remittanceDate) <= date(?)")
-                params.append(end_date)
+            # 日期范围筛选（按天，使用 (workspaceId, date(remittanceDate), id) 索引）
+            date_conditions, date_params = date_range_conditions("remittanceDate", start_date, end_date)
+            where_conditions.extend(date_conditions)
+            params.extend(date_params)
             
             # 供应商筛选
             if supplier_id is not None:
@@ -107,30 +113,24 @@ async def get_remittance_records(
             
             where_clause = " AND ".join(where_conditions)
             
-            # 获取总数
-            count_cursor = conn.execute(
-                f"SELECT COUNT(*) FROM remittance WHERE {where_clause}",
-                tuple(params)
-            )
-            total = count_cursor.fetchone()[0]
-            
-            # 计算分页
-            offset = (page - 1) * page_size
-            total_pages = (total + page_size - 1) // page_size
-            
-            # 获取汇款记录列表
-            cursor = conn.execute(
-                f"""
-                SELECT id, userId, remittanceDate, supplierId, amount, employeeId,
-                       paymentMethod, note, created_at
-                FROM remittance
-                WHERE {where_clause}
-                ORDER BY remittanceDate DESC, id DESC
-                LIMIT ? OFFSET ?
+            # 获取汇款记录列表（提供游标时从游标之后开始，不使用 OFFSET）
+            rows, next_cursor, total = await fetch_page(
+                conn,
+                "remittance",
+                """
+                id, userId, remittanceDate, supplierId, amount, employeeId,
+                paymentMethod, note, created_at
                 """,
-                tuple(params) + (page_size, offset)
+                where_clause,
+                params,
+                REMITTANCE_KEYSET,
+                cursor_values,
+                page,
+                page_size,
+                include_total=include_total,
+                # 只按 workspace 过滤时，总数读取触发器维护的行数
+                workspace_id=workspace_id if len(where_conditions) == 1 and workspace_id is not None else None
             )
-            rows = cursor.fetchall()
             
             # 转换为响应模型
             remittance_records = []
@@ -153,7 +153,8 @@ async def get_remittance_records(
                 total=total,
                 page=page,
                 page_size=page_size,
-                total_pages=total_pages
+                total_pages=page_count(total, page_size),
+                next_cursor=next_cursor
             )
             
             return BaseResponse(
@@ -191,7 +192,7 @@ async def get_remittance_record(
     user_id = current_user["user_id"]
     
     try:
-        with pool.get_connection() as conn:
+        async with pool.acquire(readonly=True) as conn:
             # 构建查询条件
             if workspace_id is not None:
                 # 检查是否为服务器存储类型（本地 workspace 的业务数据存储在客户端）
@@ -210,7 +211,7 @@ async def get_remittance_record(
                 where_clause = "id = ? AND userId = ?"
                 params = (remittance_id, user_id)
             
-            cursor = conn.execute(
+            cursor = await conn.execute(
                 f"""
                 SELECT id, userId, remittanceDate, supplierId, amount, employeeId,
                        paymentMethod, note, created_at
@@ -219,7 +220,7 @@ async def get_remittance_record(
                 """,
                 params
             )
-            row = cursor.fetchone()
+            row = await cursor.fetchone()
             
             if row is None:
                 raise HTTPException(
@@ -276,7 +277,7 @@ async def create_remittance_record(
     user_id = current_user["user_id"]
     
     try:
-        with pool.get_connection() as conn:
+        async with pool.acquire() as conn:
             # 如果提供了workspace_id，检查权限
             if workspace_id is not None:
                 # 检查是否为服务器存储类型（本地 workspace 的业务数据存储在客户端）
@@ -290,11 +291,11 @@ async def create_remittance_record(
                     )
                 # 验证供应商是否存在（如果提供了supplierId，必须属于同一workspace）
                 if remittance_data.supplierId is not None:
-                    supplier_cursor = conn.execute(
+                    supplier_cursor = await conn.execute(
                         "SELECT id FROM suppliers WHERE id = ? AND workspaceId = ?",
                         (remittance_data.supplierId, workspace_id)
                     )
-                    if supplier_cursor.fetchone() is None:
+                    if await supplier_cursor.fetchone() is None:
                         raise HTTPException(
                             status_code=status.HTTP_400_BAD_REQUEST,
                             detail="供应商不存在或不属于该 Workspace"
@@ -302,18 +303,18 @@ async def create_remittance_record(
                 
                 # 验证员工是否存在（如果提供了employeeId，必须属于同一workspace）
                 if remittance_data.employeeId is not None:
-                    employee_cursor = conn.execute(
+                    employee_cursor = await conn.execute(
                         "SELECT id FROM employees WHERE id = ? AND workspaceId = ?",
                         (remittance_data.employeeId, workspace_id)
                     )
-                    if employee_cursor.fetchone() is None:
+                    if await employee_cursor.fetchone() is None:
                         raise HTTPException(
                             status_code=status.HTTP_400_BAD_REQUEST,
                             detail="员工不存在或不属于该 Workspace"
                         )
                 
                 # 插入汇款记录（包含workspaceId）
-                cursor = conn.execute(
+                cursor = await conn.execute(
                     """
                     INSERT INTO remittance (userId, workspaceId, remittanceDate, supplierId, amount, employeeId, paymentMethod, note, created_at)
                     VALUES (?, ?, ?, ?, ?, ?, ?, ?, datetime('now'))
@@ -333,11 +334,11 @@ async def create_remittance_record(
                 # 向后兼容：不设置workspaceId
                 # 验证供应商是否存在（如果提供了 supplierId）
                 if remittance_data.supplierId is not None:
-                    supplier_cursor = conn.execute(
+                    supplier_cursor = await conn.execute(
                         "SELECT id FROM suppliers WHERE id = ? AND userId = ?",
                         (remittance_data.supplierId, user_id)
                     )
-                    if supplier_cursor.fetchone() is None:
+                    if await supplier_cursor.fetchone() is None:
                         raise HTTPException(
                             status_code=status.HTTP_400_BAD_REQUEST,
                             detail="供应商不存在或无权限访问"
@@ -345,18 +346,18 @@ async def create_remittance_record(
                 
                 # 验证员工是否存在（如果提供了 employeeId）
                 if remittance_data.employeeId is not None:
-                    employee_cursor = conn.execute(
+                    employee_cursor = await conn.execute(
                         "SELECT id FROM employees WHERE id = ? AND userId = ?",
                         (remittance_data.employeeId, user_id)
                     )
-                    if employee_cursor.fetchone() is None:
+                    if await employee_cursor.fetchone() is None:
                         raise HTTPException(
                             status_code=status.HTTP_400_BAD_REQUEST,
                             detail="员工不存在或无权限访问"
                         )
                 
                 # 插入汇款记录（不包含workspaceId）
-                cursor = conn.execute(
+                cursor = await conn.execute(
                     """
                     INSERT INTO remittance (userId, remittanceDate, supplierId, amount, employeeId, paymentMethod, note, created_at)
                     VALUES (?, ?, ?, ?, ?, ?, ?, datetime('now'))
@@ -372,10 +373,10 @@ async def create_remittance_record(
                     )
                 )
             remittance_id = cursor.lastrowid
-            conn.commit()
+            await conn.commit()
             
             # 获取创建的汇款记录
-            cursor = conn.execute(
+            cursor = await conn.execute(
                 """
                 SELECT id, userId, remittanceDate, supplierId, amount, employeeId,
                        paymentMethod, note, created_at
@@ -384,7 +385,7 @@ async def create_remittance_record(
                 """,
                 (remittance_id,)
             )
-            row = cursor.fetchone()
+            row = await cursor.fetchone()
             
             remittance = RemittanceResponse(
                 id=row[0],
@@ -407,15 +408,15 @@ async def create_remittance_record(
                 # 获取供应商名称用于日志显示
                 supplier_name = "未知供应商"
                 if remittance_data.supplierId:
-                    supplier_cursor = conn.execute(
+                    supplier_cursor = await conn.execute(
                         "SELECT name FROM suppliers WHERE id = ?",
                         (remittance_data.supplierId,)
                     )
-                    supplier_row = supplier_cursor.fetchone()
+                    supplier_row = await supplier_cursor.fetchone()
                     if supplier_row:
                         supplier_name = supplier_row[0]
                 entity_name = f"{supplier_name} (金额: ¥{remittance_data.amount})"
-                AuditLogService.log_create(
+                await AuditLogService.log_create(
                     user_id=user_id,
                     username=current_user.get("username", "unknown"),
                     entity_type="remittance",
@@ -466,7 +467,7 @@ async def update_remittance_record(
     user_id = current_user["user_id"]
     
     try:
-        with pool.get_connection() as conn:
+        async with pool.acquire() as conn:
             # 构建查询条件
             if workspace_id is not None:
                 # 检查是否为服务器存储类型（本地 workspace 的业务数据存储在客户端）
@@ -486,7 +487,7 @@ async def update_remittance_record(
                 params = (remittance_id, user_id)
             
             # 获取当前汇款记录完整信息用于日志记录
-            cursor = conn.execute(
+            cursor = await conn.execute(
                 f"""
                 SELECT id, userId, remittanceDate, supplierId, amount, employeeId,
                        paymentMethod, note, created_at
@@ -495,7 +496,7 @@ async def update_remittance_record(
                 """,
                 params
             )
-            row = cursor.fetchone()
+            row = await cursor.fetchone()
             
             if row is None:
                 raise HTTPException(
@@ -520,16 +521,16 @@ async def update_remittance_record(
             if remittance_data.supplierId is not None:
                 if remittance_data.supplierId != 0:
                     if workspace_id is not None:
-                        supplier_cursor = conn.execute(
+                        supplier_cursor = await conn.execute(
                             "SELECT id FROM suppliers WHERE id = ? AND workspaceId = ?",
                             (remittance_data.supplierId, workspace_id)
                         )
                     else:
-                        supplier_cursor = conn.execute(
+                        supplier_cursor = await conn.execute(
                             "SELECT id FROM suppliers WHERE id = ? AND userId = ?",
                             (remittance_data.supplierId, user_id)
                         )
-                    if supplier_cursor.fetchone() is None:
+                    if await supplier_cursor.fetchone() is None:
                         raise HTTPException(
                             status_code=status.HTTP_400_BAD_REQUEST,
                             detail="供应商不存在或不属于该 Workspace"
@@ -539,16 +540,16 @@ async def update_remittance_record(
             if remittance_data.employeeId is not None:
                 if remittance_data.employeeId != 0:
                     if workspace_id is not None:
-                        employee_cursor = conn.execute(
+                        employee_cursor = await conn.execute(
                             "SELECT id FROM employees WHERE id = ? AND workspaceId = ?",
                             (remittance_data.employeeId, workspace_id)
                         )
                     else:
-                        employee_cursor = conn.execute(
+                        employee_cursor = await conn.execute(
                             "SELECT id FROM employees WHERE id = ? AND userId = ?",
                             (remittance_data.employeeId, user_id)
                         )
-                    if employee_cursor.fetchone() is None:
+                    if await employee_cursor.fetchone() is None:
                         raise HTTPException(
                             status_code=status.HTTP_400_BAD_REQUEST,
                             detail="员工不存在或不属于该 Workspace"
@@ -606,11 +607,11 @@ async def update_remittance_record(
                 """
                 update_values.append(user_id)
             
-            conn.execute(update_sql, tuple(update_values))
-            conn.commit()
+            await conn.execute(update_sql, tuple(update_values))
+            await conn.commit()
             
             # 获取更新后的汇款记录
-            cursor = conn.execute(
+            cursor = await conn.execute(
                 """
                 SELECT id, userId, remittanceDate, supplierId, amount, employeeId,
                        paymentMethod, note, created_at
@@ -619,7 +620,7 @@ async def update_remittance_record(
                 """,
                 (remittance_id,)
             )
-            row = cursor.fetchone()
+            row = await cursor.fetchone()
             
             remittance = RemittanceResponse(
                 id=row[0],
@@ -640,15 +641,15 @@ async def update_remittance_record(
                 # 获取供应商名称用于日志显示
                 supplier_name = "未知供应商"
                 if remittance.supplierId:
-                    supplier_cursor = conn.execute(
+                    supplier_cursor = await conn.execute(
                         "SELECT name FROM suppliers WHERE id = ?",
                         (remittance.supplierId,)
                     )
-                    supplier_row = supplier_cursor.fetchone()
+                    supplier_row = await supplier_cursor.fetchone()
                     if supplier_row:
                         supplier_name = supplier_row[0]
                 entity_name = f"{supplier_name} (金额: ¥{remittance.amount})"
-                AuditLogService.log_update(
+                await AuditLogService.log_update(
                     user_id=user_id,
                     username=current_user.get("username", "unknown"),
                     entity_type="remittance",
@@ -698,7 +699,7 @@ async def delete_remittance_record(
     user_id = current_user["user_id"]
     
     try:
-        with pool.get_connection() as conn:
+        async with pool.acquire() as conn:
             # 构建查询条件
             if workspace_id is not None:
                 # 检查是否为服务器存储类型（本地 workspace 的业务数据存储在客户端）
@@ -718,7 +719,7 @@ async def delete_remittance_record(
                 params = (remittance_id, user_id)
             
             # 获取汇款记录完整信息用于日志记录
-            cursor = conn.execute(
+            cursor = await conn.execute(
                 f"""
                 SELECT id, userId, remittanceDate, supplierId, amount, employeeId,
                        paymentMethod, note, created_at
@@ -727,7 +728,7 @@ async def delete_remittance_record(
                 """,
                 params
             )
-            row = cursor.fetchone()
+            row = await cursor.fetchone()
             
             if row is None:
                 raise HTTPException(
@@ -750,11 +751,11 @@ async def delete_remittance_record(
             amount = row[4]
             
             # 删除汇款记录
-            conn.execute(
+            await conn.execute(
                 f"DELETE FROM remittance WHERE {where_clause}",
                 params
             )
-            conn.commit()
+            await conn.commit()
             
             logger.info(f"删除汇款记录成功: 金额 {amount} (ID: {remittance_id}, 用户: {user_id})")
             
@@ -764,15 +765,15 @@ async def delete_remittance_record(
                 supplier_name = "未知供应商"
                 supplier_id = row[3]  # supplierId
                 if supplier_id:
-                    supplier_cursor = conn.execute(
+                    supplier_cursor = await conn.execute(
                         "SELECT name FROM suppliers WHERE id = ?",
                         (supplier_id,)
                     )
-                    supplier_row = supplier_cursor.fetchone()
+                    supplier_row = await supplier_cursor.fetchone()
                     if supplier_row:
                         supplier_name = supplier_row[0]
                 entity_name = f"{supplier_name} (金额: ¥{amount})"
-                AuditLogService.log_delete(
+                await AuditLogService.log_delete(
                     user_id=user_id,
                     username=current_user.get("username", "unknown"),
                     entity_type="remittance",
@@ -14,12 +14,13 @@ from server.models import (
     BaseResponse,
     ImportDataRequest
 )
+from server.timing import TimedRoute
 
 # 配置日志
 logger = logging.getLogger(__name__)
 
 # 创建路由
-router = APIRouter(prefix="/api/settings", tags=["用户设置"])
+router = APIRouter(prefix="/api/settings", tags=["用户设置"], route_class=TimedRoute)
 
 
 @router.get("", response_model=BaseResponse)
@@ -39,8 +40,8 @@ async def get_user_settings(
     user_id = current_user["user_id"]
     
     try:
-        with pool.get_connection() as conn:
-            cursor = conn.execute(
+        async with pool.acquire() as conn:
+            cursor = await conn.execute(
                 """
                 SELECT id, userId, deepseek_api_key, deepseek_model, deepseek_temperature,
                        deepseek_max_tokens, dark_mode, auto_backup_enabled, auto_backup_interval,
@@ -52,21 +53,21 @@ async def get_user_settings(
                 """,
                 (user_id,)
             )
-            row = cursor.fetchone()
+            row = await cursor.fetchone()
             
             if row is None:
                 # 如果用户设置不存在，创建默认设置
-                cursor = conn.execute(
+                cursor = await conn.execute(
                     """
                     INSERT INTO user_settings (userId, created_at, updated_at)
                     VALUES (?, datetime('now'), datetime('now'))
                     """,
                     (user_id,)
                 )
-                conn.commit()
+                await conn.commit()
                 
                 # 再次查询
-                cursor = conn.execute(
+                cursor = await conn.execute(
                     """
                     SELECT id, userId, deepseek_api_key, deepseek_model, deepseek_temperature,
                            deepseek_max_tokens, dark_mode, auto_backup_enabled, auto_backup_interval,
@@ -78,7 +79,7 @@ async def get_user_settings(
                     """,
                     (user_id,)
                 )
-                row = cursor.fetchone()
+                row = await cursor.fetchone()
             
             settings = UserSettingsResponse(
                 id=row[0],
@@ -132,24 +133,24 @@ async def update_user_settings(
     user_id = current_user["user_id"]
     
     try:
-        with pool.get_connection() as conn:
+        async with pool.acquire() as conn:
             # 检查用户设置是否存在
-            cursor = conn.execute(
+            cursor = await conn.execute(
                 "SELECT id FROM user_settings WHERE userId = ?",
                 (user_id,)
             )
-            existing = cursor.fetchone()
+            existing = await cursor.fetchone()
             
             if existing is None:
                 # 如果不存在，先创建
-                cursor = conn.execute(
+                cursor = await conn.execute(
                     """
                     INSERT INTO user_settings (userId, created_at, updated_at)
                     VALUES (?, datetime('now'), datetime('now'))
                     """,
                     (user_id,)
                 )
-                conn.commit()
+                await conn.commit()
             
             # 构建更新字段
             update_fields = []
@@ -217,11 +218,11 @@ async def update_user_settings(
                 SET {', '.join(update_fields)}
                 WHERE userId = ?
             """
-            conn.execute(update_sql, tuple(update_values))
-            conn.commit()
+            await conn.execute(update_sql, tuple(update_values))
+            await conn.commit()
             
             # 获取更新后的设置
-            cursor = conn.execute(
+            cursor = await conn.execute(
                 """
                 SELECT id, userId, deepseek_api_key, deepseek_model, deepseek_temperature,
                        deepseek_max_tokens, dark_mode, auto_backup_enabled, auto_backup_interval,
@@ -233,7 +234,7 @@ async def update_user_settings(
                 """,
                 (user_id,)
             )
-            row = cursor.fetchone()
+            row = await cursor.fetchone()
             
             settings = UserSettingsResponse(
                 id=row[0],
@@ -296,21 +297,21 @@ async def import_data(
     user_id = current_user["user_id"]
     
     try:
-        with pool.get_connection() as conn:
+        async with pool.acquire() as conn:
             # 在事务中执行数据导入
-            conn.execute("BEGIN")
+            await conn.execute("BEGIN")
             
             try:
                 # 1. 删除当前用户的所有业务数据（不包括 user_settings）
-                conn.execute("DELETE FROM remittance WHERE userId = ?", (user_id,))
-                conn.execute("DELETE FROM income WHERE userId = ?", (user_id,))
-                conn.execute("DELETE FROM returns WHERE userId = ?", (user_id,))
-                conn.execute("DELETE FROM sales WHERE userId = ?", (user_id,))
-                conn.execute("DELETE FROM purchases WHERE userId = ?", (user_id,))
-                conn.execute("DELETE FROM products WHERE userId = ?", (user_id,))
-                conn.execute("DELETE FROM employees WHERE userId = ?", (user_id,))
-                conn.execute("DELETE FROM customers WHERE userId = ?", (user_id,))
-                conn.execute("DELETE FROM suppliers WHERE userId = ?", (user_id,))
+                await conn.execute("DELETE FROM remittance WHERE userId = ?", (user_id,))
+                await conn.execute("DELETE FROM income WHERE userId = ?", (user_id,))
+                await conn.execute("DELETE FROM returns WHERE userId = ?", (user_id,))
+                await conn.execute("DELETE FROM sales WHERE userId = ?", (user_id,))
+                await conn.execute("DELETE FROM purchases WHERE userId = ?", (user_id,))
+                await conn.execute("DELETE FROM products WHERE userId = ?", (user_id,))
+                await conn.execute("DELETE FROM employees WHERE userId = ?", (user_id,))
+                await conn.execute("DELETE FROM customers WHERE userId = ?", (user_id,))
+                await conn.execute("DELETE FROM suppliers WHERE userId = ?", (user_id,))
                 
                 # 2. 创建 ID 映射表（旧ID -> 新ID）
                 supplier_id_map = {}
@@ -329,7 +330,7 @@ async def import_data(
                             'name': supplier_data.get('name', ''),
                             'note': supplier_data.get('note')
                         }
-                        cursor = conn.execute(
+                        cursor = await conn.execute(
                             """
                             INSERT INTO suppliers (userId, name, note, created_at, updated_at)
                             VALUES (?, ?, ?, datetime('now'), datetime('now'))
@@ -350,7 +351,7 @@ async def import_data(
                             'name': customer_data.get('name', ''),
                             'note': customer_data.get('note')
                         }
-                        cursor = conn.execute(
+                        cursor = await conn.execute(
                             """
                             INSERT INTO customers (userId, name, note, created_at, updated_at)
                             VALUES (?, ?, ?, datetime('now'), datetime('now'))
@@ -371,7 +372,7 @@ async def import_data(
                             'name': employee_data.get('name', ''),
                             'note': employee_data.get('note')
                         }
-                        cursor = conn.execute(
+                        cursor = await conn.execute(
                             """
                             INSERT INTO employees (userId, name, note, created_at, updated_at)
                             VALUES (?, ?, ?, datetime('now'), datetime('now'))
@@ -402,7 +403,7 @@ async def import_data(
                             if unit not in ['斤', '公斤', '袋']:
                                 unit = '公斤'
                         
-                        cursor = conn.execute(
+                        cursor = await conn.execute(
                             """
                             INSERT INTO products (userId, name, description, stock, unit, supplierId, version, created_at, updated_at)
                             VALUES (?, ?, ?, ?, ?, ?, 1, datetime('now'), datetime('now'))
@@ -435,7 +436,7 @@ async def import_data(
                         elif supplier_id and supplier_id not in supplier_id_map:
                             supplier_id = None
                         
-                        cursor = conn.execute(
+                        cursor = await conn.execute(
                             """
                             INSERT INTO purchases (userId, productName, quantity, purchaseDate, supplierId, totalPurchasePrice, note, created_at)
                             VALUES (?, ?, ?, ?, ?, ?, ?, datetime('now'))
@@ -463,7 +464,7 @@ async def import_data(
                         elif customer_id and customer_id not in customer_id_map:
                             customer_id = None
                         
-                        cursor = conn.execute(
+                        cursor = await conn.execute(
                             """
                             INSERT INTO sales (userId, productName, quantity, saleDate, customerId, totalSalePrice, note, created_at)
                             VALUES (?, ?, ?, ?, ?, ?, ?, datetime('now'))
@@ -491,7 +492,7 @@ async def import_data(
                         elif customer_id and customer_id not in customer_id_map:
                             customer_id = None
                         
-                        cursor = conn.execute(
+                        cursor = await conn.execute(
                             """
                             INSERT INTO returns (userId, productName, quantity, returnDate, customerId, totalReturnPrice, note, created_at)
                             VALUES (?, ?, ?, ?, ?, ?, ?, datetime('now'))
@@ -525,7 +526,7 @@ async def import_data(
                         elif employee_id and employee_id not in employee_id_map:
                             employee_id = None
                         
-                        cursor = conn.execute(
+                        cursor = await conn.execute(
                             """
                             INSERT INTO income (userId, incomeDate, customerId, amount, discount, employeeId, paymentMethod, note, created_at)
                             VALUES (?, ?, ?, ?, ?, ?, ?, ?, datetime('now'))
@@ -560,7 +561,7 @@ async def import_data(
                         elif employee_id and employee_id not in employee_id_map:
                             employee_id = None
                         
-                        cursor = conn.execute(
+                        cursor = await conn.execute(
                             """
                             INSERT INTO remittance (userId, remittanceDate, supplierId, amount, employeeId, paymentMethod, note, created_at)
                             VALUES (?, ?, ?, ?, ?, ?, ?, datetime('now'))
@@ -578,7 +579,7 @@ async def import_data(
                         remittance_count += 1
                 
                 # 提交事务
-                conn.execute("COMMIT")
+                await conn.execute("COMMIT")
                 
                 logger.info(f"数据导入成功: 用户 {user_id}, 供应商: {supplier_count}, 客户: {customer_count}, 员工: {employee_count}, 产品: {product_count}, 采购: {purchase_count}, 销售: {sale_count}, 退货: {return_count}, 进账: {income_count}, 汇款: {remittance_count}")
                 
@@ -602,7 +603,7 @@ async def import_data(
                 
             except Exception as e:
                 # 回滚事务
-                conn.execute("ROLLBACK")
+                await conn.execute("ROLLBACK")
                 raise e
                 
     except HTTPException:
@@ -23,18 +23,29 @@ from server.models import (
     PaginatedResponse
 )
 from server.services.audit_log_service import AuditLogService
+from server.pagination import Keyset, SortColumn, fetch_page, page_count
+from server.timing import TimedRoute
 
 # 配置日志
 logger = logging.getLogger(__name__)
 
 # 创建路由
-router = APIRouter(prefix="/api/suppliers", tags=["供应商管理"])
+router = APIRouter(prefix="/api/suppliers", tags=["供应商管理"], route_class=TimedRoute)
+
+# 列表排序键（游标分页）
+SUPPLIERS_KEYSET = Keyset(
+    SortColumn("updated_at", nullable=True),
+    SortColumn("name", descending=False),
+    SortColumn("id", descending=False)
+)
 
 
 @router.get("", response_model=BaseResponse)
 async def get_suppliers(
     page: int = Query(1, ge=1, description="页码"),
     page_size: int = Query(20, ge=1, le=10000, description="每页数量（最大 10000）"),
+    cursor: Optional[str] = Query(None, description="分页游标（上一页返回的 next_cursor，提供时忽略 page）"),
+    include_total: bool = Query(False, description="使用游标时是否也返回总数（按页码查询时总是返回，无限滚动不需要）"),
     search: Optional[str] = Query(None, description="搜索关键词（供应商名称或备注）"),
     workspace_id: Optional[int] = Header(None, alias="X-Workspace-ID"),
     current_user: dict = Depends(get_current_user)
@@ -45,6 +56,8 @@ async def get_suppliers(
     Args:
         page: 页码
         page_size: 每页数量
+        cursor: 分页游标
+        include_total: 使用游标时是否也返回总数
         search: 搜索关键词
         workspace_id: Workspace ID（可选，如果提供则只查询该workspace的数据）
         current_user: 当前用户信息
@@ -52,11 +65,12 @@ async def get_suppliers(
     Returns:
         供应商列表（分页）
     """
+    cursor_values = SUPPLIERS_KEYSET.decode(cursor)
     pool = get_pool()
     user_id = current_user["user_id"]
     
     try:
-        with pool.get_connection() as conn:
+        async with pool.acquire(readonly=True) as conn:
             # 构建查询条件
             # 如果提供了workspace_id，使用workspace过滤；否则使用userId过滤（向后兼容）
             if workspace_id is not None:
@@ -84,29 +98,23 @@ async def get_suppliers(
             
             where_clause = " AND ".join(where_conditions)
             
-            # 获取总数
-            count_cursor = conn.execute(
-                f"SELECT COUNT(*) FROM suppliers WHERE {where_clause}",
-                tuple(params)
-            )
-            total = count_cursor.fetchone()[0]
-            
-            # 计算分页
-            offset = (page - 1) * page_size
-            total_pages = (total + page_size - 1) // page_size
-            
-            # 获取供应商列表
-            cursor = conn.execute(
-                f"""
-                SELECT id, userId, name, note, created_at, updated_at
-                FROM suppliers
-                WHERE {where_clause}
-                ORDER BY updated_at DESC, name ASC
-                LIMIT ? OFFSET ?
+            # 获取供应商列表（提供游标时从游标之后开始，不使用 OFFSET）
+            rows, next_cursor, total = await fetch_page(
+                conn,
+                "suppliers",
+                """
+                id, userId, name, note, created_at, updated_at
                 """,
-                tuple(params) + (page_size, offset)
+                where_clause,
+                params,
+                SUPPLIERS_KEYSET,
+                cursor_values,
+                page,
+                page_size,
+                include_total=include_total,
+                # 只按 workspace 过滤时，总数读取触发器维护的行数
+                workspace_id=workspace_id if len(where_conditions) == 1 and workspace_id is not None else None
             )
-            rows = cursor.fetchall()
             
             # 转换为响应模型
             suppliers = []
@@ -126,7 +134,8 @@ async def get_suppliers(
                 total=total,
                 page=page,
                 page_size=page_size,
-                total_pages=total_pages
+                total_pages=page_count(total, page_size),
+                next_cursor=next_cursor
             )
             
             return BaseResponse(
@@ -172,9 +181,9 @@ async def get_all_suppliers(
             )
     
     try:
-        with pool.get_connection() as conn:
+        async with pool.acquire(readonly=True) as conn:
             if workspace_id is not None:
-                cursor = conn.execute(
+                cursor = await conn.execute(
                     """
                     SELECT id, userId, name, note, created_at, updated_at
                     FROM suppliers
@@ -184,7 +193,7 @@ async def get_all_suppliers(
                     (workspace_id,)
                 )
             else:
-                cursor = conn.execute(
+                cursor = await conn.execute(
                     """
                     SELECT id, userId, name, note, created_at, updated_at
                     FROM suppliers
@@ -193,7 +202,7 @@ async def get_all_suppliers(
                     """,
                     (user_id,)
                 )
-            rows = cursor.fetchall()
+            rows = await cursor.fetchall()
             
             suppliers = []
             for row in rows:
@@ -242,7 +251,7 @@ async def get_supplier(
     user_id = current_user["user_id"]
     
     try:
-        with pool.get_connection() as conn:
+        async with pool.acquire(readonly=True) as conn:
             # 构建查询条件
             if workspace_id is not None:
                 # 检查是否为服务器存储类型（本地 workspace 的业务数据存储在客户端）
@@ -261,7 +270,7 @@ async def get_supplier(
                 where_clause = "id = ? AND userId = ?"
                 params = (supplier_id, user_id)
             
-            cursor = conn.execute(
+            cursor = await conn.execute(
                 f"""
                 SELECT id, userId, name, note, created_at, updated_at
                 FROM suppliers
@@ -269,7 +278,7 @@ async def get_supplier(
                 """,
                 params
             )
-            row = cursor.fetchone()
+            row = await cursor.fetchone()
             
             if row is None:
                 raise HTTPException(
@@ -323,24 +332,25 @@ async def create_supplier(
     user_id = current_user["user_id"]
     
     try:
-        with pool.get_connection() as conn:
-            # 如果提供了workspace_id，检查权限
+        # 如果提供了workspace_id，检查权限
+        if workspace_id is not None:
+            # 检查是否为服务器存储类型（本地 workspace 的业务数据存储在供应商端）
+            await require_server_storage(workspace_id, user_id)
+            # 检查创建权限
+            can_create = await check_workspace_permission(workspace_id, user_id, 'create')
+            if not can_create:
+                raise HTTPException(
+                    status_code=status.HTTP_403_FORBIDDEN,
+                    detail="无创建权限"
+                )
+        
+        def _insert_supplier(conn):
             if workspace_id is not None:
-                # 检查是否为服务器存储类型（本地 workspace 的业务数据存储在客户端）
-                await require_server_storage(workspace_id, user_id)
-                # 检查创建权限
-                can_create = await check_workspace_permission(workspace_id, user_id, 'create')
-                if not can_create:
-                    raise HTTPException(
-                        status_code=status.HTTP_403_FORBIDDEN,
-                        detail="无创建权限"
-                    )
                 # 检查同一workspace下供应商名称是否已存在
-                cursor = conn.execute(
+                existing = conn.execute(
                     "SELECT id FROM suppliers WHERE workspaceId = ? AND name = ?",
                     (workspace_id, supplier_data.name)
-                )
-                existing = cursor.fetchone()
+                ).fetchone()
                 
                 if existing:
                     raise HTTPException(
@@ -364,11 +374,10 @@ async def create_supplier(
             else:
                 # 向后兼容：不设置workspaceId
                 # 检查同一用户下供应商名称是否已存在
-                cursor = conn.execute(
+                existing = conn.execute(
                     "SELECT id FROM suppliers WHERE userId = ? AND name = ?",
                     (user_id, supplier_data.name)
-                )
-                existing = cursor.fetchone()
+                ).fetchone()
                 
                 if existing:
                     raise HTTPException(
@@ -388,51 +397,52 @@ async def create_supplier(
                         supplier_data.note
                     )
                 )
-            supplier_id = cursor.lastrowid
-            conn.commit()
             
             # 获取创建的供应商
-            cursor = conn.execute(
+            return conn.execute(
                 """
                 SELECT id, userId, name, note, created_at, updated_at
                 FROM suppliers
                 WHERE id = ?
                 """,
-                (supplier_id,)
-            )
-            row = cursor.fetchone()
-            
-            supplier = SupplierResponse(
-                id=row[0],
-                userId=row[1],
-                name=row[2],
-                note=row[3],
-                created_at=row[4],
-                updated_at=row[5]
-            )
-            
-            logger.info(f"创建供应商成功: {supplier_data.name} (ID: {supplier_id}, 用户: {user_id})")
-            
-            # 记录操作日志
-            try:
-                AuditLogService.log_create(
-                    user_id=user_id,
-                    username=current_user.get("username", "unknown"),
-                    entity_type="supplier",
-                    entity_id=supplier_id,
-                    entity_name=supplier_data.name,
-                    new_data=supplier.model_dump(),
-                    workspace_id=workspace_id
-                )
-            except Exception as e:
-                logger.warning(f"记录供应商创建日志失败: {e}")
-            
-            return BaseResponse(
-                success=True,
-                message="创建供应商成功",
-                data=supplier.model_dump()
+                (cursor.lastrowid,)
+            ).fetchone()
+        
+        # 单行创建走组提交，与并发的小写事务合并为一次提交
+        row = await pool.group_commit(_insert_supplier)
+        supplier_id = row[0]
+        
+        supplier = SupplierResponse(
+            id=row[0],
+            userId=row[1],
+            name=row[2],
+            note=row[3],
+            created_at=row[4],
+            updated_at=row[5]
+        )
+        
+        logger.info(f"创建供应商成功: {supplier_data.name} (ID: {supplier_id}, 用户: {user_id})")
+        
+        # 记录操作日志
+        try:
+            await AuditLogService.log_create(
+                user_id=user_id,
+                username=current_user.get("username", "unknown"),
+                entity_type="supplier",
+                entity_id=supplier_id,
+                entity_name=supplier_data.name,
+                new_data=supplier.model_dump(),
+                workspace_id=workspace_id
             )
-            
+        except Exception as e:
+            logger.warning(f"记录供应商创建日志失败: {e}")
+        
+        return BaseResponse(
+            success=True,
+            message="创建供应商成功",
+            data=supplier.model_dump()
+        )
+        
     except HTTPException:
         raise
     except Exception as e:
@@ -466,7 +476,7 @@ async def update_supplier(
     user_id = current_user["user_id"]
     
     try:
-        with pool.get_connection() as conn:
+        async with pool.acquire() as conn:
             # 构建查询条件
             if workspace_id is not None:
                 # 检查是否为服务器存储类型（本地 workspace 的业务数据存储在客户端）
@@ -486,7 +496,7 @@ async def update_supplier(
                 params = (supplier_id, user_id)
             
             # 获取当前供应商完整信息用于日志记录
-            cursor = conn.execute(
+            cursor = await conn.execute(
                 f"""
                 SELECT id, userId, name, note, created_at, updated_at
                 FROM suppliers
@@ -494,7 +504,7 @@ async def update_supplier(
                 """,
                 params
             )
-            row = cursor.fetchone()
+            row = await cursor.fetchone()
             
             if row is None:
                 raise HTTPException(
@@ -515,16 +525,16 @@ async def update_supplier(
             # 检查供应商名称唯一性（如果修改了名称）
             if supplier_data.name and supplier_data.name != row[2]:
                 if workspace_id is not None:
-                    name_cursor = conn.execute(
+                    name_cursor = await conn.execute(
                         "SELECT id FROM suppliers WHERE workspaceId = ? AND name = ? AND id != ?",
                         (workspace_id, supplier_data.name, supplier_id)
                     )
                 else:
-                    name_cursor = conn.execute(
+                    name_cursor = await conn.execute(
                         "SELECT id FROM suppliers WHERE userId = ? AND name = ? AND id != ?",
                         (user_id, supplier_data.name, supplier_id)
                     )
-                if name_cursor.fetchone():
+                if await name_cursor.fetchone():
                     raise HTTPException(
                         status_code=status.HTTP_400_BAD_REQUEST,
                         detail=f"供应商名称 '{supplier_data.name}' 已存在"
@@ -568,11 +578,11 @@ async def update_supplier(
                 """
                 update_values.append(user_id)
             
-            conn.execute(update_sql, tuple(update_values))
-            conn.commit()
+            await conn.execute(update_sql, tuple(update_values))
+            await conn.commit()
             
             # 获取更新后的供应商
-            cursor = conn.execute(
+            cursor = await conn.execute(
                 """
                 SELECT id, userId, name, note, created_at, updated_at
                 FROM suppliers
@@ -580,7 +590,7 @@ async def update_supplier(
                 """,
                 (supplier_id,)
             )
-            row = cursor.fetchone()
+            row = await cursor.fetchone()
             
             supplier = SupplierResponse(
                 id=row[0],
@@ -595,7 +605,7 @@ async def update_supplier(
             
             # 记录操作日志
             try:
-                AuditLogService.log_update(
+                await AuditLogService.log_update(
                     user_id=user_id,
                     username=current_user.get("username", "unknown"),
                     entity_type="supplier",
@@ -647,7 +657,7 @@ async def delete_supplier(
     user_id = current_user["user_id"]
     
     try:
-        with pool.get_connection() as conn:
+        async with pool.acquire() as conn:
             # 构建查询条件
             if workspace_id is not None:
                 # 检查是否为服务器存储类型（本地 workspace 的业务数据存储在客户端）
@@ -667,7 +677,7 @@ async def delete_supplier(
                 params = (supplier_id, user_id)
             
             # 获取供应商完整信息用于日志记录
-            cursor = conn.execute(
+            cursor = await conn.execute(
                 f"""
                 SELECT id, userId, name, note, created_at, updated_at
                 FROM suppliers
@@ -675,7 +685,7 @@ async def delete_supplier(
                 """,
                 params
             )
-            row = cursor.fetchone()
+            row = await cursor.fetchone()
             
             if row is None:
                 raise HTTPException(
@@ -695,17 +705,17 @@ async def delete_supplier(
             supplier_name = row[2]
             
             # 删除供应商（外键约束会自动将相关记录的 supplierId 设置为 NULL）
-            conn.execute(
+            await conn.execute(
                 f"DELETE FROM suppliers WHERE {where_clause}",
                 params
             )
-            conn.commit()
+            await conn.commit()
             
             logger.info(f"删除供应商成功: {supplier_name} (ID: {supplier_id}, 用户: {user_id})")
             
             # 记录操作日志
             try:
-                AuditLogService.log_delete(
+                await AuditLogService.log_delete(
                     user_id=user_id,
                     username=current_user.get("username", "unknown"),
                     entity_type="supplier",
@@ -763,10 +773,10 @@ async def search_all_suppliers(
             )
     
     try:
-        with pool.get_connection() as conn:
+        async with pool.acquire(readonly=True) as conn:
             search_pattern = f"%{search}%"
             if workspace_id is not None:
-                cursor = conn.execute(
+                cursor = await conn.execute(
                     """
                     SELECT id, userId, name, note, created_at, updated_at
                     FROM suppliers
@@ -777,7 +787,7 @@ async def search_all_suppliers(
                     (workspace_id, search_pattern, search_pattern)
                 )
             else:
-                cursor = conn.execute(
+                cursor = await conn.execute(
                     """
                     SELECT id, userId, name, note, created_at, updated_at
                     FROM suppliers
@@ -787,7 +797,7 @@ async def search_all_suppliers(
                     """,
                     (user_id, search_pattern, search_pattern)
                 )
-            rows = cursor.fetchall()
+            rows = await cursor.fetchall()
             
             suppliers = []
             for row in rows:
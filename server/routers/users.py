@@ -16,12 +16,13 @@ from server.models import (
     BaseResponse,
     ErrorResponse
 )
+from server.timing import TimedRoute
 
 # 配置日志
 logger = logging.getLogger(__name__)
 
 # 创建路由
-router = APIRouter(prefix="/api/users", tags=["用户状态"])
+router = APIRouter(prefix="/api/users", tags=["用户状态"], route_class=TimedRoute)
 
 # 在线用户超时时间（秒），超过此时间未心跳视为离线
 # 设置为心跳间隔的 3 倍（心跳间隔 10 秒，超时 30 秒），确保有足够的容错时间
@@ -55,29 +56,20 @@ async def update_heartbeat(
     device_name = action_data.device_name if action_data and action_data.device_name else None
     
     try:
-        with pool.get_connection() as conn:
+        def _upsert_heartbeat(conn):
             # 更新或插入在线用户记录（支持多设备）
             # 使用 INSERT OR REPLACE 会替换整行，确保 device_name 也被更新
             # 注意：SQLite 的 INSERT OR REPLACE 需要所有字段，否则会丢失未指定的字段
-            # 所以我们需要先检查记录是否存在，如果存在则更新，否则插入
+            # 所以先尝试更新现有记录，没有命中再插入
             cursor = conn.execute(
-                "SELECT userId, deviceId FROM online_users WHERE userId = ? AND deviceId = ?",
-                (user_id, device_id)
+                """
+                UPDATE online_users 
+                SET username = ?, last_heartbeat = datetime('now'), current_action = ?, platform = ?, device_name = ?
+                WHERE userId = ? AND deviceId = ?
+                """,
+                (username, current_action, platform, device_name, user_id, device_id)
             )
-            existing = cursor.fetchone()
-            
-            if existing:
-                # 更新现有记录
-                conn.execute(
-                    """
-                    UPDATE online_users 
-                    SET username = ?, last_heartbeat = datetime('now'), current_action = ?, platform = ?, device_name = ?
-                    WHERE userId = ? AND deviceId = ?
-                    """,
-                    (username, current_action, platform, device_name, user_id, device_id)
-                )
-            else:
-                # 插入新记录
+            if cursor.rowcount == 0:
                 conn.execute(
                     """
                     INSERT INTO online_users (userId, deviceId, username, last_heartbeat, current_action, platform, device_name)
@@ -85,15 +77,17 @@ async def update_heartbeat(
                     """,
                     (user_id, device_id, username, current_action, platform, device_name)
                 )
-            conn.commit()
-            
-            logger.info(f"用户心跳更新: {username} (ID: {user_id}), deviceId={device_id}, device_name={device_name}, platform={platform}, 操作: {current_action}")
-            
-            return BaseResponse(
-                success=True,
-                message="心跳更新成功"
-            )
-            
+        
+        # 心跳频率高、写入量小，走组提交与其他设备的心跳合并为一次提交
+        await pool.group_commit(_upsert_heartbeat)
+        
+        logger.debug(f"用户心跳更新: {username} (ID: {user_id}), deviceId={device_id}, device_name={device_name}, platform={platform}, 操作: {current_action}")
+        
+        return BaseResponse(
+            success=True,
+            message="心跳更新成功"
+        )
+        
     except Exception as e:
         logger.error(f"更新心跳失败: {e}", exc_info=True)
         raise HTTPException(
@@ -121,14 +115,14 @@ async def get_online_users(
     current_user_id = current_user["user_id"]
     
     try:
-        with pool.get_connection() as conn:
+        async with pool.acquire() as conn:
             # 先清理过期的在线用户
-            _cleanup_expired_users(conn)
+            await _cleanup_expired_users(conn)
             
             # 查询当前账号的所有在线设备（在超时时间内的）
             # 使用 SQLite 的 datetime 函数计算超时阈值
             # 只返回当前用户ID的在线设备
-            cursor = conn.execute(
+            cursor = await conn.execute(
                 """
                 SELECT userId, deviceId, username, last_heartbeat, current_action, platform, device_name
                 FROM online_users
@@ -137,7 +131,7 @@ async def get_online_users(
                 """,
                 (current_user_id, ONLINE_TIMEOUT_SECONDS)
             )
-            rows = cursor.fetchall()
+            rows = await cursor.fetchall()
             
             # 转换为响应模型
             online_users = []
@@ -158,10 +152,10 @@ async def get_online_users(
                 # 使用 model_dump(exclude_none=False) 确保即使值为 None 也包含字段
                 user_dict = online_user.model_dump(exclude_none=False, mode='json')
                 # 调试：打印设备名称（使用 INFO 级别以便在生产环境也能看到）
-                logger.info(f"在线设备: deviceId={user_dict.get('deviceId')}, device_name={user_dict.get('device_name')}, platform={user_dict.get('platform')}, row[6]={row[6] if len(row) > 6 else 'N/A'}")
+                logger.debug(f"在线设备: deviceId={user_dict.get('deviceId')}, device_name={user_dict.get('device_name')}, platform={user_dict.get('platform')}, row[6]={row[6] if len(row) > 6 else 'N/A'}")
                 online_users.append(user_dict)
             
-            logger.info(f"获取在线设备列表: 用户 {current_user_id} 有 {len(online_users)} 个设备在线")
+            logger.debug(f"获取在线设备列表: 用户 {current_user_id} 有 {len(online_users)} 个设备在线")
             
             return BaseResponse(
                 success=True,
@@ -199,21 +193,21 @@ async def get_online_users_count(
     current_user_id = current_user["user_id"]
     
     try:
-        with pool.get_connection() as conn:
+        async with pool.acquire() as conn:
             # 先清理过期的在线用户
-            _cleanup_expired_users(conn)
+            await _cleanup_expired_users(conn)
             
             # 统计当前账号的在线设备数量
-            cursor = conn.execute(
+            cursor = await conn.execute(
                 """
                 SELECT COUNT(*) FROM online_users
                 WHERE userId = ? AND datetime(last_heartbeat) > datetime('now', '-' || ? || ' seconds')
                 """,
                 (current_user_id, ONLINE_TIMEOUT_SECONDS)
             )
-            count = cursor.fetchone()[0]
+            count = (await cursor.fetchone())[0]
             
-            logger.info(f"获取在线设备数量: 用户 {current_user_id} 有 {count} 个设备在线")
+            logger.debug(f"获取在线设备数量: 用户 {current_user_id} 有 {count} 个设备在线")
             
             return BaseResponse(
                 success=True,
@@ -251,9 +245,9 @@ async def update_current_action(
     username = current_user["username"]
     
     try:
-        with pool.get_connection() as conn:
+        async with pool.acquire() as conn:
             # 更新当前操作，同时更新心跳时间
-            conn.execute(
+            await conn.execute(
                 """
                 UPDATE online_users
                 SET current_action = ?, last_heartbeat = datetime('now')
@@ -264,7 +258,7 @@ async def update_current_action(
             
             # 如果用户不在在线列表中，添加进去
             if conn.total_changes == 0:
-                conn.execute(
+                await conn.execute(
                     """
                     INSERT OR REPLACE INTO online_users (userId, username, last_heartbeat, current_action)
                     VALUES (?, ?, datetime('now'), ?)
@@ -272,7 +266,7 @@ async def update_current_action(
                     (user_id, username, action_data.current_action)
                 )
             
-            conn.commit()
+            await conn.commit()
             
             logger.debug(f"更新用户操作: {username} (ID: {user_id}) - {action_data.current_action}")
             
@@ -308,9 +302,9 @@ async def clear_current_action(
     user_id = current_user["user_id"]
     
     try:
-        with pool.get_connection() as conn:
+        async with pool.acquire() as conn:
             # 清除操作描述，但保持在线状态
-            conn.execute(
+            await conn.execute(
                 """
                 UPDATE online_users
                 SET current_action = NULL, last_heartbeat = datetime('now')
@@ -318,7 +312,7 @@ async def clear_current_action(
                 """,
                 (user_id,)
             )
-            conn.commit()
+            await conn.commit()
             
             logger.debug(f"清除用户操作: {user_id}")
             
@@ -353,8 +347,8 @@ async def cleanup_expired_users(
     pool = get_pool()
     
     try:
-        with pool.get_connection() as conn:
-            deleted_count = _cleanup_expired_users(conn)
+        async with pool.acquire() as conn:
+            deleted_count = await _cleanup_expired_users(conn)
             
             logger.info(f"清理过期在线用户: 删除了 {deleted_count} 条记录")
             
@@ -372,7 +366,7 @@ async def cleanup_expired_users(
         )
 
 
-def _cleanup_expired_users(conn) -> int:
+async def _cleanup_expired_users(conn) -> int:
     """
     清理过期的在线用户记录（内部函数）
     
@@ -384,7 +378,7 @@ def _cleanup_expired_users(conn) -> int:
     """
     try:
         # 使用 SQLite 的 datetime 函数计算超时阈值
-        cursor = conn.execute(
+        cursor = await conn.execute(
             """
             DELETE FROM online_users
             WHERE datetime(last_heartbeat) <= datetime('now', '-' || ? || ' seconds')
@@ -392,7 +386,7 @@ def _cleanup_expired_users(conn) -> int:
             (ONLINE_TIMEOUT_SECONDS,)
         )
         deleted_count = cursor.rowcount
-        conn.commit()
+        await conn.commit()
         return deleted_count
     except Exception as e:
         logger.error(f"清理过期用户时出错: {e}")
@@ -417,12 +411,12 @@ async def get_user_online_status(
     pool = get_pool()
     
     try:
-        with pool.get_connection() as conn:
+        async with pool.acquire() as conn:
             # 先清理过期的在线用户
-            _cleanup_expired_users(conn)
+            await _cleanup_expired_users(conn)
             
             # 查询指定用户的在线状态
-            cursor = conn.execute(
+            cursor = await conn.execute(
                 """
                 SELECT userId, username, last_heartbeat, current_action
                 FROM online_users
@@ -430,7 +424,7 @@ async def get_user_online_status(
                 """,
                 (user_id,)
             )
-            row = cursor.fetchone()
+            row = await cursor.fetchone()
             
             if row is None:
                 return BaseResponse(
@@ -443,7 +437,7 @@ async def get_user_online_status(
                 )
             
             # 检查是否在超时时间内（使用 SQLite 函数）
-            cursor_check = conn.execute(
+            cursor_check = await conn.execute(
                 """
                 SELECT CASE 
                     WHEN datetime(last_heartbeat) > datetime('now', '-' || ? || ' seconds')
@@ -453,7 +447,7 @@ async def get_user_online_status(
                 """,
                 (ONLINE_TIMEOUT_SECONDS, user_id)
             )
-            check_result = cursor_check.fetchone()
+            check_result = await cursor_check.fetchone()
             is_online = check_result[0] == 1 if check_result else False
             
             if is_online:
@@ -473,8 +467,8 @@ async def get_user_online_status(
                 )
             else:
                 # 用户已超时，删除记录
-                conn.execute("DELETE FROM online_users WHERE userId = ?", (user_id,))
-                conn.commit()
+                await conn.execute("DELETE FROM online_users WHERE userId = ?", (user_id,))
+                await conn.commit()
                 
                 return BaseResponse(
                     success=True,
@@ -16,9 +16,11 @@ from server.middleware.workspace_permission import (
     check_workspace_permission,
     get_workspace_role,
     get_workspace_storage_type,
+    invalidate_workspace_access,
     PERMISSIONS
 )
 from server.services.audit_log_service import AuditLogService
+from server.services.db_maintenance import notify_bulk_change
 from server.models import (
     WorkspaceCreate,
     WorkspaceUpdate,
@@ -31,12 +33,13 @@ from server.models import (
     PaginatedResponse,
     ImportDataRequest
 )
+from server.timing import TimedRoute
 
 # 配置日志
 logger = logging.getLogger(__name__)
 
 # 创建路由
-router = APIRouter(prefix="/api/workspaces", tags=["Workspace管理"])
+router = APIRouter(prefix="/api/workspaces", tags=["Workspace管理"], route_class=TimedRoute)
 
 
 @router.get("", response_model=BaseResponse)
@@ -53,10 +56,10 @@ async def get_workspaces(
     user_id = current_user["user_id"]
     
     try:
-        with pool.get_connection() as conn:
+        async with pool.acquire(readonly=True) as conn:
             # 查询用户拥有的和参与的 workspace
             # 注意：只返回服务器 workspace（storage_type='server'），本地 workspace 的数据存储在客户端，不应在服务器返回
-            cursor = conn.execute('''
+            cursor = await conn.execute('''
                 SELECT DISTINCT w.id, w.name, w.description, w.ownerId, w.storage_type, 
                        w.is_shared, w.created_at, w.updated_at
                 FROM workspaces w
@@ -64,7 +67,7 @@ async def get_workspaces(
                 WHERE (w.ownerId = ? OR wm.userId = ?) AND w.storage_type = 'server'
                 ORDER BY w.created_at DESC
             ''', (user_id, user_id))
-            rows = cursor.fetchall()
+            rows = await cursor.fetchall()
             
             workspaces = []
             for row in rows:
@@ -112,9 +115,9 @@ async def create_workspace(
     user_id = current_user["user_id"]
     
     try:
-        with pool.get_connection() as conn:
+        async with pool.acquire() as conn:
             # 创建 workspace
-            cursor = conn.execute('''
+            cursor = await conn.execute('''
                 INSERT INTO workspaces (name, description, ownerId, storage_type, is_shared, created_at, updated_at)
                 VALUES (?, ?, ?, ?, 0, datetime('now'), datetime('now'))
             ''', (
@@ -130,14 +133,14 @@ async def create_workspace(
             # 只有服务器 workspace 才需要创建成员记录，但 owner 不需要添加
             # （如果添加了 owner 到 workspace_members，会导致在成员列表中显示两次）
             
-            conn.commit()
+            await conn.commit()
             
             # 获取创建的 workspace
-            cursor = conn.execute(
+            cursor = await conn.execute(
                 "SELECT id, name, description, ownerId, storage_type, is_shared, created_at, updated_at FROM workspaces WHERE id = ?",
                 (workspace_id,)
             )
-            row = cursor.fetchone()
+            row = await cursor.fetchone()
             
             workspace = WorkspaceResponse(
                 id=row[0],
@@ -184,12 +187,12 @@ async def get_workspace(
     user_id = current_user["user_id"]
     
     try:
-        with pool.get_connection() as conn:
-            cursor = conn.execute(
+        async with pool.acquire(readonly=True) as conn:
+            cursor = await conn.execute(
                 "SELECT id, name, description, ownerId, storage_type, is_shared, created_at, updated_at FROM workspaces WHERE id = ?",
                 (workspace_id,)
             )
-            row = cursor.fetchone()
+            row = await cursor.fetchone()
             
             if not row:
                 raise HTTPException(
@@ -269,7 +272,7 @@ async def update_workspace(
         )
     
     try:
-        with pool.get_connection() as conn:
+        async with pool.acquire() as conn:
             # 检查是否为本地 workspace（本地 workspace 不能设置为共享）
             storage_type = await get_workspace_storage_type(workspace_id)
             if storage_type == 'local' and workspace_data.is_shared == True:
@@ -303,18 +306,19 @@ async def update_workspace(
             updates.append("updated_at = datetime('now')")
             params.append(workspace_id)
             
-            conn.execute(
+            await conn.execute(
                 f"UPDATE workspaces SET {', '.join(updates)} WHERE id = ?",
                 tuple(params)
             )
-            conn.commit()
+            await conn.commit()
+            invalidate_workspace_access(workspace_id)
             
             # 获取更新后的 workspace
-            cursor = conn.execute(
+            cursor = await conn.execute(
                 "SELECT id, name, description, ownerId, storage_type, is_shared, created_at, updated_at FROM workspaces WHERE id = ?",
                 (workspace_id,)
             )
-            row = cursor.fetchone()
+            row = await cursor.fetchone()
             
             workspace = WorkspaceResponse(
                 id=row[0],
@@ -359,64 +363,74 @@ async def delete_workspace(
     Returns:
         删除成功响应
     """
-    from server.middleware.core import verify_password
+    from server.middleware.core import verify_password_async
     
     pool = get_pool()
     user_id = current_user["user_id"]
     
     try:
-        with pool.get_connection() as conn:
+        async with pool.acquire(readonly=True) as conn:
             # 检查是否是 owner
-            cursor = conn.execute(
+            cursor = await conn.execute(
                 "SELECT ownerId FROM workspaces WHERE id = ?",
                 (workspace_id,)
             )
-            workspace = cursor.fetchone()
+            workspace = await cursor.fetchone()
             
-            if not workspace:
-                raise HTTPException(
-                    status_code=status.HTTP_404_NOT_FOUND,
-                    detail="Workspace 不存在"
-                )
-            
-            if workspace[0] != user_id:
-                raise HTTPException(
-                    status_code=status.HTTP_403_FORBIDDEN,
-                    detail="只有 Workspace 拥有者可以删除"
-                )
-            
-            # 验证密码
-            cursor = conn.execute(
+            # 查询用户密码
+            cursor = await conn.execute(
                 "SELECT password FROM users WHERE id = ?",
                 (user_id,)
             )
-            user = cursor.fetchone()
-            
-            if user is None:
-                raise HTTPException(
-                    status_code=status.HTTP_404_NOT_FOUND,
-                    detail="用户不存在"
-                )
-            
-            hashed_password = user[0]
-            
-            # 验证密码
-            if not verify_password(delete_data.password, hashed_password):
+            user = await cursor.fetchone()
+        
+        if not workspace:
+            raise HTTPException(
+                status_code=status.HTTP_404_NOT_FOUND,
+                detail="Workspace 不存在"
+            )
+        
+        if workspace[0] != user_id:
+            raise HTTPException(
+                status_code=status.HTTP_403_FORBIDDEN,
+                detail="只有 Workspace 拥有者可以删除"
+            )
+        
+        if user is None:
+            raise HTTPException(
+                status_code=status.HTTP_404_NOT_FOUND,
+                detail="用户不存在"
+            )
+        
+        hashed_password = user[0]
+        
+        # 验证密码（在密码哈希线程池中执行，期间不占用数据库连接）
+        if not await verify_password_async(delete_data.password, hashed_password):
+            raise HTTPException(
+                status_code=status.HTTP_401_UNAUTHORIZED,
+                detail="密码不正确，无法删除 Workspace"
+            )
+        
+        async with pool.acquire() as conn:
+            # 删除 workspace（外键约束会自动删除相关数据）；验证密码期间所有权可能已转移，删除时再次限定 owner
+            cursor = await conn.execute(
+                "DELETE FROM workspaces WHERE id = ? AND ownerId = ?",
+                (workspace_id, user_id)
+            )
+            if cursor.rowcount == 0:
                 raise HTTPException(
-                    status_code=status.HTTP_401_UNAUTHORIZED,
-                    detail="密码不正确，无法删除 Workspace"
+                    status_code=status.HTTP_409_CONFLICT,
+                    detail="Workspace 已被删除或所有权已转移"
                 )
-            
-            # 删除 workspace（外键约束会自动删除相关数据）
-            conn.execute("DELETE FROM workspaces WHERE id = ?", (workspace_id,))
-            conn.commit()
-            
-            logger.info(f"用户 {current_user['username']} (ID: {user_id}) 删除 Workspace (ID: {workspace_id})")
-            
-            return BaseResponse(
-                success=True,
-                message="删除 Workspace 成功"
-            )
+            await conn.commit()
+        invalidate_workspace_access(workspace_id)
+        
+        logger.info(f"用户 {current_user['username']} (ID: {user_id}) 删除 Workspace (ID: {workspace_id})")
+        
+        return BaseResponse(
+            success=True,
+            message="删除 Workspace 成功"
+        )
     except HTTPException:
         raise
     except Exception as e:
@@ -462,15 +476,15 @@ async def get_workspace_members(
         )
     
     try:
-        with pool.get_connection() as conn:
+        async with pool.acquire(readonly=True) as conn:
             # 获取 owner
-            cursor = conn.execute('''
+            cursor = await conn.execute('''
                 SELECT w.id, w.ownerId, u.username
                 FROM workspaces w
                 JOIN users u ON w.ownerId = u.id
                 WHERE w.id = ?
             ''', (workspace_id,))
-            owner_row = cursor.fetchone()
+            owner_row = await cursor.fetchone()
             
             members = []
             if owner_row:
@@ -487,7 +501,7 @@ async def get_workspace_members(
             # 获取其他成员（包含邀请者用户名）
             # 注意：排除 role='owner' 的记录，因为 owner 已经通过 workspaces.ownerId 单独处理
             # 这样可以避免 owner 在成员列表中显示两次
-            cursor = conn.execute('''
+            cursor = await conn.execute('''
                 SELECT wm.id, wm.workspaceId, wm.userId, u.username, wm.role, wm.joined_at, 
                        wm.invited_by, inviter.username as invited_by_username
                 FROM workspace_members wm
@@ -495,7 +509,7 @@ async def get_workspace_members(
                 LEFT JOIN users inviter ON wm.invited_by = inviter.id
                 WHERE wm.workspaceId = ? AND wm.role != 'owner'
             ''', (workspace_id,))
-            rows = cursor.fetchall()
+            rows = await cursor.fetchall()
             
             for row in rows:
                 members.append({
@@ -567,15 +581,15 @@ async def invite_member(
         )
     
     try:
-        with pool.get_connection() as conn:
+        async with pool.acquire() as conn:
             # 如果提供了 userId，检查用户是否存在
             target_user_id = None
             if invite_data.userId:
-                cursor = conn.execute(
+                cursor = await conn.execute(
                     "SELECT id FROM users WHERE id = ?",
                     (invite_data.userId,)
                 )
-                user = cursor.fetchone()
+                user = await cursor.fetchone()
                 if not user:
                     raise HTTPException(
                         status_code=status.HTTP_404_NOT_FOUND,
@@ -584,11 +598,11 @@ async def invite_member(
                 target_user_id = invite_data.userId
             # 如果提供了 username，通过用户名查找用户
             elif invite_data.username:
-                cursor = conn.execute(
+                cursor = await conn.execute(
                     "SELECT id FROM users WHERE username = ?",
                     (invite_data.username,)
                 )
-                user = cursor.fetchone()
+                user = await cursor.fetchone()
                 if not user:
                     raise HTTPException(
                         status_code=status.HTTP_404_NOT_FOUND,
@@ -597,11 +611,11 @@ async def invite_member(
                 target_user_id = user[0]
                 
                 # 检查用户是否已经是成员
-                cursor = conn.execute(
+                cursor = await conn.execute(
                     "SELECT id FROM workspace_members WHERE workspaceId = ? AND userId = ?",
                     (workspace_id, target_user_id)
                 )
-                existing_member = cursor.fetchone()
+                existing_member = await cursor.fetchone()
                 if existing_member:
                     raise HTTPException(
                         status_code=status.HTTP_400_BAD_REQUEST,
@@ -609,11 +623,11 @@ async def invite_member(
                     )
                 
                 # 检查用户是否是 owner
-                cursor = conn.execute(
+                cursor = await conn.execute(
                     "SELECT id FROM workspaces WHERE id = ? AND ownerId = ?",
                     (workspace_id, target_user_id)
                 )
-                is_owner = cursor.fetchone()
+                is_owner = await cursor.fetchone()
                 if is_owner:
                     raise HTTPException(
                         status_code=status.HTTP_400_BAD_REQUEST,
@@ -623,7 +637,7 @@ async def invite_member(
             # 如果找到了用户ID（通过username或userId），直接添加为成员（不需要邀请流程）
             if target_user_id:
                 # 直接添加为成员
-                conn.execute('''
+                await conn.execute('''
                     INSERT INTO workspace_members 
                     (workspaceId, userId, role, invited_by, joined_at)
                     VALUES (?, ?, ?, ?, datetime('now'))
@@ -633,7 +647,8 @@ async def invite_member(
                     invite_data.role,
                     user_id
                 ))
-                conn.commit()
+                await conn.commit()
+                invalidate_workspace_access(workspace_id, target_user_id)
                 
                 return BaseResponse(
                     success=True,
@@ -647,7 +662,7 @@ async def invite_member(
                 expires_at = (datetime.now() + timedelta(days=7)).isoformat()
                 
                 # 创建邀请记录
-                conn.execute('''
+                await conn.execute('''
                     INSERT INTO workspace_invitations 
                     (workspaceId, email, userId, role, token, invited_by, expires_at, status, created_at)
                     VALUES (?, ?, ?, ?, ?, ?, ?, 'pending', datetime('now'))
@@ -660,7 +675,7 @@ async def invite_member(
                     user_id,
                     expires_at
                 ))
-                conn.commit()
+                await conn.commit()
                 
                 return BaseResponse(
                     success=True,
@@ -722,12 +737,12 @@ async def update_member_role(
         )
     
     # 不能修改 owner 的权限
-    with pool.get_connection() as conn:
-        cursor = conn.execute(
+    async with pool.acquire() as conn:
+        cursor = await conn.execute(
             "SELECT ownerId FROM workspaces WHERE id = ?",
             (workspace_id,)
         )
-        owner = cursor.fetchone()
+        owner = await cursor.fetchone()
         if owner and owner[0] == member_user_id:
             raise HTTPException(
                 status_code=status.HTTP_400_BAD_REQUEST,
@@ -735,25 +750,26 @@ async def update_member_role(
             )
     
     try:
-        with pool.get_connection() as conn:
+        async with pool.acquire() as conn:
             # 检查成员是否存在
-            cursor = conn.execute(
+            cursor = await conn.execute(
                 "SELECT id FROM workspace_members WHERE workspaceId = ? AND userId = ?",
                 (workspace_id, member_user_id)
             )
-            member = cursor.fetchone()
+            member = await cursor.fetchone()
             if not member:
                 raise HTTPException(
                     status_code=status.HTTP_404_NOT_FOUND,
                     detail="成员不存在"
                 )
             
-            conn.execute('''
+            await conn.execute('''
                 UPDATE workspace_members 
                 SET role = ? 
                 WHERE workspaceId = ? AND userId = ?
             ''', (update_data.role, workspace_id, member_user_id))
-            conn.commit()
+            await conn.commit()
+            invalidate_workspace_access(workspace_id, member_user_id)
             
             return BaseResponse(
                 success=True,
@@ -806,12 +822,12 @@ async def remove_member(
         )
     
     # 不能移除 owner
-    with pool.get_connection() as conn:
-        cursor = conn.execute(
+    async with pool.acquire() as conn:
+        cursor = await conn.execute(
             "SELECT ownerId FROM workspaces WHERE id = ?",
             (workspace_id,)
         )
-        owner = cursor.fetchone()
+        owner = await cursor.fetchone()
         if owner and owner[0] == member_user_id:
             raise HTTPException(
                 status_code=status.HTTP_400_BAD_REQUEST,
@@ -819,24 +835,25 @@ async def remove_member(
             )
     
     try:
-        with pool.get_connection() as conn:
+        async with pool.acquire() as conn:
             # 检查成员是否存在
-            cursor = conn.execute(
+            cursor = await conn.execute(
                 "SELECT id FROM workspace_members WHERE workspaceId = ? AND userId = ?",
                 (workspace_id, member_user_id)
             )
-            member = cursor.fetchone()
+            member = await cursor.fetchone()
             if not member:
                 raise HTTPException(
                     status_code=status.HTTP_404_NOT_FOUND,
                     detail="成员不存在"
                 )
             
-            conn.execute('''
+            await conn.execute('''
                 DELETE FROM workspace_members 
                 WHERE workspaceId = ? AND userId = ?
             ''', (workspace_id, member_user_id))
-            conn.commit()
+            await conn.commit()
+            invalidate_workspace_access(workspace_id, member_user_id)
             
             return BaseResponse(
                 success=True,
@@ -871,14 +888,14 @@ async def accept_invitation(
     user_id = current_user["user_id"]
     
     try:
-        with pool.get_connection() as conn:
+        async with pool.acquire() as conn:
             # 查找邀请记录
-            cursor = conn.execute('''
+            cursor = await conn.execute('''
                 SELECT id, workspaceId, userId, role, expires_at, status
                 FROM workspace_invitations
                 WHERE token = ?
             ''', (token,))
-            invitation = cursor.fetchone()
+            invitation = await cursor.fetchone()
             
             if not invitation:
                 raise HTTPException(
@@ -899,12 +916,12 @@ async def accept_invitation(
             if expires_at:
                 expires = datetime.fromisoformat(expires_at)
                 if datetime.now() > expires:
-                    conn.execute('''
+                    await conn.execute('''
                         UPDATE workspace_invitations 
                         SET status = 'expired' 
                         WHERE id = ?
                     ''', (inv_id,))
-                    conn.commit()
+                    await conn.commit()
                     raise HTTPException(
                         status_code=status.HTTP_400_BAD_REQUEST,
                         detail="邀请已过期"
@@ -918,11 +935,11 @@ async def accept_invitation(
                 )
             
             # 检查用户是否已经是成员
-            cursor = conn.execute('''
+            cursor = await conn.execute('''
                 SELECT id FROM workspace_members 
                 WHERE workspaceId = ? AND userId = ?
             ''', (workspace_id, user_id))
-            existing_member = cursor.fetchone()
+            existing_member = await cursor.fetchone()
             
             if existing_member:
                 raise HTTPException(
@@ -931,19 +948,20 @@ async def accept_invitation(
                 )
             
             # 添加成员
-            conn.execute('''
+            await conn.execute('''
                 INSERT INTO workspace_members (workspaceId, userId, role, joined_at)
                 VALUES (?, ?, ?, datetime('now'))
             ''', (workspace_id, user_id, role))
             
             # 更新邀请状态
-            conn.execute('''
+            await conn.execute('''
                 UPDATE workspace_invitations 
                 SET status = 'accepted' 
                 WHERE id = ?
             ''', (inv_id,))
             
-            conn.commit()
+            await conn.commit()
+            invalidate_workspace_access(workspace_id, user_id)
             
             return BaseResponse(
                 success=True,
@@ -999,8 +1017,8 @@ async def import_workspace_data(
                 detail="只有 Workspace 拥有者和管理员可以导入数据"
             )
         
-        with pool.get_connection() as conn:
-            conn.execute("BEGIN")
+        async with pool.acquire() as conn:
+            await conn.execute("BEGIN")
             
             try:
                 # 0. 在删除前，先获取当前数据作为 oldData（用于日志对比）
@@ -1013,25 +1031,25 @@ async def import_workspace_data(
                 tables = ['suppliers', 'customers', 'employees', 'products', 
                          'purchases', 'sales', 'returns', 'income', 'remittance']
                 for table in tables:
-                    cursor = conn.execute(
+                    cursor = await conn.execute(
                         f"SELECT COUNT(*) FROM {table} WHERE workspaceId = ?",
                         (workspace_id,)
                     )
-                    count = cursor.fetchone()[0]
+                    count = (await cursor.fetchone())[0]
                     old_data["import_counts"][table] = count
                 
                 old_data["total_count"] = sum(old_data["import_counts"].values())
                 
                 # 1. 删除该 workspace 的所有业务数据
-                conn.execute("DELETE FROM remittance WHERE workspaceId = ?", (workspace_id,))
-                conn.execute("DELETE FROM income WHERE workspaceId = ?", (workspace_id,))
-                conn.execute("DELETE FROM returns WHERE workspaceId = ?", (workspace_id,))
-                conn.execute("DELETE FROM sales WHERE workspaceId = ?", (workspace_id,))
-                conn.execute("DELETE FROM purchases WHERE workspaceId = ?", (workspace_id,))
-                conn.execute("DELETE FROM products WHERE workspaceId = ?", (workspace_id,))
-                conn.execute("DELETE FROM employees WHERE workspaceId = ?", (workspace_id,))
-                conn.execute("DELETE FROM customers WHERE workspaceId = ?", (workspace_id,))
-                conn.execute("DELETE FROM suppliers WHERE workspaceId = ?", (workspace_id,))
+                await conn.execute("DELETE FROM remittance WHERE workspaceId = ?", (workspace_id,))
+                await conn.execute("DELETE FROM income WHERE workspaceId = ?", (workspace_id,))
+                await conn.execute("DELETE FROM returns WHERE workspaceId = ?", (workspace_id,))
+                await conn.execute("DELETE FROM sales WHERE workspaceId = ?", (workspace_id,))
+                await conn.execute("DELETE FROM purchases WHERE workspaceId = ?", (workspace_id,))
+                await conn.execute("DELETE FROM products WHERE workspaceId = ?", (workspace_id,))
+                await conn.execute("DELETE FROM employees WHERE workspaceId = ?", (workspace_id,))
+                await conn.execute("DELETE FROM customers WHERE workspaceId = ?", (workspace_id,))
+                await conn.execute("DELETE FROM suppliers WHERE workspaceId = ?", (workspace_id,))
                 
                 # 2. 创建 ID 映射表
                 supplier_id_map = {}
@@ -1046,7 +1064,7 @@ async def import_workspace_data(
                 if 'suppliers' in data and data['suppliers']:
                     for supplier_data in data['suppliers']:
                         original_id = supplier_data.get('id')
-                        cursor = conn.execute(
+                        cursor = await conn.execute(
                             """
                             INSERT INTO suppliers (userId, workspaceId, name, note, created_at, updated_at)
                             VALUES (?, ?, ?, ?, datetime('now'), datetime('now'))
@@ -1063,7 +1081,7 @@ async def import_workspace_data(
                 if 'customers' in data and data['customers']:
                     for customer_data in data['customers']:
                         original_id = customer_data.get('id')
-                        cursor = conn.execute(
+                        cursor = await conn.execute(
                             """
                             INSERT INTO customers (userId, workspaceId, name, note, created_at, updated_at)
                             VALUES (?, ?, ?, ?, datetime('now'), datetime('now'))
@@ -1080,7 +1098,7 @@ async def import_workspace_data(
                 if 'employees' in data and data['employees']:
                     for employee_data in data['employees']:
                         original_id = employee_data.get('id')
-                        cursor = conn.execute(
+                        cursor = await conn.execute(
                             """
                             INSERT INTO employees (userId, workspaceId, name, note, created_at, updated_at)
                             VALUES (?, ?, ?, ?, datetime('now'), datetime('now'))
@@ -1107,7 +1125,7 @@ async def import_workspace_data(
                         if unit not in ['斤', '公斤', '袋']:
                             unit = '公斤'
                         
-                        cursor = conn.execute(
+                        cursor = await conn.execute(
                             """
                             INSERT INTO products (userId, workspaceId, name, description, stock, unit, supplierId, version, created_at, updated_at)
                             VALUES (?, ?, ?, ?, ?, ?, ?, 1, datetime('now'), datetime('now'))
@@ -1132,7 +1150,7 @@ async def import_workspace_data(
                         elif supplier_id and supplier_id not in supplier_id_map:
                             supplier_id = None
                         
-                        conn.execute(
+                        await conn.execute(
                             """
                             INSERT INTO purchases (userId, workspaceId, productName, quantity, purchaseDate, supplierId, totalPurchasePrice, note, created_at)
                             VALUES (?, ?, ?, ?, ?, ?, ?, ?, datetime('now'))
@@ -1152,7 +1170,7 @@ async def import_workspace_data(
                         elif customer_id and customer_id not in customer_id_map:
                             customer_id = None
                         
-                        conn.execute(
+                        await conn.execute(
                             """
                             INSERT INTO sales (userId, workspaceId, productName, quantity, saleDate, customerId, totalSalePrice, note, created_at)
                             VALUES (?, ?, ?, ?, ?, ?, ?, ?, datetime('now'))
@@ -1172,7 +1190,7 @@ async def import_workspace_data(
                         elif customer_id and customer_id not in customer_id_map:
                             customer_id = None
                         
-                        conn.execute(
+                        await conn.execute(
                             """
                             INSERT INTO returns (userId, workspaceId, productName, quantity, returnDate, customerId, totalReturnPrice, note, created_at)
                             VALUES (?, ?, ?, ?, ?, ?, ?, ?, datetime('now'))
@@ -1198,7 +1216,7 @@ async def import_workspace_data(
                         elif employee_id and employee_id not in employee_id_map:
                             employee_id = None
                         
-                        conn.execute(
+                        await conn.execute(
                             """
                             INSERT INTO income (userId, workspaceId, incomeDate, customerId, amount, discount, employeeId, paymentMethod, note, created_at)
                             VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, datetime('now'))
@@ -1224,7 +1242,7 @@ async def import_workspace_data(
                         elif employee_id and employee_id not in employee_id_map:
                             employee_id = None
                         
-                        conn.execute(
+                        await conn.execute(
                             """
                             INSERT INTO remittance (userId, workspaceId, remittanceDate, supplierId, amount, employeeId, paymentMethod, note, created_at)
                             VALUES (?, ?, ?, ?, ?, ?, ?, ?, datetime('now'))
@@ -1234,7 +1252,15 @@ async def import_workspace_data(
                         )
                         remittance_count += 1
                 
-                conn.execute("COMMIT")
+                await conn.execute("COMMIT")
+                
+                # 覆盖导入是大批量删除 + 插入，交给后台维护任务更新统计信息、回收空闲页
+                deleted_count = old_data["total_count"]
+                notify_bulk_change(
+                    deleted_count + supplier_count + customer_count + employee_count + product_count
+                    + purchase_count + sale_count + return_count + income_count + remittance_count,
+                    deleted=deleted_count
+                )
                 
                 logger.info(f"Workspace {workspace_id} 数据导入成功: 用户 {user_id}")
                 
@@ -1262,7 +1288,7 @@ async def import_workspace_data(
                         entity_name = "数据导入"
                         note = f"导入数据（覆盖）：供应商 {supplier_count}，客户 {customer_count}，员工 {employee_count}，产品 {product_count}，采购 {purchase_count}，销售 {sale_count}，退货 {return_count}，进账 {income_count}，汇款 {remittance_count}，总计 {total_count} 条"
                     
-                    AuditLogService.log_operation(
+                    await AuditLogService.log_operation(
                         user_id=user_id,
                         username=current_user.get("username", "unknown"),
                         operation_type="COVER",
@@ -1300,7 +1326,7 @@ async def import_workspace_data(
                 )
                 
             except Exception as e:
-                conn.execute("ROLLBACK")
+                await conn.execute("ROLLBACK")
                 raise e
                 
     except HTTPException:
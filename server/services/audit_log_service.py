@@ -5,14 +5,30 @@
 
 import json
 import logging
+import time
 from typing import Optional, Dict, Any, List, Tuple
 from datetime import datetime, timedelta
 import sqlite3
 
 from server.database import get_pool
+from server.pagination import Keyset, SortColumn, fetch_page
+from server.services.db_maintenance import notify_bulk_change
+from server.timing import LatencyHistogram
 
 logger = logging.getLogger(__name__)
 
+# 操作日志写入耗时（含组提交等待）和失败次数
+audit_log_write_latency = LatencyHistogram()
+_write_failures = 0
+
+# 日志列表排序键（游标分页）
+LOGS_KEYSET = Keyset(SortColumn("operation_time", nullable=True), SortColumn("id"))
+
+
+def get_audit_log_write_failures() -> int:
+    """操作日志写入失败次数"""
+    return _write_failures
+
 # 获取本地时区的当前时间字符串
 def get_local_time_str() -> str:
     """
@@ -93,10 +109,13 @@ def convert_time_fields_in_data(data: Optional[Dict[str, Any]]) -> Optional[Dict
 
 
 class AuditLogService:
-    """操作日志服务类"""
+    """
+    操作日志服务类
+    在已持有数据库连接的请求中调用时复用该请求级连接，否则写入走组提交
+    """
     
     @staticmethod
-    def log_operation(
+    async def log_operation(
         user_id: int,
         username: str,
         operation_type: str,
@@ -131,102 +150,105 @@ class AuditLogService:
         Returns:
             日志ID
         """
+        global _write_failures
         pool = get_pool()
+        start = time.perf_counter()
         
         try:
-            with pool.get_connection() as conn:
-                # 转换时间字段从 UTC 到本地时间
-                old_data_converted = convert_time_fields_in_data(old_data)
-                new_data_converted = convert_time_fields_in_data(new_data)
-                
-                # 如果 changes 中包含时间字段，也需要转换
-                changes_converted = None
-                if changes:
-                    changes_converted = {}
-                    for key, change_info in changes.items():
-                        if isinstance(change_info, dict):
-                            change_info_copy = change_info.copy()
-                            # 转换 old 和 new 值中的时间字段
-                            if 'old' in change_info_copy and isinstance(change_info_copy['old'], str):
-                                if any(time_field in key.lower() for time_field in ['created_at', 'updated_at', 'time', 'date']):
-                                    change_info_copy['old'] = convert_utc_to_local_time_str(change_info_copy['old'])
-                            if 'new' in change_info_copy and isinstance(change_info_copy['new'], str):
-                                if any(time_field in key.lower() for time_field in ['created_at', 'updated_at', 'time', 'date']):
-                                    change_info_copy['new'] = convert_utc_to_local_time_str(change_info_copy['new'])
-                            changes_converted[key] = change_info_copy
-                        else:
-                            changes_converted[key] = change_info
-                
-                # 将字典转换为JSON字符串
-                old_data_json = json.dumps(old_data_converted, ensure_ascii=False) if old_data_converted else None
-                new_data_json = json.dumps(new_data_converted, ensure_ascii=False) if new_data_converted else None
-                changes_json = json.dumps(changes_converted, ensure_ascii=False) if changes_converted else None
-                
-                # 使用本地时间（CST，UTC+8）而不是 SQLite 的 datetime('now')（UTC）
-                local_time = get_local_time_str()
-                
-                # 如果提供了workspace_id，插入时包含workspaceId
-                if workspace_id is not None:
-                    cursor = conn.execute(
-                        """
-                        INSERT INTO operation_logs 
-                        (userId, workspaceId, username, operation_type, entity_type, entity_id, entity_name,
-                         old_data, new_data, changes, ip_address, device_info, operation_time, note)
-                        VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
-                        """,
-                        (
-                            user_id,
-                            workspace_id,
-                            username,
-                            operation_type,
-                            entity_type,
-                            entity_id,
-                            entity_name,
-                            old_data_json,
-                            new_data_json,
-                            changes_json,
-                            ip_address,
-                            device_info,
-                            local_time,
-                            note
-                        )
+            # 转换时间字段从 UTC 到本地时间
+            old_data_converted = convert_time_fields_in_data(old_data)
+            new_data_converted = convert_time_fields_in_data(new_data)
+            
+            # 如果 changes 中包含时间字段，也需要转换
+            changes_converted = None
+            if changes:
+                changes_converted = {}
+                for key, change_info in changes.items():
+                    if isinstance(change_info, dict):
+                        change_info_copy = change_info.copy()
+                        # 转换 old 和 new 值中的时间字段
+                        if 'old' in change_info_copy and isinstance(change_info_copy['old'], str):
+                            if any(time_field in key.lower() for time_field in ['created_at', 'updated_at', 'time', 'date']):
+                                change_info_copy['old'] = convert_utc_to_local_time_str(change_info_copy['old'])
+                        if 'new' in change_info_copy and isinstance(change_info_copy['new'], str):
+                            if any(time_field in key.lower() for time_field in ['created_at', 'updated_at', 'time', 'date']):
+                                change_info_copy['new'] = convert_utc_to_local_time_str(change_info_copy['new'])
+                        changes_converted[key] = change_info_copy
+                    else:
+                        changes_converted[key] = change_info
+            
+            # 将字典转换为JSON字符串
+            old_data_json = json.dumps(old_data_converted, ensure_ascii=False) if old_data_converted else None
+            new_data_json = json.dumps(new_data_converted, ensure_ascii=False) if new_data_converted else None
+            changes_json = json.dumps(changes_converted, ensure_ascii=False) if changes_converted else None
+            
+            # 使用本地时间（CST，UTC+8）而不是 SQLite 的 datetime('now')（UTC）
+            local_time = get_local_time_str()
+            
+            # 如果提供了workspace_id，插入时包含workspaceId
+            if workspace_id is not None:
+                sql, params = (
+                    """
+                    INSERT INTO operation_logs 
+                    (userId, workspaceId, username, operation_type, entity_type, entity_id, entity_name,
+                     old_data, new_data, changes, ip_address, device_info, operation_time, note)
+                    VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+                    """,
+                    (
+                        user_id,
+                        workspace_id,
+                        username,
+                        operation_type,
+                        entity_type,
+                        entity_id,
+                        entity_name,
+                        old_data_json,
+                        new_data_json,
+                        changes_json,
+                        ip_address,
+                        device_info,
+                        local_time,
+                        note
                     )
-                else:
-                    cursor = conn.execute(
-                        """
-                        INSERT INTO operation_logs 
-                        (userId, username, operation_type, entity_type, entity_id, entity_name,
-                         old_data, new_data, changes, ip_address, device_info, operation_time, note)
-                        VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
-                        """,
-                        (
-                            user_id,
-                            username,
-                            operation_type,
-                            entity_type,
-                            entity_id,
-                            entity_name,
-                            old_data_json,
-                            new_data_json,
-                            changes_json,
-                            ip_address,
-                            device_info,
-                            local_time,
-                            note
-                        )
+                )
+            else:
+                sql, params = (
+                    """
+                    INSERT INTO operation_logs 
+                    (userId, username, operation_type, entity_type, entity_id, entity_name,
+                     old_data, new_data, changes, ip_address, device_info, operation_time, note)
+                    VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+                    """,
+                    (
+                        user_id,
+                        username,
+                        operation_type,
+                        entity_type,
+                        entity_id,
+                        entity_name,
+                        old_data_json,
+                        new_data_json,
+                        changes_json,
+                        ip_address,
+                        device_info,
+                        local_time,
+                        note
                     )
-                log_id = cursor.lastrowid
-                conn.commit()
-                
-                logger.debug(f"操作日志已记录: ID={log_id}, 用户={username}, 操作={operation_type}, 实体={entity_type}")
-                return log_id
+                )
+            # 操作日志是高频小写入，走组提交与并发请求的日志合并为一次提交
+            log_id = await pool.group_commit(lambda conn: conn.execute(sql, params).lastrowid)
+            audit_log_write_latency.observe(time.perf_counter() - start)
+            
+            logger.debug(f"操作日志已记录: ID={log_id}, 用户={username}, 操作={operation_type}, 实体={entity_type}")
+            return log_id
         except Exception as e:
+            _write_failures += 1
             logger.error(f"记录操作日志失败: {e}", exc_info=True)
             # 日志记录失败不应影响主业务，只记录错误
             return 0
     
     @staticmethod
-    def log_create(
+    async def log_create(
         user_id: int,
         username: str,
         entity_type: str,
@@ -255,7 +277,7 @@ class AuditLogService:
         Returns:
             日志ID
         """
-        return AuditLogService.log_operation(
+        return await AuditLogService.log_operation(
             user_id=user_id,
             username=username,
             operation_type="CREATE",
@@ -270,7 +292,7 @@ class AuditLogService:
         )
     
     @staticmethod
-    def log_update(
+    async def log_update(
         user_id: int,
         username: str,
         entity_type: str,
@@ -307,7 +329,7 @@ class AuditLogService:
         if changes is None and old_data is not None and new_data is not None:
             changes = AuditLogService.compare_data(old_data, new_data)
         
-        return AuditLogService.log_operation(
+        return await AuditLogService.log_operation(
             user_id=user_id,
             username=username,
             operation_type="UPDATE",
@@ -324,7 +346,7 @@ class AuditLogService:
         )
     
     @staticmethod
-    def log_delete(
+    async def log_delete(
         user_id: int,
         username: str,
         entity_type: str,
@@ -353,7 +375,7 @@ class AuditLogService:
         Returns:
             日志ID
         """
-        return AuditLogService.log_operation(
+        return await AuditLogService.log_operation(
             user_id=user_id,
             username=username,
             operation_type="DELETE",
@@ -405,7 +427,7 @@ class AuditLogService:
         return changes
     
     @staticmethod
-    def get_logs(
+    async def get_logs(
         user_id: int,
         page: int = 1,
         page_size: int = 20,
@@ -414,8 +436,10 @@ class AuditLogService:
         start_time: Optional[str] = None,
         end_time: Optional[str] = None,
         search: Optional[str] = None,
-        workspace_id: Optional[int] = None
-    ) -> Tuple[List[Dict[str, Any]], int]:
+        workspace_id: Optional[int] = None,
+        cursor: Optional[str] = None,
+        include_total: bool = False
+    ) -> Tuple[List[Dict[str, Any]], Optional[int], Optional[str]]:
         """
         获取操作日志列表
         
@@ -423,19 +447,22 @@ class AuditLogService:
             user_id: 用户ID
             page: 页码（从1开始）
             page_size: 每页数量
+            cursor: 分页游标（上一页返回的 next_cursor，提供时忽略 page）
             operation_type: 操作类型筛选
             entity_type: 实体类型筛选
             start_time: 开始时间（ISO8601格式）
             end_time: 结束时间（ISO8601格式）
             search: 搜索关键词（实体名称、备注）
+            include_total: 使用游标时是否也计算总数（按页码查询时总是返回）
         
         Returns:
-            (日志列表, 总数)
+            (日志列表, 总数（未计算时为 None）, 下一页的游标)
         """
+        cursor_values = LOGS_KEYSET.decode(cursor)
         pool = get_pool()
         
         try:
-            with pool.get_connection() as conn:
+            async with pool.acquire(readonly=True) as conn:
                 # 构建查询条件
                 # 如果提供了workspace_id，使用workspace过滤；否则使用userId过滤（向后兼容）
                 if workspace_id is not None:
@@ -468,28 +495,25 @@ class AuditLogService:
                 
                 where_clause = " AND ".join(conditions)
                 
-                # 查询总数
-                count_cursor = conn.execute(
-                    f"SELECT COUNT(*) FROM operation_logs WHERE {where_clause}",
-                    params
-                )
-                total = count_cursor.fetchone()[0]
-                
-                # 查询数据（分页）
-                offset = (page - 1) * page_size
-                cursor = conn.execute(
-                    f"""
-                    SELECT id, userId, username, operation_type, entity_type, entity_id, entity_name,
-                           old_data, new_data, changes, ip_address, device_info, operation_time, note
-                    FROM operation_logs
-                    WHERE {where_clause}
-                    ORDER BY operation_time DESC
-                    LIMIT ? OFFSET ?
+                # 查询数据和总数（分页；提供游标时从游标之后开始，不使用 OFFSET）
+                rows, next_cursor, total = await fetch_page(
+                    conn,
+                    "operation_logs",
+                    """
+                    id, userId, username, operation_type, entity_type, entity_id, entity_name,
+                    old_data, new_data, changes, ip_address, device_info, operation_time, note
                     """,
-                    params + [page_size, offset]
+                    where_clause,
+                    params,
+                    LOGS_KEYSET,
+                    cursor_values,
+                    page,
+                    page_size,
+                    include_total=include_total,
+                    # 只按 workspace 过滤时，总数读取触发器维护的行数
+                    workspace_id=workspace_id if len(conditions) == 1 and workspace_id is not None else None
                 )
                 
-                rows = cursor.fetchall()
                 logs = []
                 
                 for row in rows:
@@ -521,13 +545,13 @@ class AuditLogService:
                     
                     logs.append(log_dict)
                 
-                return logs, total
+                return logs, total, next_cursor
         except Exception as e:
             logger.error(f"查询操作日志失败: {e}", exc_info=True)
             raise
     
     @staticmethod
-    def get_log_detail(log_id: int, user_id: int, workspace_id: Optional[int] = None) -> Optional[Dict[str, Any]]:
+    async def get_log_detail(log_id: int, user_id: int, workspace_id: Optional[int] = None) -> Optional[Dict[str, Any]]:
         """
         获取操作日志详情
         
@@ -541,10 +565,10 @@ class AuditLogService:
         pool = get_pool()
         
         try:
-            with pool.get_connection() as conn:
+            async with pool.acquire(readonly=True) as conn:
                 # 构建查询条件
                 if workspace_id is not None:
-                    cursor = conn.execute(
+                    cursor = await conn.execute(
                         """
                         SELECT id, userId, username, operation_type, entity_type, entity_id, entity_name,
                                old_data, new_data, changes, ip_address, device_info, operation_time, note
@@ -554,7 +578,7 @@ class AuditLogService:
                         (log_id, workspace_id)
                     )
                 else:
-                    cursor = conn.execute(
+                    cursor = await conn.execute(
                         """
                         SELECT id, userId, username, operation_type, entity_type, entity_id, entity_name,
                                old_data, new_data, changes, ip_address, device_info, operation_time, note
@@ -564,7 +588,7 @@ class AuditLogService:
                         (log_id, user_id)
                     )
                 
-                row = cursor.fetchone()
+                row = await cursor.fetchone()
                 if not row:
                     return None
                 
@@ -601,7 +625,7 @@ class AuditLogService:
             raise
     
     @staticmethod
-    def cleanup_old_logs(days: int = 730, user_id: Optional[int] = None, workspace_id: Optional[int] = None) -> int:
+    async def cleanup_old_logs(days: int = 730, user_id: Optional[int] = None, workspace_id: Optional[int] = None) -> int:
         """
         清理指定天数之前的旧日志
         
@@ -614,7 +638,7 @@ class AuditLogService:
         pool = get_pool()
         
         try:
-            with pool.get_connection() as conn:
+            async with pool.acquire() as conn:
                 # 构建删除条件
                 conditions = ["operation_time < datetime('now', '-' || ? || ' days')"]
                 params = [days]
@@ -628,7 +652,7 @@ class AuditLogService:
                 
                 where_clause = " AND ".join(conditions)
                 
-                cursor = conn.execute(
+                cursor = await conn.execute(
                     f"""
                     DELETE FROM operation_logs
                     WHERE {where_clause}
@@ -636,7 +660,8 @@ class AuditLogService:
                     tuple(params)
                 )
                 deleted_count = cursor.rowcount
-                conn.commit()
+                await conn.commit()
+                notify_bulk_change(deleted_count, deleted=deleted_count)
                 
                 logger.info(f"清理了 {deleted_count} 条 {days} 天前的操作日志")
                 return deleted_count
@@ -0,0 +1,309 @@
+"""
+数据库维护服务
+后台定期执行 WAL checkpoint、统计信息更新（PRAGMA optimize / ANALYZE）和增量清理（incremental_vacuum），
+防止大批量导入或清理后 -wal 文件持续增长、查询计划过时
+"""
+
+import asyncio
+import logging
+import os
+import sqlite3
+import time
+from datetime import datetime
+from typing import Optional, Dict, Any
+
+from server.database import SQLiteConnectionPool
+
+logger = logging.getLogger(__name__)
+
+# PRAGMA auto_vacuum 的取值
+_AUTO_VACUUM_MODES = {0: "none", 1: "full", 2: "incremental"}
+
+
+class DatabaseMaintenance:
+    """
+    数据库维护调度器
+
+    每个周期执行：
+    - PASSIVE checkpoint：不等待读写，尽量把 WAL 合并回主库
+    - TRUNCATE checkpoint：连接池空闲一段时间后执行，把 -wal 文件截断为 0
+    - PRAGMA optimize（从未分析过时执行 ANALYZE）：累计变更行数达到阈值后执行
+    - incremental_vacuum：空闲页达到阈值且系统空闲时执行（仅 auto_vacuum=INCREMENTAL 的数据库）
+    """
+
+    def __init__(
+        self,
+        pool: SQLiteConnectionPool,
+        interval: float = 30.0,
+        idle_seconds: float = 60.0,
+        analyze_threshold: int = 10000,
+        vacuum_threshold: int = 1000,
+        vacuum_pages: int = 2000
+    ):
+        """
+        Args:
+            pool: 连接池
+            interval: 维护周期（秒）
+            idle_seconds: 多久没有写入（-wal 文件未变化）且没有借出的连接时视为空闲，
+                允许执行 TRUNCATE checkpoint 和 incremental_vacuum（秒）
+            analyze_threshold: 累计变更多少行后执行 PRAGMA optimize
+            vacuum_threshold: 空闲页超过多少页后执行 incremental_vacuum
+            vacuum_pages: 单次 incremental_vacuum 最多释放的页数（避免长时间占用写锁）
+        """
+        self._pool = pool
+        self.interval = interval
+        self.idle_seconds = idle_seconds
+        self.analyze_threshold = analyze_threshold
+        self.vacuum_threshold = vacuum_threshold
+        self.vacuum_pages = vacuum_pages
+        self._wal_path = f"{pool.db_path}-wal"
+        # 最近一次观察到的 -wal 文件状态（大小, 修改时间）及其变化时间
+        self._wal_state = None
+        self._wal_changed_at = time.monotonic()
+        # 自上次 optimize 以来的变更行数 / 删除行数（由 notify_bulk_change 累加）
+        self._pending_changes = 0
+        self._pending_deletes = 0
+        self._stats: Dict[str, Any] = {
+            'passive_checkpoints': 0,
+            'truncate_checkpoints': 0,
+            'last_checkpoint': None,
+            'optimize_runs': 0,
+            'last_optimize': None,
+            'vacuum_runs': 0,
+            'freed_pages': 0,
+            'last_vacuum': None,
+            'errors': 0,
+        }
+
+    def note_changes(self, rows: int, deleted: int = 0):
+        """
+        记录一次大批量变更，下个维护周期据此决定是否更新统计信息、回收空闲页
+
+        Args:
+            rows: 变更（插入/更新/删除）的总行数
+            deleted: 其中删除的行数
+        """
+        self._pending_changes += max(0, rows)
+        self._pending_deletes += max(0, deleted)
+
+    async def run(self, health=None):
+        """
+        后台循环，直到任务被取消
+
+        Args:
+            health: 后台任务状态（server.metrics.BackgroundTaskHealth），记录每个周期的成功 / 失败
+        """
+        while True:
+            await asyncio.sleep(self.interval)
+            try:
+                await self.run_once()
+                if health is not None:
+                    health.success()
+            except Exception as e:
+                self._stats['errors'] += 1
+                if health is not None:
+                    health.failure()
+                logger.error(f"数据库维护任务出错: {e}", exc_info=True)
+
+    async def run_once(self):
+        """执行一个维护周期"""
+        idle = self.is_idle()
+
+        mode = "TRUNCATE" if idle and self.wal_size() > 0 else "PASSIVE"
+        await self.checkpoint(mode)
+
+        if self._pending_changes >= self.analyze_threshold:
+            await self.optimize()
+
+        if idle:
+            await self.vacuum()
+
+    def is_idle(self) -> bool:
+        """
+        判断系统是否空闲：-wal 文件在 idle_seconds 内没有变化（没有提交写入），且当前没有借出的连接
+        （只读请求和后台清理不写 -wal，不影响判断；checkpoint 只写主库，也不会重置计时）
+        """
+        try:
+            st = os.stat(self._wal_path)
+            state = (st.st_size, st.st_mtime_ns)
+        except OSError:
+            state = None
+        now = time.monotonic()
+        if state != self._wal_state:
+            self._wal_state = state
+            self._wal_changed_at = now
+            return False
+        if now - self._wal_changed_at < self.idle_seconds:
+            return False
+        stats = self._pool.get_stats()
+        return not (stats['active_connections'] or stats['writer_busy'] or stats['waiting'])
+
+    def wal_size(self) -> int:
+        """当前 -wal 文件大小（字节）"""
+        try:
+            return os.path.getsize(self._wal_path)
+        except OSError:
+            return 0
+
+    async def checkpoint(self, mode: str = "PASSIVE") -> Dict[str, Any]:
+        """
+        执行 WAL checkpoint
+
+        Args:
+            mode: PASSIVE / FULL / RESTART / TRUNCATE
+
+        Returns:
+            本次 checkpoint 的结果
+        """
+        wal_before = self.wal_size()
+        start = time.perf_counter()
+        async with self._pool.acquire() as conn:
+            row = await conn.fetchone(f"PRAGMA wal_checkpoint({mode})")
+        duration_ms = (time.perf_counter() - start) * 1000
+
+        result = {
+            'mode': mode,
+            'busy': bool(row[0]),
+            'wal_frames': row[1],
+            'checkpointed_frames': row[2],
+            'wal_bytes_before': wal_before,
+            'wal_bytes_after': self.wal_size(),
+            'duration_ms': round(duration_ms, 3),
+            'at': datetime.now().strftime('%Y-%m-%d %H:%M:%S'),
+        }
+        self._stats['truncate_checkpoints' if mode == "TRUNCATE" else 'passive_checkpoints'] += 1
+        self._stats['last_checkpoint'] = result
+
+        if mode == "TRUNCATE":
+            logger.info(
+                f"WAL checkpoint({mode}): {wal_before} -> {result['wal_bytes_after']} 字节, "
+                f"耗时 {duration_ms:.1f}ms"
+            )
+        elif result['busy']:
+            logger.debug(f"WAL checkpoint({mode}) 未完成（有活跃的读写）: {row[2]}/{row[1]} 帧")
+        return result
+
+    async def optimize(self) -> Dict[str, Any]:
+        """更新查询规划器统计信息（从未分析过时执行 ANALYZE，否则执行 PRAGMA optimize）"""
+        changes = self._pending_changes
+
+        def _optimize(conn: sqlite3.Connection) -> str:
+            analyzed = conn.execute(
+                "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'sqlite_stat1'"
+            ).fetchone()
+            # 限制每个索引的采样行数，大表上也能很快完成
+            conn.execute("PRAGMA analysis_limit = 1000")
+            if analyzed:
+                conn.execute("PRAGMA optimize")
+                return "optimize"
+            conn.execute("ANALYZE")
+            return "analyze"
+
+        start = time.perf_counter()
+        async with self._pool.acquire() as conn:
+            action = await conn.run_sync(_optimize)
+        duration_ms = (time.perf_counter() - start) * 1000
+
+        self._pending_changes = 0
+        result = {
+            'action': action,
+            'changes': changes,
+            'duration_ms': round(duration_ms, 3),
+            'at': datetime.now().strftime('%Y-%m-%d %H:%M:%S'),
+        }
+        self._stats['optimize_runs'] += 1
+        self._stats['last_optimize'] = result
+        logger.info(f"更新统计信息（{action}）: 累计变更 {changes} 行, 耗时 {duration_ms:.1f}ms")
+        return result
+
+    async def vacuum(self) -> Optional[Dict[str, Any]]:
+        """
+        回收空闲页（incremental_vacuum）
+
+        Returns:
+            本次回收的结果；数据库不是 INCREMENTAL 模式或空闲页未达阈值时返回 None
+        """
+        def _vacuum(conn: sqlite3.Connection) -> Optional[Dict[str, Any]]:
+            if conn.execute("PRAGMA auto_vacuum").fetchone()[0] != 2:
+                return None
+            before = conn.execute("PRAGMA freelist_count").fetchone()[0]
+            if before < self.vacuum_threshold:
+                return None
+            # incremental_vacuum 每一步只释放一页；execute() 对没有结果列的语句只执行一步，
+            # executescript() 才会执行到结束
+            conn.executescript(f"PRAGMA incremental_vacuum({int(self.vacuum_pages)})")
+            after = conn.execute("PRAGMA freelist_count").fetchone()[0]
+            return {'freelist_before': before, 'freelist_after': after, 'freed_pages': before - after}
+
+        start = time.perf_counter()
+        async with self._pool.acquire() as conn:
+            result = await conn.run_sync(_vacuum)
+        self._pending_deletes = 0
+        if result is None:
+            return None
+
+        duration_ms = (time.perf_counter() - start) * 1000
+        result['duration_ms'] = round(duration_ms, 3)
+        result['at'] = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+        self._stats['vacuum_runs'] += 1
+        self._stats['freed_pages'] += result['freed_pages']
+        self._stats['last_vacuum'] = result
+        logger.info(
+            f"增量清理: 释放 {result['freed_pages']} 页（剩余空闲页 {result['freelist_after']}）, "
+            f"耗时 {duration_ms:.1f}ms"
+        )
+        return result
+
+    async def get_stats(self) -> Dict[str, Any]:
+        """获取维护统计信息（含当前 WAL 大小、页数和空闲页数）"""
+        async with self._pool.acquire(readonly=True) as conn:
+            page_size = (await conn.fetchone("PRAGMA page_size"))[0]
+            page_count = (await conn.fetchone("PRAGMA page_count"))[0]
+            freelist = (await conn.fetchone("PRAGMA freelist_count"))[0]
+            auto_vacuum = (await conn.fetchone("PRAGMA auto_vacuum"))[0]
+        return {
+            **self._stats,
+            'wal_size_bytes': self.wal_size(),
+            'db_size_bytes': page_size * page_count,
+            'freelist_pages': freelist,
+            'auto_vacuum': _AUTO_VACUUM_MODES.get(auto_vacuum, str(auto_vacuum)),
+            'pending_changes': self._pending_changes,
+            'pending_deletes': self._pending_deletes,
+        }
+
+
+# 全局维护调度器实例
+_maintenance: Optional[DatabaseMaintenance] = None
+
+
+def init_maintenance(pool: SQLiteConnectionPool, **kwargs) -> DatabaseMaintenance:
+    """
+    初始化全局数据库维护调度器
+
+    Args:
+        pool: 连接池
+        **kwargs: 其他调度器参数
+
+    Returns:
+        调度器实例
+    """
+    global _maintenance
+    _maintenance = DatabaseMaintenance(pool, **kwargs)
+    return _maintenance
+
+
+def get_maintenance() -> Optional[DatabaseMaintenance]:
+    """获取全局数据库维护调度器（未启动时返回 None）"""
+    return _maintenance
+
+
+def notify_bulk_change(rows: int, deleted: int = 0):
+    """
+    通知维护调度器发生了大批量变更（数据导入、日志清理等）
+
+    Args:
+        rows: 变更的总行数
+        deleted: 其中删除的行数
+    """
+    if _maintenance is not None:
+        _maintenance.note_changes(rows, deleted)
@@ -0,0 +1,159 @@
+"""
+密码哈希线程池
+bcrypt 哈希 / 校验单次耗时数百毫秒，直接在 async 处理函数里调用会阻塞事件循环；
+这里把它们放到独立线程池执行（bcrypt 计算期间释放 GIL，多个线程可以并行），
+并限制同时执行数和排队数，超出时立即拒绝，由调用方返回 429
+"""
+
+import asyncio
+import logging
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Optional, Dict, Any, Callable, TypeVar
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar("T")
+
+
+class PasswordHasherBusyError(Exception):
+    """密码哈希线程池已满（执行中和排队中的任务都达到上限）"""
+    pass
+
+
+class PasswordHasher:
+    """
+    带准入控制的密码哈希线程池
+
+    - 最多 max_workers 个任务同时执行
+    - 最多 max_queue 个任务排队等待；再有新任务时抛出 PasswordHasherBusyError
+    - 排队超过 queue_timeout 秒的任务同样被拒绝，避免请求在过载时无限等待
+    """
+
+    def __init__(
+        self,
+        max_workers: Optional[int] = None,
+        max_queue: int = 32,
+        queue_timeout: float = 5.0
+    ):
+        """
+        Args:
+            max_workers: 最大并发数（默认取 CPU 核数，最多 4）
+            max_queue: 最大排队数
+            queue_timeout: 最长排队时间（秒）
+        """
+        if max_workers is None:
+            max_workers = min(4, os.cpu_count() or 1)
+        self.max_workers = max(1, max_workers)
+        self.max_queue = max(0, max_queue)
+        self.queue_timeout = queue_timeout
+        self._executor = ThreadPoolExecutor(
+            max_workers=self.max_workers,
+            thread_name_prefix="password-hasher"
+        )
+        # 信号量在首次使用时创建，绑定到当时的事件循环
+        self._semaphore: Optional[asyncio.Semaphore] = None
+        self._running = 0
+        self._waiting = 0
+        self._stats: Dict[str, Any] = {
+            'completed': 0,
+            'rejected': 0,
+            'timeouts': 0,
+            'total_time_ms': 0.0,
+            'total_wait_ms': 0.0,
+            'max_wait_ms': 0.0,
+        }
+
+    async def run(self, func: Callable[..., T], *args) -> T:
+        """
+        在线程池中执行 func(*args)
+
+        Raises:
+            PasswordHasherBusyError: 排队数已达上限或排队超时
+        """
+        if self._semaphore is None:
+            self._semaphore = asyncio.Semaphore(self.max_workers)
+
+        if self._semaphore.locked() and self._waiting >= self.max_queue:
+            self._stats['rejected'] += 1
+            raise PasswordHasherBusyError(
+                f"密码哈希任务过多（执行中 {self._running}，排队 {self._waiting}）"
+            )
+
+        wait_start = time.perf_counter()
+        self._waiting += 1
+        try:
+            await asyncio.wait_for(self._semaphore.acquire(), timeout=self.queue_timeout)
+        except asyncio.TimeoutError:
+            self._stats['timeouts'] += 1
+            raise PasswordHasherBusyError(f"密码哈希任务排队超过 {self.queue_timeout:g} 秒")
+        finally:
+            self._waiting -= 1
+
+        wait_ms = (time.perf_counter() - wait_start) * 1000
+        self._running += 1
+        start = time.perf_counter()
+        try:
+            loop = asyncio.get_running_loop()
+            return await loop.run_in_executor(self._executor, func, *args)
+        finally:
+            self._running -= 1
+            self._semaphore.release()
+            self._stats['completed'] += 1
+            self._stats['total_time_ms'] += (time.perf_counter() - start) * 1000
+            self._stats['total_wait_ms'] += wait_ms
+            self._stats['max_wait_ms'] = max(self._stats['max_wait_ms'], wait_ms)
+
+    def get_stats(self) -> Dict[str, Any]:
+        """获取线程池统计信息"""
+        completed = self._stats['completed']
+        return {
+            'max_workers': self.max_workers,
+            'max_queue': self.max_queue,
+            'running': self._running,
+            'waiting': self._waiting,
+            'completed': completed,
+            'rejected': self._stats['rejected'],
+            'timeouts': self._stats['timeouts'],
+            'avg_time_ms': round(self._stats['total_time_ms'] / completed, 3) if completed else 0.0,
+            'avg_wait_ms': round(self._stats['total_wait_ms'] / completed, 3) if completed else 0.0,
+            'max_wait_ms': round(self._stats['max_wait_ms'], 3),
+        }
+
+    def shutdown(self):
+        """关闭线程池（等待执行中的任务完成）"""
+        self._executor.shutdown(wait=True)
+
+
+# 全局密码哈希线程池实例
+_hasher: Optional[PasswordHasher] = None
+
+
+def init_password_hasher(**kwargs) -> PasswordHasher:
+    """
+    初始化全局密码哈希线程池（替换已有实例）
+
+    Args:
+        **kwargs: 线程池参数
+
+    Returns:
+        线程池实例
+    """
+    global _hasher
+    old = _hasher
+    _hasher = PasswordHasher(**kwargs)
+    if old is not None:
+        old.shutdown()
+    logger.info(
+        f"密码哈希线程池已初始化: 并发 {_hasher.max_workers}, 排队上限 {_hasher.max_queue}"
+    )
+    return _hasher
+
+
+def get_password_hasher() -> PasswordHasher:
+    """获取全局密码哈希线程池（未初始化时使用默认参数创建）"""
+    global _hasher
+    if _hasher is None:
+        _hasher = PasswordHasher()
+    return _hasher
@@ -0,0 +1,322 @@
+"""
+慢查询日志
+连接池中的连接在执行 SQL 时计时（含逐行读取结果的时间），超过阈值的语句交给后台线程：
+规范化 SQL（字面量替换为 ?）、脱敏参数、用独立的只读连接执行 EXPLAIN QUERY PLAN，
+然后写入按大小轮转的 JSON Lines 文件，并在内存中保留最近的记录供管理接口查询
+"""
+
+import hashlib
+import json
+import logging
+import logging.handlers
+import queue
+import re
+import sqlite3
+import threading
+import time
+from collections import OrderedDict, deque
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Optional, Dict, Any, List
+
+logger = logging.getLogger(__name__)
+
+# 只对这些语句执行 EXPLAIN QUERY PLAN
+_EXPLAINABLE = ("SELECT", "WITH", "INSERT", "UPDATE", "DELETE", "REPLACE")
+
+_STRING_LITERAL = re.compile(r"'(?:[^']|'')*'")
+_NUMBER_LITERAL = re.compile(r"(?<![\w.])-?\d+(?:\.\d+)?\b")
+_IN_LIST = re.compile(r"\bIN\s*\(\s*\?(?:\s*,\s*\?)*\s*\)", re.IGNORECASE)
+_WHITESPACE = re.compile(r"\s+")
+
+# 每条记录最多保留的参数个数
+MAX_PARAMS = 20
+
+
+def normalize_sql(sql: str) -> str:
+    """
+    规范化 SQL：字符串和数字字面量替换为 ?，IN (?, ?, ...) 合并为 IN (...)，合并空白
+
+    同一"形状"的查询（只是条件值不同）得到相同的结果
+    """
+    sql = _STRING_LITERAL.sub("?", sql)
+    sql = _NUMBER_LITERAL.sub("?", sql)
+    sql = _IN_LIST.sub("IN (...)", sql)
+    return _WHITESPACE.sub(" ", sql).strip()
+
+
+def fingerprint(normalized_sql: str) -> str:
+    """规范化 SQL 的短哈希，用于按查询形状分组"""
+    return hashlib.sha1(normalized_sql.encode("utf-8")).hexdigest()[:12]
+
+
+def redact_params(params) -> Any:
+    """
+    脱敏参数：数字、布尔值和 NULL 原样保留（多为 ID、分页参数），字符串和二进制只保留长度
+    """
+    def _redact(value):
+        if value is None or isinstance(value, (bool, int, float)):
+            return value
+        if isinstance(value, str):
+            return f"<str:{len(value)}>"
+        if isinstance(value, (bytes, bytearray, memoryview)):
+            return f"<bytes:{len(value)}>"
+        return f"<{type(value).__name__}>"
+
+    if isinstance(params, dict):
+        return {key: _redact(value) for key, value in list(params.items())[:MAX_PARAMS]}
+    if isinstance(params, (list, tuple)):
+        return [_redact(value) for value in params[:MAX_PARAMS]]
+    return None
+
+
+def format_plan(rows: List[tuple]) -> List[str]:
+    """
+    把 EXPLAIN QUERY PLAN 的结果（id, parent, notused, detail）转换为带缩进的文本行
+    """
+    depth = {0: -1}
+    lines = []
+    for node_id, parent, _, detail in rows:
+        level = depth.get(parent, -1) + 1
+        depth[node_id] = level
+        lines.append("  " * level + detail)
+    return lines
+
+
+def is_full_scan(plan: List[str]) -> bool:
+    """执行计划中是否有不使用索引的整表扫描"""
+    for line in plan:
+        detail = line.strip()
+        if detail.startswith("SCAN ") and " USING " not in detail:
+            return True
+    return False
+
+
+class SlowQueryLog:
+    """
+    慢查询日志（执行 SQL 的线程只负责计时和入队，EXPLAIN 与写文件在后台线程中完成）
+    """
+
+    def __init__(
+        self,
+        db_path: str,
+        threshold_ms: float,
+        log_file: Optional[str] = None,
+        max_bytes: int = 10 * 1024 * 1024,
+        backup_count: int = 5,
+        max_entries: int = 500,
+        max_fingerprints: int = 1000,
+        queue_size: int = 1000
+    ):
+        """
+        Args:
+            db_path: 数据库文件路径（EXPLAIN QUERY PLAN 使用独立的只读连接）
+            threshold_ms: 慢查询阈值（毫秒），执行和读取结果的总耗时不低于该值时记录
+            log_file: 日志文件路径（JSON Lines，为空时只保存在内存中）
+            max_bytes: 日志文件最大字节数，超出后轮转
+            backup_count: 保留的历史日志文件数
+            max_entries: 内存中保留的最近记录数
+            max_fingerprints: 按查询形状汇总的最大条目数（超出时淘汰最久未出现的）
+            queue_size: 等待处理的记录上限，超出时丢弃
+        """
+        self.db_path = db_path
+        self.threshold = threshold_ms / 1000.0
+        self.log_file = log_file
+        self._queue: queue.Queue = queue.Queue(maxsize=queue_size)
+        self._entries: deque = deque(maxlen=max_entries)
+        self._summary: "OrderedDict[str, Dict[str, Any]]" = OrderedDict()
+        self._max_fingerprints = max_fingerprints
+        self._lock = threading.Lock()
+        self._stats = {'recorded': 0, 'dropped': 0, 'explain_errors': 0}
+        self._explain_conn: Optional[sqlite3.Connection] = None
+        self._handler: Optional[logging.Handler] = None
+        if log_file:
+            Path(log_file).parent.mkdir(parents=True, exist_ok=True)
+            self._handler = logging.handlers.RotatingFileHandler(
+                log_file, maxBytes=max_bytes, backupCount=backup_count, encoding="utf-8"
+            )
+            self._handler.setFormatter(logging.Formatter("%(message)s"))
+        self._thread = threading.Thread(target=self._worker, name="slow-query-log", daemon=True)
+        self._thread.start()
+
+    def submit(self, sql: str, params, duration: float, rows: int):
+        """
+        提交一条慢查询（在执行 SQL 的线程中调用，不阻塞）
+
+        Args:
+            sql: 原始 SQL
+            params: 绑定参数（仅用于 EXPLAIN，不会原样写入日志）
+            duration: 执行和读取结果的总耗时（秒）
+            rows: 返回的行数（查询）或影响的行数（写操作）
+        """
+        try:
+            self._queue.put_nowait((time.time(), sql, params, duration, rows))
+        except queue.Full:
+            self._stats['dropped'] += 1
+
+    def _worker(self):
+        while True:
+            item = self._queue.get()
+            if item is None:
+                break
+            try:
+                self._process(*item)
+            except Exception as e:
+                logger.error(f"处理慢查询记录失败: {e}", exc_info=True)
+        # EXPLAIN 连接只能在创建它的线程中关闭
+        if self._explain_conn is not None:
+            self._explain_conn.close()
+            self._explain_conn = None
+
+    def _process(self, ts: float, sql: str, params, duration: float, rows: int):
+        normalized = normalize_sql(sql)
+        key = fingerprint(normalized)
+        plan = self._explain(sql, params)
+        entry = {
+            'ts': datetime.fromtimestamp(ts, timezone.utc).isoformat(timespec="milliseconds"),
+            'fingerprint': key,
+            'sql': normalized,
+            'params': redact_params(params),
+            'duration_ms': round(duration * 1000, 3),
+            'rows': rows,
+            'plan': plan,
+            'full_scan': is_full_scan(plan) if plan else False,
+        }
+
+        with self._lock:
+            self._entries.append(entry)
+            self._stats['recorded'] += 1
+            summary = self._summary.get(key)
+            if summary is None:
+                summary = {'fingerprint': key, 'sql': normalized, 'count': 0, 'total_ms': 0.0, 'max_ms': 0.0}
+                self._summary[key] = summary
+                while len(self._summary) > self._max_fingerprints:
+                    self._summary.popitem(last=False)
+            else:
+                self._summary.move_to_end(key)
+            summary['count'] += 1
+            summary['total_ms'] += entry['duration_ms']
+            summary['max_ms'] = max(summary['max_ms'], entry['duration_ms'])
+            summary['last_seen'] = entry['ts']
+            summary['last_rows'] = rows
+            summary['plan'] = plan
+            summary['full_scan'] = entry['full_scan']
+
+        if self._handler is not None:
+            record = logging.LogRecord(
+                "server.slow_query", logging.WARNING, __file__, 0,
+                json.dumps(entry, ensure_ascii=False), None, None
+            )
+            self._handler.handle(record)
+        logger.warning(f"慢查询 {entry['duration_ms']:.1f}ms ({rows} 行) [{key}]: {normalized[:200]}")
+
+    def _explain(self, sql: str, params) -> Optional[List[str]]:
+        """用独立的只读连接获取执行计划（临时表等连接私有对象不可见时返回 None）"""
+        statement = sql.lstrip().split(None, 1)[0].upper() if sql.strip() else ""
+        if statement not in _EXPLAINABLE:
+            return None
+        try:
+            if self._explain_conn is None:
+                self._explain_conn = sqlite3.connect(
+                    f"{Path(self.db_path).resolve().as_uri()}?mode=ro", uri=True, timeout=1.0
+                )
+                self._explain_conn.execute("PRAGMA query_only = 1")
+            rows = self._explain_conn.execute(f"EXPLAIN QUERY PLAN {sql}", params or ()).fetchall()
+            return format_plan(rows)
+        except sqlite3.Error as e:
+            self._stats['explain_errors'] += 1
+            logger.debug(f"获取执行计划失败: {e}")
+            return None
+
+    def recent(
+        self,
+        limit: int = 100,
+        min_ms: float = 0.0,
+        fingerprint: Optional[str] = None,
+        search: Optional[str] = None
+    ) -> List[Dict[str, Any]]:
+        """
+        最近的慢查询（新的在前）
+
+        Args:
+            limit: 最多返回的条数
+            min_ms: 只返回耗时不低于该值的记录（毫秒）
+            fingerprint: 只返回该查询形状的记录
+            search: SQL 中包含的关键字（不区分大小写，如表名）
+        """
+        search = search.lower() if search else None
+        with self._lock:
+            entries = list(self._entries)
+        result = []
+        for entry in reversed(entries):
+            if entry['duration_ms'] < min_ms:
+                continue
+            if fingerprint and entry['fingerprint'] != fingerprint:
+                continue
+            if search and search not in entry['sql'].lower():
+                continue
+            result.append(entry)
+            if len(result) >= limit:
+                break
+        return result
+
+    def summary(self, limit: int = 50) -> List[Dict[str, Any]]:
+        """按查询形状汇总（按总耗时降序）"""
+        with self._lock:
+            items = [dict(summary) for summary in self._summary.values()]
+        for item in items:
+            item['total_ms'] = round(item['total_ms'], 3)
+            item['avg_ms'] = round(item['total_ms'] / item['count'], 3)
+        items.sort(key=lambda item: item['total_ms'], reverse=True)
+        return items[:limit]
+
+    def clear(self):
+        """清空内存中的记录（日志文件不受影响）"""
+        with self._lock:
+            self._entries.clear()
+            self._summary.clear()
+
+    def get_stats(self) -> Dict[str, Any]:
+        """获取统计信息"""
+        return {
+            **self._stats,
+            'threshold_ms': self.threshold * 1000,
+            'pending': self._queue.qsize(),
+            'log_file': self.log_file,
+        }
+
+    def close(self):
+        """处理完队列中剩余的记录后停止后台线程"""
+        self._queue.put(None)
+        self._thread.join(timeout=5)
+        if self._handler is not None:
+            self._handler.close()
+
+
+# 全局慢查询日志实例（未启用时为 None）
+_slow_query_log: Optional[SlowQueryLog] = None
+
+
+def init_slow_query_log(db_path: str, threshold_ms: float, **kwargs) -> SlowQueryLog:
+    """
+    初始化全局慢查询日志
+
+    Args:
+        db_path: 数据库文件路径
+        threshold_ms: 慢查询阈值（毫秒）
+        **kwargs: 其他 SlowQueryLog 参数
+
+    Returns:
+        慢查询日志实例
+    """
+    global _slow_query_log
+    if _slow_query_log is not None:
+        _slow_query_log.close()
+    _slow_query_log = SlowQueryLog(db_path, threshold_ms, **kwargs)
+    logger.info(f"慢查询日志已启用（阈值 {threshold_ms:g}ms，文件: {_slow_query_log.log_file or '无'}）")
+    return _slow_query_log
+
+
+def get_slow_query_log() -> Optional[SlowQueryLog]:
+    """获取全局慢查询日志（未启用时返回 None）"""
+    return _slow_query_log
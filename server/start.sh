@@ -20,7 +20,31 @@ fi
 # 如果server目录是独立的，使用 data/agrisalews.db
 export DB_PATH="${DB_PATH:-data/agrisalews.db}"
 export DB_MAX_CONNECTIONS="${DB_MAX_CONNECTIONS:-10}"
+export DB_PROFILE="${DB_PROFILE:-balanced}"
 export DB_BUSY_TIMEOUT="${DB_BUSY_TIMEOUT:-5000}"
+export DB_POOL_MODE="${DB_POOL_MODE:-shared}"
+export DB_GROUP_COMMIT_LATENCY_MS="${DB_GROUP_COMMIT_LATENCY_MS:-5}"
+export DB_GROUP_COMMIT_BATCH="${DB_GROUP_COMMIT_BATCH:-64}"
+export DB_CONN_MAX_LIFETIME="${DB_CONN_MAX_LIFETIME:-3600}"
+export DB_CONN_MAX_USES="${DB_CONN_MAX_USES:-10000}"
+export DB_CONN_IDLE_TIMEOUT="${DB_CONN_IDLE_TIMEOUT:-300}"
+export DB_MAINTENANCE_INTERVAL="${DB_MAINTENANCE_INTERVAL:-30}"
+export DB_MAINTENANCE_IDLE_SECONDS="${DB_MAINTENANCE_IDLE_SECONDS:-60}"
+export AUTH_HASH_WORKERS="${AUTH_HASH_WORKERS:-0}"
+export AUTH_HASH_QUEUE="${AUTH_HASH_QUEUE:-32}"
+export RATE_LIMIT_ENABLED="${RATE_LIMIT_ENABLED:-false}"
+export RATE_LIMIT_SHARED_DB="${RATE_LIMIT_SHARED_DB:-}"
+export RATE_LIMIT_MAX_KEYS="${RATE_LIMIT_MAX_KEYS:-10000}"
+export LOG_LEVEL="${LOG_LEVEL:-INFO}"
+export LOG_FORMAT="${LOG_FORMAT:-text}"
+export LOG_FILE="${LOG_FILE:-}"
+export LOG_MAX_BYTES="${LOG_MAX_BYTES:-10485760}"
+export LOG_BACKUP_COUNT="${LOG_BACKUP_COUNT:-5}"
+export LOG_SLOW_REQUEST_MS="${LOG_SLOW_REQUEST_MS:-1000}"
+export SLOW_QUERY_MS="${SLOW_QUERY_MS:-0}"
+export SLOW_QUERY_LOG_FILE="${SLOW_QUERY_LOG_FILE:-}"
+export ADMIN_USERNAMES="${ADMIN_USERNAMES:-}"
+export QUERY_DEADLINES_MS="${QUERY_DEADLINES_MS:-interactive=2000,report=10000,export=30000}"
 export SECRET_KEY="${SECRET_KEY:-your-secret-key-change-this-in-production}"
 export HOST="${HOST:-0.0.0.0}"
 export PORT="${PORT:-9000}"  # 默认端口 9000
@@ -56,6 +80,6 @@ else
     export PYTHONPATH="${PYTHONPATH}:$(pwd)"
 fi
 
-# 启动服务器
-python -m uvicorn server.main:app --host "$HOST" --port "$PORT" --reload
+# 启动服务器（访问日志由应用的 APIMiddleware 异步记录，关闭 uvicorn 自带的同步访问日志）
+python -m uvicorn server.main:app --host "$HOST" --port "$PORT" --reload --no-access-log
 
@@ -0,0 +1,268 @@
+"""
+请求阶段计时
+每个请求在 contextvar 中保存一份各阶段（认证、权限检查、连接等待、SQL 执行、处理函数、序列化）的累计耗时，
+由 APIMiddleware 输出为 Server-Timing 响应头，并记录到按路由分组的延迟直方图
+"""
+
+import bisect
+import contextvars
+import functools
+import inspect
+import threading
+import time
+from contextlib import contextmanager
+from typing import Optional, Dict, Tuple
+
+from fastapi.routing import APIRoute
+
+# 阶段名称（同时作为 Server-Timing 中的指标名）
+PHASE_AUTH = "auth"
+PHASE_PERMISSION = "perm"
+PHASE_DB_WAIT = "db-wait"
+PHASE_DB = "db"
+PHASE_HANDLER = "app"
+PHASE_SERIALIZE = "serialize"
+PHASE_TOTAL = "total"
+
+# 当前请求的计时：阶段名 -> [累计秒数, 次数]；另有 "_handler_end" 记录处理函数返回的时间点
+# 保存的是可变字典，线程池中执行的代码（复制的上下文）也会写入同一个字典
+_request_timings: contextvars.ContextVar[Optional[dict]] = contextvars.ContextVar(
+    "request_timings", default=None
+)
+
+
+class LatencyHistogram:
+    """
+    延迟直方图（线程安全）
+    按毫秒分桶记录耗时，桶计数为非累积值，另记录总数、总耗时和最大值
+    """
+
+    DEFAULT_BUCKETS_MS = (1, 5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000, 10000)
+
+    def __init__(self, buckets_ms: tuple = DEFAULT_BUCKETS_MS):
+        self._bounds = tuple(buckets_ms)
+        self._counts = [0] * (len(self._bounds) + 1)  # 最后一个桶为 +Inf
+        self._count = 0
+        self._sum_ms = 0.0
+        self._max_ms = 0.0
+        self._lock = threading.Lock()
+
+    def observe(self, seconds: float):
+        """记录一次耗时（秒）"""
+        ms = seconds * 1000
+        index = bisect.bisect_left(self._bounds, ms)
+        with self._lock:
+            self._counts[index] += 1
+            self._count += 1
+            self._sum_ms += ms
+            if ms > self._max_ms:
+                self._max_ms = ms
+
+    def cumulative(self) -> Tuple[list, int, float]:
+        """
+        累积桶计数（用于 Prometheus 导出）
+
+        Returns:
+            ([(上界毫秒, 累积计数), ..., (inf, 总数)], 总数, 总耗时毫秒)
+        """
+        with self._lock:
+            counts = list(self._counts)
+            count, sum_ms = self._count, self._sum_ms
+        buckets = []
+        total = 0
+        for bound, n in zip(self._bounds + (float("inf"),), counts):
+            total += n
+            buckets.append((bound, total))
+        return buckets, count, sum_ms
+
+    def snapshot(self) -> dict:
+        """获取当前统计快照"""
+        with self._lock:
+            buckets = {str(bound): count for bound, count in zip(self._bounds, self._counts)}
+            buckets['+Inf'] = self._counts[-1]
+            return {
+                'count': self._count,
+                'sum_ms': round(self._sum_ms, 3),
+                'avg_ms': round(self._sum_ms / self._count, 3) if self._count else 0.0,
+                'max_ms': round(self._max_ms, 3),
+                'buckets': buckets
+            }
+
+
+def start_request() -> contextvars.Token:
+    """开始记录当前请求的阶段耗时"""
+    return _request_timings.set({})
+
+
+def end_request(token: contextvars.Token):
+    """结束记录（恢复 start_request 之前的状态）"""
+    _request_timings.reset(token)
+
+
+def current_timings() -> Optional[dict]:
+    """当前请求的计时字典（不在请求中时返回 None）"""
+    return _request_timings.get()
+
+
+def record(name: str, seconds: float):
+    """累加一个阶段的耗时（不在请求中时忽略）"""
+    timings = _request_timings.get()
+    if timings is None:
+        return
+    entry = timings.get(name)
+    if entry is None:
+        timings[name] = [seconds, 1]
+    else:
+        entry[0] += seconds
+        entry[1] += 1
+
+
+@contextmanager
+def phase(name: str):
+    """
+    计时上下文（可以跨越 await）
+
+    Usage:
+        with phase(PHASE_AUTH):
+            ...
+    """
+    if _request_timings.get() is None:
+        yield
+        return
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        record(name, time.perf_counter() - start)
+
+
+def timed(name: str):
+    """把整个异步函数计为一个阶段的装饰器（可用于 FastAPI 依赖）"""
+    def decorator(func):
+        @functools.wraps(func)
+        async def wrapper(*args, **kwargs):
+            with phase(name):
+                return await func(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def mark_handler_end():
+    """记录处理函数返回的时间点（之后到响应开始发送之间计为序列化耗时）"""
+    timings = _request_timings.get()
+    if timings is not None:
+        timings["_handler_end"] = time.perf_counter()
+
+
+def server_timing_header(timings: dict, total_seconds: float) -> str:
+    """
+    生成 Server-Timing 响应头
+
+    Returns:
+        如 "auth;dur=0.12, db-wait;dur=0.03, db;dur=2.41;desc=\"3 calls\", app;dur=3.10, total;dur=3.52"
+    """
+    parts = []
+    for name, (seconds, count) in _phase_items(timings):
+        part = f"{name};dur={seconds * 1000:.2f}"
+        if count > 1:
+            part += f';desc="{count} calls"'
+        parts.append(part)
+    parts.append(f"{PHASE_TOTAL};dur={total_seconds * 1000:.2f}")
+    return ", ".join(parts)
+
+
+def _phase_items(timings: dict):
+    return ((name, value) for name, value in timings.items() if not name.startswith("_"))
+
+
+def _wrap_endpoint(endpoint):
+    """包装路由处理函数：记录处理耗时和返回时间点"""
+    if inspect.iscoroutinefunction(endpoint):
+        @functools.wraps(endpoint)
+        async def timed_endpoint(*args, **kwargs):
+            start = time.perf_counter()
+            try:
+                return await endpoint(*args, **kwargs)
+            finally:
+                record(PHASE_HANDLER, time.perf_counter() - start)
+                mark_handler_end()
+    else:
+        @functools.wraps(endpoint)
+        def timed_endpoint(*args, **kwargs):
+            start = time.perf_counter()
+            try:
+                return endpoint(*args, **kwargs)
+            finally:
+                record(PHASE_HANDLER, time.perf_counter() - start)
+                mark_handler_end()
+    return timed_endpoint
+
+
+class TimedRoute(APIRoute):
+    """记录处理函数耗时的路由类（APIRouter(route_class=TimedRoute)）"""
+
+    def __init__(self, path: str, endpoint, **kwargs):
+        super().__init__(path, _wrap_endpoint(endpoint), **kwargs)
+
+
+class RouteTimingStats:
+    """按路由（方法 + 路由模板）分组的各阶段延迟直方图"""
+
+    # 未匹配到路由的请求（404 等）合并为一组，避免按原始路径无限增长
+    UNMATCHED = "unmatched"
+
+    def __init__(self):
+        self._routes: Dict[Tuple[str, str], Dict[str, LatencyHistogram]] = {}
+        # (method, route, status) -> 请求数
+        self._responses: Dict[Tuple[str, str, int], int] = {}
+        self._lock = threading.Lock()
+
+    def observe(
+        self,
+        method: str,
+        route: Optional[str],
+        timings: dict,
+        total_seconds: float,
+        status: Optional[int] = None
+    ):
+        """记录一个请求的各阶段耗时和响应状态码"""
+        key = (method, route or self.UNMATCHED)
+        histograms = self._routes.get(key)
+        if histograms is None:
+            with self._lock:
+                histograms = self._routes.setdefault(key, {})
+        for name, (seconds, _) in list(_phase_items(timings)):
+            self._histogram(histograms, name).observe(seconds)
+        self._histogram(histograms, PHASE_TOTAL).observe(total_seconds)
+        if status is not None:
+            status_key = (*key, status)
+            with self._lock:
+                self._responses[status_key] = self._responses.get(status_key, 0) + 1
+
+    def _histogram(self, histograms: Dict[str, LatencyHistogram], name: str) -> LatencyHistogram:
+        histogram = histograms.get(name)
+        if histogram is None:
+            with self._lock:
+                histogram = histograms.setdefault(name, LatencyHistogram())
+        return histogram
+
+    def items(self):
+        """遍历 ((method, route), {phase: LatencyHistogram})"""
+        with self._lock:
+            return [(key, dict(histograms)) for key, histograms in self._routes.items()]
+
+    def responses(self) -> Dict[Tuple[str, str, int], int]:
+        """按 (method, route, status) 统计的请求数"""
+        with self._lock:
+            return dict(self._responses)
+
+    def snapshot(self) -> dict:
+        """获取统计快照：{"GET /api/products": {"db": {...}, "total": {...}}}"""
+        return {
+            f"{method} {route}": {name: histogram.snapshot() for name, histogram in histograms.items()}
+            for (method, route), histograms in self.items()
+        }
+
+
+# 全局路由计时统计
+route_timings = RouteTimingStats()